@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark Active MAC Compaction: compares the cost of the dense and
+    the compacted (active MACs only) forward pass of a SparseyLayer
+    as the fraction of active MACs changes.
+"""
+
+
+import argparse
+
+import torch
+
+from benchmark_utils import (
+    create_layer_input, create_sparsey_layer, time_function
+)
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    Parses the command line arguments passed in during execution.
+
+    Returns:
+        Namespace containing the parsed arguments.
+    """
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        '--input_fractions', type=float, nargs='+',
+        default=[0.05, 0.1, 0.2, 0.3, 0.5, 0.8, 1.0],
+        help='Fractions of active input MACs to benchmark.'
+    )
+
+    parser.add_argument(
+        '--batch_size', type=int, default=64,
+        help='The number of samples in each batch.'
+    )
+
+    parser.add_argument(
+        '--grid_size', type=int, default=12,
+        help='Side length of the square MAC grids of both layers.'
+    )
+
+    parser.add_argument(
+        '--num_cms_per_mac', type=int, default=8,
+        help='The number of CMs in each MAC of both layers.'
+    )
+
+    parser.add_argument(
+        '--num_neurons_per_cm', type=int, default=8,
+        help='The number of neurons in each CM of both layers.'
+    )
+
+    parser.add_argument(
+        '--num_repeats', type=int, default=10,
+        help='The number of timed forward passes.'
+    )
+
+    return parser.parse_args()
+
+
+def main():
+    """
+    Runs the active MAC compaction benchmark.
+    """
+    args = parse_args()
+    num_macs = args.grid_size * args.grid_size
+
+    layer_params = dict(
+        num_macs=num_macs,
+        num_cms_per_mac=args.num_cms_per_mac,
+        num_neurons_per_cm=args.num_neurons_per_cm,
+        mac_grid_num_rows=args.grid_size,
+        mac_grid_num_cols=args.grid_size,
+        mac_receptive_field_size=0.2,
+        prev_layer_num_cms_per_mac=args.num_cms_per_mac,
+        prev_layer_num_neurons_per_cm=args.num_neurons_per_cm,
+        prev_layer_mac_grid_num_rows=args.grid_size,
+        prev_layer_mac_grid_num_cols=args.grid_size,
+        prev_layer_num_macs=num_macs,
+        activation_threshold_min=0.3
+    )
+
+    torch.manual_seed(0)
+
+    dense_layer = create_sparsey_layer(**layer_params)
+    compact_layer = create_sparsey_layer(
+        active_mac_compaction=True, **layer_params
+    )
+
+    torch.nn.init.uniform_(dense_layer.weights.data)
+    compact_layer.load_state_dict(dense_layer.state_dict())
+
+    print(
+        f"{'input frac':>10} {'active macs':>12} {'mode':>6} "
+        f"{'dense (ms)':>11} {'compact (ms)':>13} {'speedup':>8}"
+    )
+
+    for input_fraction in args.input_fractions:
+        layer_input = create_layer_input(
+            dense_layer, args.batch_size, input_fraction
+        )
+
+        for training in (False, True):
+            dense_layer.train(training)
+            compact_layer.train(training)
+
+            dense_time = time_function(
+                lambda: dense_layer(layer_input), args.num_repeats
+            )
+
+            compact_time = time_function(
+                lambda: compact_layer(layer_input), args.num_repeats
+            )
+
+            active_fraction = compact_layer.is_active.float().mean().item()
+
+            print(
+                f'{input_fraction:>10.2f} {active_fraction:>12.2f} '
+                f"{'train' if training else 'eval':>6} "
+                f'{dense_time * 1000:>11.2f} {compact_time * 1000:>13.2f} '
+                f'{dense_time / compact_time:>8.2f}'
+            )
+
+
+if __name__ == "__main__":
+    main()
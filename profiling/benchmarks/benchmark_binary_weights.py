@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark Binary Weights: compares the throughput of the float and
+    the bit-packed popcount forward passes on the MNIST_1K profiling
+    configurations, with binary weights.
+"""
+
+
+import argparse
+
+import torch
+
+from benchmark_utils import (
+    PROFILING_CONFIGS, build_profiling_model, time_function
+)
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    Parses the command line arguments passed in during execution.
+
+    Returns:
+        Namespace containing the parsed arguments.
+    """
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        '--configs', type=str, nargs='+', default=PROFILING_CONFIGS,
+        help='The profiling configurations to benchmark.'
+    )
+
+    parser.add_argument(
+        '--batch_size', type=int, default=64,
+        help='The number of samples in each batch.'
+    )
+
+    parser.add_argument(
+        '--weight_density', type=float, default=0.2,
+        help='The fraction of weights that are set.'
+    )
+
+    parser.add_argument(
+        '--num_repeats', type=int, default=10,
+        help='The number of timed forward passes.'
+    )
+
+    return parser.parse_args()
+
+
+def main():
+    """
+    Runs the binary weights benchmark.
+    """
+    args = parse_args()
+    device = torch.device('cpu')
+
+    print(
+        f"{'config':>12} {'float (ms)':>11} {'popcount (ms)':>14} "
+        f"{'speedup':>8} {'identical':>10}"
+    )
+
+    for config_name in args.configs:
+        torch.manual_seed(0)
+
+        float_model = build_profiling_model(config_name, device)
+
+        for layer in float_model.children():
+            layer.weights.data.copy_(
+                torch.lt(
+                    torch.rand(layer.weights.shape), args.weight_density
+                ).float()
+            )
+
+        binary_model = build_profiling_model(
+            config_name, device, binary_weights=True
+        )
+
+        binary_model.load_state_dict(float_model.state_dict())
+
+        float_model.eval()
+        binary_model.eval()
+
+        data = torch.lt(torch.rand((args.batch_size, 784, 1)), 0.2).float()
+
+        float_time = time_function(
+            lambda: float_model(data), args.num_repeats
+        )
+
+        binary_time = time_function(
+            lambda: binary_model(data), args.num_repeats
+        )
+
+        print(
+            f'{config_name:>12} {float_time * 1000:>11.1f} '
+            f'{binary_time * 1000:>14.1f} '
+            f'{float_time / binary_time:>7.2f}x '
+            f'{str(torch.equal(float_model(data), binary_model(data))):>10}'
+        )
+
+
+if __name__ == "__main__":
+    main()
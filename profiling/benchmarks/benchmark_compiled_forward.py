@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark Compiled Forward: compares the throughput of eager and
+    compiled forward passes on the MNIST_1K profiling configurations.
+"""
+
+
+import argparse
+import time
+
+import torch
+
+from benchmark_utils import (
+    PROFILING_CONFIGS, build_profiling_model, time_function
+)
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    Parses the command line arguments passed in during execution.
+
+    Returns:
+        Namespace containing the parsed arguments.
+    """
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        '--configs', type=str, nargs='+', default=PROFILING_CONFIGS,
+        help='The profiling configurations to benchmark.'
+    )
+
+    parser.add_argument(
+        '--batch_size', type=int, default=64,
+        help='The number of samples in each batch.'
+    )
+
+    parser.add_argument(
+        '--num_repeats', type=int, default=20,
+        help='The number of timed forward passes.'
+    )
+
+    return parser.parse_args()
+
+
+def main():
+    """
+    Runs the compiled forward benchmark.
+    """
+    args = parse_args()
+    device = torch.device('cpu')
+
+    print(
+        f"{'config':>12} {'mode':>6} {'eager (ms)':>11} "
+        f"{'compiled (ms)':>14} {'speedup':>8} {'compile (s)':>12} "
+        f"{'identical':>10}"
+    )
+
+    for config_name in args.configs:
+        torch.manual_seed(0)
+
+        eager_model = build_profiling_model(config_name, device)
+
+        for layer in eager_model.children():
+            torch.nn.init.uniform_(layer.weights.data)
+
+        compiled_model = build_profiling_model(config_name, device)
+        compiled_model.load_state_dict(eager_model.state_dict())
+        compiled_model.compile_forward()
+
+        data = torch.lt(torch.rand((args.batch_size, 784, 1)), 0.2).float()
+
+        for training in (False, True):
+            eager_model.train(training)
+            compiled_model.train(training)
+
+            # the first compiled call includes compilation.
+            start_time = time.perf_counter()
+            torch.manual_seed(1)
+            compiled_output = compiled_model(data)
+            compile_time = time.perf_counter() - start_time
+
+            torch.manual_seed(1)
+            eager_output = eager_model(data)
+
+            eager_time = time_function(
+                lambda: eager_model(data), args.num_repeats
+            )
+
+            compiled_time = time_function(
+                lambda: compiled_model(data), args.num_repeats
+            )
+
+            print(
+                f"{config_name:>12} {'train' if training else 'eval':>6} "
+                f'{eager_time * 1000:>11.2f} {compiled_time * 1000:>14.2f} '
+                f'{eager_time / compiled_time:>8.2f} {compile_time:>12.1f} '
+                f'{str(torch.equal(eager_output, compiled_output)):>10}'
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark Compute Dtype: compares the CPU throughput and results of
+    the MNIST_1K profiling configurations with their forward pass
+    matmuls run in float32 and in bfloat16, for weights stored in
+    float32 and in bfloat16.
+"""
+
+
+import argparse
+import time
+
+import torch
+
+from benchmark_utils import PROFILING_CONFIGS, build_profiling_model
+from sparseypy.core.optimizers.hebbian import HebbianOptimizer
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    Parses the command line arguments passed in during execution.
+
+    Returns:
+        Namespace containing the parsed arguments.
+    """
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        '--configs', type=str, nargs='+', default=PROFILING_CONFIGS,
+        help='The profiling configurations to benchmark.'
+    )
+
+    parser.add_argument(
+        '--weight_dtypes', type=str, nargs='+',
+        default=['float32', 'bfloat16'],
+        help='The weight dtypes to benchmark.'
+    )
+
+    parser.add_argument(
+        '--batch_size', type=int, default=32,
+        help='The number of samples in each batch.'
+    )
+
+    parser.add_argument(
+        '--num_steps', type=int, default=10,
+        help='The number of timed steps.'
+    )
+
+    return parser.parse_args()
+
+
+def main():
+    """
+    Runs the compute dtype benchmark.
+
+    Every combination of dtypes loads the same random weights and
+    trains for the same steps, then evaluates the same batches. The
+    speedups are relative to float32 weights and compute, and the
+    CM agreement is the share of evaluation CM winners that match
+    those of float32 compute with the same weight dtype.
+    """
+    args = parse_args()
+    device = torch.device('cpu')
+
+    print(
+        f"{'config':>12} {'weights':>9} {'compute':>9} {'train (ms)':>11} "
+        f"{'speedup':>8} {'eval (ms)':>10} {'speedup':>8} "
+        f"{'CM agreement':>13}"
+    )
+
+    for config_name in args.configs:
+        torch.manual_seed(0)
+
+        batches = [
+            torch.lt(torch.rand((args.batch_size, 784, 1)), 0.2).float()
+            for _ in range(args.num_steps + 1)
+        ]
+
+        initial_state = None
+        base_times = None
+
+        for weight_dtype in args.weight_dtypes:
+            reference_outputs = None
+
+            for compute_dtype in ('float32', 'bfloat16'):
+                model = build_profiling_model(
+                    config_name, device, weight_dtype=weight_dtype,
+                    compute_dtype=compute_dtype, sampling_seed=0
+                )
+
+                if initial_state is None:
+                    for layer in model.children():
+                        torch.nn.init.uniform_(layer.weights.data)
+
+                    initial_state = model.state_dict()
+
+                model.load_state_dict(initial_state)
+
+                optimizer = HebbianOptimizer(model, device)
+                model.train()
+
+                # the first step converts the weights and warms up.
+                model(batches[0])
+                optimizer.step()
+
+                start_time = time.perf_counter()
+
+                for data in batches[1:]:
+                    model(data)
+                    optimizer.step()
+
+                train_time = (
+                    (time.perf_counter() - start_time) / args.num_steps
+                )
+
+                model.load_state_dict(initial_state)
+                model.eval()
+                model(batches[0])
+
+                start_time = time.perf_counter()
+                outputs = [model(data) for data in batches[1:]]
+                eval_time = (time.perf_counter() - start_time) / args.num_steps
+
+                reference_outputs = reference_outputs or outputs
+                base_times = base_times or (train_time, eval_time)
+
+                num_neurons_per_cm = list(model.children())[-1].num_neurons_per_cm
+
+                cm_agreement = torch.mean(
+                    torch.cat([
+                        torch.eq(output, reference).view(
+                            -1, num_neurons_per_cm
+                        ).all(dim=-1).float()
+                        for output, reference in zip(outputs, reference_outputs)
+                    ])
+                ).item()
+
+                print(
+                    f'{config_name:>12} {weight_dtype:>9} {compute_dtype:>9} '
+                    f'{train_time * 1000:>11.1f} '
+                    f'{base_times[0] / train_time:>7.2f}x '
+                    f'{eval_time * 1000:>10.1f} '
+                    f'{base_times[1] / eval_time:>7.2f}x '
+                    f'{cm_agreement:>13.4f}'
+                )
+
+
+if __name__ == "__main__":
+    main()
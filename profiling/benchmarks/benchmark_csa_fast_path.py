@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark CSA Fast Path: compares the time taken by training forward
+    passes of a layer with large CMs that sample every (sample, MAC)
+    pair from its full CSA distribution with passes that take closed-
+    form winners for the pairs whose distribution is effectively
+    one-hot or uniform, and reports the fraction of pairs taking each
+    path.
+"""
+
+
+import argparse
+from itertools import product
+
+import torch
+
+from benchmark_utils import (
+    create_layer_input, create_sparsey_layer, time_function
+)
+from sparseypy.access_objects.models.model import Model
+from sparseypy.core.optimizers.hebbian import HebbianOptimizer
+
+
+# the scenarios: the fraction of active input MACs, the sigmoid phi
+# parameter, and whether the layer is trained on the timed inputs.
+# with the default phi of 5, the least active neurons of a CM always
+# keep a few percent of its distribution, so it is never one-hot.
+SCENARIOS = {
+    'novel': (0.5, 5.0, False),
+    'sparse_input': (0.05, 5.0, False),
+    'familiar': (0.5, 5.0, True),
+    'familiar_phi_12': (0.5, 12.0, True)
+}
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    Parses the command line arguments passed in during execution.
+
+    Returns:
+        Namespace containing the parsed arguments.
+    """
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        '--tolerances', type=float, nargs='+', default=[1e-3, 1e-2],
+        help='The CSA fast path tolerances to benchmark.'
+    )
+
+    parser.add_argument(
+        '--batch_sizes', type=int, nargs='+', default=[1, 16],
+        help='The numbers of samples in each batch.'
+    )
+
+    parser.add_argument(
+        '--num_training_steps', type=int, default=20,
+        help='The number of steps the familiar layers are trained for.'
+    )
+
+    parser.add_argument(
+        '--num_repeats', type=int, default=10,
+        help='The number of timed calls.'
+    )
+
+    return parser.parse_args()
+
+
+def create_model(sigmoid_phi: float, tolerance) -> Model:
+    """
+    Creates a one-layer model with large CMs.
+
+    Args:
+        sigmoid_phi (float): the phi parameter of the CSA sigmoid.
+        tolerance (Optional[float]): the CSA fast path tolerance.
+
+    Returns:
+        (Model): the model.
+    """
+    model = Model(torch.device('cpu'))
+    model.add_layer(
+        create_sparsey_layer(
+            num_cms_per_mac=32, num_neurons_per_cm=32,
+            sigmoid_phi=sigmoid_phi, sampling_seed=0,
+            csa_fast_path_tolerance=tolerance
+        )
+    )
+
+    return model
+
+
+def main():
+    """
+    Runs the CSA fast path benchmark.
+    """
+    args = parse_args()
+    device = torch.device('cpu')
+
+    print(
+        f"{'scenario':>16} {'batch':>5} {'tolerance':>10} "
+        f"{'full (ms)':>10} {'fast (ms)':>10} {'speedup':>8} {'one-hot':>8} "
+        f"{'uniform':>8} {'sampled':>8} {'same codes':>11}"
+    )
+
+    for scenario, (active_mac_fraction, sigmoid_phi, familiar) in (
+        SCENARIOS.items()
+    ):
+        for batch_size, tolerance in product(
+            args.batch_sizes, args.tolerances
+        ):
+            torch.manual_seed(0)
+
+            models = [
+                create_model(sigmoid_phi, None),
+                create_model(sigmoid_phi, tolerance)
+            ]
+            layer_input = create_layer_input(
+                models[0].layers[0], batch_size, active_mac_fraction
+            )
+
+            if familiar:
+                optimizer = HebbianOptimizer(models[0], device)
+                models[0].train()
+
+                for _ in range(args.num_training_steps):
+                    models[0](layer_input)
+                    optimizer.step()
+
+            models[1].load_state_dict(models[0].state_dict())
+
+            times, outputs = [], []
+
+            for model in models:
+                model.train()
+                times.append(
+                    time_function(
+                        lambda: model(layer_input), args.num_repeats
+                    )
+                )
+
+            # both layers sample the compared codes at the same step.
+            for model in models:
+                model.layers[0].sampling_step = 0
+                outputs.append(model(layer_input).clone())
+
+            fractions = models[1].layers[0].get_csa_path_fractions()
+            same_codes = torch.mean(
+                torch.eq(outputs[0], outputs[1]).all(dim=-1).float()
+            ).item()
+
+            print(
+                f'{scenario:>16} {batch_size:>5} {tolerance:>10.0e} '
+                f'{times[0] * 1000:>10.2f} {times[1] * 1000:>10.2f} '
+                f'{times[0] / times[1]:>7.2f}x ' +
+                ' '.join(f'{fraction:>8.3f}' for fraction in fractions) +
+                f' {same_codes:>11.3f}'
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark Dead Samples: compares the training step and evaluation
+    forward pass times of the MNIST_1K profiling configurations when
+    every layer runs every sample with those when the layers above a
+    sample with no active MAC skip it, for growing fractions of empty
+    input samples.
+"""
+
+
+import argparse
+
+import torch
+
+from benchmark_utils import (
+    PROFILING_CONFIGS, build_profiling_model, create_layer_input,
+    time_function
+)
+from sparseypy.core.optimizers.hebbian import HebbianOptimizer
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    Parses the command line arguments passed in during execution.
+
+    Returns:
+        Namespace containing the parsed arguments.
+    """
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        '--configs', type=str, nargs='+', default=PROFILING_CONFIGS,
+        help='The profiling configurations to benchmark.'
+    )
+
+    parser.add_argument(
+        '--dead_fractions', type=float, nargs='+',
+        default=[0.0, 0.25, 0.5, 0.75],
+        help='The fractions of samples with an empty input.'
+    )
+
+    parser.add_argument(
+        '--batch_size', type=int, default=32,
+        help='The number of samples in each batch.'
+    )
+
+    parser.add_argument(
+        '--num_repeats', type=int, default=5,
+        help='The number of timed calls.'
+    )
+
+    return parser.parse_args()
+
+
+def main():
+    """
+    Runs the dead samples benchmark.
+    """
+    args = parse_args()
+    device = torch.device('cpu')
+
+    print(
+        f"{'config':>12} {'dead':>5} "
+        f"{'train (ms)':>11} {'skipping':>9} {'speedup':>8} "
+        f"{'eval (ms)':>10} {'skipping':>9} {'speedup':>8}"
+    )
+
+    for config_name in args.configs:
+        for dead_fraction in args.dead_fractions:
+            train_times, eval_times = [], []
+
+            for skip_dead_samples in (False, True):
+                torch.manual_seed(0)
+
+                model = build_profiling_model(config_name, device)
+                optimizer = HebbianOptimizer(model, device)
+
+                if not skip_dead_samples:
+                    for layer in model.layers:
+                        layer.can_skip_dead_samples = lambda: False
+
+                data = create_layer_input(model.layers[0], args.batch_size)
+                data[:int(dead_fraction * args.batch_size)] = 0.0
+
+                def train_step() -> None:
+                    model(data)
+                    optimizer.step()
+
+                model.train()
+                train_times.append(time_function(train_step, args.num_repeats))
+
+                model.eval()
+                eval_times.append(
+                    time_function(lambda: model(data), args.num_repeats)
+                )
+
+            print(
+                f'{config_name:>12} {dead_fraction:>5.2f} '
+                f'{train_times[0] * 1000:>11.2f} '
+                f'{train_times[1] * 1000:>9.2f} '
+                f'{train_times[0] / train_times[1]:>7.2f}x '
+                f'{eval_times[0] * 1000:>10.2f} {eval_times[1] * 1000:>9.2f} '
+                f'{eval_times[0] / eval_times[1]:>7.2f}x'
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark Fused Forward: compares the time taken by training steps
+    of deep models with small MACs when the optimizer and metrics read
+    the layer inputs and outputs through forward hooks, and when the
+    model runs fused forward passes that call no hooks.
+"""
+
+
+import argparse
+import cProfile
+import pstats
+import time
+from typing import Callable
+
+import torch
+
+from sparseypy.access_objects.models.model import Model
+from sparseypy.access_objects.models.model_builder import ModelBuilder
+from sparseypy.core.metrics.feature_coverage import FeatureCoverageMetric
+from sparseypy.core.metrics.num_activations import NumActivationsMetric
+from sparseypy.core.optimizers.hebbian import HebbianOptimizer
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    Parses the command line arguments passed in during execution.
+
+    Returns:
+        Namespace containing the parsed arguments.
+    """
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        '--num_layers', type=int, nargs='+', default=[4, 16, 64],
+        help='The numbers of layers of the benchmarked models.'
+    )
+
+    parser.add_argument(
+        '--num_metrics', type=int, default=4,
+        help='The number of metrics computed at every step.'
+    )
+
+    parser.add_argument(
+        '--batch_size', type=int, default=1,
+        help='The number of samples in each batch.'
+    )
+
+    parser.add_argument(
+        '--num_steps', type=int, default=20,
+        help='The number of steps in each timed run.'
+    )
+
+    parser.add_argument(
+        '--num_repeats', type=int, default=5,
+        help='The number of timed runs, of which the fastest is kept.'
+    )
+
+    return parser.parse_args()
+
+
+def build_model(num_layers: int, fused_forward: bool) -> Model:
+    """
+    Builds a deep model of layers with four small MACs each.
+
+    Args:
+        num_layers (int): the number of layers.
+        fused_forward (bool): whether the model runs fused forward
+            passes.
+
+    Returns:
+        (Model): the model.
+    """
+    layers = []
+
+    for layer_index in range(num_layers):
+        layers.append({
+            'name': 'sparsey',
+            'params': {
+                'autosize_grid': False, 'grid_layout': 'rect',
+                'num_macs': 4, 'num_cms_per_mac': 2, 'num_neurons_per_cm': 4,
+                'mac_grid_num_rows': 2, 'mac_grid_num_cols': 2,
+                'mac_receptive_field_size': 1.5,
+                'prev_layer_num_cms_per_mac': 1 if layer_index == 0 else 2,
+                'prev_layer_num_neurons_per_cm': 1 if layer_index == 0 else 4,
+                'prev_layer_mac_grid_num_rows': 4 if layer_index == 0 else 2,
+                'prev_layer_mac_grid_num_cols': 4 if layer_index == 0 else 2,
+                'prev_layer_num_macs': 16 if layer_index == 0 else 4,
+                'prev_layer_grid_layout': 'rect',
+                'sigmoid_phi': 5.0, 'sigmoid_lambda': 28.0,
+                'saturation_threshold': 0.5, 'permanence_steps': 10,
+                'permanence_convexity': 0.3, 'activation_threshold_min': 0.2,
+                'activation_threshold_max': 1.0, 'min_familiarity': 0.2,
+                'sigmoid_chi': 2.5
+            }
+        })
+
+    return ModelBuilder.build_model(
+        {'layers': layers, 'sampling_seed': 0, 'fused_forward': fused_forward},
+        torch.device('cpu')
+    )
+
+
+def time_runs(run: Callable[[], None], num_repeats: int) -> float:
+    """
+    Returns the time taken by the fastest of several runs.
+
+    Args:
+        run (Callable[[], None]): the function to time.
+        num_repeats (int): the number of runs.
+
+    Returns:
+        (float): the fastest run time, in seconds.
+    """
+    run_times = []
+
+    for _ in range(num_repeats):
+        start_time = time.perf_counter()
+        run()
+        run_times.append(time.perf_counter() - start_time)
+
+    return min(run_times)
+
+
+def count_calls(run: Callable[[], None]) -> int:
+    """
+    Returns the number of Python and builtin function calls made by
+    a run, which unlike its time does not depend on the load of the
+    machine.
+
+    Args:
+        run (Callable[[], None]): the function to profile.
+
+    Returns:
+        (int): the number of calls.
+    """
+    profile = cProfile.Profile()
+    profile.runcall(run)
+
+    return pstats.Stats(profile).total_calls
+
+
+def main():
+    """
+    Runs the fused forward benchmark.
+
+    Forward passes are timed alone, with the hooks of the optimizer
+    and metrics registered, and as part of training steps that also
+    run the optimizer step and the metrics, half of them computing
+    the number of active MACs and half the feature coverage. The
+    function calls made by each forward pass are also counted.
+    """
+    args = parse_args()
+    device = torch.device('cpu')
+
+    print(
+        f"{'layers':>7} {'forward hooks (ms)':>19} {'fused (ms)':>11} "
+        f"{'speedup':>8} {'step hooks (ms)':>16} {'fused (ms)':>11} "
+        f"{'speedup':>8} {'calls hooks':>12} {'fused':>7}"
+    )
+
+    for num_layers in args.num_layers:
+        torch.manual_seed(0)
+
+        batches = [
+            torch.lt(torch.rand((args.batch_size, 16, 1)), 0.5).float()
+            for _ in range(args.num_steps)
+        ]
+
+        forward_times, step_times, forward_calls = [], [], []
+
+        for fused_forward in (False, True):
+            model = build_model(num_layers, fused_forward)
+            optimizer = HebbianOptimizer(model, device)
+            metrics = [
+                (NumActivationsMetric if index % 2 == 0
+                 else FeatureCoverageMetric)(model, device)
+                for index in range(args.num_metrics)
+            ]
+
+            def run_steps() -> None:
+                for data in batches:
+                    model(data)
+                    optimizer.step()
+
+                    for metric in metrics:
+                        metric.compute(model, data, None, True)
+
+            def run_forward() -> None:
+                for data in batches:
+                    model(data)
+
+            model.train()
+
+            # the first step allocates the optimizer state.
+            run_steps()
+
+            step_times.append(time_runs(run_steps, args.num_repeats))
+            forward_times.append(time_runs(run_forward, args.num_repeats))
+            forward_calls.append(count_calls(run_forward) / args.num_steps)
+
+        print(
+            f'{num_layers:>7} '
+            f'{forward_times[0] / args.num_steps * 1000:>19.2f} '
+            f'{forward_times[1] / args.num_steps * 1000:>11.2f} '
+            f'{forward_times[0] / forward_times[1]:>7.2f}x '
+            f'{step_times[0] / args.num_steps * 1000:>16.2f} '
+            f'{step_times[1] / args.num_steps * 1000:>11.2f} '
+            f'{step_times[0] / step_times[1]:>7.2f}x '
+            f'{forward_calls[0]:>12.0f} {forward_calls[1]:>7.0f}'
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark Incremental Forward: compares the time taken by full and
+    incremental evaluation forward passes of the MNIST_1K profiling
+    configurations over streams of 28x28 frames, as a function of
+    the fraction of pixels that change between consecutive frames.
+
+    The changed pixels either form a single square patch, like an
+    object moving in a video, or are scattered over the frame.
+"""
+
+
+import argparse
+import math
+import time
+
+import torch
+
+from benchmark_utils import PROFILING_CONFIGS, build_profiling_model
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    Parses the command line arguments passed in during execution.
+
+    Returns:
+        Namespace containing the parsed arguments.
+    """
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        '--configs', type=str, nargs='+', default=PROFILING_CONFIGS,
+        help='The profiling configurations to benchmark.'
+    )
+
+    parser.add_argument(
+        '--batch_size', type=int, default=1,
+        help='The number of input streams processed together.'
+    )
+
+    parser.add_argument(
+        '--change_rates', type=float, nargs='+',
+        default=[0.0, 0.002, 0.005, 0.02, 0.1],
+        help='The fractions of pixels changed between frames.'
+    )
+
+    parser.add_argument(
+        '--num_frames', type=int, default=20,
+        help='The number of timed frames.'
+    )
+
+    return parser.parse_args()
+
+
+def change_frames(frames: torch.Tensor, change_rate: float,
+                  pattern: str) -> torch.Tensor:
+    """
+    Returns the next frames of the streams, with a fraction of the
+    pixels of each frame flipped.
+
+    Args:
+        frames (torch.Tensor): the current frames, of size
+            (batch_size, 784, 1).
+        change_rate (float): the fraction of pixels to flip.
+        pattern (str): 'patch' to flip a square patch of pixels,
+            'scattered' to flip pixels anywhere in the frame.
+
+    Returns:
+        (torch.Tensor): the next frames.
+    """
+    batch_size = frames.shape[0]
+    num_changed = round(change_rate * 784)
+
+    if not num_changed:
+        return frames.clone()
+
+    if pattern == 'patch':
+        side = min(28, max(1, round(math.sqrt(num_changed))))
+        rows, cols = torch.randint(0, 29 - side, (2, batch_size))
+        offsets = torch.arange(side)
+
+        pixels = torch.add(
+            (rows.view(-1, 1, 1) + offsets.view(1, -1, 1)) * 28,
+            cols.view(-1, 1, 1) + offsets.view(1, 1, -1)
+        ).view(batch_size, -1)
+    else:
+        pixels = torch.argsort(torch.rand((batch_size, 784)))[:, :num_changed]
+
+    changed = torch.zeros((batch_size, 784, 1), dtype=torch.bool)
+    changed.scatter_(1, pixels.unsqueeze(-1), True)
+
+    return torch.where(changed, 1.0 - frames, frames)
+
+
+def time_stream(model: torch.nn.Module,
+                frames: list) -> float:
+    """
+    Returns the mean time taken to pass each frame of a stream
+    through a model.
+
+    Args:
+        model (torch.nn.Module): the model.
+        frames (list): the frames of the stream.
+
+    Returns:
+        (float): the mean time per frame, in seconds.
+    """
+    model(frames[0])
+
+    start_time = time.perf_counter()
+
+    for frame in frames[1:]:
+        model(frame)
+
+    return (time.perf_counter() - start_time) / (len(frames) - 1)
+
+
+def main():
+    """
+    Runs the incremental forward benchmark.
+    """
+    args = parse_args()
+    device = torch.device('cpu')
+
+    print(
+        f"{'config':>12} {'pattern':>10} {'change rate':>12} "
+        f"{'full (ms)':>10} {'incremental (ms)':>17} {'speedup':>8} "
+        f"{'recomputed':>11} {'identical':>10}"
+    )
+
+    for config_name in args.configs:
+        torch.manual_seed(0)
+
+        model = build_profiling_model(config_name, device)
+
+        for layer in model.children():
+            torch.nn.init.uniform_(layer.weights.data)
+
+        model.eval()
+
+        for pattern in ('patch', 'scattered'):
+            for change_rate in args.change_rates:
+                frames = [
+                    torch.lt(torch.rand((args.batch_size, 784, 1)), 0.2).float()
+                ]
+
+                for _ in range(args.num_frames):
+                    frames.append(
+                        change_frames(frames[-1], change_rate, pattern)
+                    )
+
+                model.set_incremental(False)
+                full_time = time_stream(model, frames)
+                full_outputs = [model(frame).clone() for frame in frames]
+
+                model.set_incremental(True)
+                incremental_time = time_stream(model, frames)
+
+                model.set_incremental(True)
+                identical = True
+                num_recomputed = num_macs = 0
+
+                for frame_index, frame in enumerate(frames):
+                    identical = identical and torch.equal(
+                        model(frame), full_outputs[frame_index]
+                    )
+
+                    if frame_index:
+                        for layer in model.children():
+                            num_recomputed += layer.num_recomputed_macs
+                            num_macs += args.batch_size * layer.num_macs
+
+                print(
+                    f'{config_name:>12} {pattern:>10} {change_rate:>12.3f} '
+                    f'{full_time * 1000:>10.2f} '
+                    f'{incremental_time * 1000:>17.2f} '
+                    f'{full_time / incremental_time:>7.2f}x '
+                    f'{num_recomputed / num_macs:>11.1%} '
+                    f'{str(identical):>10}'
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark Integer Activations: compares the evaluation forward pass
+    times of the layers of a profiling configuration with uint8
+    weights, and those of training forward passes that follow a weight
+    update, when the raw activations are computed by float32 matmuls
+    of the dequantized weights and by the quantized integer kernels,
+    and reports how closely the two paths agree.
+"""
+
+
+import argparse
+
+import torch
+
+from benchmark_utils import (
+    build_profiling_model, create_layer_input, time_function
+)
+from sparseypy.core.optimizers.hebbian import HebbianOptimizer
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    Parses the command line arguments passed in during execution.
+
+    Returns:
+        Namespace containing the parsed arguments.
+    """
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        '--config', type=str, default='big_macs',
+        help='The profiling configuration to benchmark.'
+    )
+
+    parser.add_argument(
+        '--batch_sizes', type=int, nargs='+', default=[1, 16],
+        help='The numbers of samples in each batch.'
+    )
+
+    parser.add_argument(
+        '--num_repeats', type=int, default=5,
+        help='The number of timed calls.'
+    )
+
+    return parser.parse_args()
+
+
+def main():
+    """
+    Runs the integer activations benchmark.
+
+    Both models load the same trained weights, and every layer is fed
+    the same random codes. The agreement is the share of the CMs of
+    every sample and MAC whose evaluation winners are the same on both
+    paths, and the error the largest relative difference between their
+    raw activations.
+    """
+    args = parse_args()
+    device = torch.device('cpu')
+
+    print(
+        f"{'layer':>5} {'batch':>5} {'eval (ms)':>10} {'integer':>8} "
+        f"{'speedup':>8} {'train (ms)':>11} {'integer':>8} {'speedup':>8} "
+        f"{'agreement':>10} {'max rel error':>14}"
+    )
+
+    torch.manual_seed(0)
+
+    models = [
+        build_profiling_model(
+            args.config, device, weight_dtype='uint8',
+            integer_activations=integer_activations
+        ) for integer_activations in (False, True)
+    ]
+
+    # a few training steps give the weights realistic values.
+    optimizer = HebbianOptimizer(models[0], device)
+    models[0].train()
+
+    for _ in range(10):
+        models[0](create_layer_input(models[0].layers[0], 16))
+        optimizer.step()
+
+    models[1].load_state_dict(models[0].state_dict())
+
+    for layer_index, (layer, integer_layer) in enumerate(
+        zip(models[0].layers, models[1].layers)
+    ):
+        for batch_size in args.batch_sizes:
+            layer_input = create_layer_input(layer, batch_size)
+            eval_times, train_times = [], []
+
+            for timed_layer in (layer, integer_layer):
+                # the weights are restored after the timed updates.
+                state_dict = {
+                    key: value.clone()
+                    for key, value in timed_layer.state_dict().items()
+                }
+
+                timed_layer.train()
+
+                def train_step() -> None:
+                    timed_layer(layer_input)
+
+                    # the packed weights are rebuilt after every update.
+                    with torch.no_grad():
+                        timed_layer.weights.add_(0)
+
+                train_times.append(
+                    time_function(train_step, args.num_repeats)
+                )
+
+                timed_layer.load_state_dict(state_dict)
+                timed_layer.eval()
+
+                eval_times.append(
+                    time_function(
+                        lambda: timed_layer(layer_input), args.num_repeats
+                    )
+                )
+
+            with torch.no_grad():
+                raw_activations = layer.compute_raw_activations(
+                    layer_input
+                )[0].clone()
+                integer_activations = integer_layer.compute_raw_activations(
+                    layer_input
+                )[0]
+
+            max_error = torch.max(
+                torch.abs(integer_activations - raw_activations) /
+                torch.clamp(torch.abs(raw_activations), min=1e-6)
+            ).item()
+
+            output, integer_output = (
+                timed_layer(layer_input).view(
+                    batch_size, layer.num_macs, layer.num_cms_per_mac, -1
+                ) for timed_layer in (layer, integer_layer)
+            )
+
+            agreement = torch.mean(
+                torch.eq(output, integer_output).all(dim=-1).float()
+            ).item()
+
+            print(
+                f'{layer_index:>5} {batch_size:>5} '
+                f'{eval_times[0] * 1000:>10.2f} {eval_times[1] * 1000:>8.2f} '
+                f'{eval_times[0] / eval_times[1]:>7.2f}x '
+                f'{train_times[0] * 1000:>11.2f} '
+                f'{train_times[1] * 1000:>8.2f} '
+                f'{train_times[0] / train_times[1]:>7.2f}x '
+                f'{agreement:>10.4f} {max_error:>14.2e}'
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark Layer Autotuner: times a training step of every layer of
+    the MNIST_1K profiling configurations with each backend the
+    autotuner chooses from, and reports the backend it picks for
+    several batch sizes.
+"""
+
+
+import argparse
+import os
+import tempfile
+
+import torch
+
+from benchmark_utils import PROFILING_CONFIGS, load_network_config
+from sparseypy.access_objects.models.layer_autotuner import (
+    LAYER_BACKENDS, LayerAutotuner
+)
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    Parses the command line arguments passed in during execution.
+
+    Returns:
+        Namespace containing the parsed arguments.
+    """
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        '--configs', type=str, nargs='+', default=PROFILING_CONFIGS,
+        help='The profiling configurations to benchmark.'
+    )
+
+    parser.add_argument(
+        '--batch_sizes', type=int, nargs='+', default=[1, 32],
+        help='The batch sizes to time the backends with.'
+    )
+
+    parser.add_argument(
+        '--num_repeats', type=int, default=5,
+        help='The number of timed steps of each backend.'
+    )
+
+    return parser.parse_args()
+
+
+def main():
+    """
+    Runs the layer autotuner benchmark, with a temporary cache so
+    that every backend is timed.
+    """
+    args = parse_args()
+    device = torch.device('cpu')
+
+    print(
+        f"{'config':>12} {'layer':>5} {'batch':>5} " +
+        ' '.join(f'{backend + " (ms)":>17}' for backend in LAYER_BACKENDS) +
+        f" {'chosen':>12} {'vs padded':>10}"
+    )
+
+    with tempfile.TemporaryDirectory() as cache_directory:
+        for config_name in args.configs:
+            model_config = load_network_config(config_name)
+
+            for batch_size in args.batch_sizes:
+                autotuner = LayerAutotuner(
+                    os.path.join(cache_directory, 'backends.json'),
+                    batch_size, args.num_repeats
+                )
+
+                for layer_index, layer_config in enumerate(
+                    model_config['layers']
+                ):
+                    layer_params = dict(
+                        layer_config['params'], layer_index=layer_index,
+                        receptive_field_layout='auto'
+                    )
+
+                    torch.manual_seed(0)
+                    backend = autotuner.select_backend(layer_params, device)
+                    times = autotuner.decisions[
+                        autotuner.get_cache_key(layer_params, device)
+                    ]['times']
+
+                    print(
+                        f'{config_name:>12} {layer_index:>5} {batch_size:>5} ' +
+                        ' '.join(
+                            f'{times.get(name, float("nan")) * 1000:>17.2f}'
+                            for name in LAYER_BACKENDS
+                        ) +
+                        f' {backend:>12} '
+                        f'{times["padded"] / times[backend]:>9.2f}x'
+                    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark Layer Construction: measures how long it takes to build
+    the MAC geometry (positions and receptive fields) of large
+    Sparsey layers, and compares it against the original
+    pairwise Python loop implementation.
+"""
+
+
+import argparse
+import time
+
+import torch
+
+from benchmark_utils import create_sparsey_layer
+
+
+def compute_mac_positions_loop(num_macs: int, mac_grid_num_rows: int,
+                               mac_grid_num_cols: int,
+                               grid_layout: str) -> list:
+    """
+    Original scalar implementation of SparseyLayer.compute_mac_positions.
+    """
+    mac_positions = []
+    global_col_offset = 0.5 if grid_layout == 'hex' else 0
+    grid_col_spacing = 0.0
+
+    if mac_grid_num_rows == 1:
+        row_locations = [0.5]
+    else:
+        grid_row_spacing = 1 / (mac_grid_num_rows - 1)
+        row_locations = [
+            i * grid_row_spacing for i in range(mac_grid_num_rows)
+        ]
+
+    if mac_grid_num_cols == 1:
+        col_locations = [0.5]
+    else:
+        grid_col_spacing = 1 / (mac_grid_num_cols - 1)
+        col_locations = [
+            i * grid_col_spacing for i in range(mac_grid_num_cols)
+        ]
+
+    for i in range(num_macs):
+        mac_positions.append(
+            (
+                row_locations[i // mac_grid_num_cols],
+                col_locations[i % mac_grid_num_cols] + (
+                    global_col_offset * (
+                        (i % mac_grid_num_rows) % 2
+                    ) * grid_col_spacing
+                )
+            )
+        )
+
+    return mac_positions
+
+
+def find_connected_macs_loop(mac_positions: list,
+                             prev_layer_mac_positions: list,
+                             prev_layer_num_macs: int,
+                             receptive_field_size: float) -> tuple:
+    """
+    Original pairwise implementation of
+    SparseyLayer.find_connected_macs_in_prev_layer.
+    """
+    connections = []
+    max_len = 0
+
+    for mac_position in mac_positions:
+        mac_connections = []
+
+        for index, prev_layer_mac_position in enumerate(
+            prev_layer_mac_positions
+        ):
+            if (
+                abs(mac_position[0] - prev_layer_mac_position[0]) ** 2 +
+                abs(mac_position[1] - prev_layer_mac_position[1]) ** 2
+            ) ** 0.5 <= receptive_field_size:
+                mac_connections.append(index)
+
+        connections.append(mac_connections)
+        max_len = max(max_len, len(mac_connections))
+
+    mac_rf_sizes = [len(connection) for connection in connections]
+
+    for connection in connections:
+        connection.extend(
+            [prev_layer_num_macs] * (max_len - len(connection))
+        )
+
+    return torch.tensor(connections, dtype=torch.long), torch.tensor(
+        mac_rf_sizes, dtype=torch.float32
+    )
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    Parses the command line arguments passed in during execution.
+
+    Returns:
+        Namespace containing the parsed arguments.
+    """
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        '--grid_sizes', type=int, nargs='+', default=[32, 64, 100, 128],
+        help='Side lengths of the square MAC grids to benchmark.'
+    )
+
+    parser.add_argument(
+        '--receptive_field_size', type=float, default=0.05,
+        help='The receptive field radius of the MACs.'
+    )
+
+    parser.add_argument(
+        '--grid_layout', type=str, default='rect',
+        help='The grid layout of both layers (rect or hex).'
+    )
+
+    parser.add_argument(
+        '--max_loop_macs', type=int, default=4096,
+        help='Largest layer to also time the original loop on.'
+    )
+
+    return parser.parse_args()
+
+
+def main():
+    """
+    Runs the layer construction benchmark.
+    """
+    args = parse_args()
+
+    print(
+        f"{'macs':>8} {'rf macs':>8} {'layer build (s)':>16} "
+        f"{'geometry (s)':>13} {'loop geometry (s)':>18} {'identical':>10}"
+    )
+
+    for grid_size in args.grid_sizes:
+        num_macs = grid_size * grid_size
+
+        start_time = time.perf_counter()
+
+        layer = create_sparsey_layer(
+            grid_layout=args.grid_layout,
+            num_macs=num_macs, num_cms_per_mac=1, num_neurons_per_cm=1,
+            mac_grid_num_rows=grid_size, mac_grid_num_cols=grid_size,
+            mac_receptive_field_size=args.receptive_field_size,
+            prev_layer_num_cms_per_mac=1, prev_layer_num_neurons_per_cm=1,
+            prev_layer_mac_grid_num_rows=grid_size,
+            prev_layer_mac_grid_num_cols=grid_size,
+            prev_layer_num_macs=num_macs,
+            prev_layer_grid_layout=args.grid_layout
+        )
+
+        build_time = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+
+        positions = layer.compute_mac_positions(
+            num_macs, grid_size, grid_size, args.grid_layout
+        )
+
+        layer.find_connected_macs_in_prev_layer(
+            positions, positions, num_macs
+        )
+
+        geometry_time = time.perf_counter() - start_time
+
+        loop_time = float('nan')
+        identical = '-'
+
+        if num_macs <= args.max_loop_macs:
+            start_time = time.perf_counter()
+
+            loop_positions = compute_mac_positions_loop(
+                num_macs, grid_size, grid_size, args.grid_layout
+            )
+
+            loop_connections, loop_rf_sizes = find_connected_macs_loop(
+                loop_positions, loop_positions, num_macs,
+                args.receptive_field_size
+            )
+
+            loop_time = time.perf_counter() - start_time
+
+            _, rf_sizes = layer.find_connected_macs_in_prev_layer(
+                positions, positions, num_macs
+            )
+
+            identical = str(
+                torch.equal(loop_connections, layer.input_connections) and
+                torch.equal(loop_rf_sizes, rf_sizes)
+            )
+
+        print(
+            f'{num_macs:>8} {layer.receptive_field_num_macs:>8} '
+            f'{build_time:>16.3f} {geometry_time:>13.3f} '
+            f'{loop_time:>18.3f} {identical:>10}'
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark MAC Group Threads: measures how the training step time of
+    the MAC profiling configurations scales with the number of CPU
+    threads, with torch's intra-op parallelism and with MACs split
+    into groups run on a thread pool (each thread then running its
+    operators on a single intra-op thread).
+"""
+
+
+import argparse
+import os
+import time
+
+import torch
+
+from benchmark_utils import build_profiling_model
+from sparseypy.core.optimizers.hebbian import HebbianOptimizer
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    Parses the command line arguments passed in during execution.
+
+    Returns:
+        Namespace containing the parsed arguments.
+    """
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        '--configs', type=str, nargs='+',
+        default=['medium_macs', 'big_macs'],
+        help='The profiling configurations to benchmark.'
+    )
+
+    parser.add_argument(
+        '--max_threads', type=int, default=os.cpu_count(),
+        help='The largest number of threads to run on.'
+    )
+
+    parser.add_argument(
+        '--batch_size', type=int, default=16,
+        help='The number of samples in each batch.'
+    )
+
+    parser.add_argument(
+        '--num_repeats', type=int, default=5,
+        help='The number of timed training steps.'
+    )
+
+    return parser.parse_args()
+
+
+def time_training_step(config_name: str, batch_size: int,
+                       num_repeats: int, num_threads: int) -> float:
+    """
+    Returns the mean time taken by a forward pass and an optimizer
+    step of a profiling model.
+
+    Args:
+        config_name (str): the name of the profiling configuration.
+        batch_size (int): the number of samples in each batch.
+        num_repeats (int): the number of timed steps.
+        num_threads (int): the number of threads of the layers and
+            the optimizer.
+
+    Returns:
+        (float): the mean time per step, in seconds.
+    """
+    device = torch.device('cpu')
+
+    torch.manual_seed(0)
+
+    model = build_profiling_model(
+        config_name, device, sampling_seed=0, num_threads=num_threads
+    )
+
+    optimizer = HebbianOptimizer(model, device, num_threads=num_threads)
+
+    model.train()
+
+    data = torch.lt(torch.rand((batch_size, 784, 1)), 0.2).float()
+
+    model(data)
+    optimizer.step()
+
+    start_time = time.perf_counter()
+
+    for _ in range(num_repeats):
+        model(data)
+        optimizer.step()
+
+    return (time.perf_counter() - start_time) / num_repeats
+
+
+def main():
+    """
+    Runs the MAC group threads benchmark.
+    """
+    args = parse_args()
+    default_num_threads = torch.get_num_threads()
+
+    print(
+        f"{'config':>12} {'threads':>8} {'intra-op (ms)':>14} "
+        f"{'speedup':>8} {'MAC groups (ms)':>16} {'speedup':>8}"
+    )
+
+    for config_name in args.configs:
+        intra_op_base, groups_base = None, None
+
+        for num_threads in range(1, args.max_threads + 1):
+            torch.set_num_threads(num_threads)
+
+            intra_op_time = time_training_step(
+                config_name, args.batch_size, args.num_repeats, 1
+            )
+
+            torch.set_num_threads(1)
+
+            groups_time = time_training_step(
+                config_name, args.batch_size, args.num_repeats, num_threads
+            )
+
+            intra_op_base = intra_op_base or intra_op_time
+            groups_base = groups_base or groups_time
+
+            print(
+                f'{config_name:>12} {num_threads:>8} '
+                f'{intra_op_time * 1000:>14.1f} '
+                f'{intra_op_base / intra_op_time:>7.2f}x '
+                f'{groups_time * 1000:>16.1f} '
+                f'{groups_base / groups_time:>7.2f}x'
+            )
+
+    torch.set_num_threads(default_num_threads)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark MAC Ordering: measures the throughput of the receptive
+    field gathers, and the evaluation forward pass time, of layers on
+    large grids storing their MACs in row-major, Z-order and Hilbert
+    order.
+"""
+
+
+import argparse
+
+import torch
+
+from benchmark_utils import (
+    create_layer_input, create_sparsey_layer, time_function
+)
+from sparseypy.core.model_layers.sparsey_layer import SparseyLayer
+
+
+MAC_ORDERINGS = ['row_major', 'z_order', 'hilbert']
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    Parses the command line arguments passed in during execution.
+
+    Returns:
+        Namespace containing the parsed arguments.
+    """
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        '--grid_sizes', type=int, nargs='+', default=[64, 128],
+        help='The number of rows and columns of the MAC grids.'
+    )
+
+    parser.add_argument(
+        '--receptive_field_size', type=float, default=0.03,
+        help='The receptive field radius of the MACs.'
+    )
+
+    parser.add_argument(
+        '--batch_size', type=int, default=4,
+        help='The number of samples in each batch.'
+    )
+
+    parser.add_argument(
+        '--num_repeats', type=int, default=5,
+        help='The number of timed calls.'
+    )
+
+    return parser.parse_args()
+
+
+def create_layer(grid_size: int, receptive_field_size: float,
+                 mac_ordering: str) -> SparseyLayer:
+    """
+    Creates a layer with the CSR layout on a square grid, over a
+    previous layer on a grid of the same size.
+
+    Args:
+        grid_size (int): the number of rows and columns of the grids.
+        receptive_field_size (float): the receptive field radius.
+        mac_ordering (str): the order to store the MACs in.
+
+    Returns:
+        (SparseyLayer): the layer.
+    """
+    return create_sparsey_layer(
+        num_macs=grid_size ** 2, num_cms_per_mac=1, num_neurons_per_cm=2,
+        mac_grid_num_rows=grid_size, mac_grid_num_cols=grid_size,
+        mac_receptive_field_size=receptive_field_size,
+        prev_layer_num_macs=grid_size ** 2,
+        prev_layer_mac_grid_num_rows=grid_size,
+        prev_layer_mac_grid_num_cols=grid_size,
+        receptive_field_layout='csr', mac_ordering=mac_ordering
+    )
+
+
+def gather_receptive_fields(layer: SparseyLayer,
+                            x: torch.Tensor) -> None:
+    """
+    Gathers the inputs of every receptive field bucket of a layer,
+    in the order the layer stores them.
+
+    Args:
+        layer (SparseyLayer): the layer.
+        x (torch.Tensor): the layer input, padded with an empty MAC.
+    """
+    for bucket in layer.rf_buckets:
+        x[:, bucket.input_connections]
+
+
+def main():
+    """
+    Runs the MAC ordering benchmark.
+    """
+    args = parse_args()
+
+    print(
+        f"{'grid':>9} {'ordering':>10} {'gather (ms)':>12} "
+        f"{'GB/s':>7} {'forward (ms)':>13} {'speedup':>8}"
+    )
+
+    for grid_size in args.grid_sizes:
+        torch.manual_seed(0)
+
+        layers = {
+            mac_ordering: create_layer(
+                grid_size, args.receptive_field_size, mac_ordering
+            ) for mac_ordering in MAC_ORDERINGS
+        }
+
+        layer_input = create_layer_input(
+            layers['row_major'], args.batch_size
+        )
+
+        x = layers['row_major'].pad_input(layer_input)
+        gathered_bytes = sum(
+            bucket.input_connections.numel() * x.shape[-1] *
+            x.element_size() * args.batch_size
+            for bucket in layers['row_major'].rf_buckets
+        )
+
+        base_gather_time = None
+
+        for mac_ordering, layer in layers.items():
+            layer.eval()
+
+            gather_time = time_function(
+                lambda: gather_receptive_fields(layer, x), args.num_repeats
+            )
+
+            forward_time = time_function(
+                lambda: layer(layer_input), args.num_repeats
+            )
+
+            base_gather_time = base_gather_time or gather_time
+
+            print(
+                f"{f'{grid_size}x{grid_size}':>9} {mac_ordering:>10} "
+                f'{gather_time * 1000:>12.1f} '
+                f'{gathered_bytes / gather_time / 1e9:>7.2f} '
+                f'{forward_time * 1000:>13.1f} '
+                f'{base_gather_time / gather_time:>7.2f}x'
+            )
+
+
+if __name__ == "__main__":
+    main()
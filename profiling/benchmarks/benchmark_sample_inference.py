@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark Sample Inference: compares the per-sample latency of
+    evaluation forward passes of batches of one with the single-sample
+    inference path of the model, reporting the median and 99th
+    percentile latencies on the MNIST_1K profiling configurations.
+"""
+
+
+import argparse
+import time
+from typing import Callable, List
+
+import torch
+
+from benchmark_utils import (
+    PROFILING_CONFIGS, build_profiling_model, create_layer_input
+)
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    Parses the command line arguments passed in during execution.
+
+    Returns:
+        Namespace containing the parsed arguments.
+    """
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        '--configs', type=str, nargs='+', default=PROFILING_CONFIGS,
+        help='The profiling configurations to benchmark.'
+    )
+
+    parser.add_argument(
+        '--receptive_field_layouts', type=str, nargs='+',
+        default=['padded', 'csr'],
+        help='The receptive field layouts of the layers.'
+    )
+
+    parser.add_argument(
+        '--num_samples', type=int, default=500,
+        help='The number of timed samples.'
+    )
+
+    parser.add_argument(
+        '--num_warmup', type=int, default=20,
+        help='The number of untimed samples run first.'
+    )
+
+    return parser.parse_args()
+
+
+def measure_latencies(infer: Callable[[torch.Tensor], torch.Tensor],
+                      samples: List[torch.Tensor],
+                      num_warmup: int) -> torch.Tensor:
+    """
+    Returns the latency of inference on each sample.
+
+    Args:
+        infer (Callable[[torch.Tensor], torch.Tensor]): the function
+            running inference on a sample.
+        samples (List[torch.Tensor]): the samples.
+        num_warmup (int): the number of untimed samples run first.
+
+    Returns:
+        (torch.Tensor): the latency of each sample, in seconds.
+    """
+    for sample in samples[:num_warmup]:
+        infer(sample)
+
+    latencies = []
+
+    for sample in samples:
+        start_time = time.perf_counter()
+        infer(sample)
+        latencies.append(time.perf_counter() - start_time)
+
+    return torch.tensor(latencies, dtype=torch.float64)
+
+
+def main():
+    """
+    Runs the sample inference benchmark.
+    """
+    args = parse_args()
+    device = torch.device('cpu')
+
+    print(
+        f"{'config':>12} {'layout':>7} "
+        f"{'eval p50 (ms)':>14} {'p99':>7} "
+        f"{'sample p50 (ms)':>16} {'p99':>7} "
+        f"{'p50 speedup':>12} {'p99 speedup':>12}"
+    )
+
+    for config_name in args.configs:
+        for receptive_field_layout in args.receptive_field_layouts:
+            torch.manual_seed(0)
+
+            model = build_profiling_model(
+                config_name, device,
+                receptive_field_layout=receptive_field_layout
+            )
+            model.eval()
+
+            samples = list(
+                create_layer_input(model.layers[0], args.num_samples)
+            )
+
+            def eval_forward(sample: torch.Tensor) -> torch.Tensor:
+                return model(sample.unsqueeze(0))[0]
+
+            quantiles = torch.tensor([0.5, 0.99], dtype=torch.float64)
+            eval_p50, eval_p99 = torch.quantile(
+                measure_latencies(eval_forward, samples, args.num_warmup),
+                quantiles
+            ).tolist()
+            sample_p50, sample_p99 = torch.quantile(
+                measure_latencies(
+                    model.infer_sample, samples, args.num_warmup
+                ), quantiles
+            ).tolist()
+
+            print(
+                f'{config_name:>12} {receptive_field_layout:>7} '
+                f'{eval_p50 * 1000:>14.3f} {eval_p99 * 1000:>7.3f} '
+                f'{sample_p50 * 1000:>16.3f} {sample_p99 * 1000:>7.3f} '
+                f'{eval_p50 / sample_p50:>11.2f}x '
+                f'{eval_p99 / sample_p99:>11.2f}x'
+            )
+
+
+if __name__ == "__main__":
+    main()
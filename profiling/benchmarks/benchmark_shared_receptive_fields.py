@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark Shared Receptive Fields: compares the evaluation forward
+    pass and training step times of CSR layers whose MACs each gather
+    their own inputs with layers that gather every distinct receptive
+    field once, for growing receptive field radii.
+"""
+
+
+import argparse
+
+import torch
+
+from benchmark_utils import (
+    create_layer_input, create_sparsey_layer, time_function
+)
+from sparseypy.access_objects.models.model import Model
+from sparseypy.core.optimizers.hebbian import HebbianOptimizer
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    Parses the command line arguments passed in during execution.
+
+    Returns:
+        Namespace containing the parsed arguments.
+    """
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        '--receptive_field_sizes', type=float, nargs='+',
+        default=[0.2, 0.4, 0.8, 1.5],
+        help='The receptive field radii of the MACs.'
+    )
+
+    parser.add_argument(
+        '--grid_size', type=int, default=16,
+        help='The number of rows and columns of the MAC grid.'
+    )
+
+    parser.add_argument(
+        '--prev_grid_size', type=int, default=8,
+        help='The number of rows and columns of the previous layer grid.'
+    )
+
+    parser.add_argument(
+        '--batch_size', type=int, default=16,
+        help='The number of samples in each batch.'
+    )
+
+    parser.add_argument(
+        '--num_repeats', type=int, default=5,
+        help='The number of timed calls.'
+    )
+
+    return parser.parse_args()
+
+
+def create_model(grid_size: int, prev_grid_size: int,
+                 receptive_field_size: float,
+                 shared_receptive_fields: bool) -> Model:
+    """
+    Creates a one-layer model with the CSR layout.
+
+    Args:
+        grid_size (int): the number of rows and columns of the grid.
+        prev_grid_size (int): the number of rows and columns of the
+            previous layer grid.
+        receptive_field_size (float): the receptive field radius.
+        shared_receptive_fields (bool): whether the layer shares the
+            gathers of identical receptive fields.
+
+    Returns:
+        (Model): the model.
+    """
+    model = Model(torch.device('cpu'))
+    model.add_layer(
+        create_sparsey_layer(
+            num_macs=grid_size ** 2, num_cms_per_mac=4,
+            num_neurons_per_cm=8,
+            mac_grid_num_rows=grid_size, mac_grid_num_cols=grid_size,
+            mac_receptive_field_size=receptive_field_size,
+            prev_layer_num_macs=prev_grid_size ** 2,
+            prev_layer_mac_grid_num_rows=prev_grid_size,
+            prev_layer_mac_grid_num_cols=prev_grid_size,
+            receptive_field_layout='csr',
+            shared_receptive_fields=shared_receptive_fields
+        )
+    )
+
+    return model
+
+
+def main():
+    """
+    Runs the shared receptive fields benchmark.
+    """
+    args = parse_args()
+
+    print(
+        f"{'radius':>7} {'rf size':>8} {'macs':>6} {'shared sets':>12} "
+        f"{'buckets':>8} {'shared':>7} "
+        f"{'eval (ms)':>10} {'shared':>8} {'speedup':>8} "
+        f"{'train (ms)':>11} {'shared':>8} {'speedup':>8}"
+    )
+
+    for receptive_field_size in args.receptive_field_sizes:
+        eval_times, train_times, num_buckets = [], [], []
+
+        for shared_receptive_fields in (False, True):
+            torch.manual_seed(0)
+
+            model = create_model(
+                args.grid_size, args.prev_grid_size, receptive_field_size,
+                shared_receptive_fields
+            )
+            optimizer = HebbianOptimizer(model, torch.device('cpu'))
+            layer = model.layers[0]
+            layer_input = create_layer_input(layer, args.batch_size)
+            num_buckets.append(len(layer.rf_buckets))
+
+            def train_step() -> None:
+                model(layer_input)
+                optimizer.step()
+
+            model.train()
+            train_times.append(time_function(train_step, args.num_repeats))
+
+            model.eval()
+            eval_times.append(
+                time_function(lambda: model(layer_input), args.num_repeats)
+            )
+
+        # MACs in buckets with little sharing gather their own inputs.
+        num_input_sets = 0
+
+        if layer.input_set_offsets is not None:
+            num_input_sets = layer.input_set_offsets.shape[0] - 1
+
+        print(
+            f'{receptive_field_size:>7.2f} '
+            f'{layer.receptive_field_num_macs:>8} '
+            f'{layer.num_macs:>6} '
+            f'{num_input_sets:>12} '
+            f'{num_buckets[0]:>8} {num_buckets[1]:>7} '
+            f'{eval_times[0] * 1000:>10.2f} {eval_times[1] * 1000:>8.2f} '
+            f'{eval_times[0] / eval_times[1]:>7.2f}x '
+            f'{train_times[0] * 1000:>11.2f} {train_times[1] * 1000:>8.2f} '
+            f'{train_times[0] / train_times[1]:>7.2f}x'
+        )
+
+
+if __name__ == "__main__":
+    main()
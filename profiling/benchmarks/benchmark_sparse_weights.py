@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark Sparse Weights: compares the weight memory and the training
+    step time of a profiling configuration with dense and sparse
+    weight storage.
+"""
+
+
+import argparse
+import time
+
+import torch
+
+from benchmark_utils import build_profiling_model
+from sparseypy.core.optimizers.hebbian import HebbianOptimizer
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    Parses the command line arguments passed in during execution.
+
+    Returns:
+        Namespace containing the parsed arguments.
+    """
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        '--config', type=str, default='small_macs',
+        help='The profiling configuration to benchmark.'
+    )
+
+    parser.add_argument(
+        '--batch_size', type=int, default=16,
+        help='The number of samples in each batch.'
+    )
+
+    parser.add_argument(
+        '--num_steps', type=int, default=20,
+        help='The number of timed training steps.'
+    )
+
+    parser.add_argument(
+        '--compaction_interval', type=int, default=5,
+        help='The number of steps between weight compactions.'
+    )
+
+    return parser.parse_args()
+
+
+def main():
+    """
+    Runs the sparse weight storage benchmark.
+    """
+    args = parse_args()
+    device = torch.device('cpu')
+
+    print(
+        f"{'storage':>8} {'step (ms)':>10} {'weights (MB)':>13} "
+        f"{'timesteps (MB)':>15}"
+    )
+
+    final_weights = []
+
+    for weight_storage in ('dense', 'sparse'):
+        torch.manual_seed(0)
+
+        model = build_profiling_model(
+            args.config, device, weight_storage=weight_storage,
+            weight_compaction_interval=args.compaction_interval
+        )
+
+        optimizer = HebbianOptimizer(model, device)
+        model.train()
+
+        step_time = 0.0
+
+        for step in range(args.num_steps):
+            data = torch.lt(
+                torch.rand((args.batch_size, 784, 1)), 0.2
+            ).float()
+
+            torch.manual_seed(step)
+            start_time = time.perf_counter()
+
+            model(data)
+            optimizer.step()
+
+            step_time += time.perf_counter() - start_time
+
+        weight_bytes = sum(
+            param.numel() * param.element_size()
+            for param in model.parameters()
+        ) + sum(
+            layer.weight_rows.numel() * layer.weight_rows.element_size()
+            for layer in model.children()
+            if layer.weight_storage == 'sparse'
+        )
+
+        timestep_bytes = sum(
+            timesteps.numel() * timesteps.element_size()
+            for timesteps in optimizer.timesteps.values()
+        )
+
+        final_weights.append(
+            [layer.get_dense_weights() for layer in model.children()]
+        )
+
+        print(
+            f'{weight_storage:>8} {step_time / args.num_steps * 1000:>10.1f} '
+            f'{weight_bytes / 2 ** 20:>13.2f} {timestep_bytes / 2 ** 20:>15.2f}'
+        )
+
+    print(
+        'identical weights:',
+        all(
+            torch.equal(dense_weights, sparse_weights)
+            for dense_weights, sparse_weights in zip(*final_weights)
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark Utils: helpers shared by the layer and model benchmarks.
+"""
+
+
+import os
+import time
+from typing import Callable
+
+import torch
+
+from sparseypy.access_objects.models.model import Model
+from sparseypy.access_objects.models.model_builder import ModelBuilder
+from sparseypy.cli.config_validation.validate_config import (
+    validate_config, get_config_info
+)
+from sparseypy.core.model_layers.sparsey_layer import SparseyLayer
+
+
+PROFILING_DIRECTORY = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'mnist_1k'
+)
+
+PROFILING_CONFIGS = ['small_macs', 'medium_macs', 'big_macs']
+
+
+def load_network_config(config_name: str) -> dict:
+    """
+    Loads and validates the network config of one of the
+    MNIST_1K profiling configurations.
+
+    Args:
+        config_name (str): the name of the profiling configuration,
+            e.g. 'small_macs'.
+
+    Returns:
+        (dict): the validated model config.
+    """
+    config_info = get_config_info(
+        os.path.join(
+            PROFILING_DIRECTORY, config_name, 'configs', 'network.yaml'
+        )
+    )
+
+    return validate_config(config_info, 'model', 'sparsey')
+
+
+def build_profiling_model(config_name: str, device: torch.device,
+                          **layer_params) -> Model:
+    """
+    Builds the model of one of the MNIST_1K profiling configurations,
+    optionally overriding layer parameters in every layer.
+
+    Args:
+        config_name (str): the name of the profiling configuration.
+        device (torch.device): the device to build the model on.
+        layer_params: parameters to override in every layer.
+
+    Returns:
+        (Model): the constructed model.
+    """
+    model_config = load_network_config(config_name)
+
+    for layer_config in model_config['layers']:
+        layer_config['params'].update(layer_params)
+
+    return ModelBuilder.build_model(model_config, device)
+
+
+def create_sparsey_layer(**layer_params) -> SparseyLayer:
+    """
+    Creates a SparseyLayer with default parameters,
+    overridden by any parameters passed in.
+
+    Args:
+        layer_params: parameters to override.
+
+    Returns:
+        (SparseyLayer): the constructed layer.
+    """
+    params = {
+        'autosize_grid': False, 'grid_layout': 'rect',
+        'num_macs': 16, 'num_cms_per_mac': 8, 'num_neurons_per_cm': 8,
+        'mac_grid_num_rows': 4, 'mac_grid_num_cols': 4,
+        'mac_receptive_field_size': 0.5,
+        'prev_layer_num_cms_per_mac': 8,
+        'prev_layer_num_neurons_per_cm': 8,
+        'prev_layer_mac_grid_num_rows': 4,
+        'prev_layer_mac_grid_num_cols': 4,
+        'prev_layer_num_macs': 16, 'prev_layer_grid_layout': 'rect',
+        'layer_index': 0, 'sigmoid_phi': 5.0, 'sigmoid_lambda': 28.0,
+        'saturation_threshold': 0.5, 'permanence_steps': 10,
+        'permanence_convexity': 0.3, 'activation_threshold_min': 0.2,
+        'activation_threshold_max': 1.0, 'min_familiarity': 0.2,
+        'sigmoid_chi': 2.5, 'device': torch.device('cpu')
+    }
+
+    params.update(layer_params)
+
+    return SparseyLayer(**params)
+
+
+def create_layer_input(layer: SparseyLayer, batch_size: int,
+                       active_mac_fraction: float = 0.5) -> torch.Tensor:
+    """
+    Creates a random, correctly coded input for a layer: every CM of
+    every active input MAC contains exactly one active neuron.
+
+    Args:
+        layer (SparseyLayer): the layer to create input for.
+        batch_size (int): the number of samples.
+        active_mac_fraction (float): the probability of each input
+            MAC being active.
+
+    Returns:
+        (torch.Tensor): the layer input.
+    """
+    num_input_macs = layer.prev_layer_output_shape[0]
+
+    layer_input = torch.zeros(
+        (
+            batch_size, num_input_macs,
+            layer.prev_layer_num_cms_per_mac,
+            layer.prev_layer_num_neurons_per_cm
+        ), dtype=torch.float32, device=layer.device
+    )
+
+    layer_input.scatter_(
+        3, torch.randint(
+            0, layer.prev_layer_num_neurons_per_cm,
+            (*layer_input.shape[:3], 1), device=layer.device
+        ), 1.0
+    )
+
+    layer_input *= torch.lt(
+        torch.rand((batch_size, num_input_macs, 1, 1), device=layer.device),
+        active_mac_fraction
+    )
+
+    return layer_input.view(batch_size, num_input_macs, -1)
+
+
+def time_function(function: Callable, num_repeats: int = 10,
+                  num_warmup: int = 2) -> float:
+    """
+    Returns the mean wall-clock time of a function call in seconds.
+
+    Args:
+        function (Callable): the function to time.
+        num_repeats (int): the number of timed calls.
+        num_warmup (int): the number of untimed calls made first.
+
+    Returns:
+        (float): the mean time per call in seconds.
+    """
+    for _ in range(num_warmup):
+        function()
+
+    start_time = time.perf_counter()
+
+    for _ in range(num_repeats):
+        function()
+
+    return (time.perf_counter() - start_time) / num_repeats
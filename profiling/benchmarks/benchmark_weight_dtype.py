@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark Weight Dtype: compares the weight memory, throughput and
+    results of a profiling configuration with weights stored in
+    float32 and in lower precision dtypes.
+"""
+
+
+import argparse
+import time
+
+import torch
+
+from benchmark_utils import build_profiling_model
+from sparseypy.core.metrics.basis_set_size import BasisSetSizeMetric
+from sparseypy.core.optimizers.hebbian import HebbianOptimizer
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    Parses the command line arguments passed in during execution.
+
+    Returns:
+        Namespace containing the parsed arguments.
+    """
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        '--config', type=str, default='small_macs',
+        help='The profiling configuration to benchmark.'
+    )
+
+    parser.add_argument(
+        '--dtypes', type=str, nargs='+',
+        default=['float32', 'float16', 'bfloat16', 'uint8'],
+        help='The weight dtypes to benchmark.'
+    )
+
+    parser.add_argument(
+        '--batch_size', type=int, default=16,
+        help='The number of samples in each batch.'
+    )
+
+    parser.add_argument(
+        '--num_steps', type=int, default=20,
+        help='The number of training steps.'
+    )
+
+    return parser.parse_args()
+
+
+def main():
+    """
+    Runs the weight dtype benchmark.
+
+    Every dtype trains its own model on the same data, which gives the
+    training throughput and the mean basis set size per MAC. The
+    weights trained in the first dtype are then loaded into a model of
+    each dtype, and the share of evaluation output codes that match
+    those of the first dtype is reported as the code agreement.
+    """
+    args = parse_args()
+    device = torch.device('cpu')
+
+    torch.manual_seed(0)
+
+    batches = [
+        torch.lt(torch.rand((args.batch_size, 784, 1)), 0.2).float()
+        for _ in range(args.num_steps)
+    ]
+
+    print(
+        f"{'dtype':>9} {'weights (MB)':>13} {'train (ms)':>11} "
+        f"{'eval (ms)':>10} {'basis set size':>15} {'code agreement':>15}"
+    )
+
+    reference_state = None
+    reference_outputs = None
+
+    for weight_dtype in args.dtypes:
+        model = build_profiling_model(
+            args.config, device, weight_dtype=weight_dtype
+        )
+
+        optimizer = HebbianOptimizer(model, device)
+        metric = BasisSetSizeMetric(model, device)
+        model.train()
+
+        train_time = 0.0
+
+        for step, data in enumerate(batches):
+            torch.manual_seed(step)
+            start_time = time.perf_counter()
+
+            model(data)
+            optimizer.step()
+
+            train_time += time.perf_counter() - start_time
+            metric.compute(model, data, None, True)
+
+        basis_set_sizes = [
+            len(codes) for layer_codes in metric.codes for codes in layer_codes
+        ]
+
+        weight_bytes = sum(
+            param.numel() * param.element_size()
+            for param in model.parameters()
+        )
+
+        if reference_state is None:
+            reference_state = model.state_dict()
+
+        model.load_state_dict(reference_state)
+        model.eval()
+
+        start_time = time.perf_counter()
+        outputs = [model(data) for data in batches]
+        eval_time = time.perf_counter() - start_time
+
+        if reference_outputs is None:
+            reference_outputs = outputs
+
+        code_agreement = sum(
+            torch.sum(torch.all(torch.eq(output, reference), dim=2)).item()
+            for output, reference in zip(outputs, reference_outputs)
+        ) / sum(output.shape[0] * output.shape[1] for output in outputs)
+
+        print(
+            f'{weight_dtype:>9} {weight_bytes / 2 ** 20:>13.2f} '
+            f'{train_time / len(batches) * 1000:>11.1f} '
+            f'{eval_time / len(batches) * 1000:>10.1f} '
+            f'{sum(basis_set_sizes) / len(basis_set_sizes):>15.2f} '
+            f'{code_agreement:>15.4f}'
+        )
+
+
+if __name__ == "__main__":
+    main()
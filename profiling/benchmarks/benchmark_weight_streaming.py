@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark Weight Streaming: compares the training step time of a
+    layer keeping its weights in memory with that of a layer streaming
+    them from a memory-mapped file through windows of several sizes,
+    with the file either in the page cache or paged out before every
+    step, as happens once the files outgrow the page cache.
+"""
+
+
+import argparse
+import mmap
+import os
+import tempfile
+import time
+
+import torch
+
+from benchmark_utils import create_layer_input, create_sparsey_layer
+from sparseypy.access_objects.models.model import Model
+from sparseypy.core.optimizers.hebbian import HebbianOptimizer
+
+
+# not every Python version names MADV_PAGEOUT (Linux 5.4 and later).
+MADV_PAGEOUT = getattr(mmap, 'MADV_PAGEOUT', 21)
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    Parses the command line arguments passed in during execution.
+
+    Returns:
+        Namespace containing the parsed arguments.
+    """
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        '--grid_size', type=int, default=24,
+        help='The number of rows and columns of the MAC grids.'
+    )
+
+    parser.add_argument(
+        '--receptive_field_size', type=float, default=0.15,
+        help='The receptive field size of the MACs.'
+    )
+
+    parser.add_argument(
+        '--batch_size', type=int, default=16,
+        help='The number of samples in each batch.'
+    )
+
+    parser.add_argument(
+        '--num_steps', type=int, default=5,
+        help='The number of timed training steps.'
+    )
+
+    parser.add_argument(
+        '--weight_dir', type=str, default=None,
+        help='The directory to create the weight files in.'
+    )
+
+    return parser.parse_args()
+
+
+def get_meminfo_bytes(field: str) -> int:
+    """
+    Returns a field of /proc/meminfo in bytes.
+
+    Args:
+        field (str): the name of the field, e.g. 'Cached'.
+
+    Returns:
+        (int): the value of the field, or 0 if it cannot be read.
+    """
+    try:
+        with open('/proc/meminfo', 'r', encoding='utf-8') as meminfo:
+            for line in meminfo:
+                if line.startswith(f'{field}:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    return 0
+
+
+def page_out(optimizer: HebbianOptimizer, layer) -> None:
+    """
+    Asks the kernel to evict the weight and timestep files of a layer
+    from the page cache, so that the next step reads them from disk.
+
+    Args:
+        optimizer (HebbianOptimizer): the optimizer of the layer.
+        layer (SparseyLayer): the layer.
+    """
+    for window in (layer.weight_window, *optimizer.timestep_windows.values()):
+        window.mapping._mmap.madvise(MADV_PAGEOUT)
+
+
+def main():
+    """
+    Runs the weight streaming benchmark.
+    """
+    args = parse_args()
+    device = torch.device('cpu')
+
+    layer_params = {
+        'num_macs': args.grid_size ** 2,
+        'mac_grid_num_rows': args.grid_size,
+        'mac_grid_num_cols': args.grid_size,
+        'prev_layer_num_macs': args.grid_size ** 2,
+        'prev_layer_mac_grid_num_rows': args.grid_size,
+        'prev_layer_mac_grid_num_cols': args.grid_size,
+        'mac_receptive_field_size': args.receptive_field_size,
+        'sampling_seed': 0
+    }
+
+    weight_bytes = torch.Size(
+        create_sparsey_layer(
+            **layer_params, device=torch.device('meta')
+        ).dense_weights_shape
+    ).numel() * 4
+
+    print(
+        f'weights: {weight_bytes / 2 ** 20:.0f} MB (plus as many of '
+        f'optimizer timesteps), page cache: '
+        f"{get_meminfo_bytes('Cached') / 2 ** 20:.0f} MB, available "
+        f"memory: {get_meminfo_bytes('MemAvailable') / 2 ** 20:.0f} MB"
+    )
+    print(
+        f"{'weights':>8} {'window (MB)':>12} {'cache':>6} "
+        f"{'step (ms)':>10} {'weights (MB/s)':>15}"
+    )
+
+    torch.manual_seed(0)
+
+    # the inputs only depend on the previous layer.
+    input_layer = create_sparsey_layer(**dict(
+        layer_params, num_macs=1, mac_grid_num_rows=1, mac_grid_num_cols=1
+    ))
+
+    data = [
+        create_layer_input(input_layer, args.batch_size)
+        for _ in range(args.num_steps + 1)
+    ]
+
+    runs = [('memory', None, 'warm')] + [
+        ('file', max_resident_bytes, cache)
+        for max_resident_bytes in (None, weight_bytes // 4, weight_bytes // 16)
+        for cache in ('warm', 'cold')
+    ]
+
+    final_weights = []
+
+    with tempfile.TemporaryDirectory(dir=args.weight_dir) as weight_dir:
+        for run_index, (storage, max_resident_bytes, cache) in enumerate(runs):
+            weight_file = None
+
+            if storage == 'file':
+                weight_file = os.path.join(weight_dir, f'weights_{run_index}')
+
+            layer = create_sparsey_layer(
+                **layer_params, weight_file=weight_file,
+                max_resident_weight_bytes=max_resident_bytes
+            )
+
+            model = Model(device)
+            model.add_layer(layer)
+            optimizer = HebbianOptimizer(model, device)
+            model.train()
+
+            step_time = 0.0
+
+            for step, step_data in enumerate(data):
+                if storage == 'file' and cache == 'cold' and step:
+                    page_out(optimizer, layer)
+
+                start_time = time.perf_counter()
+
+                model(step_data)
+                optimizer.step()
+
+                # the first step creates the timesteps, and is untimed.
+                if step:
+                    step_time += time.perf_counter() - start_time
+
+            step_time /= args.num_steps
+            final_weights.append(layer.weights.detach().clone())
+
+            window_mb = '-' if max_resident_bytes is None else (
+                f'{max_resident_bytes / 2 ** 20:.1f}'
+            )
+
+            print(
+                f'{storage:>8} {window_mb:>12} {cache:>6} '
+                f'{step_time * 1000:>10.1f} '
+                f'{weight_bytes / 2 ** 20 / step_time:>15.1f}'
+            )
+
+            del model, optimizer, layer
+
+    print(
+        'identical weights:',
+        all(
+            torch.equal(final_weights[0], weights)
+            for weights in final_weights[1:]
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
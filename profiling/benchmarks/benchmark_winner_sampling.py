@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark Winner Sampling: compares the time taken to sample the
+    active neurons of every layer of the MNIST_1K profiling
+    configurations with torch.distributions.Categorical and with the
+    counter-based sampler, and checks that seeded training forward
+    passes draw the same neurons when the batch is split in two.
+"""
+
+
+import argparse
+
+import torch
+from torch.distributions.categorical import Categorical
+
+from benchmark_utils import (
+    PROFILING_CONFIGS, build_profiling_model, time_function
+)
+from sparseypy.core.model_layers.winner_sampling import sample_winners
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    Parses the command line arguments passed in during execution.
+
+    Returns:
+        Namespace containing the parsed arguments.
+    """
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        '--configs', type=str, nargs='+', default=PROFILING_CONFIGS,
+        help='The profiling configurations to benchmark.'
+    )
+
+    parser.add_argument(
+        '--batch_size', type=int, default=64,
+        help='The number of samples in each batch.'
+    )
+
+    parser.add_argument(
+        '--num_repeats', type=int, default=10,
+        help='The number of timed draws.'
+    )
+
+    return parser.parse_args()
+
+
+def main():
+    """
+    Runs the winner sampling benchmark.
+    """
+    args = parse_args()
+    device = torch.device('cpu')
+
+    print(
+        f"{'config':>12} {'layer':>6} {'categorical (ms)':>17} "
+        f"{'counter (ms)':>13} {'speedup':>8}"
+    )
+
+    for config_name in args.configs:
+        torch.manual_seed(0)
+
+        model = build_profiling_model(config_name, device, sampling_seed=0)
+
+        for layer in model.children():
+            scores = torch.rand(
+                (
+                    args.batch_size, layer.num_macs,
+                    layer.num_cms_per_mac, layer.num_neurons_per_cm
+                )
+            ).add_(1e-6)
+
+            sample_indices = torch.arange(args.batch_size).unsqueeze(1)
+            mac_indices = torch.arange(layer.num_macs).unsqueeze(0)
+
+            categorical_time = time_function(
+                lambda: Categorical(probs=scores).sample(), args.num_repeats
+            )
+
+            counter_time = time_function(
+                lambda: sample_winners(
+                    scores, 0, 0, layer.layer_index,
+                    sample_indices, mac_indices
+                ), args.num_repeats
+            )
+
+            print(
+                f'{config_name:>12} {layer.layer_index:>6} '
+                f'{categorical_time * 1000:>17.2f} '
+                f'{counter_time * 1000:>13.2f} '
+                f'{categorical_time / counter_time:>7.2f}x'
+            )
+
+        data = torch.lt(torch.rand((args.batch_size, 784, 1)), 0.2).float()
+        half = args.batch_size // 2
+
+        model.train()
+        model.set_sampling_position(0)
+        full_output = model(data)
+
+        model.set_sampling_position(0)
+        first_output = model(data[:half])
+
+        model.set_sampling_position(0, half)
+        second_output = model(data[half:])
+
+        print(
+            f'{config_name:>12} identical draws with a split batch:',
+            torch.equal(
+                full_output, torch.cat((first_output, second_output))
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark Workspace Allocations: counts the tensors allocated by the
+    steady-state training forward passes and optimizer steps of the
+    MNIST_1K profiling configurations, with padded or CSR receptive
+    fields and with or without active MAC compaction, with and without
+    reused workspace buffers, and times both. With compaction, the
+    tensors of the active (sample, MAC) pairs are allocated even with
+    reused buffers, since their number changes with every batch.
+
+    Allocations are counted at the level of torch operators: every
+    operator output whose storage is not one of the operator's inputs
+    counts as an allocation. Memory allocated inside an operator
+    kernel is not seen.
+"""
+
+
+import argparse
+import time
+
+import torch
+from torch.utils._python_dispatch import TorchDispatchMode
+from torch.utils._pytree import tree_flatten
+
+from benchmark_utils import PROFILING_CONFIGS, build_profiling_model
+from sparseypy.core.optimizers.hebbian import HebbianOptimizer
+
+
+# the layer parameters of each benchmarked variant.
+VARIANTS = {
+    'padded': {'receptive_field_layout': 'padded'},
+    'csr': {'receptive_field_layout': 'csr'},
+    'compaction': {'active_mac_compaction': True}
+}
+
+
+class AllocationCounter(TorchDispatchMode):
+    """
+    AllocationCounter: counts the tensors allocated by the torch
+        operators run while it is active.
+
+    Attributes:
+        num_allocations (int): the number of allocated tensors.
+        num_bytes (int): the total size of the allocated tensors.
+    """
+    def __init__(self) -> None:
+        super().__init__()
+
+        self.num_allocations = 0
+        self.num_bytes = 0
+
+
+    def __torch_dispatch__(self, func, types, args=(), kwargs=None):
+        kwargs = kwargs or {}
+
+        input_storages = {
+            tensor.untyped_storage().data_ptr()
+            for tensor in tree_flatten((args, kwargs))[0]
+            if isinstance(tensor, torch.Tensor)
+        }
+
+        outputs = func(*args, **kwargs)
+
+        for tensor in tree_flatten(outputs)[0]:
+            if (
+                isinstance(tensor, torch.Tensor) and
+                tensor.untyped_storage().nbytes() > 0 and
+                tensor.untyped_storage().data_ptr() not in input_storages
+            ):
+                self.num_allocations += 1
+                self.num_bytes += tensor.untyped_storage().nbytes()
+
+        return outputs
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    Parses the command line arguments passed in during execution.
+
+    Returns:
+        Namespace containing the parsed arguments.
+    """
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        '--configs', type=str, nargs='+', default=PROFILING_CONFIGS,
+        help='The profiling configurations to benchmark.'
+    )
+
+    parser.add_argument(
+        '--variants', type=str, nargs='+', default=list(VARIANTS),
+        choices=list(VARIANTS),
+        help='The receptive field layouts and forward passes to benchmark.'
+    )
+
+    parser.add_argument(
+        '--batch_size', type=int, default=16,
+        help='The number of samples in each batch.'
+    )
+
+    parser.add_argument(
+        '--num_warmup_steps', type=int, default=3,
+        help='The number of training steps run before measuring.'
+    )
+
+    parser.add_argument(
+        '--num_repeats', type=int, default=5,
+        help='The number of timed training steps.'
+    )
+
+    return parser.parse_args()
+
+
+def main():
+    """
+    Runs the workspace allocations benchmark.
+    """
+    args = parse_args()
+    device = torch.device('cpu')
+
+    print(
+        f"{'config':>12} {'variant':>11} {'reuse':>6} {'forward allocs':>15} "
+        f"{'forward MB':>11} {'step allocs':>12} {'step MB':>8} "
+        f"{'time (ms)':>10}"
+    )
+
+    runs = [
+        (config_name, variant, reuse_workspace)
+        for config_name in args.configs
+        for variant in args.variants
+        for reuse_workspace in (False, True)
+    ]
+
+    for config_name, variant, reuse_workspace in runs:
+        torch.manual_seed(0)
+
+        model = build_profiling_model(
+            config_name, device, sampling_seed=0,
+            reuse_workspace=reuse_workspace, **VARIANTS[variant]
+        )
+
+        optimizer = HebbianOptimizer(
+            model, device, reuse_workspace=reuse_workspace
+        )
+
+        model.train()
+
+        data = torch.lt(
+            torch.rand((args.batch_size, 784, 1)), 0.2
+        ).float()
+
+        for _ in range(args.num_warmup_steps):
+            model(data)
+            optimizer.step()
+
+        with AllocationCounter() as forward_counter:
+            model(data)
+
+        with AllocationCounter() as step_counter:
+            optimizer.step()
+
+        start_time = time.perf_counter()
+
+        for _ in range(args.num_repeats):
+            model(data)
+            optimizer.step()
+
+        step_time = (time.perf_counter() - start_time) / args.num_repeats
+
+        print(
+            f'{config_name:>12} {variant:>11} {str(reuse_workspace):>6} '
+            f'{forward_counter.num_allocations:>15} '
+            f'{forward_counter.num_bytes / 2 ** 20:>11.1f} '
+            f'{step_counter.num_allocations:>12} '
+            f'{step_counter.num_bytes / 2 ** 20:>8.1f} '
+            f'{step_time * 1000:>10.1f}'
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark Workspace Budget: measures the training step time and the
+    peak workspace used by the layers and the Hebbian optimizer of a
+    profiling configuration under different workspace budgets.
+"""
+
+
+import argparse
+import time
+
+import torch
+
+from benchmark_utils import build_profiling_model
+from sparseypy.core.optimizers.hebbian import HebbianOptimizer
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    Parses the command line arguments passed in during execution.
+
+    Returns:
+        Namespace containing the parsed arguments.
+    """
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        '--config', type=str, default='small_macs',
+        help='The profiling configuration to benchmark.'
+    )
+
+    parser.add_argument(
+        '--budgets', type=str, nargs='+',
+        default=['none', '16777216', '4194304', '1048576', 'auto'],
+        help="Workspace budgets in bytes, 'none' or 'auto'."
+    )
+
+    parser.add_argument(
+        '--batch_size', type=int, default=64,
+        help='The number of samples in each batch.'
+    )
+
+    parser.add_argument(
+        '--num_steps', type=int, default=5,
+        help='The number of timed training steps.'
+    )
+
+    return parser.parse_args()
+
+
+def main():
+    """
+    Runs the workspace budget benchmark.
+    """
+    args = parse_args()
+    device = torch.device('cpu')
+
+    print(
+        f"{'budget':>10} {'step (ms)':>10} {'layer peak (MB)':>16} "
+        f"{'optimizer peak (MB)':>20}"
+    )
+
+    for budget in args.budgets:
+        if budget == 'none':
+            max_workspace_bytes = None
+        elif budget == 'auto':
+            max_workspace_bytes = 'auto'
+        else:
+            max_workspace_bytes = int(budget)
+
+        torch.manual_seed(0)
+
+        model = build_profiling_model(
+            args.config, device, max_workspace_bytes=max_workspace_bytes
+        )
+
+        optimizer = HebbianOptimizer(
+            model, device, max_workspace_bytes=max_workspace_bytes
+        )
+
+        model.train()
+
+        data = torch.lt(torch.rand((args.batch_size, 784, 1)), 0.2).float()
+
+        model(data)
+        optimizer.step()
+
+        layer_peak = 0
+        optimizer_peak = 0
+
+        start_time = time.perf_counter()
+
+        for _ in range(args.num_steps):
+            model(data)
+
+            layer_peak = max(
+                [layer_peak] +
+                [layer.peak_workspace_bytes for layer in model.children()]
+            )
+
+            optimizer.step()
+            optimizer_peak = max(
+                optimizer_peak, optimizer.peak_workspace_bytes
+            )
+
+        step_time = (time.perf_counter() - start_time) / args.num_steps
+
+        print(
+            f'{budget:>10} {step_time * 1000:>10.1f} '
+            f'{layer_peak / 2 ** 20:>16.2f} {optimizer_peak / 2 ** 20:>20.2f}'
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+
+"""
+Layer Autotuner: code for choosing the fastest backend of a layer
+    by benchmarking the candidates on its geometry.
+"""
+
+
+from copy import deepcopy
+import json
+import os
+import platform
+import time
+from typing import Dict, Optional
+
+import torch
+
+from sparseypy.access_objects.models.model import Model
+from sparseypy.core.model_layers.layer_factory import LayerFactory
+from sparseypy.core.optimizers.hebbian import HebbianOptimizer
+
+
+# the layer parameters that give each backend. every backend computes
+# the same outputs and weight updates, and loads the state dicts saved
+# by the others.
+LAYER_BACKENDS = {
+    'padded': {
+        'receptive_field_layout': 'padded', 'mac_ordering': 'row_major'
+    },
+    'csr': {'receptive_field_layout': 'csr', 'mac_ordering': 'row_major'},
+    'csr_z_order': {
+        'receptive_field_layout': 'csr', 'mac_ordering': 'z_order'
+    },
+    'csr_hilbert': {
+        'receptive_field_layout': 'csr', 'mac_ordering': 'hilbert'
+    }
+}
+
+DEFAULT_CACHE_PATH = os.path.join(
+    os.path.expanduser('~'), '.cache', 'sparseypy', 'layer_backends.json'
+)
+
+
+def get_hardware_key(device: torch.device) -> str:
+    """
+    Returns a description of the hardware and software a layer runs
+    on, so that decisions made on one machine are not reused on
+    another.
+
+    Args:
+        device (torch.device): the device the layer runs on.
+
+    Returns:
+        (str): the hardware key.
+    """
+    device = torch.device(device)
+
+    if device.type == 'cuda':
+        device_name = torch.cuda.get_device_name(device)
+    else:
+        device_name = platform.processor() or platform.machine()
+
+        if os.path.exists('/proc/cpuinfo'):
+            with open('/proc/cpuinfo', 'r', encoding='utf-8') as cpu_info:
+                for line in cpu_info:
+                    if line.startswith('model name'):
+                        device_name = line.split(':', 1)[1].strip()
+                        break
+
+        device_name += (
+            f' {torch.backends.cpu.get_cpu_capability()} '
+            f'{torch.get_num_threads()} threads'
+        )
+
+    return f'{device.type} {device_name} torch {torch.__version__}'
+
+
+def get_geometry_key(layer_params: dict, batch_size: int) -> str:
+    """
+    Returns a description of the geometry of a layer, made of every
+    parameter that is not chosen by the autotuner or specific to the
+    position of the layer in the model.
+
+    Args:
+        layer_params (dict): the parameters of the layer.
+        batch_size (int): the number of samples in each batch.
+
+    Returns:
+        (str): the geometry key.
+    """
+    geometry = {
+        name: value for name, value in layer_params.items()
+        if name not in (
+            'receptive_field_layout', 'mac_ordering', 'layer_index',
+            'sampling_seed', 'device'
+        )
+    }
+    geometry['batch_size'] = batch_size
+
+    return json.dumps(geometry, sort_keys=True, default=str)
+
+
+class LayerAutotuner:
+    """
+    Layer Autotuner: class to choose the backend of layers, keeping
+        its decisions in a JSON file keyed by layer geometry and
+        hardware.
+
+    Attributes:
+        cache_path (str): the location of the cache file.
+        batch_size (int): the batch size the backends are timed with.
+        num_repeats (int): the number of timed training steps of each
+            backend, of which the fastest is kept.
+        decisions (Dict[str, dict]): the cached decisions.
+    """
+    def __init__(self, cache_path: Optional[str] = None,
+                 batch_size: int = 1, num_repeats: int = 5) -> None:
+        """
+        Initializes the autotuner and loads its cache.
+
+        Args:
+            cache_path (Optional[str]): the location of the cache
+                file, or None for the default location in the user's
+                cache directory.
+            batch_size (int): the batch size to time the backends
+                with.
+            num_repeats (int): the number of timed training steps of
+                each backend.
+        """
+        self.cache_path = cache_path or DEFAULT_CACHE_PATH
+        self.batch_size = batch_size
+        self.num_repeats = num_repeats
+        self.decisions = {}
+
+        if os.path.exists(self.cache_path):
+            try:
+                with open(self.cache_path, 'r', encoding='utf-8') as cache:
+                    self.decisions = json.load(cache)
+            except (OSError, ValueError):
+                # a corrupt cache is rebuilt rather than trusted.
+                self.decisions = {}
+
+
+    def save(self) -> None:
+        """
+        Writes the cached decisions to the cache file, replacing it
+        atomically so that concurrent builds never read a partial file.
+        """
+        os.makedirs(
+            os.path.dirname(os.path.abspath(self.cache_path)), exist_ok=True
+        )
+
+        temp_path = f'{self.cache_path}.{os.getpid()}.tmp'
+
+        with open(temp_path, 'w', encoding='utf-8') as cache:
+            json.dump(self.decisions, cache, indent=2, sort_keys=True)
+
+        os.replace(temp_path, self.cache_path)
+
+
+    def time_backend(self, layer_params: dict,
+                     device: torch.device) -> float:
+        """
+        Returns the time taken by a training step of a layer: its
+        forward pass and its weight update. The inputs and the active
+        neurons are drawn from fixed seeds, so that timing the
+        backends leaves torch's random number generator untouched.
+
+        Args:
+            layer_params (dict): the parameters of the layer,
+                including its backend.
+            device (torch.device): the device to run the layer on.
+
+        Returns:
+            (float): the time of the fastest timed step, in seconds.
+        """
+        model = Model(device)
+        model.add_layer(
+            LayerFactory.create_layer(
+                'sparsey', **dict(layer_params, sampling_seed=0),
+                device=device
+            )
+        )
+
+        optimizer = HebbianOptimizer(model, device)
+        layer = model.layers[0]
+
+        generator = torch.Generator(device).manual_seed(0)
+
+        # inputs with one active neuron in each CM of half the MACs.
+        num_neurons = layer.prev_layer_output_shape[-1] // (
+            layer_params['prev_layer_num_cms_per_mac']
+        )
+        x = torch.zeros(
+            (self.batch_size, layer.prev_layer_output_shape[0],
+             layer_params['prev_layer_num_cms_per_mac'], num_neurons),
+            dtype=torch.float32, device=device
+        )
+        x.scatter_(
+            3, torch.randint(
+                0, num_neurons, (*x.shape[:3], 1), generator=generator,
+                device=device
+            ), 1.0
+        )
+        x *= torch.lt(
+            torch.rand(
+                (*x.shape[:2], 1, 1), generator=generator, device=device
+            ), 0.5
+        )
+        x = x.view(self.batch_size, layer.prev_layer_output_shape[0], -1)
+
+        model.train()
+        step_times = []
+
+        # the first step allocates the optimizer state.
+        for _ in range(self.num_repeats + 1):
+            if device.type == 'cuda':
+                torch.cuda.synchronize(device)
+
+            start_time = time.perf_counter()
+
+            model(x)
+            optimizer.step()
+
+            if device.type == 'cuda':
+                torch.cuda.synchronize(device)
+
+            step_times.append(time.perf_counter() - start_time)
+
+        return min(step_times[1:])
+
+
+    def get_cache_key(self, layer_params: dict,
+                      device: torch.device) -> str:
+        """
+        Returns the key of the cached decision for a layer.
+
+        Args:
+            layer_params (dict): the parameters of the layer.
+            device (torch.device): the device the layer will run on.
+
+        Returns:
+            (str): the cache key.
+        """
+        return (
+            f'{get_hardware_key(device)} | '
+            f'{get_geometry_key(layer_params, self.batch_size)}'
+        )
+
+
+    def select_backend(self, layer_params: dict,
+                       device: torch.device) -> str:
+        """
+        Returns the fastest backend for a layer, from the cache if
+        the same geometry was timed on the same hardware, or by timing
+        every backend otherwise. Layers built on the meta device are
+        never timed, and use the padded backend unless a decision
+        was cached.
+
+        Args:
+            layer_params (dict): the parameters of the layer.
+            device (torch.device): the device the layer will run on.
+
+        Returns:
+            (str): the name of the chosen backend in LAYER_BACKENDS.
+
+        Raises:
+            ValueError: if no backend supports the other parameters
+                of the layer, with the error of the last backend.
+        """
+        device = torch.device(device)
+        key = self.get_cache_key(layer_params, device)
+
+        if key in self.decisions:
+            return self.decisions[key]['backend']
+
+        if device.type == 'meta':
+            return 'padded'
+
+        backend_times, backend_error = {}, None
+
+        for backend, backend_params in LAYER_BACKENDS.items():
+            params = deepcopy(layer_params)
+            params.update(backend_params)
+
+            try:
+                backend_times[backend] = self.time_backend(params, device)
+            except ValueError as e:
+                # backends that do not support the other parameters
+                # of the layer are skipped.
+                backend_error = e
+
+        if not backend_times:
+            raise backend_error
+
+        backend = min(backend_times, key=backend_times.get)
+
+        self.decisions[key] = {'backend': backend, 'times': backend_times}
+        self.save()
+
+        return backend
+
+
+    def resolve_layer_params(self, layer_params: dict,
+                             device: torch.device) -> Dict:
+        """
+        Returns the parameters of a layer with its 'auto' receptive
+        field layout replaced by those of the fastest backend.
+
+        Args:
+            layer_params (dict): the parameters of the layer.
+            device (torch.device): the device the layer will run on.
+
+        Returns:
+            (Dict): the resolved parameters.
+        """
+        if layer_params.get('receptive_field_layout') != 'auto':
+            return layer_params
+
+        layer_params = dict(layer_params)
+        layer_params.update(
+            LAYER_BACKENDS[self.select_backend(layer_params, device)]
+        )
+
+        return layer_params
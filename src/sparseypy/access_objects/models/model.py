@@ -5,15 +5,39 @@ Model: file defining the Model class.
 """
 
 
+from typing import List, NamedTuple, Optional, Tuple
+
 import torch
 
 
+class ForwardResult(NamedTuple):
+    """
+    ForwardResult: the inputs and outputs of every layer of a model
+        during a fused forward pass.
+
+    Attributes:
+        layers (List[torch.nn.Module]): the layers, in order.
+        inputs (List[torch.Tensor]): the input of each layer.
+        outputs (List[torch.Tensor]): the output of each layer.
+        is_active (List[Optional[torch.Tensor]]): the boolean mask of
+            active MACs of each layer, or None for layers without one.
+    """
+    layers: List[torch.nn.Module]
+    inputs: List[torch.Tensor]
+    outputs: List[torch.Tensor]
+    is_active: List[Optional[torch.Tensor]]
+
+
 class Model(torch.nn.Module):
     """
     Model: a class to represent model objects used by the system.
 
     Attributes:
-        layers: the layers in the model.
+        layers (List[torch.nn.Module]): the layers in the model.
+        fused (bool): whether forward passes run every layer in a
+            single pass without calling the layer hooks.
+        last_result (Optional[ForwardResult]): the result of the
+            last fused forward pass.
     """
     def __init__(self, device: torch.device) -> None:
         """
@@ -23,6 +47,9 @@ class Model(torch.nn.Module):
 
         self.num_layers = 0
         self.device = device
+        self.layers = []
+        self.fused = False
+        self.last_result = None
 
 
     def add_layer(self, layer: torch.nn.Module) -> None:
@@ -30,6 +57,7 @@ class Model(torch.nn.Module):
         Adds a layer to the layers list of the model.
         """
         self.add_module(f'Layer_{self.num_layers}', layer)
+        self.layers.append(layer)
 
         self.num_layers += 1
 
@@ -48,13 +76,242 @@ class Model(torch.nn.Module):
         """
         Performs a forward pass with data x.
 
+        Samples with no active MAC in a layer are skipped by the
+        layers above it that map all-zero inputs to all-zero outputs,
+        which leave the outputs of those samples all zero. The layers
+        still receive and return full batches, so the layer hooks see
+        the same tensors as in a pass over every sample.
+
         Args:
             x (torch.Tensor): the data to pass through the model.
 
         Returns:
             (torch.Tensor): the output of the model.
         """
-        for layer_num in range(self.num_layers):
-            x = self.get_submodule(f'Layer_{layer_num}')(x)
+        if self.fused:
+            return self.forward_fused(x).outputs[-1]
+
+        samples_are_live = None
+
+        for layer in self.layers:
+            x = self.run_layer(layer, x, samples_are_live)
+            samples_are_live = self.find_live_samples(layer)
 
         return x
+
+
+    def run_layer(self, layer: torch.nn.Module, x: torch.Tensor,
+                  samples_are_live: Optional[torch.Tensor],
+                  call_hooks: bool = True) -> torch.Tensor:
+        """
+        Passes data through a layer, along with the mask of live
+        samples if the layer can skip the others.
+
+        Args:
+            layer (torch.nn.Module): the layer.
+            x (torch.Tensor): the layer input.
+            samples_are_live (Optional[torch.Tensor]): the boolean
+                mask of samples with any active MAC in the previous
+                layer, or None if unknown.
+            call_hooks (bool): whether to call the layer as a module,
+                dispatching its hooks, rather than its forward method.
+
+        Returns:
+            (torch.Tensor): the layer output.
+        """
+        forward = layer if call_hooks else layer.forward
+
+        if samples_are_live is None or not hasattr(
+            layer, 'can_skip_dead_samples'
+        ):
+            return forward(x)
+
+        return forward(x, samples_are_live=samples_are_live)
+
+
+    def find_live_samples(
+        self, layer: torch.nn.Module) -> Optional[torch.Tensor]:
+        """
+        Returns the mask of samples with any active MAC in the last
+        forward pass of a layer.
+
+        Args:
+            layer (torch.nn.Module): the layer.
+
+        Returns:
+            (Optional[torch.Tensor]): the boolean mask of live samples,
+                of size (batch_size,), or None for layers that do not
+                keep their active MACs.
+        """
+        if not hasattr(layer, 'can_skip_dead_samples'):
+            return None
+
+        return layer.find_live_samples()
+
+
+    def forward_fused(self, x: torch.Tensor) -> ForwardResult:
+        """
+        Performs a forward pass with data x, calling the forward
+        method of every layer directly rather than through the module
+        call, so that no layer hooks are dispatched. The inputs and
+        outputs of the layers are returned, and kept as last_result
+        for the optimizer and metrics to read after the step. Dead
+        samples are skipped as in forward.
+
+        Args:
+            x (torch.Tensor): the data to pass through the model.
+
+        Returns:
+            (ForwardResult): the inputs, outputs and active MACs of
+                every layer.
+        """
+        inputs, outputs, is_active = [], [], []
+        samples_are_live = None
+
+        for layer in self.layers:
+            inputs.append(x)
+            x = self.run_layer(layer, x, samples_are_live, False)
+            outputs.append(x)
+            is_active.append(getattr(layer, 'is_active', None))
+            samples_are_live = self.find_live_samples(layer)
+
+        self.last_result = ForwardResult(
+            list(self.layers), inputs, outputs, is_active
+        )
+
+        return self.last_result
+
+
+    def infer_sample(self, x: torch.Tensor) -> torch.Tensor:
+        """
+        Passes a single sample through the model for low-latency
+        inference. Each layer reuses buffers allocated by its first
+        call and takes the most active neuron of each CM, as in
+        evaluation mode, without dispatching its hooks or updating its
+        state, so the layers can stay in training mode.
+
+        The returned tensor is overwritten by the next call, and
+        should be cloned to be kept.
+
+        Args:
+            x (torch.Tensor): the sample, without a batch dimension.
+
+        Returns:
+            (torch.Tensor): the output of the model for the sample,
+                without a batch dimension.
+        """
+        input_shape = getattr(self.layers[0], 'prev_layer_output_shape', None)
+
+        if input_shape is not None and tuple(x.shape) != tuple(input_shape):
+            raise ValueError(
+                'Sample shape is incorrect! '
+                f'Expected shape {tuple(input_shape)} but received '
+                f'{tuple(x.shape)} instead.'
+            )
+
+        for layer in self.layers:
+            if hasattr(layer, 'infer_sample'):
+                x = layer.infer_sample(x)
+            else:
+                x = layer.forward(x.unsqueeze(0))[0]
+
+        return x
+
+
+    def set_fused(self, fused: bool) -> None:
+        """
+        Switches fused forward passes on or off. Layer hooks are not
+        called in fused mode, so the optimizer and metrics should be
+        created after switching it on, to read the layer inputs and
+        outputs from last_result instead.
+
+        Args:
+            fused (bool): whether to run fused forward passes.
+        """
+        self.fused = fused
+        self.last_result = None
+
+
+    def compile_forward(self) -> bool:
+        """
+        Switches every layer of the model that supports it to
+        compiled execution.
+
+        Each layer is compiled separately rather than the model as
+        a whole, so forward hooks registered on the layers keep
+        firing as in eager mode.
+
+        Returns:
+            (bool): whether every layer was compiled.
+        """
+        all_compiled = True
+
+        for layer in self.children():
+            if hasattr(layer, 'compile_forward'):
+                all_compiled = layer.compile_forward() and all_compiled
+            else:
+                all_compiled = False
+
+        return all_compiled
+
+
+    def set_sampling_position(self, step: int, sample_offset: int = 0) -> None:
+        """
+        Sets the counters of the active neuron samplers of every
+        layer, so that a run resumed from a checkpoint, or a worker
+        processing part of a larger batch, draws the same active
+        neurons as a single uninterrupted run.
+
+        Args:
+            step (int): the sampling step of the next training
+                forward pass.
+            sample_offset (int): the index of the first sample of the
+                next batch within the full batch.
+        """
+        for layer in self.modules():
+            if hasattr(layer, 'sampling_step'):
+                layer.sampling_step = step
+                layer.sampling_sample_offset = sample_offset
+
+
+    def set_incremental(self, incremental: bool) -> None:
+        """
+        Switches incremental evaluation on or off in every layer that
+        supports it. Consecutive evaluation batches are then treated
+        as the next frames of the same input streams, one per sample,
+        and each layer only recomputes the MACs whose receptive fields
+        changed since the previous batch.
+
+        Args:
+            incremental (bool): whether to run incrementally.
+        """
+        for layer in self.children():
+            if hasattr(layer, 'set_incremental'):
+                layer.set_incremental(incremental)
+
+
+    def forward_indices(
+        self, x: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Performs a forward pass with data x, passing codes between
+        layers in the index format instead of as dense tensors.
+
+        Layer hooks are not called in this mode, so it should only be
+        used for inference.
+
+        Args:
+            x (torch.Tensor): the data to pass through the model.
+
+        Returns:
+            (Tuple[torch.Tensor, torch.Tensor]): the index of the
+                active neuron in each CM of each MAC in the last layer,
+                and the boolean mask of active MACs in the last layer.
+        """
+        winners, macs_are_active = self.layers[0].encode_index_code(x)
+
+        for layer in self.layers:
+            winners, macs_are_active = layer.forward_indices(
+                winners, macs_are_active
+            )
+
+        return winners, macs_are_active
@@ -7,6 +7,7 @@ Model Builder: code for the Model Builder class.
 
 import torch
 
+from sparseypy.access_objects.models.layer_autotuner import LayerAutotuner
 from sparseypy.access_objects.models.model import Model
 from sparseypy.core.hooks.hook_factory import HookFactory
 from sparseypy.core.model_layers.layer_factory import LayerFactory
@@ -29,16 +30,76 @@ class ModelBuilder:
             (torch.nn.Module): a Model object that can be trained.
         """
         model = Model(device)
+        autotuner = None
 
         for (layer_index, layer_config) in enumerate(model_config['layers']):
             layer_config['params']['layer_index'] = layer_index
 
+            if model_config.get('sampling_seed') is not None:
+                layer_config['params']['sampling_seed'] = model_config[
+                    'sampling_seed'
+                ]
+
+            layer_name = layer_config['name']
+            layer_params = dict(layer_config['params'])
+
+            # the MACs of model parallel layers are split between the
+            # processes of the default process group.
+            if layer_params.pop('model_parallel', False):
+                # every process would time the full layer, and could
+                # pick a different backend from noisy timings.
+                if layer_params.get('receptive_field_layout') == 'auto':
+                    raise ValueError(
+                        'Invalid receptive field layout! Expected an '
+                        'explicit layout for model parallel layer '
+                        f"{layer_index} but received 'auto' instead."
+                    )
+
+                layer_name = f'sharded_{layer_name}'
+
+            # the layout sets the size of the weight file, which has to
+            # match the file saved by earlier runs.
+            if (
+                layer_params.get('weight_file') is not None and
+                layer_params.get('receptive_field_layout') == 'auto'
+            ):
+                raise ValueError(
+                    'Invalid receptive field layout! Expected an explicit '
+                    f'layout for layer {layer_index}, whose weights are '
+                    "memory-mapped to a file, but received 'auto' instead."
+                )
+
+            # the config keeps 'auto', so that a saved model picks the
+            # fastest backend again on the machine it is loaded on.
+            if layer_params.get('receptive_field_layout') == 'auto':
+                if autotuner is None:
+                    autotuner = LayerAutotuner(
+                        model_config.get('autotune_cache'),
+                        model_config.get('autotune_batch_size', 1)
+                    )
+
+                layer_params = autotuner.resolve_layer_params(
+                    layer_params, device
+                )
+
             new_layer = LayerFactory.create_layer(
-                layer_config['name'], **layer_config['params'], device=device
+                layer_name, **layer_params, device=device
             )
 
             model.add_layer(new_layer)
 
+        if model_config.get('fused_forward', False):
+            if model_config.get('hooks'):
+                raise ValueError(
+                    'Invalid model config! Layer hooks are not called by '
+                    'fused forward passes, but hooks were given.'
+                )
+
+            model.set_fused(True)
+
+        if model_config.get('forward_mode', 'eager') == 'compiled':
+            model.compile_forward()
+
         if 'hooks' in model_config:
             for hook_config in model_config['hooks']:
                 hook = HookFactory.create_hook(hook_config['name'], model)
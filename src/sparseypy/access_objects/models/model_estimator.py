@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+
+"""
+Model Estimator: code for estimating the memory and compute needed
+    to train a model, without allocating it.
+"""
+
+
+from copy import deepcopy
+import math
+from typing import List, NamedTuple
+
+import torch
+
+from sparseypy.access_objects.models.model_builder import ModelBuilder
+
+
+class LayerEstimate(NamedTuple):
+    """
+    LayerEstimate: the estimated resources used by a layer during a
+        training step.
+
+    Attributes:
+        layer_index (int): the index of the layer in the model.
+        weight_bytes (int): the memory taken by the weights, stored
+            densely, or by their window for layers with a weight file.
+        timestep_bytes (int): the memory taken by the timesteps the
+            optimizer keeps for every weight, or by their window for
+            layers with a weight file.
+        forward_workspace_bytes (int): the memory a forward pass of
+            the layer takes on top of its weights.
+        forward_flops (int): the operations of a forward pass.
+        update_flops (int): the operations of a weight update.
+    """
+    layer_index: int
+    weight_bytes: int
+    timestep_bytes: int
+    forward_workspace_bytes: int
+    forward_flops: int
+    update_flops: int
+
+
+class ModelEstimator:
+    """
+    Model Estimator: class to estimate the resources needed by
+        models, by building them on the meta device.
+    """
+    @staticmethod
+    def estimate_model(model_config: dict,
+                       batch_size: int) -> List[LayerEstimate]:
+        """
+        Builds a model on the meta device, where tensors have shapes
+        but no storage, and estimates the resources each of its layers
+        needs for a training step.
+
+        The weights of layers with sparse weight storage, and the
+        optimizer timesteps that follow them, are counted at their
+        dense size, which they can grow to. Layers with a weight file
+        are counted at the size of their window, when it is bounded.
+
+        Args:
+            model_config (dict): information about the structure of
+                the model and its layers, as for ModelBuilder.
+            batch_size (int): the number of samples in each batch.
+
+        Returns:
+            (List[LayerEstimate]): the estimate of every layer.
+        """
+        if (
+            isinstance(batch_size, bool) or
+            not isinstance(batch_size, int) or
+            batch_size <= 0
+        ):
+            raise ValueError(
+                'Invalid batch size! Expected a positive integer '
+                f'but received {batch_size}.'
+            )
+
+        # hooks and compilation only matter when running the model.
+        model_config = deepcopy(model_config)
+        model_config.pop('hooks', None)
+        model_config['forward_mode'] = 'eager'
+
+        # layers split between processes are estimated whole.
+        for layer_config in model_config['layers']:
+            layer_config['params'].pop('model_parallel', None)
+
+        model = ModelBuilder.build_model(model_config, torch.device('meta'))
+        estimates = []
+
+        for layer_index, (layer, layer_config) in enumerate(
+            zip(model.children(), model_config['layers'])
+        ):
+            if hasattr(layer, 'dense_weights_shape'):
+                num_weights = math.prod(layer.dense_weights_shape)
+            else:
+                num_weights = sum(
+                    params.numel() for params in layer.parameters()
+                )
+
+            weight_element_size = max(
+                [params.element_size() for params in layer.parameters()],
+                default=0
+            )
+            weight_bytes = num_weights * weight_element_size
+            timestep_bytes = num_weights * 4
+
+            max_resident_bytes = layer_config['params'].get(
+                'max_resident_weight_bytes'
+            )
+
+            if max_resident_bytes is not None:
+                weight_bytes = min(weight_bytes, max_resident_bytes)
+                timestep_bytes = min(
+                    timestep_bytes,
+                    max_resident_bytes * 4 // weight_element_size
+                )
+
+            if hasattr(layer, 'estimate_forward_workspace'):
+                forward_workspace_bytes = layer.estimate_forward_workspace(
+                    batch_size
+                )
+                forward_flops, update_flops = layer.estimate_flops(batch_size)
+            else:
+                forward_workspace_bytes, forward_flops, update_flops = 0, 0, 0
+
+            estimates.append(
+                LayerEstimate(
+                    layer_index, weight_bytes, timestep_bytes,
+                    forward_workspace_bytes, forward_flops, update_flops
+                )
+            )
+
+        return estimates
+
+
+    @staticmethod
+    def get_total_bytes(estimates: List[LayerEstimate]) -> int:
+        """
+        Returns the memory needed by a training step of a model: the
+        weights and optimizer timesteps of every layer, plus the
+        forward workspace of every layer, since the optimizer keeps
+        the inputs and outputs of all the layers until the step.
+
+        Args:
+            estimates (List[LayerEstimate]): the estimates of the
+                layers of the model.
+
+        Returns:
+            (int): the estimated number of bytes.
+        """
+        return sum(
+            estimate.weight_bytes + estimate.timestep_bytes +
+            estimate.forward_workspace_bytes
+            for estimate in estimates
+        )
+
+
+    @staticmethod
+    def check_model_fits(model_config: dict, batch_size: int,
+                         max_bytes: int) -> List[LayerEstimate]:
+        """
+        Checks that a training step of a model fits in a memory
+        budget before anything is allocated.
+
+        Args:
+            model_config (dict): information about the structure of
+                the model and its layers, as for ModelBuilder.
+            batch_size (int): the number of samples in each batch.
+            max_bytes (int): the memory budget in bytes.
+
+        Returns:
+            (List[LayerEstimate]): the estimate of every layer.
+
+        Raises:
+            ValueError: if the estimated memory exceeds max_bytes.
+        """
+        estimates = ModelEstimator.estimate_model(model_config, batch_size)
+        total_bytes = ModelEstimator.get_total_bytes(estimates)
+
+        if total_bytes > max_bytes:
+            raise ValueError(
+                'Model too large! A training step with a batch size of '
+                f'{batch_size} is estimated to need {total_bytes} bytes '
+                f'but the budget is {max_bytes} bytes.'
+            )
+
+        return estimates
@@ -190,6 +190,11 @@ class SparseyModelSchema(AbstractSchema):
                     'width': And(int, schema_utils.is_positive, error="Width must be a positive integer"),
                     'height': And(int, schema_utils.is_positive, error="Height must be a positive integer")
             },
+            Optional('forward_mode', default='eager'): Or('eager', 'compiled', error="Forward mode must be 'eager' or 'compiled'"),
+            Optional('fused_forward', default=False): And(bool, error="Fused forward must be a boolean"),
+            Optional('autotune_batch_size', default=1): And(int, schema_utils.is_positive, error="Autotune batch size must be a positive integer"),
+            Optional('autotune_cache', default=None): Or(None, str, error="Autotune cache must be a file path"),
+            Optional('sampling_seed', default=None): Or(None, And(int, schema_utils.is_nonnegative), error="Sampling seed must be a non-negative integer"),
             'layers': [
                 {
                     'name': And(str, lambda n: n == 'sparsey', error="Layer name must be 'sparsey'"),
@@ -214,7 +219,24 @@ class SparseyModelSchema(AbstractSchema):
                             Use(float),
                             lambda n: 0 < n,
                             error='convexity must be a float > 0'
-                        )
+                        ),
+                        Optional('receptive_field_layout', default='padded'): Or('padded', 'csr', 'auto', error="Receptive field layout must be 'padded', 'csr' or 'auto'"),
+                        Optional('active_mac_compaction', default=False): And(bool, error="Active MAC compaction must be a boolean"),
+                        Optional('max_workspace_bytes', default=None): Or(None, 'auto', And(int, schema_utils.is_positive), error="Max workspace bytes must be a positive integer or 'auto'"),
+                        Optional('weight_storage', default='dense'): Or('dense', 'sparse', error="Weight storage must be 'dense' or 'sparse'"),
+                        Optional('weight_compaction_interval', default=100): And(int, schema_utils.is_positive, error="Weight compaction interval must be a positive integer"),
+                        Optional('weight_dtype', default='float32'): Or('float32', 'float16', 'bfloat16', 'uint8', error="Weight dtype must be 'float32', 'float16', 'bfloat16' or 'uint8'"),
+                        Optional('binary_weights', default=False): And(bool, error="Binary weights must be a boolean"),
+                        Optional('reuse_workspace', default=False): And(bool, error="Reuse workspace must be a boolean"),
+                        Optional('num_threads', default=1): And(int, schema_utils.is_positive, error="Number of threads must be a positive integer"),
+                        Optional('mac_ordering', default='row_major'): Or('row_major', 'z_order', 'hilbert', error="MAC ordering must be 'row_major', 'z_order' or 'hilbert'"),
+                        Optional('compute_dtype', default='float32'): Or('float32', 'bfloat16', error="Compute dtype must be 'float32' or 'bfloat16'"),
+                        Optional('shared_receptive_fields', default=False): And(bool, error="Shared receptive fields must be a boolean"),
+                        Optional('integer_activations', default=False): And(bool, error="Integer activations must be a boolean"),
+                        Optional('csa_fast_path_tolerance', default=None): Or(None, And(Or(float, int), lambda x: 0.0 <= x < 1.0), error="CSA fast path tolerance must be a number in [0, 1)"),
+                        Optional('model_parallel', default=False): And(bool, error="Model parallel must be a boolean"),
+                        Optional('weight_file', default=None): Or(None, str, error="Weight file must be a path"),
+                        Optional('max_resident_weight_bytes', default=None): Or(None, And(int, schema_utils.is_positive), error="Max resident weight bytes must be a positive integer")
                     }
                 }
             ],
@@ -7,7 +7,7 @@ Hebbian Optimizer Schema: the schema for Sparsey trainer config files.
 
 import typing
 
-from schema import Schema, Optional, And, Use
+from schema import Schema, Optional, And, Or, Use
 
 from sparseypy.cli.config_validation.saved_schemas.abs_schema import AbstractSchema
 
@@ -55,7 +55,10 @@ class HebbianOptimizerSchema(AbstractSchema):
             a Schema that can be used to validate the config info.
         """
         optimizer_params_schema = {
-            Optional('thresh', default=None): And(Use(float), lambda t: 0.0 <= t <= 1.0, error="thresh must be a float between 0.0 and 1.0 inclusive")
+            Optional('thresh', default=None): And(Use(float), lambda t: 0.0 <= t <= 1.0, error="thresh must be a float between 0.0 and 1.0 inclusive"),
+            Optional('max_workspace_bytes', default=None): Or(None, 'auto', And(int, lambda n: n > 0), error="max_workspace_bytes must be a positive integer or 'auto'"),
+            Optional('reuse_workspace', default=False): And(bool, error="reuse_workspace must be a boolean"),
+            Optional('num_threads', default=1): And(int, lambda n: n > 0, error="num_threads must be a positive integer")
         }
 
         config_schema = Schema(
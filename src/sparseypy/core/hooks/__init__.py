@@ -1 +1 @@
-from .layer_io import LayerIOHook
\ No newline at end of file
+from .layer_io import ForwardResultIO, LayerIOHook, create_layer_io
\ No newline at end of file
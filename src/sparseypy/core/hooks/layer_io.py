@@ -5,6 +5,8 @@ Layer IO: file hlding the LayerIOHook class.
 """
 
 
+from typing import Union
+
 import torch
 
 from sparseypy.core.hooks.hook import Hook
@@ -94,3 +96,66 @@ class LayerIOHook(Hook):
             of the model.
         """
         return self.layer_list, self.input_list, self.output_list
+
+
+class ForwardResultIO:
+    """
+    Forward Result IO: reads the inputs and outputs of the layers of
+        a model running fused forward passes from the result the model
+        keeps, with the same interface as LayerIOHook but without
+        registering any hooks.
+    """
+    def __init__(self, module: torch.nn.Module) -> None:
+        """
+        Initializes the reader.
+
+        Args:
+            module (torch.nn.Module): the model to read from.
+        """
+        self.module = module
+
+
+    def get_layer_io(self) -> tuple[
+        list[torch.nn.Module], list[torch.Tensor],
+        list[torch.Tensor]]:
+        """
+        Returns the layers, inputs, and outputs of the last fused
+        forward pass of the model.
+
+        Returns:
+            (tuple[list[torch.nn.Module], list[torch.Tensor],
+                list[torch.Tensor]]
+            ): a tuple containing the layers, input, and outputs
+            of the model.
+        """
+        result = self.module.last_result
+
+        if result is None:
+            return [], [], []
+
+        return result.layers, result.inputs, result.outputs
+
+
+    def remove(self) -> None:
+        """
+        Does nothing, since no hooks were registered.
+        """
+
+
+def create_layer_io(
+    module: torch.nn.Module) -> Union[LayerIOHook, ForwardResultIO]:
+    """
+    Returns the source of layer inputs and outputs suited to a model:
+    a ForwardResultIO for models running fused forward passes, and a
+    LayerIOHook registered with the model otherwise.
+
+    Args:
+        module (torch.nn.Module): the model to read from.
+
+    Returns:
+        (Union[LayerIOHook, ForwardResultIO]): the source.
+    """
+    if getattr(module, 'fused', False):
+        return ForwardResultIO(module)
+
+    return LayerIOHook(module)
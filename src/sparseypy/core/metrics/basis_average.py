@@ -10,7 +10,7 @@ from typing import Optional, Callable
 import torch
 
 from sparseypy.access_objects.models.model import Model
-from sparseypy.core.hooks import LayerIOHook
+from sparseypy.core.hooks import create_layer_io
 from sparseypy.core.metrics.metrics import Metric
 from sparseypy.core.metrics.comparisons import max_by_layerwise_mean
 
@@ -28,8 +28,8 @@ class BasisAverageMetric(Metric):
             Choosing None will return the inputs inserted into
             their positions in a tensor of the same size as the 
             input samples to the model.
-        hook (LayerIOHook): the hook registered with the model
-            being evaluated to obtain references to each layer,
+        hook (Union[LayerIOHook, ForwardResultIO]): the source of
+            references to each layer of the model being evaluated,
             and layerwise inputs and outputs.
     """
     def __init__(self, model: torch.nn.Module,
@@ -50,7 +50,7 @@ class BasisAverageMetric(Metric):
             device, reduction
         )
 
-        self.hook = LayerIOHook(self.model)
+        self.hook = create_layer_io(self.model)
         self.summed_inputs = None
         self.num_inputs_seen = None
         self.projected_rfs = None
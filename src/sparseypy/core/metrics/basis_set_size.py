@@ -3,7 +3,7 @@ import torch
 from typing import Optional, Callable
 
 from sparseypy.core.metrics.metrics import Metric
-from sparseypy.core.hooks import LayerIOHook
+from sparseypy.core.hooks import create_layer_io
 from sparseypy.core.metrics.comparisons import min_by_layerwise_mean
 from sparseypy.access_objects.models.model import Model
 
@@ -32,7 +32,7 @@ class BasisSetSizeMetric(Metric):
 
         self.projections = None
         self.codes = None
-        self.hook = LayerIOHook(self.model)
+        self.hook = create_layer_io(self.model)
 
 
     def _compute(self, m: Model, last_batch: torch.Tensor,
@@ -5,7 +5,7 @@ import torch
 from typing import Optional, Callable
 
 from sparseypy.access_objects.models.model import Model
-from sparseypy.core.hooks import LayerIOHook
+from sparseypy.core.hooks import create_layer_io
 from sparseypy.core.metrics.metrics import Metric
 from sparseypy.core.metrics.comparisons import max_by_layerwise_mean
 
@@ -19,8 +19,8 @@ class FeatureCoverageMetric(Metric):
         reduction (str): the type of reduction to apply
             onto the raw per-layer, per-sample feature coverage
             results.
-        hook (LayerIOHook): the hook registered with the model
-            being evaluated to obtain references to each layer,
+        hook (Union[LayerIOHook, ForwardResultIO]): the source of
+            references to each layer of the model being evaluated,
             and layerwise inputs and outputs.
     """
     def __init__(self, model: torch.nn.Module,
@@ -41,7 +41,7 @@ class FeatureCoverageMetric(Metric):
             best_value, device, reduction
         )
 
-        self.hook = LayerIOHook(self.model)
+        self.hook = create_layer_io(self.model)
 
 
     def _compute(self, m: Model, last_batch: torch.Tensor,
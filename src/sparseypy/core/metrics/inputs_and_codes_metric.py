@@ -11,7 +11,7 @@ from typing import Optional, Callable
 import torch
 
 from sparseypy.access_objects.models.model import Model
-from sparseypy.core.hooks import LayerIOHook
+from sparseypy.core.hooks import create_layer_io
 from sparseypy.core.metrics.metrics import Metric
 from sparseypy.core.metrics.comparisons import max_by_layerwise_mean
 
@@ -52,7 +52,7 @@ class InputsAndCodesMetric(Metric):
             best_value, device, reduction
         )
 
-        self.hook = LayerIOHook(self.model)
+        self.hook = create_layer_io(self.model)
         self.approximation_batch_size = approximation_batch_size
         self.stored_codes = None
         self.stored_inputs = None
@@ -10,7 +10,7 @@ from typing import Optional, Callable
 import torch
 
 from sparseypy.access_objects.models.model import Model
-from sparseypy.core.hooks import LayerIOHook
+from sparseypy.core.hooks import create_layer_io
 from sparseypy.core.metrics.metrics import Metric
 from sparseypy.core.metrics.comparisons import min_by_layerwise_mean
 
@@ -24,8 +24,8 @@ class NumActivationsMetric(Metric):
         reduction (str): the type of reduction to apply
             onto the raw per-layer, per-sample feature coverage
             results.
-        hook (LayerIOHook): the hook registered with the model
-            being evaluated to obtain references to each layer,
+        hook (Union[LayerIOHook, ForwardResultIO]): the source of
+            references to each layer of the model being evaluated,
             and layerwise inputs and outputs.
     """
     def __init__(self, model: torch.nn.Module,
@@ -49,7 +49,7 @@ class NumActivationsMetric(Metric):
         )
 
         self.reduction = reduction
-        self.hook = LayerIOHook(self.model)
+        self.hook = create_layer_io(self.model)
 
 
     def _compute(self, m: Model, last_batch: torch.Tensor,
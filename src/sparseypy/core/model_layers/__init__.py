@@ -5,3 +5,4 @@ Init: initialization for the model_layers subpackage.
 """
 
 from .sparsey_layer import SparseyLayer
+from .sharded_sparsey_layer import ShardedSparseyLayer
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+"""
+MAC Groups: runs the per-MAC work of a layer on a pool of threads,
+    one group of MACs per thread.
+"""
+
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Sequence, TypeVar
+
+import torch
+
+
+GroupType = TypeVar('GroupType')
+ResultType = TypeVar('ResultType')
+
+# pools are shared by every layer and optimizer using the same
+# number of threads.
+THREAD_POOLS: Dict[int, ThreadPoolExecutor] = {}
+THREAD_POOLS_LOCK = threading.Lock()
+
+
+def check_num_threads(num_threads: int) -> None:
+    """
+    Checks that a number of threads is valid.
+
+    Args:
+        num_threads (int): the number of threads.
+
+    Raises:
+        ValueError: if num_threads is not a positive integer.
+    """
+    if (
+        isinstance(num_threads, bool) or
+        not isinstance(num_threads, int) or
+        num_threads <= 0
+    ):
+        raise ValueError(
+            'Invalid number of threads! Expected a positive integer '
+            f'but received {num_threads}.'
+        )
+
+
+def get_thread_pool(num_threads: int) -> ThreadPoolExecutor:
+    """
+    Returns the shared pool with a given number of threads,
+    creating it on first use.
+
+    Args:
+        num_threads (int): the number of threads in the pool.
+
+    Returns:
+        (ThreadPoolExecutor): the pool.
+    """
+    with THREAD_POOLS_LOCK:
+        if num_threads not in THREAD_POOLS:
+            THREAD_POOLS[num_threads] = ThreadPoolExecutor(
+                max_workers=num_threads,
+                thread_name_prefix='sparsey-mac-group'
+            )
+
+        return THREAD_POOLS[num_threads]
+
+
+def run_mac_groups(
+    function: Callable[[int, GroupType], ResultType],
+    groups: Sequence[GroupType],
+    num_threads: int) -> List[ResultType]:
+    """
+    Runs a function on every group of MACs, on a pool of threads.
+    Torch releases the GIL inside its operators, so the groups
+    run concurrently. Grad mode is thread-local, so the threads
+    run with the grad mode of the caller.
+
+    Args:
+        function (Callable[[int, GroupType], ResultType]): the
+            function to run, called with the index of the group,
+            which is also the index of the per-thread workspace to
+            use, and the group.
+        groups (Sequence[GroupType]): the groups of MACs; there
+            should be at most num_threads of them.
+        num_threads (int): the number of threads to run on.
+
+    Returns:
+        (List[ResultType]): the results of the function for each
+            group, in order.
+    """
+    if num_threads == 1 or len(groups) <= 1:
+        return [function(index, group) for index, group in enumerate(groups)]
+
+    pool = get_thread_pool(num_threads)
+    grad_enabled = torch.is_grad_enabled()
+
+    def run_group(index: int, group: GroupType) -> ResultType:
+        with torch.set_grad_enabled(grad_enabled):
+            return function(index, group)
+
+    futures = [
+        pool.submit(run_group, index, group)
+        for index, group in enumerate(groups)
+    ]
+
+    return [future.result() for future in futures]
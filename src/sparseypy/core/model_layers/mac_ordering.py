@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+"""
+MAC Ordering: space-filling curve orders of the MACs of a grid, used
+    to store the receptive fields and weights of neighbouring MACs
+    next to each other.
+"""
+
+
+import torch
+
+
+MAC_ORDERINGS = ('row_major', 'z_order', 'hilbert')
+
+
+def check_mac_ordering(mac_ordering: str) -> None:
+    """
+    Checks that a MAC ordering is valid.
+
+    Args:
+        mac_ordering (str): the MAC ordering.
+
+    Raises:
+        ValueError: if mac_ordering is not one of MAC_ORDERINGS.
+    """
+    if mac_ordering not in MAC_ORDERINGS:
+        raise ValueError(
+            'Invalid MAC ordering! Expected one of '
+            f"'row_major', 'z_order' or 'hilbert' but received {mac_ordering}."
+        )
+
+
+def get_z_order_keys(rows: torch.Tensor, cols: torch.Tensor,
+                     num_bits: int) -> torch.Tensor:
+    """
+    Computes the Z-order (Morton) key of grid cells by interleaving
+    the bits of their rows and columns.
+
+    Args:
+        rows (torch.Tensor): the row of each cell.
+        cols (torch.Tensor): the column of each cell.
+        num_bits (int): the number of bits of the rows and columns.
+
+    Returns:
+        (torch.Tensor): the key of each cell.
+    """
+    keys = torch.zeros_like(rows)
+
+    for bit in range(num_bits):
+        keys |= ((rows >> bit) & 1) << (2 * bit + 1)
+        keys |= ((cols >> bit) & 1) << (2 * bit)
+
+    return keys
+
+
+def get_hilbert_keys(rows: torch.Tensor, cols: torch.Tensor,
+                     num_bits: int) -> torch.Tensor:
+    """
+    Computes the position of grid cells along the Hilbert curve
+    covering a square grid of side 2 ** num_bits.
+
+    Args:
+        rows (torch.Tensor): the row of each cell.
+        cols (torch.Tensor): the column of each cell.
+        num_bits (int): the number of bits of the rows and columns.
+
+    Returns:
+        (torch.Tensor): the key of each cell.
+    """
+    x = cols.clone()
+    y = rows.clone()
+    keys = torch.zeros_like(rows)
+    side = 1 << num_bits
+    s = side >> 1
+
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+
+        keys += s * s * ((3 * rx.long()) ^ ry.long())
+
+        # rotates the quadrant so that the curve within it starts and
+        # ends at the right corners.
+        flip = rx & ~ry
+        x = torch.where(flip, side - 1 - x, x)
+        y = torch.where(flip, side - 1 - y, y)
+
+        swap = ~ry
+        x, y = torch.where(swap, y, x), torch.where(swap, x, y)
+
+        s >>= 1
+
+    return keys
+
+
+def get_mac_order(num_macs: int, num_cols: int, mac_ordering: str,
+                  device: torch.device) -> torch.Tensor:
+    """
+    Computes the rank of every MAC of a grid filled row by row
+    in a MAC ordering.
+
+    Args:
+        num_macs (int): the number of MACs in the grid.
+        num_cols (int): the number of columns in the grid.
+        mac_ordering (str): the MAC ordering, one of MAC_ORDERINGS.
+        device (torch.device): the device to build the ranks on.
+
+    Returns:
+        (torch.Tensor): the rank of each MAC, of size (num_macs,).
+    """
+    check_mac_ordering(mac_ordering)
+
+    mac_indices = torch.arange(num_macs, dtype=torch.long, device=device)
+
+    if mac_ordering == 'row_major':
+        return mac_indices
+
+    rows = torch.div(mac_indices, num_cols, rounding_mode='floor')
+    cols = torch.remainder(mac_indices, num_cols)
+    num_bits = max(1, (max(num_cols, int(rows[-1]) + 1) - 1).bit_length())
+
+    if mac_ordering == 'z_order':
+        keys = get_z_order_keys(rows, cols, num_bits)
+    else:
+        keys = get_hilbert_keys(rows, cols, num_bits)
+
+    mac_ranks = torch.empty_like(mac_indices)
+    mac_ranks[torch.argsort(keys)] = mac_indices
+
+    return mac_ranks
@@ -0,0 +1,416 @@
+# -*- coding: utf-8 -*-
+
+"""
+Sharded Sparsey Layer: splits the MACs of a Sparsey layer between the
+    processes of a torch.distributed process group, for layers whose
+    weights do not fit in the memory of a single process.
+"""
+
+
+from typing import Callable, List, Optional, Tuple
+
+import torch
+import torch.distributed as dist
+
+from sparseypy.core.model_layers.sparsey_layer import SparseyLayer
+
+
+def get_mac_shards(num_macs: int, num_shards: int) -> List[Tuple[int, int]]:
+    """
+    Splits the row-major MACs of a layer into contiguous ranges of
+    nearly equal sizes.
+
+    Args:
+        num_macs (int): the number of MACs in the layer.
+        num_shards (int): the number of ranges.
+
+    Returns:
+        (List[Tuple[int, int]]): the [start, end) range of each shard,
+            the first ones holding one more MAC if the MACs do not
+            split evenly.
+
+    Raises:
+        ValueError: if there are more shards than MACs.
+    """
+    if num_shards > num_macs:
+        raise ValueError(
+            f'Invalid number of shards! The {num_macs} MACs of the layer '
+            f'cannot be split between {num_shards} processes.'
+        )
+
+    shard_size, num_larger_shards = divmod(num_macs, num_shards)
+    shards, start = [], 0
+
+    for shard_index in range(num_shards):
+        end = start + shard_size + (shard_index < num_larger_shards)
+        shards.append((start, end))
+        start = end
+
+    return shards
+
+
+class ShardedSparseyLayer(torch.nn.Module):
+    """
+    Sharded Sparsey Layer: a Sparsey layer whose MACs are split
+        between the processes of a process group, each process keeping
+        the weights of its own MACs. Every process of the group builds
+        the layer with the same parameters and runs every forward pass:
+        the input of the first process of the group is broadcast to
+        the others, each process runs its MACs, and the outputs of all
+        the MACs are gathered in every process, for dense codes, index
+        codes and single samples alike. Training passes of layers
+        without a fixed sampling seed use the seed drawn by the first
+        process. The outputs, and the weight updates of each process's
+        optimizer, are those of the unsharded layer.
+
+    Attributes:
+        process_group (Optional[dist.ProcessGroup]): the group the MACs
+            are split between, or None for the default group.
+        source_rank (int): the global rank of the process whose inputs
+            are broadcast.
+        shard_index (int): the rank of this process in the group.
+        mac_shards (List[Tuple[int, int]]): the MAC range of every
+            process in the group.
+        shard (SparseyLayer): the MACs of this process.
+        num_macs (int): the number of MACs in the full layer.
+        num_cms_per_mac (int): the number of CMs in each MAC.
+        num_neurons_per_cm (int): the number of neurons in each CM.
+        prev_layer_output_shape (Tuple[int, int]): the shape of the
+            inputs of each sample.
+        layer_index (int): the index of the layer in the model.
+        saturation_threshold (float): the fraction of active weights
+            at which a MAC stops learning.
+        is_active (torch.Tensor): the boolean mask of active MACs of
+            the full layer in the last forward pass, of size
+            (batch_size, num_macs).
+    """
+    def __init__(self, process_group: Optional[dist.ProcessGroup] = None,
+                 **layer_params) -> None:
+        """
+        Initializes the shard of the layer kept by this process.
+
+        Args:
+            process_group (Optional[dist.ProcessGroup]): the group to
+                split the MACs between, or None for the default group.
+            layer_params: the parameters of the full SparseyLayer.
+
+        Raises:
+            ValueError: if torch.distributed is not initialized, or the
+                group has more processes than the layer has MACs.
+        """
+        super().__init__()
+
+        if not dist.is_available() or not dist.is_initialized():
+            raise ValueError(
+                'Invalid model parallel layer! Splitting a layer between '
+                'processes requires torch.distributed to be initialized.'
+            )
+
+        self.process_group = process_group
+        self.source_rank = dist.get_global_rank(
+            process_group or dist.group.WORLD, 0
+        )
+        self.shard_index = dist.get_rank(process_group)
+        self.mac_shards = get_mac_shards(
+            layer_params['num_macs'], dist.get_world_size(process_group)
+        )
+
+        # every process maps the weights of its own MACs to its own
+        # file.
+        if layer_params.get('weight_file') is not None:
+            layer_params = dict(
+                layer_params,
+                weight_file=f"{layer_params['weight_file']}.{self.shard_index}"
+            )
+
+        self.shard = SparseyLayer(
+            **layer_params, mac_shard=self.mac_shards[self.shard_index]
+        )
+
+        self.num_macs = layer_params['num_macs']
+        self.num_cms_per_mac = self.shard.num_cms_per_mac
+        self.num_neurons_per_cm = self.shard.num_neurons_per_cm
+        self.prev_layer_output_shape = self.shard.prev_layer_output_shape
+        self.layer_index = self.shard.layer_index
+        self.saturation_threshold = self.shard.saturation_threshold
+        self.is_active = None
+
+
+    def forward(self, x: torch.Tensor,
+                samples_are_live: Optional[torch.Tensor] = None
+                ) -> torch.Tensor:
+        """
+        Passes data through the layer. Every process of the group must
+        call it with inputs of the same shape; the inputs of the other
+        processes are overwritten with those of the first one.
+
+        Args:
+            x (torch.Tensor): the layer input, as for SparseyLayer.
+            samples_are_live (Optional[torch.Tensor]): the boolean
+                mask of samples with any active MAC in the previous
+                layer, as for SparseyLayer. Only whether it is given
+                is used, since the inputs of the first process may
+                differ from those it was found from.
+
+        Returns:
+            (torch.Tensor): the output of the full layer, as for
+                SparseyLayer.
+        """
+        with torch.no_grad():
+            self.broadcast_input(x)
+
+            if samples_are_live is not None:
+                # the mask of this process was found from its own
+                # input, so it is found again from the broadcast one.
+                samples_are_live = torch.any(
+                    torch.ne(x.flatten(1), 0.0), dim=1
+                )
+
+            output = self.gather_output(
+                self.run_shard(
+                    self.shard, x, samples_are_live=samples_are_live
+                )
+            )
+
+        # every active MAC has one active neuron in each of its CMs.
+        self.is_active = torch.any(torch.ne(output, 0.0), dim=2)
+
+        return output
+
+
+    def encode_index_code(
+        self, x: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Converts a dense input code for this layer into the index code
+        format used by forward_indices(), as for SparseyLayer.
+
+        Args:
+            x (torch.Tensor): the dense layer input.
+
+        Returns:
+            (Tuple[torch.Tensor, torch.Tensor]): the index code of the
+                input, as for SparseyLayer.
+        """
+        return self.shard.encode_index_code(x)
+
+
+    def forward_indices(self, winners: torch.Tensor,
+        macs_are_active: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Passes an index code through the layer, as for SparseyLayer.
+        The index codes of the other processes are overwritten with
+        that of the first one, and the index codes of the MACs of
+        every process are gathered.
+
+        Args:
+            winners (torch.Tensor): the index of the active neuron in
+                each CM of each previous layer MAC.
+            macs_are_active (torch.Tensor): the boolean mask of active
+                previous layer MACs.
+
+        Returns:
+            (Tuple[torch.Tensor, torch.Tensor]): the index of the
+                active neuron in each CM of each MAC of the full layer,
+                and the boolean mask of its active MACs.
+        """
+        with torch.no_grad():
+            self.broadcast_input(winners)
+            self.broadcast_input(macs_are_active)
+
+            shard_winners, shard_macs_are_active = self.run_shard(
+                self.shard.forward_indices, winners, macs_are_active
+            )
+
+            output_winners = self.gather_output(shard_winners)
+            self.is_active = self.gather_output(shard_macs_are_active)
+
+        return output_winners, self.is_active
+
+
+    def infer_sample(self, x: torch.Tensor) -> torch.Tensor:
+        """
+        Passes a single sample through the layer for inference, as for
+        SparseyLayer. The sample of the other processes is overwritten
+        with that of the first one, and is_active is left untouched.
+
+        Args:
+            x (torch.Tensor): the sample, without a batch dimension.
+
+        Returns:
+            (torch.Tensor): the output of the full layer for the
+                sample, without a batch dimension.
+        """
+        with torch.no_grad():
+            self.broadcast_input(x)
+
+            return self.gather_output(
+                self.shard.infer_sample(x).unsqueeze(0)
+            )[0]
+
+
+    def run_shard(self, method: Callable, *args, **kwargs):
+        """
+        Calls a forward method of the shard. Training passes of layers
+        without a fixed sampling seed sample the active neurons of
+        every process with the seed drawn by the first one, so that
+        the MACs of every process draw from the same counter streams
+        as in the unsharded layer.
+
+        Args:
+            method (Callable): the method of the shard to call.
+            args: the positional arguments of the method.
+            kwargs: the keyword arguments of the method.
+
+        Returns:
+            the return value of the method.
+        """
+        sampling_seed = self.shard.sampling_seed
+
+        if self.training and sampling_seed is None:
+            self.shard.sampling_seed = self.broadcast_sampling_seed()
+
+        try:
+            return method(*args, **kwargs)
+        finally:
+            self.shard.sampling_seed = sampling_seed
+
+
+    def broadcast_sampling_seed(self) -> int:
+        """
+        Draws a sampling seed from torch's random number generator in
+        every process, as the unsharded layer would at each training
+        step, and returns the one drawn by the first process.
+
+        Returns:
+            (int): the seed of the first process.
+        """
+        seed = torch.tensor(self.shard.draw_sampling_seed())
+
+        if len(self.mac_shards) > 1:
+            dist.broadcast(seed, self.source_rank, group=self.process_group)
+
+        return int(seed.item())
+
+
+    def broadcast_input(self, x: torch.Tensor) -> None:
+        """
+        Copies the input of the first process of the group into the
+        input of the other processes, in place, sent as bytes as in
+        gather_output.
+
+        Args:
+            x (torch.Tensor): the layer input, or an index code.
+        """
+        if len(self.mac_shards) == 1:
+            return
+
+        contiguous_x = x.contiguous()
+
+        dist.broadcast(
+            contiguous_x.view(torch.uint8), self.source_rank,
+            group=self.process_group
+        )
+
+        if contiguous_x is not x:
+            x.copy_(contiguous_x)
+
+
+    def gather_output(self, shard_output: torch.Tensor) -> torch.Tensor:
+        """
+        Gathers the outputs of the MACs of every process of the group.
+        Tensors are sent as bytes, since gloo supports neither boolean
+        masks nor the unsigned dtypes of index codes.
+
+        Args:
+            shard_output (torch.Tensor): the output of the MACs of this
+                process, of size (batch_size, num_shard_macs, ...),
+                either dense codes, index codes or active MAC masks.
+
+        Returns:
+            (torch.Tensor): the output of every MAC, of size
+                (batch_size, num_macs, ...).
+        """
+        if len(self.mac_shards) == 1:
+            return shard_output
+
+        dtype = shard_output.dtype
+        shard_output = shard_output.contiguous().view(torch.uint8)
+
+        # the shards are padded to the size of the largest one, since
+        # every process must send tensors of the same shape.
+        max_shard_size = max(end - start for start, end in self.mac_shards)
+        padded_output = torch.zeros(
+            (shard_output.shape[0], max_shard_size, *shard_output.shape[2:]),
+            dtype=shard_output.dtype, device=shard_output.device
+        )
+        padded_output[:, :shard_output.shape[1]] = shard_output
+
+        shard_outputs = [
+            torch.empty_like(padded_output) for _ in self.mac_shards
+        ]
+
+        dist.all_gather(
+            shard_outputs, padded_output, group=self.process_group
+        )
+
+        return torch.cat(
+            [
+                output[:, :end - start] for output, (start, end) in zip(
+                    shard_outputs, self.mac_shards
+                )
+            ], dim=1
+        ).view(dtype)
+
+
+    def select_shard_output(self, output: torch.Tensor) -> torch.Tensor:
+        """
+        Returns the output of the MACs of this process from the output
+        of the full layer, for the optimizer to update their weights.
+
+        Args:
+            output (torch.Tensor): the output of the full layer.
+
+        Returns:
+            (torch.Tensor): a view of the outputs of the shard MACs.
+        """
+        start, end = self.mac_shards[self.shard_index]
+
+        return output[:, start:end]
+
+
+    def can_skip_dead_samples(self) -> bool:
+        """
+        Checks whether the MACs of this process may skip the samples
+        whose inputs are all zero, as for SparseyLayer.
+
+        Returns:
+            (bool): whether dead samples can be skipped.
+        """
+        return self.shard.can_skip_dead_samples()
+
+
+    def find_live_samples(self) -> torch.Tensor:
+        """
+        Returns the mask of samples with any active MAC of the full
+        layer in the last forward pass, as for SparseyLayer.
+
+        Returns:
+            (torch.Tensor): the boolean mask of live samples, of size
+                (batch_size,).
+        """
+        return torch.any(
+            self.is_active, dim=1, out=self.shard.get_buffer(
+                'samples_are_live', (self.is_active.shape[0],), torch.bool
+            )
+        )
+
+
+    def set_incremental(self, incremental: bool) -> None:
+        """
+        Switches incremental evaluation of the MACs of this process on
+        or off, as for SparseyLayer.
+
+        Args:
+            incremental (bool): whether to run incrementally.
+        """
+        self.shard.set_incremental(incremental)
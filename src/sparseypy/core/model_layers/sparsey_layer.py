@@ -6,11 +6,156 @@ Sparsey Layer: code for building and using individual layers
 """
 
 
-from typing import List, Tuple
+from typing import List, NamedTuple, Optional, Tuple, Union
+import math
+import warnings
 
 import torch
 from torch.distributions.categorical import Categorical
 
+from sparseypy.core.model_layers.mac_groups import (
+    check_num_threads, run_mac_groups
+)
+from sparseypy.core.model_layers.mac_ordering import (
+    check_mac_ordering, get_mac_order
+)
+from sparseypy.core.model_layers.weight_precision import (
+    check_integer_kernels, convert_weights, dequantize_weights,
+    get_compute_dtype, get_weight_dtype, prepack_integer_weights
+)
+from sparseypy.core.model_layers.weight_streaming import (
+    WeightWindow, check_resident_budget
+)
+from sparseypy.core.model_layers.winner_sampling import (
+    sample_uniform_winners, sample_winners
+)
+from sparseypy.core.model_layers.workspace import (
+    WorkspaceArena, check_workspace_budget, get_num_bytes,
+    get_workspace_buffer, resolve_workspace_budget
+)
+
+
+# the popcount passes are bound by memory bandwidth, so without a
+# workspace budget MACs are processed in chunks that stay in cache.
+POPCOUNT_CHUNK_BYTES = 2 ** 20
+
+# incremental forward passes that would recompute more than this
+# fraction of the MACs of a layer run a full forward pass instead.
+INCREMENTAL_MAX_RECOMPUTED_FRACTION = 0.5
+
+# receptive field buckets whose MACs have fewer than this many MACs per
+# distinct receptive field on average gather their inputs per MAC, as
+# sharing would save few gathers but split them into more matmuls.
+SHARED_RECEPTIVE_FIELDS_MIN_MACS_PER_SET = 2
+
+# every compiled layer shares the code objects of the class, and needs
+# cache entries for each of its modes, batch sizes and receptive field
+# buckets, so the dynamo cache limit is raised to this while compiled
+# kernels run.
+COMPILED_CACHE_SIZE_LIMIT = 1024
+
+
+class ReceptiveFieldBucket(NamedTuple):
+    """
+    ReceptiveFieldBucket: a group of MACs in a SparseyLayer that all
+        have the same number of MACs in their receptive fields and
+        whose weights are stored contiguously.
+
+    Attributes:
+        mac_indices (torch.Tensor): the indices of the MACs in the bucket.
+        input_connections (torch.Tensor): the indices of the previous
+            layer MACs connected to each MAC in the bucket, of size
+            (num_bucket_macs, bucket_receptive_field_num_macs).
+        weights_start (int): the start of the bucket's weights along
+            the first dimension of the weights.
+        weights_end (int): the end of the bucket's weights along the
+            first dimension of the weights.
+        index_row_offsets (torch.Tensor): offset of the first weight row
+            of every (MAC, receptive field position, CM) triple in the
+            bucket, used by the index code forward pass.
+        input_sets_start (Optional[int]): the shared input set of the
+            first MAC in the bucket, or None if the MACs of the bucket
+            gather their own inputs.
+        input_sets_step (int): the difference between the shared input
+            sets of consecutive MACs in the bucket, either 0 (all MACs
+            share one set) or 1 (every MAC has the next set).
+    """
+    mac_indices: torch.Tensor
+    input_connections: torch.Tensor
+    weights_start: int
+    weights_end: int
+    index_row_offsets: torch.Tensor
+    input_sets_start: Optional[int] = None
+    input_sets_step: int = 1
+
+
+class SampleInferencePlan(NamedTuple):
+    """
+    SampleInferencePlan: the buffers and weight views used by the
+        single-sample inference path of a SparseyLayer, allocated once
+        and reused by every call. MACs are processed in the order their
+        weights are stored in, and only the output is put back in
+        row-major MAC order.
+
+    Attributes:
+        weights_key (Tuple[int, Tuple[int, ...]]): the address and
+            shape of the weights the views were taken from.
+        padded_input (Optional[torch.Tensor]): the input padded with
+            an empty MAC ('padded' layout only).
+        input_mac_sums (Optional[torch.Tensor]): the sum of the inputs
+            of every previous layer MAC, plus a zero for padded
+            connections, for layers with shared receptive fields.
+        gathered_input_sums (Optional[torch.Tensor]): the sums of the
+            inputs of each receptive field position of every MAC, for
+            layers with shared receptive fields.
+        input_connections (Optional[torch.Tensor]): the padded input
+            connections of every MAC in plan order, for layers with
+            shared receptive fields.
+        set_inputs (Optional[torch.Tensor]): the inputs of every
+            shared receptive field, for layers with shared receptive
+            fields.
+        chunks (List[Tuple]): the input connections, gathered inputs,
+            inputs of each MAC, weights, raw activations and active
+            input counts of each bucket of MACs, as views of the plan
+            buffers; the input connections are None for buckets reading
+            shared inputs.
+        raw_activations (torch.Tensor): the raw activations of every
+            MAC, of size (num_macs, num_cms_per_mac * num_neurons_per_cm).
+        num_active_inputs (torch.Tensor): the number of active inputs
+            of every MAC, of size (num_macs, 1).
+        activation_threshold_min (torch.Tensor): the minimum number of
+            active inputs of every MAC, of size (num_macs, 1).
+        activation_threshold_max (torch.Tensor): the maximum number of
+            active inputs of every MAC, of size (num_macs, 1).
+        macs_are_active (torch.Tensor): the boolean mask of active MACs.
+        macs_are_below_max (torch.Tensor): the boolean mask of MACs with
+            at most the maximum number of active inputs.
+        active_neurons (torch.Tensor): the index of the active neuron
+            in each CM of every MAC.
+        plan_output (torch.Tensor): the output of every MAC in plan
+            order, of size (num_macs, num_cms_per_mac, num_neurons_per_cm).
+        mac_order (Optional[torch.Tensor]): the MAC at each position of
+            the plan order, or None if it is row-major.
+        output (torch.Tensor): the output in row-major MAC order.
+    """
+    weights_key: Tuple[int, Tuple[int, ...]]
+    padded_input: Optional[torch.Tensor]
+    input_mac_sums: Optional[torch.Tensor]
+    gathered_input_sums: Optional[torch.Tensor]
+    input_connections: Optional[torch.Tensor]
+    set_inputs: Optional[torch.Tensor]
+    chunks: List[Tuple]
+    raw_activations: torch.Tensor
+    num_active_inputs: torch.Tensor
+    activation_threshold_min: torch.Tensor
+    activation_threshold_max: torch.Tensor
+    macs_are_active: torch.Tensor
+    macs_are_below_max: torch.Tensor
+    active_neurons: torch.Tensor
+    plan_output: torch.Tensor
+    mac_order: Optional[torch.Tensor]
+    output: torch.Tensor
+
 
 class SparseyLayer(torch.nn.Module):
     """
@@ -20,17 +165,132 @@ class SparseyLayer(torch.nn.Module):
         num_macs: int containing the number of macs in the layer.
         receptive_field_radius: float containing the radius of the 
             receptive field for the MAC.
-        mac_positions: list[Tuple[int, int]] containing the positions
-            of each MAC in the layer on the grid.
-        input_list: list[list[int]] cotaining the indices of the 
+        mac_positions: torch.Tensor of size (num_macs, 2) containing
+            the positions of each MAC in the layer on the grid.
+        input_connections: torch.Tensor containing the indices of the
             MACs in the previous layer within the receptive field of
-            each MAC in this layer.
-        mac_list: list[MAC] containing all the MACs in this layer.
+            each MAC in this layer, padded with prev_layer_num_macs.
         sigmoid_lambda (float): parameter for the familiarity computation.
         sigmoid_phi (float): parameter for the familiarity computation.
         activation_thresholds (list[list[Or[int, float]]]): a list
             of lists containing activation thresholds for each MAC in
             the Sparsey layer.
+        receptive_field_layout (str): how receptive fields and weights
+            are stored, either 'padded' (every MAC padded to the largest
+            receptive field) or 'csr' (compressed, no padding).
+        active_mac_compaction (bool): whether the forward pass only
+            computes the outputs of active MACs.
+        mac_weight_offsets (torch.Tensor): the first row of the weights
+            of each MAC in the weights flattened to 2 dimensions.
+        max_workspace_bytes (Union[int, str, None]): the workspace budget
+            used when computing activations.
+        peak_workspace_bytes (int): the peak workspace used by the
+            last forward pass.
+        input_offsets (torch.Tensor): CSR offsets into input_indices
+            for each MAC ('csr' layout only).
+        input_indices (torch.Tensor): CSR indices of the connected
+            previous layer MACs ('csr' layout only).
+        rf_buckets (list[ReceptiveFieldBucket]): groups of MACs with
+            equal receptive field sizes ('csr' layout only).
+        weight_storage (str): how the weights are stored, either
+            'dense' or 'sparse' (only the weight rows that have ever
+            been written are stored).
+        weight_compaction_interval (int): the number of optimizer
+            steps between removals of all-zero weight rows ('sparse'
+            storage only).
+        dense_weights_shape (Tuple[int, ...]): the shape of the
+            weights when stored densely.
+        weight_rows (torch.Tensor): the sorted indices of the stored
+            weight rows in the dense weights flattened to 2 dimensions
+            ('sparse' storage only).
+        weight_dtype (str): the dtype the weights are stored in, one of
+            'float32', 'float16', 'bfloat16' or 'uint8' (fixed-point).
+        binary_weights (bool): whether inputs and weights are treated
+            as binary (set if nonzero), with raw activations computed
+            as popcounts of bit-packed input and weight planes.
+        num_input_words (int): the number of 64-bit words in the
+            bit-packed receptive field of a MAC.
+        packed_weights (Tuple): the bit-packed weights, cached along
+            with the state of the weights they were built from.
+        compute_dtype (str): the dtype the activation matmuls run in,
+            either 'float32' or 'bfloat16'.
+        compute_weights (Tuple): the weights converted to the compute
+            dtype, cached along with the state of the weights they
+            were converted from.
+        sampling_seed (Optional[int]): the seed of the active neuron
+            sampler, or None to draw one from torch at every step.
+        sampling_step (int): the step counter of the active neuron
+            sampler, incremented by every training forward pass.
+        sampling_sample_offset (int): the index of the first sample of
+            the batch in the sampler counters, for workers that each
+            process part of a larger batch.
+        sampling_sample_indices (Optional[torch.Tensor]): the index
+            within the full batch of each sample of the batch being
+            processed, while dead samples are skipped, or None.
+        zero_inputs_are_inactive (bool): whether every MAC has a
+            minimum activation threshold above zero, so that no MAC is
+            active for an all-zero input.
+        workspace (Optional[WorkspaceArena]): the buffers reused by
+            every forward pass, or None to allocate new tensors.
+        incremental (bool): whether evaluation forward passes only
+            recompute the MACs whose receptive fields changed since
+            the previous pass.
+        incremental_state (Tuple): the input, output and active MACs
+            of the previous evaluation forward pass, along with the
+            state of the weights they were computed with.
+        num_recomputed_macs (int): the number of (sample, MAC) pairs
+            recomputed by the last forward pass.
+        num_threads (int): the number of threads the batched matmuls
+            of the forward pass are split across, by groups of MACs.
+        group_workspaces (Optional[List[WorkspaceArena]]): the
+            workspace of each thread, the first being workspace, or
+            None to allocate new tensors.
+        mac_ordering (str): the order the MACs of each receptive field
+            bucket are stored in, one of 'row_major', 'z_order' or
+            'hilbert' ('csr' layout only).
+        canonical_weight_rows (Optional[torch.Tensor]): the stored row
+            of every weight row of the layer in row-major MAC order,
+            used to save and load state dicts in that order, or None
+            if the MACs are stored in row-major order.
+        shared_receptive_fields (bool): whether MACs with identical
+            receptive fields share one gather of their inputs ('csr'
+            layout only).
+        input_set_offsets (Optional[torch.Tensor]): CSR offsets into
+            input_set_indices for each shared receptive field, in the
+            order the buckets use them, or None if no receptive fields
+            are shared.
+        input_set_indices (Optional[torch.Tensor]): CSR indices of the
+            previous layer MACs of each shared receptive field, or None
+            if no receptive fields are shared.
+        mac_input_sets (Optional[torch.Tensor]): the index of the
+            shared receptive field of each MAC, or -1 for MACs that
+            gather their own inputs; None if no receptive fields are
+            shared.
+        sample_plan (Optional[SampleInferencePlan]): the buffers of the
+            single-sample inference path, allocated by its first call.
+        integer_activations (bool): whether the raw activations are
+            computed by quantized integer kernels from the uint8
+            weights, with int32 accumulation.
+        integer_weights (Tuple): the weights of every MAC packed for
+            the quantized kernels, cached along with the state of the
+            weights they were packed from.
+        csa_fast_path_tolerance (Optional[float]): the share of the
+            CSA distribution of a CM that training passes may ignore
+            to take a closed-form winner, or None to always sample.
+        csa_path_counts (Tuple[int, int, int]): the number of (sample,
+            MAC) pairs of the last training pass whose winners were
+            the most active neurons, drawn uniformly, and sampled
+            from the full CSA distribution.
+        mac_shard (Tuple[int, int]): the range of the row-major MACs
+            of the full layer kept by this layer.
+        sampling_mac_offset (int): the index of the first MAC of the
+            layer in the sampler counters, the start of its MAC shard.
+        weight_file (Optional[str]): the file the weights are
+            memory-mapped to, or None if they are kept in memory.
+        weight_window (Optional[WeightWindow]): the window of chunks
+            of MACs the forward pass and the Hebbian updates stream
+            the mapped weights through, or None if the weights are
+            kept in memory.
     """
     def __init__(self, autosize_grid: bool, grid_layout: str,
         num_macs: int, num_cms_per_mac: int, num_neurons_per_cm: int,
@@ -48,7 +308,25 @@ class SparseyLayer(torch.nn.Module):
         activation_threshold_min: float,
         activation_threshold_max: float,
         min_familiarity: float, sigmoid_chi: float,
-        device: torch.device):
+        device: torch.device,
+        receptive_field_layout: str = 'padded',
+        active_mac_compaction: bool = False,
+        max_workspace_bytes: Union[int, str, None] = None,
+        weight_storage: str = 'dense',
+        weight_compaction_interval: int = 100,
+        weight_dtype: str = 'float32',
+        binary_weights: bool = False,
+        sampling_seed: Optional[int] = None,
+        reuse_workspace: bool = False,
+        num_threads: int = 1,
+        mac_ordering: str = 'row_major',
+        compute_dtype: str = 'float32',
+        shared_receptive_fields: bool = False,
+        integer_activations: bool = False,
+        csa_fast_path_tolerance: Optional[float] = None,
+        mac_shard: Optional[Tuple[int, int]] = None,
+        weight_file: Optional[str] = None,
+        max_resident_weight_bytes: Optional[int] = None):
         """
         Initializes the SparseyLayer object.
         Args:
@@ -82,11 +360,280 @@ class SparseyLayer(torch.nn.Module):
             min_familiarity (float): the minimum familiarity.
             sigmoid_chi (float): the chi parameter for the sigmoid function.
             device (torch.device): the device to run the model on.
+            receptive_field_layout (str): 'padded' or 'csr'; the
+                layout used to store receptive fields and weights.
+            active_mac_compaction (bool): whether to only compute
+                the outputs of active MACs during the forward pass.
+            max_workspace_bytes (Union[int, str, None]): the maximum
+                number of bytes of temporary memory to use when
+                computing activations; None for no limit, or 'auto'
+                to size the budget to the available memory.
+            weight_storage (str): 'dense' or 'sparse'; 'sparse' only
+                stores the weight rows that have ever been written.
+            weight_compaction_interval (int): the number of optimizer
+                steps between removals of all-zero weight rows when
+                using sparse weight storage.
+            weight_dtype (str): the dtype to store the weights in, one
+                of 'float32', 'float16', 'bfloat16' or 'uint8'; weights
+                are converted to float32 for computations.
+            binary_weights (bool): whether to treat inputs and weights
+                as binary and compute raw activations by counting the
+                active inputs with a nonzero weight, using bit-packed
+                planes and popcounts.
+            sampling_seed (Optional[int]): the seed of the counter-based
+                sampler choosing the active neurons during training, or
+                None to draw a new seed from torch's random number
+                generator at every step.
+            reuse_workspace (bool): whether to keep the temporary
+                buffers of the forward pass, and its output, between
+                calls with the same batch size instead of allocating
+                new tensors; the output of a forward pass is then
+                overwritten by the next one. With active MAC
+                compaction, the tensors of the active (sample, MAC)
+                pairs, whose number changes with every batch, are
+                still allocated.
+            num_threads (int): the number of threads to split the
+                batched matmuls of the forward pass across, each
+                computing the activations of a group of MACs with its
+                own workspace.
+            mac_ordering (str): 'row_major', 'z_order' or 'hilbert';
+                the order along which the MACs of each receptive field
+                bucket, and their weights, are stored, so that MACs
+                processed one after the other gather neighbouring
+                inputs ('csr' layout only). MACs keep their row-major
+                indices in the inputs, outputs and state dicts.
+            compute_dtype (str): 'float32' or 'bfloat16'; the dtype
+                of the inputs and weights of the batched matmuls of
+                the forward pass, whose products are accumulated in
+                float32. The activations are rounded to the compute
+                dtype and then normalized in float32. Weights stored in
+                another dtype are converted once per weight update and
+                cached. Only supported with dense weight storage,
+                without binary weights or active MAC compaction.
+            shared_receptive_fields (bool): whether MACs connected to
+                exactly the same previous layer MACs gather their inputs
+                once per step, in both the forward pass and the Hebbian
+                update, instead of each gathering its own copy. MACs
+                sharing inputs are stored next to each other within
+                their bucket, and buckets where few MACs share their
+                inputs keep gathering them per MAC ('csr' layout only).
+                Only the batched matmul passes of dense layers share
+                their gathers.
+            integer_activations (bool): whether to compute the raw
+                activations with the quantized linear kernels of torch,
+                which multiply 8-bit inputs by the uint8 weights and
+                accumulate the products in int32, before a single
+                scaling to float32 for the normalization. Binary inputs
+                are exact in 8 bits, so the raw activations only differ
+                from those of the float32 path by float32 rounding,
+                a relative error below 1e-5. Each MAC is multiplied
+                separately, and its packed weights are rebuilt after
+                every weight update, so the path suits evaluation of
+                layers with few large MACs. Requires weight_dtype
+                'uint8', dense weight storage, float32 compute dtype,
+                no binary weights and no active MAC compaction.
+            csa_fast_path_tolerance (Optional[float]): the share in
+                [0, 1) of the CSA distribution of a CM that training
+                passes may ignore. (sample, MAC) pairs where every CM
+                puts all but this share of its distribution on its most
+                active neuron take that neuron, and pairs where the
+                probabilities of the neurons of every CM are within
+                this relative tolerance of each other, such as MACs
+                below the minimum familiarity, draw uniform winners.
+                Only the other pairs go through the sigmoid transform
+                and sampling. None samples every pair from the full
+                distribution.
+            mac_shard (Optional[Tuple[int, int]]): the range [start,
+                end) of the row-major MACs of the layer to keep, for
+                layers whose MACs are split between processes, or None
+                to keep every MAC. The geometry of the kept MACs, and
+                the active neurons they sample, are those of the full
+                layer.
+            weight_file (Optional[str]): the path of a file to
+                memory-map the weights to instead of keeping them in
+                memory, or None. An existing file of the right size is
+                reused as the initial weights, and other files are
+                created filled with zeros. The batched matmuls of the
+                forward pass and the Hebbian updates copy the weights
+                of one chunk of MACs at a time into a bounded window,
+                and write the chunks they modify back to the file;
+                the other passes read the mapped weights directly.
+                Requires a CPU device, 'dense' weight storage, the
+                float32 compute dtype, no binary weights, no integer
+                activations, no active MAC compaction and one thread.
+            max_resident_weight_bytes (Optional[int]): the maximum
+                number of bytes of weights copied into memory at once
+                by a layer with a weight file, or None for no limit.
+                Chunks of MACs are sized to fit, down to a single MAC.
         """
         super().__init__()
 
-        self.device = device
+        if receptive_field_layout not in ('padded', 'csr'):
+            raise ValueError(
+                'Invalid receptive field layout! Expected one of '
+                f"'padded' or 'csr' but received {receptive_field_layout}."
+            )
+
+        if weight_storage not in ('dense', 'sparse'):
+            raise ValueError(
+                'Invalid weight storage! Expected one of '
+                f"'dense' or 'sparse' but received {weight_storage}."
+            )
+
+        if (
+            isinstance(weight_compaction_interval, bool) or
+            not isinstance(weight_compaction_interval, int) or
+            weight_compaction_interval <= 0
+        ):
+            raise ValueError(
+                'Invalid weight compaction interval! Expected a positive '
+                f'number of steps but received {weight_compaction_interval}.'
+            )
+
+        check_mac_ordering(mac_ordering)
+        get_compute_dtype(compute_dtype)
+
+        if compute_dtype != 'float32' and (
+            weight_storage != 'dense' or binary_weights or
+            active_mac_compaction
+        ):
+            raise ValueError(
+                'Invalid compute dtype! Only float32 is supported with '
+                'sparse weight storage, binary weights or active MAC '
+                f'compaction but received {compute_dtype}.'
+            )
+
+        if mac_ordering != 'row_major' and receptive_field_layout != 'csr':
+            raise ValueError(
+                'Invalid MAC ordering! MACs can only be reordered with '
+                f"the 'csr' receptive field layout but received {mac_ordering} "
+                f'with the {receptive_field_layout} layout.'
+            )
+
+        if integer_activations:
+            check_integer_kernels()
+
+            if (
+                weight_dtype != 'uint8' or weight_storage != 'dense' or
+                compute_dtype != 'float32' or binary_weights or
+                active_mac_compaction
+            ):
+                raise ValueError(
+                    'Invalid integer activations! Integer activations '
+                    "require uint8 weights, 'dense' weight storage, the "
+                    'float32 compute dtype, no binary weights and no active '
+                    f'MAC compaction but received {weight_dtype} weights, '
+                    f'{weight_storage} weight storage, the {compute_dtype} '
+                    f'compute dtype, binary weights {binary_weights} and '
+                    f'active MAC compaction {active_mac_compaction}.'
+                )
+
+        if csa_fast_path_tolerance is not None and (
+            isinstance(csa_fast_path_tolerance, bool) or
+            not isinstance(csa_fast_path_tolerance, (int, float)) or
+            not 0.0 <= csa_fast_path_tolerance < 1.0
+        ):
+            raise ValueError(
+                'Invalid CSA fast path tolerance! Expected None or a share '
+                f'in [0, 1) but received {csa_fast_path_tolerance}.'
+            )
+
+        if mac_shard is None:
+            mac_shard = (0, num_macs)
+
+        if not 0 <= mac_shard[0] < mac_shard[1] <= num_macs:
+            raise ValueError(
+                'Invalid MAC shard! Expected a nonempty range of the '
+                f'{num_macs} MACs of the layer but received {mac_shard}.'
+            )
+
+        if shared_receptive_fields and receptive_field_layout != 'csr':
+            raise ValueError(
+                'Invalid receptive field sharing! Receptive fields can only '
+                "be shared with the 'csr' receptive field layout but "
+                f'received the {receptive_field_layout} layout.'
+            )
+
+        check_resident_budget(max_resident_weight_bytes)
+
+        if weight_file is None and max_resident_weight_bytes is not None:
+            raise ValueError(
+                'Invalid resident weight size! Only layers with a weight '
+                'file stream their weights through memory but received '
+                f'{max_resident_weight_bytes} bytes without a weight file.'
+            )
+
+        if weight_file is not None and (
+            torch.device(device).type not in ('cpu', 'meta') or
+            weight_storage != 'dense' or compute_dtype != 'float32' or
+            binary_weights or integer_activations or
+            active_mac_compaction or num_threads != 1
+        ):
+            raise ValueError(
+                'Invalid weight file! Memory-mapped weights require a CPU '
+                "device, 'dense' weight storage, the float32 compute "
+                'dtype, no binary weights, no integer activations, no '
+                'active MAC compaction and one thread but received the '
+                f'{device} device, {weight_storage} weight storage, the '
+                f'{compute_dtype} compute dtype, binary weights '
+                f'{binary_weights}, integer activations '
+                f'{integer_activations}, active MAC compaction '
+                f'{active_mac_compaction} and {num_threads} threads.'
+            )
+
+        # the receptive fields of a layer built on the meta device are
+        # still needed to size its weights, so they are built on the
+        # CPU and only the weights are left unallocated.
+        self.device = (
+            torch.device('cpu') if torch.device(device).type == 'meta'
+            else device
+        )
         self.layer_index = layer_index
+        check_workspace_budget(max_workspace_bytes)
+        check_num_threads(num_threads)
+        weights_dtype = get_weight_dtype(weight_dtype)
+
+        self.receptive_field_layout = receptive_field_layout
+        self.active_mac_compaction = active_mac_compaction
+        self.max_workspace_bytes = max_workspace_bytes
+        self.peak_workspace_bytes = 0
+        self.weight_storage = weight_storage
+        self.weight_compaction_interval = weight_compaction_interval
+        self.weight_dtype = weight_dtype
+        self.binary_weights = binary_weights
+        self.packed_weights = None
+        self.compute_dtype = compute_dtype
+        self.compute_weights = None
+        self.sampling_seed = sampling_seed
+        self.sampling_step = 0
+        self.sampling_sample_offset = 0
+        self.sampling_sample_indices = None
+        self.workspace = WorkspaceArena(device) if reuse_workspace else None
+        self.num_threads = num_threads
+        self.group_workspaces = None
+        self.mac_ordering = mac_ordering
+        self.canonical_weight_rows = None
+        self.shared_receptive_fields = shared_receptive_fields
+        self.input_set_offsets = None
+        self.input_set_indices = None
+        self.mac_input_sets = None
+        self.integer_activations = integer_activations
+        self.integer_weights = None
+        self.csa_fast_path_tolerance = csa_fast_path_tolerance
+        self.csa_path_counts = (0, 0, 0)
+        self.mac_shard = tuple(mac_shard)
+        self.sampling_mac_offset = mac_shard[0]
+        self.weight_file = weight_file
+        self.weight_window = None
+
+        if reuse_workspace:
+            self.group_workspaces = [self.workspace] + [
+                WorkspaceArena(device) for _ in range(num_threads - 1)
+            ]
+        self.incremental = False
+        self.incremental_state = None
+        self.num_recomputed_macs = 0
+        self.sample_plan = None
         self.is_grid_autosized = autosize_grid
         self.num_macs = num_macs
         self.num_cms_per_mac = num_cms_per_mac
@@ -99,6 +646,7 @@ class SparseyLayer(torch.nn.Module):
         self.permanence_convexity = permanence_convexity
         self.saturation_threshold = saturation_threshold
         self.is_active = None
+        self.compiled_kernels = None
         self.receptive_field_size = mac_receptive_field_size
 
         self.grid_size = (
@@ -132,7 +680,32 @@ class SparseyLayer(torch.nn.Module):
             self.mac_positions, prev_layer_mac_positions, prev_layer_num_macs
         )
 
+        # the MAC order is that of the full grid, restricted to the
+        # MACs of the shard.
+        mac_ranks = None
+
+        if self.receptive_field_layout == 'csr':
+            mac_ranks = get_mac_order(
+                num_macs, mac_grid_num_cols, mac_ordering, self.device
+            )[mac_shard[0]:mac_shard[1]]
+
+        if self.mac_shard != (0, num_macs):
+            self.mac_positions = self.mac_positions[mac_shard[0]:mac_shard[1]]
+            self.input_connections = self.input_connections[
+                mac_shard[0]:mac_shard[1]
+            ]
+            mac_rf_sizes = mac_rf_sizes[mac_shard[0]:mac_shard[1]]
+            num_macs = mac_shard[1] - mac_shard[0]
+            self.num_macs = num_macs
+
         self.receptive_field_num_macs = self.input_connections.shape[1]
+        self.mac_indices = torch.arange(
+            num_macs, dtype=torch.long, device=self.device
+        )
+        self.num_input_words = -(
+            -self.receptive_field_num_macs * prev_layer_num_cms_per_mac *
+            prev_layer_num_neurons_per_cm // 64
+        )
 
         self.activation_threshold_min = torch.mul(
             mac_rf_sizes,
@@ -144,272 +717,4011 @@ class SparseyLayer(torch.nn.Module):
             activation_threshold_max * prev_layer_num_cms_per_mac
         ).unsqueeze(-1).unsqueeze(0)
 
-        self.weights = torch.nn.Parameter(
-            torch.zeros(
+        self.zero_inputs_are_inactive = bool(
+            torch.all(self.activation_threshold_min > 0)
+        )
+
+        self.prev_layer_num_cms_per_mac = prev_layer_num_cms_per_mac
+        self.prev_layer_num_neurons_per_cm = prev_layer_num_neurons_per_cm
+
+        if self.receptive_field_layout == 'csr':
+            mac_input_sets = None
+
+            if shared_receptive_fields:
+                mac_input_sets = self.find_shared_receptive_fields(
+                    self.input_connections
+                )
+
+            self.build_csr_receptive_fields(
+                mac_rf_sizes, mac_ranks, mac_input_sets
+            )
+
+            weights_shape = (
+                self.input_indices.shape[0] *
+                prev_layer_num_cms_per_mac *
+                prev_layer_num_neurons_per_cm,
+                self.num_cms_per_mac * self.num_neurons_per_cm
+            )
+        else:
+            weights_shape = (
                 self.num_macs,
                 self.receptive_field_num_macs *
                 prev_layer_num_cms_per_mac *
                 prev_layer_num_neurons_per_cm,
-                self.num_cms_per_mac * self.num_neurons_per_cm,
-                dtype=torch.float32, device=self.device,
+                self.num_cms_per_mac * self.num_neurons_per_cm
+            )
+
+        self.dense_weights_shape = weights_shape
+
+        if self.weight_storage == 'sparse':
+            # no weight row has been written yet, so none are stored.
+            self.weight_rows = torch.empty(
+                0, dtype=torch.long, device=self.device
+            )
+
+            weights_shape = (0, weights_shape[-1])
+
+        if weight_file is None or torch.device(device).type == 'meta':
+            weights = torch.zeros(
+                weights_shape,
+                dtype=weights_dtype, device=device,
                 requires_grad=False
             )
+        else:
+            self.weight_window = WeightWindow(
+                weight_file, weights_shape, weights_dtype,
+                max_resident_weight_bytes
+            )
+
+            weights = self.weight_window.weights
+
+        # integer tensors cannot require gradients.
+        self.weights = torch.nn.Parameter(
+            weights, requires_grad=weights_dtype.is_floating_point
         )
 
+        if self.receptive_field_layout == 'csr':
+            self.mac_weight_offsets = torch.empty(
+                self.num_macs, dtype=torch.long, device=self.device
+            )
 
-    def compute_mac_positions(
-        self, num_macs: int, mac_grid_num_rows: int,
-        mac_grid_num_cols: int,
-        grid_layout: str) -> List[Tuple[float, float]]:
+            for bucket in self.rf_buckets:
+                self.mac_weight_offsets[bucket.mac_indices] = torch.arange(
+                    bucket.weights_start, bucket.weights_end,
+                    (bucket.weights_end - bucket.weights_start) //
+                    bucket.mac_indices.shape[0],
+                    dtype=torch.long, device=self.device
+                )
+
+            if self.mac_ordering != 'row_major' or shared_receptive_fields:
+                self.canonical_weight_rows = self.get_canonical_weight_rows()
+        else:
+            self.mac_weight_offsets = torch.mul(
+                torch.arange(
+                    self.num_macs, dtype=torch.long, device=self.device
+                ), self.dense_weights_shape[1]
+            )
+
+        self.input_winner_dtype = self._get_winner_dtype(
+            prev_layer_num_neurons_per_cm
+        )
+        self.output_winner_dtype = self._get_winner_dtype(num_neurons_per_cm)
+
+        # the index code path never pads its inputs with a dummy MAC, so
+        # padded connections are masked out and redirected to MAC 0.
+        self.input_connection_mask = torch.lt(
+            self.input_connections, prev_layer_num_macs
+        )
+
+        self.index_input_connections = torch.mul(
+            self.input_connections, self.input_connection_mask
+        )
+
+        if self.receptive_field_layout == 'padded':
+            # offset of the first weight row of every (MAC, receptive
+            # field position, CM) triple in the flattened weight matrix.
+            self.index_row_offsets = torch.add(
+                torch.arange(
+                    self.num_macs, dtype=torch.long, device=self.device
+                ).view(-1, 1, 1) * self.dense_weights_shape[1],
+                torch.arange(
+                    self.receptive_field_num_macs *
+                    prev_layer_num_cms_per_mac,
+                    dtype=torch.long, device=self.device
+                ).view(
+                    1, self.receptive_field_num_macs,
+                    prev_layer_num_cms_per_mac
+                ) * prev_layer_num_neurons_per_cm
+            ).unsqueeze(0)
+
+        self.device = device
+
+
+    def build_csr_receptive_fields(
+        self, mac_rf_sizes: torch.Tensor, mac_ranks: torch.Tensor,
+        mac_input_sets: Optional[torch.Tensor] = None) -> None:
         """
-        Computes the positions of each MAC in this layer.
+        Builds the compressed (CSR) receptive field representation
+        of the layer from the padded input connections, and groups
+        MACs with equal receptive field sizes into buckets whose
+        weights are stored contiguously.
 
         Args:
-            num_macs: int representing the number of macs in the layer.
-            mac_grid_num_rows: int representing the number of rows
-                in the grid for this layer.
-            mac_grid_num_cols: int representing the number of columns
-                in the grid for this layer.   
-            grid_layout: the type of grid layout (rectangular or hexagonal)
-                for the layer.   
-
-        Returns:
-            (list[Tuple(int, int)]): the positions of all MACs in the layer.      
+            mac_rf_sizes (torch.Tensor): the number of previous layer
+                MACs in the receptive field of each MAC.
+            mac_ranks (torch.Tensor): the rank of each MAC in the
+                order MACs are stored in within their bucket.
+            mac_input_sets (Optional[torch.Tensor]): the distinct
+                receptive field of each MAC, as returned by
+                find_shared_receptive_fields, to split the buckets
+                into buckets of MACs sharing their inputs; None to not
+                share inputs.
         """
-        mac_positions = []
-        global_col_offset = 0.5 if grid_layout == 'hex' else 0
+        rf_sizes = mac_rf_sizes.long()
+        rows_per_input_mac = (
+            self.prev_layer_num_cms_per_mac *
+            self.prev_layer_num_neurons_per_cm
+        )
 
-        grid_col_spacing = 0.0
+        self.input_offsets = torch.zeros(
+            self.num_macs + 1, dtype=torch.long, device=self.device
+        )
 
-        if mac_grid_num_rows == 1:
-            row_locations = [0.5]
-        else:
-            grid_row_spacing = 1 / (mac_grid_num_rows - 1)
+        torch.cumsum(rf_sizes, dim=0, out=self.input_offsets[1:])
 
-            row_locations = [
-                i * grid_row_spacing
-                for i in range(mac_grid_num_rows)
-            ]
+        self.input_indices = self.input_connections[
+            torch.lt(
+                torch.arange(
+                    self.receptive_field_num_macs, device=self.device
+                ).unsqueeze(0),
+                rf_sizes.unsqueeze(1)
+            )
+        ]
 
-        if mac_grid_num_cols == 1:
-            col_locations = [0.5]
-        else:
-            grid_col_spacing = 1 / (mac_grid_num_cols - 1)
+        self.rf_buckets = []
+        input_set_macs = []
+        num_input_sets = 0
+        weights_start = 0
 
-            col_locations = [
-                i * grid_col_spacing
-                for i in range(mac_grid_num_cols)
-            ]
+        for rf_size in torch.unique(rf_sizes).tolist():
+            mac_indices = torch.nonzero(
+                torch.eq(rf_sizes, rf_size)
+            ).view(-1)
 
-        for i in range(num_macs):
-            mac_positions.append(
-                (
-                    row_locations[i // mac_grid_num_cols],
-                    col_locations[i % mac_grid_num_cols] + (
-                        global_col_offset * (
-                            (i % mac_grid_num_rows) % 2
-                        ) * grid_col_spacing
+            mac_indices = mac_indices[torch.argsort(mac_ranks[mac_indices])]
+
+            if mac_input_sets is None:
+                buckets = [(mac_indices, None, 1)]
+            else:
+                buckets, set_macs = self.split_shared_bucket(
+                    mac_indices, mac_input_sets[mac_indices],
+                    num_input_sets
+                )
+
+                if set_macs.shape[0] > 0:
+                    input_set_macs.append(set_macs)
+                    num_input_sets += set_macs.shape[0]
+
+            bucket_rows_per_mac = rf_size * rows_per_input_mac
+
+            for bucket_macs, input_sets_start, input_sets_step in buckets:
+                weights_end = (
+                    weights_start + bucket_macs.shape[0] * bucket_rows_per_mac
+                )
+
+                index_row_offsets = torch.add(
+                    torch.arange(
+                        bucket_macs.shape[0], dtype=torch.long,
+                        device=self.device
+                    ).view(-1, 1, 1) * bucket_rows_per_mac + weights_start,
+                    torch.arange(
+                        rf_size * self.prev_layer_num_cms_per_mac,
+                        dtype=torch.long, device=self.device
+                    ).view(
+                        1, rf_size, self.prev_layer_num_cms_per_mac
+                    ) * self.prev_layer_num_neurons_per_cm
+                ).unsqueeze(0)
+
+                self.rf_buckets.append(
+                    ReceptiveFieldBucket(
+                        bucket_macs,
+                        self.input_connections[bucket_macs, :rf_size],
+                        weights_start, weights_end,
+                        index_row_offsets,
+                        input_sets_start, input_sets_step
                     )
-                 )
+                )
+
+                weights_start = weights_end
+
+        if input_set_macs:
+            input_set_macs = torch.cat(input_set_macs)
+
+            self.input_set_offsets = torch.zeros(
+                input_set_macs.shape[0] + 1, dtype=torch.long,
+                device=self.device
             )
 
-        return mac_positions
+            torch.cumsum(
+                rf_sizes[input_set_macs], dim=0,
+                out=self.input_set_offsets[1:]
+            )
+
+            self.input_set_indices = self.input_connections[
+                input_set_macs
+            ][
+                torch.lt(
+                    torch.arange(
+                        self.receptive_field_num_macs, device=self.device
+                    ).unsqueeze(0),
+                    rf_sizes[input_set_macs].unsqueeze(1)
+                )
+            ]
 
+            # MACs that gather their own inputs have no shared set.
+            input_set_order = torch.full(
+                (torch.max(mac_input_sets).item() + 1,), -1,
+                dtype=torch.long, device=self.device
+            )
+            input_set_order[mac_input_sets[input_set_macs]] = torch.arange(
+                input_set_macs.shape[0], dtype=torch.long, device=self.device
+            )
 
-    def _compute_distance(self,
-        position_1: Tuple[float, float],
-        position_2: Tuple[float, float]) -> float:
+            self.mac_input_sets = input_set_order[mac_input_sets]
+
+
+    def find_shared_receptive_fields(
+        self, input_connections: torch.Tensor) -> torch.Tensor:
         """
-        Computes the Euclidean distance between two positions.
+        Finds the MACs whose receptive fields contain exactly the same
+        previous layer MACs, as found by
+        find_connected_macs_in_prev_layer.
 
         Args:
-            position_1 (Tuple[int, int]): x and y coordinates of the
-                first point.
+            input_connections (torch.Tensor): the padded indices of the
+                connected previous layer MACs of each MAC, sorted.
+
+        Returns:
+            (torch.Tensor): the index of the distinct receptive field
+                of each MAC; MACs with the same index are connected to
+                the same MACs.
         """
-        return (
-            abs(position_1[0] - position_2[0]) ** 2 +
-            abs(position_1[1] - position_2[1]) ** 2
-        ) ** 0.5
+        return torch.unique(
+            input_connections, dim=0, return_inverse=True
+        )[1]
 
 
-    def find_connected_macs_in_prev_layer(
-        self, mac_positions: list[Tuple[float, float]],
-        prev_layer_mac_positions: list[Tuple[float, float]],
-        prev_layer_num_macs: int
-    ) -> list[torch.Tensor]:
+    def split_shared_bucket(
+        self, mac_indices: torch.Tensor, bucket_input_sets: torch.Tensor,
+        input_sets_start: int
+    ) -> Tuple[List[Tuple[torch.Tensor, Optional[int], int]], torch.Tensor]:
         """
-        Finds the list of connected MACs in the previous layer
-        for each MAC in the current layer.
+        Splits a bucket of MACs with equal receptive field sizes into
+        buckets whose MACs gather their inputs from one shared gather
+        of each distinct receptive field, with a single batched matmul
+        per bucket.
+
+        The largest groups of MACs sharing a receptive field each get a
+        bucket whose MACs all read the same inputs. The MACs of the
+        other groups are dealt out over levels: the first MAC of every
+        group, then the second MAC of every group with at least two,
+        and so on, so that the MACs of each level read consecutive
+        receptive fields. The number of largest groups is chosen to
+        minimize the number of buckets. Buckets with too few MACs per
+        receptive field are not split, and gather the inputs of each
+        MAC.
 
         Args:
-            mac_positions (list[Tuple[int, int]]): list
-                of positions of MACs in the current layer.
-            prev_layer_mac_positions (list[Tuple[int, int]]):
-                list of positions of MACs in the previous layer.
-            prev_layer_num_macs (int): the number of MACS
-                in the previous layer.
+            mac_indices (torch.Tensor): the MACs of the bucket, in the
+                order they would be stored in.
+            bucket_input_sets (torch.Tensor): the distinct receptive
+                field of each MAC of the bucket.
+            input_sets_start (int): the index of the first receptive
+                field of the bucket among the shared gathers.
 
         Returns:
-            torch.tensor: list of tensors containing the indices
-                of connected MACs from the previous layer for each
-                MAC in the current layer.
+            (Tuple[List[Tuple[torch.Tensor, Optional[int], int]],
+                torch.Tensor]): the MAC indices, first receptive field
+                and receptive field step of each bucket, and a MAC
+                connected to each shared receptive field of the bucket,
+                in the order they are gathered in.
         """
-        connections = []
-        mac_rf_sizes = []
-        max_len = 0
+        num_bucket_macs = mac_indices.shape[0]
 
-        for mac_position in mac_positions:
-            mac_connections = []
-
-            for (
-                index, prev_layer_mac_position
-            ) in enumerate(prev_layer_mac_positions):
-                if self._compute_distance(
-                    mac_position,
-                    prev_layer_mac_position
-                ) <= self.receptive_field_size:
-                    mac_connections.append(index)
+        _, mac_sets, set_sizes = torch.unique(
+            bucket_input_sets, return_inverse=True, return_counts=True
+        )
 
-            connections.append(mac_connections)
-            max_len = max(max_len, len(mac_connections))
+        if (
+            set_sizes.shape[0] * SHARED_RECEPTIVE_FIELDS_MIN_MACS_PER_SET >
+            num_bucket_macs
+        ):
+            return [(mac_indices, None, 1)], mac_indices[:0]
 
-        for i in range(len(connections)):
-            mac_rf_sizes.append(len(connections[i]))
+        positions = torch.arange(
+            num_bucket_macs, dtype=torch.long, device=self.device
+        )
 
-            while len(connections[i]) < max_len:
-                connections[i].append(prev_layer_num_macs)
+        set_first_positions = torch.full_like(
+            set_sizes, num_bucket_macs
+        ).scatter_reduce_(0, mac_sets, positions, 'amin')
 
-        return torch.tensor(
-            connections, dtype=torch.long, device=self.device
-        ), torch.tensor(
-            mac_rf_sizes, dtype=torch.float32, device=self.device
+        # groups are ordered by decreasing size, then by their first
+        # MAC, so that the groups of every level come first.
+        set_order = torch.argsort(
+            -set_sizes * num_bucket_macs + set_first_positions
+        )
+        set_ranks = torch.empty_like(set_order)
+        set_ranks[set_order] = torch.arange(
+            set_order.shape[0], dtype=torch.long, device=self.device
         )
 
+        sorted_sizes = set_sizes[set_order].tolist()
 
-    def forward(self, x: torch.Tensor) -> torch.Tensor:
-        """
-        Passes data through a Sparsey layer.
+        # each own bucket takes one matmul, and the levels of the other
+        # groups as many as the largest of them has MACs.
+        num_own_buckets = min(
+            range(len(sorted_sizes) + 1),
+            key=lambda num_own: num_own + (
+                sorted_sizes[num_own] if num_own < len(sorted_sizes) else 0
+            )
+        )
 
-        Args:
-            x: torch.Tensor of size (
-                batch_size,
-                prev_layer_num_macs,
-                prev_layer_num_cms_per_mac *
-                prev_layer_num_neurons_per_cm
-            ) of dtype torch.float32
+        mac_set_ranks = set_ranks[mac_sets]
+        mac_order = torch.argsort(
+            mac_set_ranks * num_bucket_macs + positions
+        )
+        sorted_set_ranks = mac_set_ranks[mac_order]
 
-        Returns:
-            torch.Tensor of size (
-                batch_size,
-                num_macs,
-                num_cms_per_mac * num_neurons_per_cm
-            ) of dtype torch.float32
-        """
-        if tuple(x.shape[1:]) != self.prev_layer_output_shape:
-            raise ValueError(
-                'Input shape is incorrect! '
-                f'Expected shape {self.prev_layer_output_shape} but received '
-                f'{tuple(x.shape[1:])} instead.'    
-            )
+        set_starts = torch.zeros_like(set_sizes)
+        torch.cumsum(set_sizes[set_order][:-1], dim=0, out=set_starts[1:])
 
-        x = torch.cat(
-            (
-                x,
-                torch.zeros(
-                    (x.shape[0], 1, *self.prev_layer_output_shape[1:]),
-                    dtype=torch.float32,
-                    device=self.device
-                )
-            ), dim=1
+        positions_in_set = torch.sub(
+            positions, set_starts[sorted_set_ranks]
         )
 
-        batch_size = x.shape[0]
+        buckets = []
 
-        with torch.no_grad():
-            mac_inputs = x[:, self.input_connections].view(
-                batch_size, self.num_macs, -1
-            )
+        for set_rank in range(num_own_buckets):
+            start = set_starts[set_rank].item()
 
-            num_active_inputs = torch.sum(mac_inputs, dim=2, keepdim=True)
+            buckets.append((
+                mac_indices[mac_order[start:start + sorted_sizes[set_rank]]],
+                input_sets_start + set_rank, 0
+            ))
 
-            macs_are_active = torch.logical_and(
-                torch.ge(
-                    num_active_inputs,
-                    self.activation_threshold_min
-                ),
-                torch.le(
-                    num_active_inputs,
-                    self.activation_threshold_max
-                )
-            )
+        if num_own_buckets < len(sorted_sizes):
+            levels_start = set_starts[num_own_buckets].item()
 
-            self.is_active = macs_are_active.view(batch_size, self.num_macs)
+            for level in range(sorted_sizes[num_own_buckets]):
+                level_macs = mac_order[levels_start:][
+                    torch.eq(positions_in_set[levels_start:], level)
+                ]
 
-            raw_activations = torch.matmul(
-                mac_inputs.transpose(0, 1),
-                self.weights
-            ).transpose(0, 1)
+                buckets.append((
+                    mac_indices[level_macs],
+                    input_sets_start + num_own_buckets, 1
+                ))
 
-            torch.div(raw_activations, num_active_inputs, out=raw_activations)
-            torch.nan_to_num(raw_activations, nan=0.0, out=raw_activations)
+        return buckets, mac_indices[mac_order[set_starts]]
+
+    def get_padded_weight_rows(self) -> torch.Tensor:
+        """
+        Finds where every weight row of the 'csr' layout, in row-major
+        MAC order, is stored in the weights of the 'padded' layout
+        flattened to 2 dimensions. Used to load state dicts saved by
+        a layer with the other layout.
+
+        Returns:
+            (torch.Tensor): the padded row of every CSR weight row.
+        """
+        rows_per_input_mac = (
+            self.prev_layer_num_cms_per_mac *
+            self.prev_layer_num_neurons_per_cm
+        )
+        rf_sizes = torch.sum(self.input_connection_mask, dim=1)
+
+        # CSR stores MACs by receptive field size, then by index.
+        mac_order = torch.argsort(
+            rf_sizes * self.num_macs +
+            torch.arange(self.num_macs, device=self.device)
+        )
+
+        padded_rows = torch.arange(
+            self.num_macs * self.receptive_field_num_macs *
+            rows_per_input_mac,
+            dtype=torch.long, device=self.device
+        ).view(self.num_macs, -1)
+
+        rows_are_stored = torch.lt(
+            torch.arange(padded_rows.shape[1], device=self.device),
+            (rf_sizes * rows_per_input_mac).unsqueeze(1)
+        )
+
+        return padded_rows[mac_order][rows_are_stored[mac_order]]
+
+
+    def get_canonical_weight_rows(self) -> torch.Tensor:
+        """
+        Finds where every weight row of the layer would be stored if
+        the MACs of each receptive field size were stored in row-major
+        order ('csr' layout only).
+
+        Returns:
+            (torch.Tensor): the stored row of every weight row in
+                row-major MAC order.
+        """
+        rows_per_mac = torch.mul(
+            torch.sum(
+                torch.lt(
+                    self.input_connections, self.prev_layer_output_shape[0]
+                ), dim=1
+            ),
+            self.prev_layer_num_cms_per_mac *
+            self.prev_layer_num_neurons_per_cm
+        )
+
+        # CSR stores MACs by receptive field size, then by index.
+        mac_order = torch.argsort(
+            rows_per_mac * self.num_macs +
+            torch.arange(self.num_macs, device=self.device)
+        )
+        rows_per_mac = rows_per_mac[mac_order]
+
+        mac_row_starts = torch.zeros_like(rows_per_mac)
+        torch.cumsum(rows_per_mac[:-1], dim=0, out=mac_row_starts[1:])
+
+        return torch.add(
+            torch.repeat_interleave(
+                self.mac_weight_offsets[mac_order] - mac_row_starts,
+                rows_per_mac
+            ),
+            torch.arange(
+                self.dense_weights_shape[0], dtype=torch.long,
+                device=self.device
+            )
+        )
+
+
+    def get_bucket_weights(self, bucket: ReceptiveFieldBucket,
+        weights: torch.Tensor = None) -> torch.Tensor:
+        """
+        Returns a view of the weights of the MACs in a receptive
+        field bucket ('csr' layout only).
+
+        Args:
+            bucket (ReceptiveFieldBucket): the bucket to get the
+                weights for.
+            weights (torch.Tensor): a tensor with the same layout
+                as the layer weights to take the view of; defaults to
+                the layer weights.
+
+        Returns:
+            (torch.Tensor): view of size (
+                num_bucket_macs,
+                bucket_receptive_field_num_macs *
+                prev_layer_num_cms_per_mac *
+                prev_layer_num_neurons_per_cm,
+                num_cms_per_mac * num_neurons_per_cm
+            ).
+        """
+        if weights is None:
+            weights = self.weights
+
+        return weights[bucket.weights_start:bucket.weights_end].view(
+            bucket.mac_indices.shape[0], -1, weights.shape[-1]
+        )
+
+
+    def get_mac_chunks(self, workspace_budget: Optional[int],
+                       bytes_per_weight_row: int,
+                       bytes_per_mac: int = 0) -> List[ReceptiveFieldBucket]:
+        """
+        Splits the MACs of the layer into chunks of MACs with equal
+        receptive field sizes whose weights are stored contiguously,
+        so that the workspace needed to process each chunk fits in a
+        budget, and the weights of each chunk fit in the weight window
+        of layers with a weight file. Chunks always contain at least
+        one MAC.
+
+        Args:
+            workspace_budget (Optional[int]): the workspace budget in
+                bytes, or None to not split the MACs any further than
+                their receptive field sizes require.
+            bytes_per_weight_row (int): the workspace needed per weight
+                row of each MAC in a chunk.
+            bytes_per_mac (int): the additional workspace needed per
+                MAC in a chunk.
+
+        Returns:
+            (List[ReceptiveFieldBucket]): the chunks. For the padded
+                layout, the weights range of a chunk is its MAC range.
+        """
+        if self.receptive_field_layout == 'csr':
+            buckets = self.rf_buckets
+        else:
+            buckets = [
+                ReceptiveFieldBucket(
+                    self.mac_indices,
+                    self.input_connections, 0, self.num_macs,
+                    self.index_row_offsets
+                )
+            ]
+
+        max_resident_bytes = None
+
+        if self.weight_window is not None:
+            max_resident_bytes = self.weight_window.max_resident_bytes
+
+        if workspace_budget is None and max_resident_bytes is None:
+            return buckets
+
+        chunks = []
+
+        for bucket in buckets:
+            num_bucket_macs = bucket.mac_indices.shape[0]
+            num_mac_weight_rows = (
+                bucket.input_connections.shape[1] *
+                self.prev_layer_num_cms_per_mac *
+                self.prev_layer_num_neurons_per_cm
+            )
+
+            chunk_size = num_bucket_macs
+
+            if workspace_budget is not None:
+                chunk_size = max(
+                    1, workspace_budget // (
+                        bytes_per_mac +
+                        bytes_per_weight_row * num_mac_weight_rows
+                    )
+                )
+
+            if max_resident_bytes is not None:
+                chunk_size = min(
+                    chunk_size, max(
+                        1, max_resident_bytes // (
+                            num_mac_weight_rows * self.weights.shape[-1] *
+                            self.weights.element_size()
+                        )
+                    )
+                )
+
+            for chunk_start in range(0, num_bucket_macs, chunk_size):
+                chunks.append(
+                    self.slice_mac_chunk(
+                        bucket, chunk_start,
+                        min(chunk_start + chunk_size, num_bucket_macs)
+                    )
+                )
+
+        return chunks
+
+
+    def slice_mac_chunk(self, chunk: ReceptiveFieldBucket, start: int,
+                        end: int) -> ReceptiveFieldBucket:
+        """
+        Returns a range of the MACs of a chunk as a chunk.
+
+        Args:
+            chunk (ReceptiveFieldBucket): the chunk to slice.
+            start (int): the position of the first MAC in the chunk.
+            end (int): the position after the last MAC in the chunk.
+
+        Returns:
+            (ReceptiveFieldBucket): the chunk of MACs in the range.
+        """
+        weights_per_mac = (
+            chunk.weights_end - chunk.weights_start
+        ) // chunk.mac_indices.shape[0]
+
+        input_sets_start = chunk.input_sets_start
+
+        if input_sets_start is not None:
+            input_sets_start += start * chunk.input_sets_step
+
+        return ReceptiveFieldBucket(
+            chunk.mac_indices[start:end],
+            chunk.input_connections[start:end],
+            chunk.weights_start + start * weights_per_mac,
+            chunk.weights_start + end * weights_per_mac,
+            chunk.index_row_offsets[:, start:end],
+            input_sets_start, chunk.input_sets_step
+        )
+
+
+    def get_mac_groups(
+        self, chunks: List[ReceptiveFieldBucket],
+        num_groups: int) -> List[List[ReceptiveFieldBucket]]:
+        """
+        Splits chunks of MACs into groups doing about the same amount
+        of work, to be processed by different threads. The work of a
+        MAC is taken to be proportional to its receptive field size,
+        and chunks are sliced where groups meet.
+
+        Args:
+            chunks (List[ReceptiveFieldBucket]): the chunks, as
+                returned by get_mac_chunks.
+            num_groups (int): the number of groups to split them into.
+
+        Returns:
+            (List[List[ReceptiveFieldBucket]]): the chunks of each
+                nonempty group, at most num_groups of them.
+        """
+        if num_groups == 1:
+            return [chunks]
+
+        total_work = sum(chunk.input_connections.numel() for chunk in chunks)
+        groups = [[] for _ in range(num_groups)]
+        group_index, work = 0, 0
+
+        for chunk in chunks:
+            num_chunk_macs, mac_work = chunk.input_connections.shape
+            start = 0
+
+            while start < num_chunk_macs:
+                group_end_work = total_work * (group_index + 1) / num_groups
+                end = min(
+                    num_chunk_macs,
+                    start + max(1, math.ceil((group_end_work - work) / mac_work))
+                )
+
+                groups[group_index].append(
+                    chunk if end - start == num_chunk_macs
+                    else self.slice_mac_chunk(chunk, start, end)
+                )
+
+                work += (end - start) * mac_work
+                start = end
+
+                if work >= group_end_work and group_index < num_groups - 1:
+                    group_index += 1
+
+        return [group for group in groups if group]
+
+
+    def get_group_workspace(
+        self, group_index: int) -> Optional[WorkspaceArena]:
+        """
+        Returns the workspace of the thread processing a group of MACs.
+
+        Args:
+            group_index (int): the index of the group.
+
+        Returns:
+            (Optional[WorkspaceArena]): the workspace, or None if the
+                layer does not reuse its workspace.
+        """
+        if self.group_workspaces is None:
+            return None
+
+        return self.group_workspaces[group_index]
+
+
+    def get_buffer(self, name: str, shape: Tuple[int, ...],
+                   dtype: torch.dtype = torch.float32) -> torch.Tensor:
+        """
+        Returns a temporary buffer, reused between forward passes if
+        the layer keeps a workspace.
+
+        Args:
+            name (str): the name of the buffer.
+            shape (Tuple[int, ...]): the shape of the buffer.
+            dtype (torch.dtype): the dtype of the buffer.
+
+        Returns:
+            (torch.Tensor): the buffer, with undefined contents.
+        """
+        return get_workspace_buffer(
+            self.workspace, name, shape, dtype, self.device
+        )
+
+
+    def pad_input(self, x: torch.Tensor,
+                  dtype: torch.dtype = torch.float32) -> torch.Tensor:
+        """
+        Appends the empty MAC that padded receptive field connections
+        point to to the layer input.
+
+        Args:
+            x (torch.Tensor): the layer input.
+            dtype (torch.dtype): the dtype of the padded input.
+
+        Returns:
+            (torch.Tensor): the padded input, of size (
+                batch_size, prev_layer_num_macs + 1,
+                prev_layer_num_cms_per_mac *
+                prev_layer_num_neurons_per_cm
+            ).
+        """
+        padded_input = self.get_buffer(
+            'padded_input',
+            (x.shape[0], x.shape[1] + 1, *self.prev_layer_output_shape[1:]),
+            dtype
+        )
+
+        padded_input[:, :-1].copy_(x)
+        padded_input[:, -1].zero_()
+
+        return padded_input
+
+
+    def gather_input_sets(
+        self, x: torch.Tensor,
+        workspace: Optional[WorkspaceArena] = None) -> torch.Tensor:
+        """
+        Gathers the inputs of every shared receptive field of the
+        layer once, to be shared by all the MACs connected to it.
+
+        Args:
+            x (torch.Tensor): the layer input.
+            workspace (Optional[WorkspaceArena]): the arena to take
+                the gathered inputs from, if any.
+
+        Returns:
+            (torch.Tensor): the gathered inputs of the receptive fields
+                one after the other, of size (
+                    batch_size,
+                    num_input_set_indices *
+                    prev_layer_num_cms_per_mac *
+                    prev_layer_num_neurons_per_cm
+                ).
+        """
+        return torch.index_select(
+            x, 1, self.input_set_indices,
+            out=get_workspace_buffer(
+                workspace, 'input_sets',
+                (x.shape[0], self.input_set_indices.shape[0], x.shape[2]),
+                x.dtype, self.device
+            )
+        ).view(x.shape[0], -1)
+
+
+    def get_chunk_set_inputs(self, chunk: ReceptiveFieldBucket,
+                             set_inputs: torch.Tensor) -> torch.Tensor:
+        """
+        Returns a view of the shared inputs of the MACs in a chunk
+        with shared receptive fields.
+
+        Args:
+            chunk (ReceptiveFieldBucket): the chunk of MACs.
+            set_inputs (torch.Tensor): the inputs of every receptive
+                field, as returned by gather_input_sets.
+
+        Returns:
+            (torch.Tensor): view of size (
+                batch_size, num_chunk_macs,
+                chunk_receptive_field_num_macs *
+                prev_layer_num_cms_per_mac *
+                prev_layer_num_neurons_per_cm
+            ).
+        """
+        num_chunk_macs = chunk.mac_indices.shape[0]
+        rows_per_input_mac = (
+            self.prev_layer_num_cms_per_mac *
+            self.prev_layer_num_neurons_per_cm
+        )
+        num_inputs = chunk.input_connections.shape[1] * rows_per_input_mac
+        start = self.input_set_offsets[
+            chunk.input_sets_start
+        ].item() * rows_per_input_mac
+
+        if chunk.input_sets_step == 0:
+            return set_inputs[:, start:start + num_inputs].unsqueeze(1).expand(
+                -1, num_chunk_macs, -1
+            )
+
+        # the receptive fields of a chunk all have the same size, and
+        # are stored one after the other.
+        return set_inputs[
+            :, start:start + num_chunk_macs * num_inputs
+        ].view(-1, num_chunk_macs, num_inputs)
+
+
+    def count_active_inputs(self, x: torch.Tensor) -> torch.Tensor:
+        """
+        Counts the active inputs of each MAC from the sums of the
+        inputs of every previous layer MAC, without gathering the
+        inputs of each MAC.
+
+        Args:
+            x (torch.Tensor): the layer input.
+
+        Returns:
+            (torch.Tensor): the number of active inputs of each MAC, of
+                size (batch_size, num_macs, 1).
+        """
+        input_mac_sums = self.get_buffer(
+            'input_mac_sums', (x.shape[0], x.shape[1] + 1)
+        )
+
+        input_mac_sums[:, -1].zero_()
+        torch.sum(x, dim=2, dtype=torch.float32, out=input_mac_sums[:, :-1])
+
+        mac_input_sums = torch.index_select(
+            input_mac_sums, 1, self.input_connections.reshape(-1),
+            out=self.get_buffer(
+                'mac_input_sums', (x.shape[0], self.input_connections.numel())
+            )
+        ).view(x.shape[0], self.num_macs, -1)
+
+        return torch.sum(
+            mac_input_sums, dim=2, keepdim=True,
+            out=self.get_buffer(
+                'num_active_inputs', (x.shape[0], self.num_macs, 1)
+            )
+        )
+
+
+    def find_weight_rows(
+        self, rows: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Finds where weight rows are kept in the sparse weight storage.
+
+        Args:
+            rows (torch.Tensor): indices of rows in the dense weights
+                flattened to 2 dimensions.
+
+        Returns:
+            (Tuple[torch.Tensor, torch.Tensor]): the positions of the
+                rows in the stored weights, and a boolean mask of the
+                rows that are stored. Positions of rows that are not
+                stored are valid but meaningless.
+        """
+        if not self.weight_rows.shape[0]:
+            return (
+                torch.zeros_like(rows),
+                torch.zeros(rows.shape, dtype=torch.bool, device=self.device)
+            )
+
+        positions = torch.searchsorted(self.weight_rows, rows)
+        torch.clamp(positions, max=self.weight_rows.shape[0] - 1, out=positions)
+
+        return positions, torch.eq(self.weight_rows[positions], rows)
+
+
+    def get_weight_row_macs(self) -> torch.Tensor:
+        """
+        Returns the MAC each row of the sparse weight storage
+        belongs to.
+
+        Returns:
+            (torch.Tensor): the index of the MAC of each stored row.
+        """
+        mac_weight_offsets, mac_order = torch.sort(self.mac_weight_offsets)
+
+        return mac_order[
+            torch.searchsorted(
+                mac_weight_offsets, self.weight_rows, right=True
+            ) - 1
+        ]
+
+
+    def insert_weight_rows(self, rows: torch.Tensor) -> torch.Tensor:
+        """
+        Adds zero-valued rows to the sparse weight storage for every
+        row in rows that is not stored yet.
+
+        Args:
+            rows (torch.Tensor): indices of rows in the dense weights
+                flattened to 2 dimensions.
+
+        Returns:
+            (torch.Tensor): the new position of every previously
+                stored row, used to move state kept per stored row.
+        """
+        num_stored_rows = self.weight_rows.shape[0]
+        new_rows = torch.unique(rows[~self.find_weight_rows(rows)[1]])
+
+        if not new_rows.shape[0]:
+            return torch.arange(
+                num_stored_rows, dtype=torch.long, device=self.device
+            )
+
+        weight_rows, row_order = torch.sort(
+            torch.cat((self.weight_rows, new_rows))
+        )
+
+        row_positions = torch.empty_like(row_order)
+        row_positions[row_order] = torch.arange(
+            row_order.shape[0], dtype=torch.long, device=self.device
+        )
+
+        weights = torch.zeros(
+            (row_order.shape[0], self.weights.shape[-1]),
+            dtype=self.weights.dtype, device=self.device
+        )
+
+        weights[row_positions[:num_stored_rows]] = self.weights.detach()
+
+        self.weight_rows = weight_rows
+        self.weights.data = weights
+
+        return row_positions[:num_stored_rows]
+
+
+    def compact_weights(self) -> torch.Tensor:
+        """
+        Removes the rows whose weights are all zero from the sparse
+        weight storage.
+
+        Returns:
+            (torch.Tensor): the previous positions of the rows that
+                were kept, used to move state kept per stored row.
+        """
+        kept_rows = torch.nonzero(
+            torch.any(torch.ne(self.weights.detach(), 0.0), dim=1)
+        ).view(-1)
+
+        self.weight_rows = self.weight_rows[kept_rows]
+        self.weights.data = self.weights.detach()[kept_rows]
+
+        return kept_rows
+
+
+    def get_dense_weights(self) -> torch.Tensor:
+        """
+        Returns the weights of the layer in the dense format,
+        whatever the weight storage.
+
+        Returns:
+            (torch.Tensor): the weights, of size dense_weights_shape.
+        """
+        if self.weight_storage == 'dense':
+            return self.weights.detach()
+
+        weights = torch.zeros(
+            (
+                math.prod(self.dense_weights_shape[:-1]),
+                self.dense_weights_shape[-1]
+            ), dtype=self.weights.dtype, device=self.device
+        )
+
+        weights[self.weight_rows] = self.weights.detach()
+
+        return weights.view(self.dense_weights_shape)
+
+
+    def set_dense_weights(self, weights: torch.Tensor) -> None:
+        """
+        Replaces the weights of the layer with weights in the
+        dense format, whatever the weight storage.
+
+        Args:
+            weights (torch.Tensor): the new weights, of size
+                dense_weights_shape.
+        """
+        weights = convert_weights(
+            weights.detach().to(self.device), self.weights.dtype
+        )
+
+        if self.weight_storage == 'dense':
+            self.weights.data.copy_(weights)
+
+            return
+
+        weights = weights.reshape(-1, self.dense_weights_shape[-1])
+
+        self.weight_rows = torch.nonzero(
+            torch.any(torch.ne(weights, 0.0), dim=1)
+        ).view(-1)
+
+        self.weights.data = weights[self.weight_rows].clone()
+
+
+    def _save_to_state_dict(self, destination, prefix, keep_vars):
+        """
+        Saves the weights in the dense format and in row-major MAC
+        order whatever the weight storage and MAC ordering, so that
+        the state dicts of all these layers are interchangeable.
+        """
+        super()._save_to_state_dict(destination, prefix, keep_vars)
+
+        if self.weight_storage == 'sparse':
+            destination[prefix + 'weights'] = self.get_dense_weights()
+
+        if self.canonical_weight_rows is not None:
+            destination[prefix + 'weights'] = destination[
+                prefix + 'weights'
+            ].detach()[self.canonical_weight_rows]
+
+
+    def _load_from_state_dict(self, state_dict, prefix, local_metadata,
+                              strict, missing_keys, unexpected_keys,
+                              error_msgs):
+        """
+        Loads dense format weights into layers using sparse
+        weight storage, converts weights saved in another dtype or by
+        a layer with the other receptive field layout, and moves
+        weights saved in row-major MAC order to the MAC order of the
+        layer.
+        """
+        key = prefix + 'weights'
+
+        # weights saved in another dtype are converted on load.
+        if key in state_dict and isinstance(state_dict[key], torch.Tensor):
+            state_dict[key] = convert_weights(
+                state_dict[key], self.weights.dtype
+            )
+
+            state_dict[key] = self.convert_weights_layout(state_dict[key])
+
+            if (
+                self.canonical_weight_rows is not None and
+                tuple(state_dict[key].shape) ==
+                tuple(self.dense_weights_shape)
+            ):
+                weights = torch.empty_like(state_dict[key])
+                weights[self.canonical_weight_rows.to(weights.device)] = (
+                    state_dict[key]
+                )
+
+                state_dict[key] = weights
+
+        if self.weight_storage == 'sparse' and key in state_dict:
+            weights = state_dict[key]
+
+            if tuple(weights.shape) == tuple(self.dense_weights_shape):
+                self.set_dense_weights(weights)
+            else:
+                error_msgs.append(
+                    f'size mismatch for {key}: copying a param with shape '
+                    f'{tuple(weights.shape)} from checkpoint, the shape in '
+                    f'current model is {tuple(self.dense_weights_shape)}.'
+                )
+
+            # the stored rows are already up to date.
+            state_dict[key] = self.weights.detach()
+
+        super()._load_from_state_dict(
+            state_dict, prefix, local_metadata, strict,
+            missing_keys, unexpected_keys, error_msgs
+        )
+
+
+    def convert_weights_layout(self, weights: torch.Tensor) -> torch.Tensor:
+        """
+        Converts dense weights saved by a layer with the same geometry
+        but the other receptive field layout to the layout of this
+        layer, in row-major MAC order. Other weights are returned
+        unchanged.
+
+        Args:
+            weights (torch.Tensor): the saved weights.
+
+        Returns:
+            (torch.Tensor): the weights in the layout of the layer.
+        """
+        rows_per_input_mac = (
+            self.prev_layer_num_cms_per_mac *
+            self.prev_layer_num_neurons_per_cm
+        )
+        padded_shape = (
+            self.num_macs,
+            self.receptive_field_num_macs * rows_per_input_mac,
+            self.num_cms_per_mac * self.num_neurons_per_cm
+        )
+        num_csr_rows = (
+            torch.sum(self.input_connection_mask).item() * rows_per_input_mac
+        )
+
+        if (
+            self.receptive_field_layout == 'csr' and
+            tuple(weights.shape) == padded_shape
+        ):
+            return weights.reshape(-1, padded_shape[-1])[
+                self.get_padded_weight_rows().to(weights.device)
+            ]
+
+        if (
+            self.receptive_field_layout == 'padded' and
+            tuple(weights.shape) == (num_csr_rows, padded_shape[-1])
+        ):
+            padded_weights = torch.zeros(
+                (padded_shape[0] * padded_shape[1], padded_shape[2]),
+                dtype=weights.dtype, device=weights.device
+            )
+            padded_weights[self.get_padded_weight_rows().to(weights.device)] = (
+                weights
+            )
+
+            return padded_weights.view(padded_shape)
+
+        return weights
+
+
+    def _get_winner_dtype(self, num_neurons_per_cm: int) -> torch.dtype:
+        """
+        Returns the smallest integer dtype that can hold the index
+        of any neuron in a CM.
+
+        Args:
+            num_neurons_per_cm (int): the number of neurons per CM.
+
+        Returns:
+            (torch.dtype): torch.int16 or torch.int32.
+        """
+        if num_neurons_per_cm <= torch.iinfo(torch.int16).max:
+            return torch.int16
+
+        return torch.int32
+
+
+    def compute_mac_positions(
+        self, num_macs: int, mac_grid_num_rows: int,
+        mac_grid_num_cols: int,
+        grid_layout: str) -> torch.Tensor:
+        """
+        Computes the positions of each MAC in this layer.
+
+        Args:
+            num_macs: int representing the number of macs in the layer.
+            mac_grid_num_rows: int representing the number of rows
+                in the grid for this layer.
+            mac_grid_num_cols: int representing the number of columns
+                in the grid for this layer.   
+            grid_layout: the type of grid layout (rectangular or hexagonal)
+                for the layer.   
+
+        Returns:
+            (torch.Tensor): the (row, column) positions of all MACs in
+                the layer, of size (num_macs, 2) and dtype torch.float64.
+        """
+        global_col_offset = 0.5 if grid_layout == 'hex' else 0
+        mac_indices = torch.arange(num_macs, dtype=torch.long)
+
+        grid_col_spacing = 0.0
+
+        if mac_grid_num_rows == 1:
+            row_locations = torch.full(
+                (mac_grid_num_rows,), 0.5, dtype=torch.float64
+            )
+        else:
+            grid_row_spacing = 1 / (mac_grid_num_rows - 1)
+
+            row_locations = torch.mul(
+                torch.arange(mac_grid_num_rows, dtype=torch.float64),
+                grid_row_spacing
+            )
+
+        if mac_grid_num_cols == 1:
+            col_locations = torch.full(
+                (mac_grid_num_cols,), 0.5, dtype=torch.float64
+            )
+        else:
+            grid_col_spacing = 1 / (mac_grid_num_cols - 1)
+
+            col_locations = torch.mul(
+                torch.arange(mac_grid_num_cols, dtype=torch.float64),
+                grid_col_spacing
+            )
+
+        # hex rows are offset by half a column; the operations are
+        # ordered to reproduce the scalar computation bit for bit.
+        col_offsets = torch.mul(
+            torch.mul(
+                torch.remainder(
+                    torch.remainder(mac_indices, mac_grid_num_rows), 2
+                ).double(),
+                global_col_offset
+            ),
+            grid_col_spacing
+        )
+
+        return torch.stack(
+            (
+                row_locations[mac_indices // mac_grid_num_cols],
+                torch.add(
+                    col_locations[mac_indices % mac_grid_num_cols],
+                    col_offsets
+                )
+            ), dim=1
+        )
+
+
+    def _compute_distance(self,
+        position_1: Tuple[float, float],
+        position_2: Tuple[float, float]) -> float:
+        """
+        Computes the Euclidean distance between two positions.
+
+        Args:
+            position_1 (Tuple[int, int]): x and y coordinates of the
+                first point.
+        """
+        return (
+            abs(position_1[0] - position_2[0]) ** 2 +
+            abs(position_1[1] - position_2[1]) ** 2
+        ) ** 0.5
+
+
+    def find_connected_macs_in_prev_layer(
+        self, mac_positions: torch.Tensor,
+        prev_layer_mac_positions: torch.Tensor,
+        prev_layer_num_macs: int,
+        max_chunk_size: int = 2 ** 22
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Finds the list of connected MACs in the previous layer
+        for each MAC in the current layer.
+
+        MACs are processed in chunks of consecutive grid rows. Since
+        MAC rows are sorted by index, only the slice of previous layer
+        MACs whose rows lie within the receptive field radius of the
+        chunk is compared against it, which keeps the work close to
+        linear in the number of MACs.
+
+        Args:
+            mac_positions (torch.Tensor): positions of MACs in the
+                current layer.
+            prev_layer_mac_positions (torch.Tensor): positions of
+                MACs in the previous layer.
+            prev_layer_num_macs (int): the number of MACS
+                in the previous layer.
+            max_chunk_size (int): the maximum number of MAC pairs to
+                compare at once.
+
+        Returns:
+            (Tuple[torch.Tensor, torch.Tensor]): the indices of the
+                connected MACs from the previous layer for each MAC in
+                the current layer, padded to the largest receptive field
+                with prev_layer_num_macs, and the number of connected
+                MACs for each MAC in the current layer.
+        """
+        radius = self.receptive_field_size
+        prev_layer_rows = prev_layer_mac_positions[:, 0].contiguous()
+        num_macs = mac_positions.shape[0]
+        chunk_num_macs = max(
+            1, max_chunk_size // max(1, prev_layer_num_macs)
+        )
+
+        chunk_connections = []
+        max_len = 0
+
+        for chunk_start in range(0, num_macs, chunk_num_macs):
+            chunk_positions = mac_positions[
+                chunk_start:chunk_start + chunk_num_macs
+            ]
+
+            # the slack on the search bounds keeps borderline rows in
+            # the candidate set; they are resolved exactly below.
+            candidates_start = torch.searchsorted(
+                prev_layer_rows,
+                torch.min(chunk_positions[:, 0]).item() - radius - 1e-9
+            ).item()
+
+            candidates_end = torch.searchsorted(
+                prev_layer_rows,
+                torch.max(chunk_positions[:, 0]).item() + radius + 1e-9,
+                right=True
+            ).item()
+
+            candidate_positions = prev_layer_mac_positions[
+                candidates_start:candidates_end
+            ]
+
+            offsets = torch.sub(
+                chunk_positions.unsqueeze(1),
+                candidate_positions.unsqueeze(0)
+            )
+
+            distances = torch.pow(
+                torch.add(
+                    torch.pow(torch.abs(offsets[:, :, 0]), 2),
+                    torch.pow(torch.abs(offsets[:, :, 1]), 2)
+                ), 0.5
+            )
+
+            is_connected = torch.le(distances, radius)
+
+            # the vectorized square root can differ from the scalar
+            # computation by one ulp, so pairs lying on the boundary are
+            # recomputed with the scalar distance.
+            for mac_index, candidate_index in torch.nonzero(
+                torch.le(
+                    torch.abs(torch.sub(distances, radius)),
+                    1e-12 * max(1.0, radius)
+                )
+            ).tolist():
+                is_connected[mac_index, candidate_index] = (
+                    self._compute_distance(
+                        chunk_positions[mac_index].tolist(),
+                        candidate_positions[candidate_index].tolist()
+                    ) <= radius
+                )
+
+            connections = torch.where(
+                is_connected,
+                torch.arange(
+                    candidates_start, candidates_end, dtype=torch.long
+                ).unsqueeze(0),
+                prev_layer_num_macs
+            )
+
+            connections = torch.sort(connections, dim=1)[0]
+            chunk_connections.append(connections)
+
+            max_len = max(
+                max_len, torch.max(torch.sum(is_connected, dim=1)).item()
+            )
+
+        connections = torch.full(
+            (num_macs, max_len), prev_layer_num_macs, dtype=torch.long
+        )
+
+        chunk_start = 0
+
+        for chunk in chunk_connections:
+            chunk_len = min(max_len, chunk.shape[1])
+
+            connections[
+                chunk_start:chunk_start + chunk.shape[0], :chunk_len
+            ] = chunk[:, :chunk_len]
+
+            chunk_start += chunk.shape[0]
+
+        mac_rf_sizes = torch.sum(
+            torch.lt(connections, prev_layer_num_macs), dim=1
+        )
+
+        return connections.to(self.device), mac_rf_sizes.to(
+            torch.float32
+        ).to(self.device)
+
+
+    def forward(self, x: torch.Tensor,
+                samples_are_live: Optional[torch.Tensor] = None
+                ) -> torch.Tensor:
+        """
+        Passes data through a Sparsey layer.
+
+        Args:
+            x: torch.Tensor of size (
+                batch_size,
+                prev_layer_num_macs,
+                prev_layer_num_cms_per_mac *
+                prev_layer_num_neurons_per_cm
+            ) of dtype torch.float32
+            samples_are_live (Optional[torch.Tensor]): the boolean
+                mask of samples with any active MAC in the previous
+                layer, of size (batch_size,). The inputs of the other
+                samples are all zero, so they are skipped if the layer
+                can_skip_dead_samples.
+
+        Returns:
+            torch.Tensor of size (
+                batch_size,
+                num_macs,
+                num_cms_per_mac * num_neurons_per_cm
+            ) of dtype torch.float32
+        """
+        if tuple(x.shape[1:]) != self.prev_layer_output_shape:
+            raise ValueError(
+                'Input shape is incorrect! '
+                f'Expected shape {self.prev_layer_output_shape} but received '
+                f'{tuple(x.shape[1:])} instead.'    
+            )
+
+        if samples_are_live is not None and self.can_skip_dead_samples():
+            return self.forward_live_samples(x, samples_are_live)
+
+        batch_size = x.shape[0]
+
+        is_incremental = self.incremental and not self.training
+
+        with torch.no_grad():
+            output, macs_are_active, changed_pairs = None, None, None
+            self.num_recomputed_macs = batch_size * self.num_macs
+
+            if is_incremental and self.has_incremental_state(x):
+                changed_pairs = self.find_changed_pairs(x)
+
+            if changed_pairs is not None:
+                output, macs_are_active = self.run_changed_macs(
+                    x, *changed_pairs
+                )
+            elif self.active_mac_compaction:
+                output, macs_are_active = self.run_active_macs(x)
+            elif self.compiled_kernels is not None:
+                try:
+                    output, macs_are_active = self.run_compiled_kernels(x)
+                except Exception as e:
+                    warnings.warn(
+                        f'Compiled forward pass of layer {self.layer_index} '
+                        f'failed, falling back to eager mode: {e}'
+                    )
+
+                    self.compiled_kernels = None
+
+            if output is None:
+                scores, macs_are_active = self.compute_neuron_scores(x)
+
+                output = self.build_output(
+                    self.select_active_neurons(scores), macs_are_active
+                )
+
+            if not is_incremental:
+                self.incremental_state = None
+            elif changed_pairs is None:
+                self.incremental_state = (
+                    self.get_weights_state(), x.clone(),
+                    output.clone(), macs_are_active.clone()
+                )
+
+        self.is_active = macs_are_active.view(batch_size, self.num_macs)
+
+        if self.training:
+            self.sampling_step += 1
+
+        return output
+
+
+    def can_skip_dead_samples(self) -> bool:
+        """
+        Checks whether the forward pass may skip the samples whose
+        inputs are all zero: no MAC of the layer can then be active,
+        since its minimum activation threshold is above zero, so their
+        outputs are all zero. Incremental evaluation keeps the state of
+        every sample and compiled kernels are built for fixed batch
+        sizes, so neither skips samples.
+
+        Returns:
+            (bool): whether dead samples can be skipped.
+        """
+        return (
+            self.compiled_kernels is None and
+            not (self.incremental and not self.training) and
+            self.zero_inputs_are_inactive
+        )
+
+
+    def find_live_samples(self) -> torch.Tensor:
+        """
+        Returns the mask of samples with any active MAC in the last
+        forward pass, in a buffer overwritten by the next call.
+
+        Returns:
+            (torch.Tensor): the boolean mask of live samples, of size
+                (batch_size,).
+        """
+        return torch.any(
+            self.is_active, dim=1, out=self.get_buffer(
+                'samples_are_live', (self.is_active.shape[0],), torch.bool
+            )
+        )
+
+
+    def forward_live_samples(self, x: torch.Tensor,
+                             samples_are_live: torch.Tensor) -> torch.Tensor:
+        """
+        Passes data through the layer, running only the live samples
+        and leaving the outputs of the others all zero. The live
+        samples draw the same active neurons as in a pass over the
+        full batch, since the sampler counters use their indices in
+        the full batch.
+
+        The working batch is rounded up to a power of two with dead
+        samples, so that the workspace only keeps buffers for a few
+        batch sizes.
+
+        Args:
+            x (torch.Tensor): the layer input.
+            samples_are_live (torch.Tensor): the boolean mask of
+                samples with any active input, of size (batch_size,).
+
+        Returns:
+            (torch.Tensor): the layer output, as returned by forward.
+        """
+        batch_size = x.shape[0]
+        num_live_samples = int(torch.sum(
+            samples_are_live, dim=0,
+            out=self.get_buffer('num_live_samples', (), torch.long)
+        ).item())
+        num_samples = min(
+            batch_size, 1 << max(num_live_samples - 1, 0).bit_length()
+        )
+
+        if num_samples == batch_size and num_live_samples:
+            return self.forward(x)
+
+        output = self.get_buffer(
+            'live_sample_output',
+            (batch_size, self.num_macs,
+             self.num_cms_per_mac * self.num_neurons_per_cm)
+        ).zero_()
+        is_active = self.get_buffer(
+            'live_sample_is_active', (batch_size, self.num_macs), torch.bool
+        ).zero_()
+
+        if num_live_samples:
+            # the live samples come first, followed by dead ones.
+            samples_are_dead = torch.logical_not(
+                samples_are_live, out=self.get_buffer(
+                    'samples_are_dead', (batch_size,), torch.uint8
+                )
+            )
+            samples = torch.sort(
+                samples_are_dead, stable=True, out=(
+                    self.get_buffer(
+                        'sorted_samples_are_dead', (batch_size,), torch.uint8
+                    ),
+                    self.get_buffer(
+                        'live_sample_indices', (batch_size,), torch.long
+                    )
+                )
+            )[1][:num_samples]
+
+            live_x = torch.index_select(
+                x, 0, samples, out=self.get_buffer(
+                    'live_sample_input', (num_samples, *x.shape[1:]), x.dtype
+                )
+            )
+
+            self.sampling_sample_indices = samples
+
+            try:
+                output.index_copy_(0, samples, self.forward(live_x))
+            finally:
+                self.sampling_sample_indices = None
+
+            is_active.index_copy_(0, samples, self.is_active)
+        else:
+            self.incremental_state = None
+            self.num_recomputed_macs = 0
+
+            if self.training:
+                # a pass over the full batch would draw a seed, even
+                # with no active MAC, unless it only ran active MACs.
+                if not self.active_mac_compaction:
+                    self.draw_sampling_seed()
+
+                self.sampling_step += 1
+
+        self.is_active = is_active
+
+        return output
+
+
+    def infer_sample(self, x: torch.Tensor) -> torch.Tensor:
+        """
+        Passes a single sample through the layer for inference, with
+        the active neuron of each CM chosen by argmax whatever the
+        mode of the layer. The input shape is not checked, and the
+        buffers of the sample plan are reused by every call, so the
+        output is overwritten by the next call. The layer hooks,
+        is_active and the sampling step are left untouched.
+
+        Layers whose weights are not dense float32 weights used as
+        they are stored run a regular evaluation forward pass instead.
+
+        Args:
+            x (torch.Tensor): the sample, of size (
+                prev_layer_num_macs,
+                prev_layer_num_cms_per_mac *
+                prev_layer_num_neurons_per_cm
+            ).
+
+        Returns:
+            (torch.Tensor): the layer output, of size (
+                num_macs, num_cms_per_mac * num_neurons_per_cm
+            ).
+        """
+        if (
+            self.weight_storage != 'dense' or self.binary_weights or
+            self.weights.dtype != torch.float32 or
+            self.compute_dtype != 'float32'
+        ):
+            return self.forward_sample_in_eval(x)
+
+        plan = self.sample_plan
+
+        if plan is None or plan.weights_key != (
+            self.weights.data_ptr(), self.weights.shape
+        ):
+            plan = self.sample_plan = self.build_sample_plan()
+
+        with torch.no_grad():
+            if plan.padded_input is not None:
+                plan.padded_input[:-1].copy_(x)
+                x = plan.padded_input
+
+            if plan.set_inputs is not None:
+                torch.index_select(
+                    x, 0, self.input_set_indices, out=plan.set_inputs
+                )
+
+            for (
+                input_connections, gathered_inputs, mac_inputs, weights,
+                raw_activations, num_active_inputs
+            ) in plan.chunks:
+                if input_connections is not None:
+                    torch.index_select(
+                        x, 0, input_connections, out=gathered_inputs
+                    )
+
+                    if plan.input_mac_sums is None:
+                        torch.sum(mac_inputs, dim=2, out=num_active_inputs)
+
+                torch.bmm(mac_inputs, weights, out=raw_activations)
+
+            if plan.input_mac_sums is not None:
+                # the active inputs of MACs sharing their receptive
+                # fields are counted as in the batched forward pass.
+                torch.sum(x, dim=1, out=plan.input_mac_sums[:-1])
+                torch.index_select(
+                    plan.input_mac_sums, 0, plan.input_connections,
+                    out=plan.gathered_input_sums
+                )
+                torch.sum(
+                    plan.gathered_input_sums.view(self.num_macs, -1),
+                    dim=1, keepdim=True, out=plan.num_active_inputs
+                )
+
+            torch.ge(
+                plan.num_active_inputs, plan.activation_threshold_min,
+                out=plan.macs_are_active
+            )
+            torch.le(
+                plan.num_active_inputs, plan.activation_threshold_max,
+                out=plan.macs_are_below_max
+            )
+            plan.macs_are_active.logical_and_(plan.macs_are_below_max)
+
+            torch.div(
+                plan.raw_activations, plan.num_active_inputs,
+                out=plan.raw_activations
+            )
+            torch.nan_to_num(
+                plan.raw_activations, nan=0.0, out=plan.raw_activations
+            )
+
+            torch.argmax(
+                plan.raw_activations.view(
+                    self.num_macs, self.num_cms_per_mac,
+                    self.num_neurons_per_cm
+                ), dim=-1, keepdim=True, out=plan.active_neurons
+            )
+
+            plan.plan_output.zero_().scatter_(2, plan.active_neurons, 1.0)
+
+            plan_output = plan.plan_output.view(self.num_macs, -1)
+            torch.mul(plan_output, plan.macs_are_active, out=plan_output)
+
+            if plan.mac_order is not None:
+                plan.output.index_copy_(0, plan.mac_order, plan_output)
+
+        return plan.output
+
+
+    def forward_sample_in_eval(self, x: torch.Tensor) -> torch.Tensor:
+        """
+        Passes a single sample through a regular forward pass in
+        evaluation mode, for the layers the single-sample inference
+        path does not support.
+
+        Args:
+            x (torch.Tensor): the sample.
+
+        Returns:
+            (torch.Tensor): the layer output for the sample.
+        """
+        training, is_active = self.training, self.is_active
+        self.training = False
+
+        try:
+            output = self.forward(x.unsqueeze(0))[0]
+        finally:
+            self.training, self.is_active = training, is_active
+
+        return output
+
+
+    def build_sample_plan(self) -> SampleInferencePlan:
+        """
+        Allocates the buffers of the single-sample inference path, and
+        takes the views of the weights of each bucket of MACs.
+
+        Returns:
+            (SampleInferencePlan): the plan.
+        """
+        num_outputs = self.num_cms_per_mac * self.num_neurons_per_cm
+        rows_per_input_mac = self.prev_layer_output_shape[1]
+        weights = self.weights.detach()
+
+        def empty(*shape: int, dtype: torch.dtype = torch.float32):
+            return torch.empty(shape, dtype=dtype, device=self.device)
+
+        padded_input, set_inputs, mac_order = None, None, None
+
+        if self.receptive_field_layout == 'padded':
+            padded_input = torch.zeros(
+                (self.prev_layer_output_shape[0] + 1, rows_per_input_mac),
+                dtype=torch.float32, device=self.device
+            )
+
+            buckets = self.get_mac_chunks(None, 0)
+        else:
+            buckets = self.rf_buckets
+            mac_order = torch.cat([bucket.mac_indices for bucket in buckets])
+
+            if self.input_set_indices is not None:
+                set_inputs = empty(
+                    self.input_set_indices.shape[0], rows_per_input_mac
+                )
+
+        raw_activations = empty(self.num_macs, num_outputs)
+        num_active_inputs = empty(self.num_macs, 1)
+        chunks = []
+        mac_start = 0
+
+        for bucket in buckets:
+            num_bucket_macs = bucket.mac_indices.shape[0]
+            mac_end = mac_start + num_bucket_macs
+
+            if bucket.input_sets_start is not None:
+                input_connections, gathered_inputs = None, None
+                mac_inputs = self.get_chunk_set_inputs(
+                    bucket, set_inputs.view(1, -1)
+                )[0].unsqueeze(1)
+            else:
+                input_connections = bucket.input_connections.reshape(-1)
+                gathered_inputs = empty(
+                    input_connections.shape[0], rows_per_input_mac
+                )
+                mac_inputs = gathered_inputs.view(num_bucket_macs, 1, -1)
+
+            chunks.append((
+                input_connections, gathered_inputs, mac_inputs,
+                self.get_bucket_weights(bucket, weights),
+                raw_activations[mac_start:mac_end].unsqueeze(1),
+                num_active_inputs[mac_start:mac_end]
+            ))
+
+            mac_start = mac_end
+
+        plan_macs = self.mac_indices if mac_order is None else mac_order
+        input_mac_sums, gathered_input_sums, input_connections = (
+            None, None, None
+        )
+
+        if self.input_set_indices is not None:
+            input_mac_sums = torch.zeros(
+                self.prev_layer_output_shape[0] + 1, dtype=torch.float32,
+                device=self.device
+            )
+            input_connections = self.input_connections[plan_macs].view(-1)
+            gathered_input_sums = empty(input_connections.shape[0])
+
+        plan_output = empty(
+            self.num_macs, self.num_cms_per_mac, self.num_neurons_per_cm
+        )
+
+        return SampleInferencePlan(
+            (weights.data_ptr(), weights.shape), padded_input,
+            input_mac_sums, gathered_input_sums, input_connections,
+            set_inputs, chunks, raw_activations, num_active_inputs,
+            self.activation_threshold_min.view(-1, 1)[plan_macs],
+            self.activation_threshold_max.view(-1, 1)[plan_macs],
+            empty(self.num_macs, 1, dtype=torch.bool),
+            empty(self.num_macs, 1, dtype=torch.bool),
+            empty(self.num_macs, self.num_cms_per_mac, 1, dtype=torch.long),
+            plan_output, mac_order,
+            plan_output.view(self.num_macs, -1) if mac_order is None
+            else empty(self.num_macs, num_outputs)
+        )
+
+
+    def set_incremental(self, incremental: bool) -> None:
+        """
+        Switches incremental evaluation on or off. In incremental
+        mode, each evaluation forward pass compares its input with the
+        input of the previous pass, sample by sample, and only
+        recomputes the MACs with a changed previous-layer MAC in their
+        receptive fields; the other MACs keep their previous outputs.
+
+        Evaluation outputs only depend on the receptive field of each
+        MAC, so the results are the same as a full forward pass. A
+        full forward pass is run instead when more than
+        INCREMENTAL_MAX_RECOMPUTED_FRACTION of the MACs would be
+        recomputed. The previous pass is forgotten when the batch size
+        or the weights change, and by every training forward pass.
+
+        Args:
+            incremental (bool): whether to run incrementally.
+        """
+        self.incremental = incremental
+        self.incremental_state = None
+
+
+    def has_incremental_state(self, x: torch.Tensor) -> bool:
+        """
+        Checks whether the previous evaluation forward pass can be
+        updated incrementally to give the outputs for an input.
+
+        Args:
+            x (torch.Tensor): the layer input.
+
+        Returns:
+            (bool): whether the previous pass was run on an input of
+                the same size with the current weights.
+        """
+        return (
+            self.incremental_state is not None and
+            self.incremental_state[0] == self.get_weights_state() and
+            self.incremental_state[1].shape == x.shape
+        )
+
+
+    def uses_pair_kernel(self) -> bool:
+        """
+        Checks whether the activations of the layer are computed (sample,
+        MAC) pair by pair from the nonzero inputs of each pair rather
+        than with a batched matmul over the samples.
+
+        Returns:
+            (bool): whether the layer computes activations by pair.
+        """
+        return (
+            self.active_mac_compaction or self.binary_weights or
+            self.weight_storage == 'sparse'
+        )
+
+
+    def find_changed_pairs(
+        self, x: torch.Tensor) -> Optional[Tuple[torch.Tensor, torch.Tensor]]:
+        """
+        Finds the (sample, MAC) pairs whose receptive fields contain a
+        previous-layer MAC whose input changed since the last pass.
+
+        Args:
+            x (torch.Tensor): the layer input.
+
+        Returns:
+            (Optional[Tuple[torch.Tensor, torch.Tensor]]): the sample
+                and the MAC of each changed pair, or None if so many
+                MACs would have to be recomputed that a full forward
+                pass is cheaper.
+        """
+        batch_size = x.shape[0]
+
+        # the padding MAC of the receptive fields never changes.
+        inputs_changed = torch.zeros(
+            (batch_size, x.shape[1] + 1), dtype=torch.bool, device=self.device
+        )
+
+        inputs_changed[:, :-1] = torch.any(
+            torch.ne(x, self.incremental_state[1]), dim=2
+        )
+
+        sample_indices, mac_indices = torch.nonzero(
+            torch.any(inputs_changed[:, self.input_connections], dim=2),
+            as_tuple=True
+        )
+
+        if self.uses_pair_kernel():
+            num_recomputed_macs = sample_indices.shape[0]
+        else:
+            num_recomputed_macs = batch_size * torch.unique(
+                mac_indices
+            ).shape[0]
+
+        if num_recomputed_macs > (
+            INCREMENTAL_MAX_RECOMPUTED_FRACTION * batch_size * self.num_macs
+        ):
+            return None
+
+        return sample_indices, mac_indices
+
+
+    def run_changed_macs(
+        self, x: torch.Tensor, sample_indices: torch.Tensor,
+        mac_indices: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Runs an evaluation forward pass incrementally, recomputing
+        only the (sample, MAC) pairs whose receptive fields contain a
+        previous-layer MAC whose input changed since the last pass.
+
+        The changed pairs are recomputed with the same kernel as a
+        full forward pass, so that the outputs are identical: pair by
+        pair for layers whose activations are computed from the
+        nonzero inputs of each pair, and otherwise with the batched
+        matmul over every sample of the MACs with a changed pair.
+
+        Args:
+            x (torch.Tensor): the layer input.
+            sample_indices (torch.Tensor): the sample of each changed
+                pair, as returned by find_changed_pairs.
+            mac_indices (torch.Tensor): the MAC of each changed pair.
+
+        Returns:
+            (Tuple[torch.Tensor, torch.Tensor]): the layer output and
+                the boolean mask of active MACs, as returned by
+                build_output and compute_neuron_scores.
+        """
+        _, prev_input, prev_output, prev_macs_are_active = (
+            self.incremental_state
+        )
+
+        batch_size = x.shape[0]
+        prev_input.copy_(x)
+
+        self.num_recomputed_macs = sample_indices.shape[0]
+        self.peak_workspace_bytes = 0
+
+        if self.num_recomputed_macs:
+            x = self.pad_input(x)
+            self.peak_workspace_bytes = get_num_bytes(x)
+
+            num_active_inputs = torch.sum(
+                torch.sum(x, dim=2)[:, self.input_connections],
+                dim=2, keepdim=True
+            )
+
+            prev_macs_are_active.copy_(self.threshold_macs(num_active_inputs))
+
+            pairs_are_active = prev_macs_are_active.view(
+                batch_size, self.num_macs
+            )[sample_indices, mac_indices]
+
+            output = prev_output.view(
+                batch_size, self.num_macs,
+                self.num_cms_per_mac, self.num_neurons_per_cm
+            )
+
+            if self.uses_pair_kernel():
+                output[sample_indices, mac_indices] = 0.0
+
+                sample_indices = sample_indices[pairs_are_active]
+                mac_indices = mac_indices[pairs_are_active]
+
+                if sample_indices.shape[0]:
+                    output[
+                        sample_indices, mac_indices
+                    ] = self.compute_pair_codes(
+                        x, num_active_inputs, sample_indices, mac_indices
+                    )
+            else:
+                mac_indices = torch.unique(mac_indices)
+                self.num_recomputed_macs = batch_size * mac_indices.shape[0]
+
+                output[:, mac_indices] = torch.mul(
+                    self.compute_mac_codes(
+                        x, num_active_inputs, mac_indices
+                    ),
+                    prev_macs_are_active[:, mac_indices].unsqueeze(-1)
+                )
+
+        return prev_output.clone(), prev_macs_are_active.clone()
+
+
+    def compile_forward(self) -> bool:
+        """
+        Compiles the tensor computations of the forward pass with
+        torch.compile to cut the per-op dispatch overhead.
+
+        Sampling the active neurons during training always runs
+        eagerly, so compiled and eager layers draw the same
+        random numbers.
+
+        Returns:
+            (bool): whether the layer was compiled; if not, the
+                layer keeps running in eager mode.
+        """
+        if self.workspace is not None:
+            warnings.warn(
+                f'Unable to compile layer {self.layer_index}, which reuses '
+                'its workspace, falling back to eager mode.'
+            )
+
+            return False
+
+        if self.num_threads > 1:
+            warnings.warn(
+                f'Unable to compile layer {self.layer_index}, which runs '
+                'on a thread pool, falling back to eager mode.'
+            )
+
+            return False
+
+        if self.compute_dtype != 'float32':
+            warnings.warn(
+                f'Unable to compile layer {self.layer_index}, which computes '
+                f'in {self.compute_dtype}, falling back to eager mode.'
+            )
+
+            return False
+
+        if self.integer_activations:
+            warnings.warn(
+                f'Unable to compile layer {self.layer_index}, which computes '
+                'integer activations, falling back to eager mode.'
+            )
+
+            return False
+
+        if self.weight_window is not None:
+            warnings.warn(
+                f'Unable to compile layer {self.layer_index}, which streams '
+                'its weights from a file, falling back to eager mode.'
+            )
+
+            return False
+
+        try:
+            self.compiled_kernels = (
+                torch.compile(
+                    type(self).compute_compiled_neuron_scores, dynamic=False
+                ),
+                torch.compile(type(self).build_output, dynamic=False)
+            )
+        except RuntimeError as e:
+            warnings.warn(
+                f'Unable to compile layer {self.layer_index}, '
+                f'falling back to eager mode: {e}'
+            )
+
+            self.compiled_kernels = None
+
+            return False
+
+        return True
+
+
+    def run_compiled_kernels(
+        self, x: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Runs the forward pass using the compiled kernels.
+
+        Args:
+            x (torch.Tensor): the layer input.
+
+        Returns:
+            (Tuple[torch.Tensor, torch.Tensor]): the layer output and
+                the boolean mask of active MACs, as returned by
+                build_output and compute_neuron_scores.
+        """
+        compute_neuron_scores, build_output = self.compiled_kernels
+
+        with torch._dynamo.config.patch(
+            cache_size_limit=max(
+                torch._dynamo.config.cache_size_limit,
+                COMPILED_CACHE_SIZE_LIMIT
+            )
+        ):
+            scores, macs_are_active = compute_neuron_scores(self, x)
+
+            output = build_output(
+                self, self.select_active_neurons(scores), macs_are_active
+            )
+
+        return output, macs_are_active
+
+
+    def compute_neuron_scores(
+        self, x: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Computes the scores used to select the active neuron in
+        each CM of each MAC, from a dense layer input.
+
+        Args:
+            x (torch.Tensor): the layer input, of size (
+                batch_size,
+                prev_layer_num_macs,
+                prev_layer_num_cms_per_mac *
+                prev_layer_num_neurons_per_cm
+            ).
+
+        Returns:
+            (Tuple[torch.Tensor, torch.Tensor]): the neuron scores and
+                the boolean mask of active MACs, as returned by
+                score_neurons.
+        """
+        return self.score_neurons(*self.compute_raw_activations(x))
+
+
+    def compute_compiled_neuron_scores(
+        self, x: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Computes the neuron scores like compute_neuron_scores, in the
+        form that is compiled by compile_forward.
+
+        The batched matmul leaves the raw activations laid out MAC by
+        MAC, and inductor computes the in-place CSA updates wrongly
+        on that layout, so they are made contiguous first; the copy
+        is fused into the compiled kernel.
+
+        Args:
+            x (torch.Tensor): the layer input.
+
+        Returns:
+            (Tuple[torch.Tensor, torch.Tensor]): the neuron scores and
+                the boolean mask of active MACs, as returned by
+                score_neurons.
+        """
+        raw_activations, num_active_inputs = self.compute_raw_activations(x)
+
+        return self.score_neurons(
+            raw_activations.contiguous(), num_active_inputs
+        )
+
+
+    def run_active_macs(
+        self, x: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Runs the forward pass on the active MACs only.
+
+        The (sample, MAC) pairs passing the activation thresholds are
+        packed together first, so the raw activations, the CSA
+        distribution and the sampling are only computed for active
+        MACs. Since every active MAC has its own weights, the raw
+        activations are computed by summing the weight rows selected
+        by the nonzero inputs of each pair instead of with a matmul.
+
+        Args:
+            x (torch.Tensor): the layer input.
+
+        Returns:
+            (Tuple[torch.Tensor, torch.Tensor]): the layer output and
+                the boolean mask of active MACs, as returned by
+                build_output and compute_neuron_scores.
+        """
+        batch_size = x.shape[0]
+
+        num_active_inputs = self.count_active_inputs(x)
+        x = self.pad_input(x)
+
+        macs_are_active = self.threshold_macs(num_active_inputs)
+
+        # the tensors of the active pairs change size with every batch,
+        # so only the ones sized by the batch come from the workspace.
+        sample_indices, mac_indices = torch.nonzero(
+            macs_are_active.view(batch_size, self.num_macs),
+            as_tuple=True
+        )
+
+        output = self.get_buffer(
+            'active_mac_output',
+            (
+                batch_size, self.num_macs,
+                self.num_cms_per_mac, self.num_neurons_per_cm
+            )
+        ).zero_()
+
+        self.peak_workspace_bytes = get_num_bytes(x)
+
+        if sample_indices.shape[0]:
+            output[sample_indices, mac_indices] = self.compute_pair_codes(
+                x, num_active_inputs, sample_indices, mac_indices
+            )
+
+        return output.view(batch_size, self.num_macs, -1), macs_are_active
+
+
+    def compute_mac_codes(self, x: torch.Tensor,
+                          num_active_inputs: torch.Tensor,
+                          mac_indices: torch.Tensor) -> torch.Tensor:
+        """
+        Computes the evaluation codes of a subset of the MACs for every
+        sample of the batch, with the same batched matmul as
+        compute_raw_activations. The codes of inactive MACs are not
+        zeroed.
+
+        Args:
+            x (torch.Tensor): the layer input, padded with an empty MAC.
+            num_active_inputs (torch.Tensor): the number of active
+                inputs to every MAC, of size (batch_size, num_macs, 1).
+            mac_indices (torch.Tensor): the sorted indices of the MACs.
+
+        Returns:
+            (torch.Tensor): the codes of the MACs, of size (
+                batch_size, num_subset_macs,
+                num_cms_per_mac, num_neurons_per_cm
+            ).
+        """
+        batch_size = x.shape[0]
+        compute_weights = self.get_compute_weights()
+        x = x.to(get_compute_dtype(self.compute_dtype))
+
+        raw_activations = torch.empty(
+            (batch_size, self.num_macs, self.weights.shape[-1]),
+            dtype=torch.float32, device=self.device
+        )
+
+        for bucket in self.get_mac_chunks(None, 0):
+            bucket_positions = torch.nonzero(
+                torch.isin(bucket.mac_indices, mac_indices)
+            ).squeeze(1).tolist()
+
+            if not bucket_positions:
+                continue
+
+            bucket_weights = self.get_bucket_weights(bucket, compute_weights)
+
+            # runs of consecutive MACs have contiguous weights, so they
+            # are multiplied in place instead of gathering the weights.
+            run_starts = [
+                position for index, position in enumerate(bucket_positions)
+                if not index or bucket_positions[index - 1] != position - 1
+            ]
+
+            run_ends = [
+                position + 1
+                for index, position in enumerate(bucket_positions)
+                if index == len(bucket_positions) - 1 or
+                bucket_positions[index + 1] != position + 1
+            ]
+
+            for run_start, run_end in zip(run_starts, run_ends):
+                mac_inputs = x[
+                    :, bucket.input_connections[run_start:run_end]
+                ].view(batch_size, run_end - run_start, -1)
+
+                if self.integer_activations:
+                    raw_activations[
+                        :, bucket.mac_indices[run_start:run_end]
+                    ] = self.compute_integer_activations(
+                        mac_inputs, bucket.mac_indices[run_start:run_end]
+                    )
+
+                    continue
+
+                run_weights = bucket_weights[run_start:run_end]
+                dequantized_weights = run_weights
+
+                if compute_weights is None:
+                    dequantized_weights = dequantize_weights(run_weights)
+
+                raw_activations[
+                    :, bucket.mac_indices[run_start:run_end]
+                ] = torch.matmul(
+                    mac_inputs.transpose(0, 1), dequantized_weights
+                ).transpose(0, 1).float()
+
+                self.peak_workspace_bytes = max(
+                    self.peak_workspace_bytes,
+                    get_num_bytes(x) + get_num_bytes(mac_inputs) +
+                    (
+                        0 if dequantized_weights is run_weights
+                        else get_num_bytes(dequantized_weights)
+                    )
+                )
+
+        raw_activations = raw_activations[:, mac_indices]
+
+        torch.div(
+            raw_activations, num_active_inputs[:, mac_indices],
+            out=raw_activations
+        )
+
+        torch.nan_to_num(raw_activations, nan=0.0, out=raw_activations)
+
+        scores = raw_activations.view(
+            batch_size, -1, self.num_cms_per_mac, self.num_neurons_per_cm
+        )
+
+        return torch.zeros_like(scores).scatter_(
+            3, torch.argmax(scores, dim=-1, keepdim=True), 1.0
+        )
+
+
+    def compute_pair_codes(self, x: torch.Tensor,
+                           num_active_inputs: torch.Tensor,
+                           sample_indices: torch.Tensor,
+                           mac_indices: torch.Tensor) -> torch.Tensor:
+        """
+        Computes the codes of a set of active (sample, MAC) pairs.
+
+        Args:
+            x (torch.Tensor): the layer input, padded with an empty MAC.
+            num_active_inputs (torch.Tensor): the number of active
+                inputs to every MAC, of size (batch_size, num_macs, 1).
+            sample_indices (torch.Tensor): the sample of each pair.
+            mac_indices (torch.Tensor): the MAC of each pair.
+
+        Returns:
+            (torch.Tensor): the codes of the pairs, of size (
+                num_pairs, num_cms_per_mac, num_neurons_per_cm
+            ).
+        """
+        num_pairs = sample_indices.shape[0]
+
+        mac_inputs = x[
+            sample_indices.unsqueeze(1),
+            self.input_connections[mac_indices]
+        ].view(num_pairs, -1)
+
+        self.peak_workspace_bytes += get_num_bytes(mac_inputs)
+
+        raw_activations = self.sum_pair_weight_rows(mac_inputs, mac_indices)
+
+        torch.div(
+            raw_activations,
+            num_active_inputs[sample_indices, mac_indices],
+            out=raw_activations
+        )
+
+        torch.nan_to_num(raw_activations, nan=0.0, out=raw_activations)
+
+        scores = raw_activations.view(
+            num_pairs, self.num_cms_per_mac, self.num_neurons_per_cm
+        )
+
+        if self.training and self.csa_fast_path_tolerance is None:
+            self.compute_csa_probabilities(scores)
+
+        return torch.zeros_like(scores).scatter_(
+            2,
+            self.select_active_neurons(scores, sample_indices, mac_indices),
+            1.0
+        )
+
+
+    def sum_pair_weight_rows(self, mac_inputs: torch.Tensor,
+                             mac_indices: torch.Tensor) -> torch.Tensor:
+        """
+        Computes the raw activations of (sample, MAC) pairs by summing
+        the weight rows of each MAC selected by its nonzero inputs,
+        scaled by the input values.
+
+        Args:
+            mac_inputs (torch.Tensor): the inputs in the receptive
+                field of each pair, of size (num_pairs, num_input_rows).
+            mac_indices (torch.Tensor): the MAC of each pair.
+
+        Returns:
+            (torch.Tensor): the raw activations of size
+                (num_pairs, num_cms_per_mac * num_neurons_per_cm).
+        """
+        num_pairs = mac_inputs.shape[0]
+
+        pair_indices, input_rows = torch.nonzero(mac_inputs, as_tuple=True)
+        input_values = mac_inputs[pair_indices, input_rows]
+
+        if self.binary_weights:
+            input_values = torch.ones_like(input_values)
+
+        weight_rows = torch.add(
+            self.mac_weight_offsets[mac_indices][pair_indices], input_rows
+        )
+
+        if self.weight_storage == 'sparse':
+            # rows that are not stored are all zero and can be skipped.
+            weight_rows, row_is_stored = self.find_weight_rows(weight_rows)
+
+            if not torch.any(row_is_stored):
+                return torch.zeros(
+                    (num_pairs, self.weights.shape[-1]),
+                    dtype=torch.float32, device=self.device
+                )
+
+            pair_indices = pair_indices[row_is_stored]
+            weight_rows = weight_rows[row_is_stored]
+            input_values = input_values[row_is_stored]
+
+        flat_weights = self.weights.view(-1, self.weights.shape[-1])
+
+        if self.weights.dtype != torch.float32 or self.binary_weights:
+            flat_weights, weight_rows = self.gather_weight_rows(weight_rows)
+
+        pair_num_inputs = torch.bincount(pair_indices, minlength=num_pairs)
+
+        return torch.nn.functional.embedding_bag(
+            weight_rows,
+            flat_weights,
+            torch.sub(torch.cumsum(pair_num_inputs, dim=0), pair_num_inputs),
+            mode='sum',
+            per_sample_weights=input_values
+        )
+
+
+    def gather_weight_rows(
+        self, weight_rows: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Gathers rows of weights stored in a lower precision (or
+        binarized, for binary weights) as float32, so they can be
+        summed exactly like float32 weights.
+
+        Args:
+            weight_rows (torch.Tensor): indices of rows in the stored
+                weights flattened to 2 dimensions.
+
+        Returns:
+            (Tuple[torch.Tensor, torch.Tensor]): the gathered rows as
+                float32, of size (
+                    weight_rows.numel(),
+                    num_cms_per_mac * num_neurons_per_cm
+                ), and the indices of the rows in the gathered rows,
+                shaped like weight_rows.
+        """
+        rows = self.weights.view(-1, self.weights.shape[-1])[
+            weight_rows.reshape(-1)
+        ]
+
+        if self.binary_weights:
+            rows = torch.ne(rows, 0).float()
+
+        return dequantize_weights(rows), torch.arange(
+            weight_rows.numel(), dtype=torch.long, device=self.device
+        ).view(weight_rows.shape)
+
+
+    def compute_raw_activations(
+        self, x: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Computes the unnormalized activations of every neuron in
+        the layer, and the number of active inputs to each MAC.
+
+        Args:
+            x (torch.Tensor): the layer input, of size (
+                batch_size,
+                prev_layer_num_macs,
+                prev_layer_num_cms_per_mac *
+                prev_layer_num_neurons_per_cm
+            ).
+
+        Returns:
+            (Tuple[torch.Tensor, torch.Tensor]): the raw activations of
+                size (
+                    batch_size, num_macs,
+                    num_cms_per_mac * num_neurons_per_cm
+                ), and the number of active inputs of size
+                (batch_size, num_macs, 1).
+        """
+        batch_size = x.shape[0]
+
+        workspace_budget = resolve_workspace_budget(
+            self.max_workspace_bytes, self.device
+        )
+
+        if self.binary_weights:
+            return self.compute_popcount_raw_activations(x, workspace_budget)
+
+        if self.weight_storage == 'sparse':
+            return self.compute_sparse_raw_activations(x, workspace_budget)
+
+        if self.integer_activations:
+            return self.compute_integer_raw_activations(x, workspace_budget)
+
+        compute_weights = self.get_compute_weights()
+        compute_dtype = get_compute_dtype(self.compute_dtype)
+
+        # weights stored in a lower precision are converted to float32
+        # one chunk at a time.
+        dequantized_bytes_per_row = 0
+
+        if compute_weights is None and self.weights.dtype != torch.float32:
+            dequantized_bytes_per_row = self.weights.shape[-1] * 4
+
+        if self.receptive_field_layout == 'csr':
+            x = x.to(compute_dtype)
+
+            raw_activations = self.get_buffer(
+                'raw_activations',
+                (batch_size, self.num_macs, self.weights.shape[-1])
+            )
+
+            set_inputs, set_inputs_bytes = None, 0
+
+            if self.input_set_indices is None:
+                num_active_inputs = self.get_buffer(
+                    'num_active_inputs', (batch_size, self.num_macs, 1)
+                )
+            else:
+                # every shared receptive field is gathered once, and
+                # read by all the MACs connected to it.
+                set_inputs = self.gather_input_sets(x, self.workspace)
+                set_inputs_bytes = get_num_bytes(set_inputs)
+                num_active_inputs = self.count_active_inputs(x)
+
+                if workspace_budget is not None:
+                    workspace_budget = max(
+                        0, workspace_budget - set_inputs_bytes
+                    )
+
+            if workspace_budget is not None:
+                # every thread processes a chunk at the same time.
+                workspace_budget //= self.num_threads
+
+            def compute_group_activations(
+                group_index: int, group: List[ReceptiveFieldBucket]) -> int:
+                workspace = self.get_group_workspace(group_index)
+                peak_workspace_bytes = 0
+
+                # the MACs of a chunk are not contiguous, so their
+                # results are computed in buffers and scattered.
+                for chunk in group:
+                    num_chunk_macs = chunk.mac_indices.shape[0]
+
+                    if chunk.input_sets_start is None:
+                        if workspace is None:
+                            mac_inputs = x[:, chunk.input_connections]
+                        else:
+                            mac_inputs = torch.index_select(
+                                x, 1, chunk.input_connections.reshape(-1),
+                                out=workspace.get(
+                                    'mac_inputs',
+                                    (
+                                        batch_size,
+                                        chunk.input_connections.numel(),
+                                        x.shape[2]
+                                    ), x.dtype
+                                )
+                            )
+
+                        mac_inputs = mac_inputs.view(
+                            batch_size, num_chunk_macs, -1
+                        )
+
+                        if set_inputs is None:
+                            num_active_inputs[:, chunk.mac_indices] = (
+                                torch.sum(
+                                    mac_inputs, dim=2, keepdim=True,
+                                    dtype=torch.float32,
+                                    out=get_workspace_buffer(
+                                        workspace, 'chunk_num_active_inputs',
+                                        (batch_size, num_chunk_macs, 1),
+                                        torch.float32, self.device
+                                    )
+                                )
+                            )
+
+                        mac_inputs_bytes = get_num_bytes(mac_inputs)
+                    else:
+                        mac_inputs = self.get_chunk_set_inputs(
+                            chunk, set_inputs
+                        )
+                        mac_inputs_bytes = 0
+
+                    chunk_weights = self.get_chunk_weights(
+                        chunk, compute_weights
+                    )
+
+                    chunk_activations = torch.matmul(
+                        mac_inputs.transpose(0, 1), chunk_weights,
+                        out=get_workspace_buffer(
+                            workspace, 'chunk_activations',
+                            (
+                                num_chunk_macs, batch_size,
+                                chunk_weights.shape[-1]
+                            ), x.dtype, self.device
+                        )
+                    )
+
+                    raw_activations[:, chunk.mac_indices] = (
+                        chunk_activations.transpose(0, 1).float()
+                    )
+
+                    peak_workspace_bytes = max(
+                        peak_workspace_bytes,
+                        mac_inputs_bytes +
+                        get_num_bytes(chunk_activations) +
+                        chunk_weights.shape[0] * chunk_weights.shape[1] *
+                        dequantized_bytes_per_row
+                    )
+
+                return peak_workspace_bytes
+
+            self.peak_workspace_bytes = set_inputs_bytes + sum(
+                run_mac_groups(
+                    compute_group_activations,
+                    self.get_mac_groups(
+                        self.get_mac_chunks(
+                            workspace_budget,
+                            batch_size * x.element_size() +
+                            dequantized_bytes_per_row,
+                            batch_size * raw_activations.shape[-1] *
+                            raw_activations.element_size()
+                        ), self.num_threads
+                    ), self.num_threads
+                )
+            )
+
+            if self.weight_window is not None:
+                self.weight_window.release()
+
+            return raw_activations, num_active_inputs
+
+        x = self.pad_input(x, compute_dtype)
+
+        raw_activations = self.get_buffer(
+            'raw_activations',
+            (self.num_macs, batch_size, self.weights.shape[-1])
+        )
+
+        num_active_inputs = self.get_buffer(
+            'num_active_inputs', (batch_size, self.num_macs, 1)
+        )
+
+        if workspace_budget is not None:
+            workspace_budget = max(
+                0, workspace_budget - get_num_bytes(x)
+            ) // self.num_threads
+
+        def compute_group_activations(
+            group_index: int, group: List[ReceptiveFieldBucket]) -> int:
+            workspace = self.get_group_workspace(group_index)
+            peak_workspace_bytes = 0
+
+            # padded weights are indexed by MAC, so the weight range
+            # of each chunk is also its range of MACs.
+            for chunk in group:
+                if workspace is None:
+                    mac_inputs = x[:, chunk.input_connections]
+                else:
+                    mac_inputs = torch.index_select(
+                        x, 1, chunk.input_connections.reshape(-1),
+                        out=workspace.get(
+                            'mac_inputs',
+                            (
+                                batch_size, chunk.input_connections.numel(),
+                                x.shape[2]
+                            ), x.dtype
+                        )
+                    )
+
+                mac_inputs = mac_inputs.view(
+                    batch_size, chunk.mac_indices.shape[0], -1
+                )
+
+                torch.sum(
+                    mac_inputs, dim=2, keepdim=True, dtype=torch.float32,
+                    out=num_active_inputs[
+                        :, chunk.weights_start:chunk.weights_end
+                    ]
+                )
+
+                chunk_weights = self.get_chunk_weights(chunk, compute_weights)
+                chunk_raw_activations = raw_activations[
+                    chunk.weights_start:chunk.weights_end
+                ]
+
+                if compute_weights is None:
+                    torch.matmul(
+                        mac_inputs.transpose(0, 1), chunk_weights,
+                        out=chunk_raw_activations
+                    )
+
+                    chunk_activations_bytes = 0
+                else:
+                    # matmuls cannot write lower precision products to
+                    # a float32 output, so they are copied.
+                    chunk_activations = torch.matmul(
+                        mac_inputs.transpose(0, 1), chunk_weights
+                    )
+
+                    chunk_raw_activations.copy_(chunk_activations)
+                    chunk_activations_bytes = get_num_bytes(chunk_activations)
+
+                peak_workspace_bytes = max(
+                    peak_workspace_bytes,
+                    get_num_bytes(mac_inputs) + chunk_activations_bytes +
+                    chunk_weights.shape[0] * chunk_weights.shape[1] *
+                    dequantized_bytes_per_row
+                )
+
+            return peak_workspace_bytes
+
+        self.peak_workspace_bytes = get_num_bytes(x) + sum(
+            run_mac_groups(
+                compute_group_activations,
+                self.get_mac_groups(
+                    self.get_mac_chunks(
+                        workspace_budget,
+                        batch_size * x.element_size() +
+                        dequantized_bytes_per_row,
+                        0 if compute_weights is None else
+                        batch_size * raw_activations.shape[-1] *
+                        x.element_size()
+                    ), self.num_threads
+                ), self.num_threads
+            )
+        )
+
+        if self.weight_window is not None:
+            self.weight_window.release()
+
+        return raw_activations.transpose(0, 1), num_active_inputs
+
+
+    def estimate_forward_workspace(self, batch_size: int) -> int:
+        """
+        Estimates the memory a forward pass takes on top of the
+        weights, without running it: the workspace that
+        compute_raw_activations would report as its peak, plus the
+        weights converted to the compute dtype, and the activations,
+        output and winner sampling buffers of the layer. Binary,
+        sparse and integer layers are estimated as if they used the
+        batched matmul path of dense layers.
+
+        Args:
+            batch_size (int): the number of samples in the batch.
+
+        Returns:
+            (int): the estimated number of bytes.
+        """
+        workspace_budget = resolve_workspace_budget(
+            self.max_workspace_bytes, self.device
+        )
+
+        num_outputs = self.dense_weights_shape[-1]
+        rows_per_input_mac = (
+            self.prev_layer_num_cms_per_mac *
+            self.prev_layer_num_neurons_per_cm
+        )
+
+        compute_dtype = get_compute_dtype(self.compute_dtype)
+        element_size = torch.finfo(compute_dtype).bits // 8
+        dequantized_bytes_per_row = 0
+        compute_weights_bytes = 0
+
+        if compute_dtype == torch.float32:
+            if self.weights.dtype != torch.float32:
+                dequantized_bytes_per_row = num_outputs * 4
+        elif self.weights.dtype != compute_dtype:
+            compute_weights_bytes = (
+                math.prod(self.dense_weights_shape) * element_size
+            )
+
+        input_bytes = 0
+        # the workspace of the products of each MAC, used to size the
+        # chunks and actually taken.
+        bytes_per_mac = batch_size * num_outputs * 4
+        activations_bytes_per_mac = batch_size * num_outputs * element_size
+
+        if self.receptive_field_layout == 'padded':
+            # the padded input; float32 activations are written in place.
+            input_bytes = (
+                batch_size * (self.prev_layer_output_shape[0] + 1) *
+                rows_per_input_mac * element_size
+            )
+
+            if compute_dtype == torch.float32:
+                bytes_per_mac, activations_bytes_per_mac = 0, 0
+            else:
+                bytes_per_mac = activations_bytes_per_mac
+
+            if workspace_budget is not None:
+                workspace_budget = max(0, workspace_budget - input_bytes)
+        elif self.input_set_indices is not None:
+            # the inputs of every shared receptive field.
+            input_bytes = (
+                batch_size * self.input_set_indices.shape[0] *
+                rows_per_input_mac * element_size
+            )
+
+            if workspace_budget is not None:
+                workspace_budget = max(0, workspace_budget - input_bytes)
+
+        if workspace_budget is not None:
+            workspace_budget //= self.num_threads
+
+        groups = self.get_mac_groups(
+            self.get_mac_chunks(
+                workspace_budget,
+                batch_size * element_size + dequantized_bytes_per_row,
+                bytes_per_mac
+            ), self.num_threads
+        )
+
+        workspace_bytes = input_bytes + compute_weights_bytes + sum(
+            max(
+                chunk.input_connections.numel() * rows_per_input_mac * (
+                    (
+                        0 if chunk.input_sets_start is not None
+                        else batch_size * element_size
+                    ) + dequantized_bytes_per_row
+                ) + chunk.mac_indices.shape[0] * activations_bytes_per_mac
+                for chunk in group
+            ) for group in groups
+        )
+
+        # the raw activations and the output, plus the cumulative
+        # scores and comparison mask of the winner sampler.
+        return workspace_bytes + batch_size * self.num_macs * num_outputs * 13
+
+
+    def estimate_flops(self, batch_size: int) -> Tuple[int, int]:
+        """
+        Estimates the floating point operations of a training forward
+        pass of the layer and of the Hebbian update of its weights.
+        Both are dominated by one multiply-add per (sample, weight),
+        padding weights included; scoring the neurons and the
+        permanence update add a few operations per neuron and per
+        weight.
+
+        Args:
+            batch_size (int): the number of samples in the batch.
+
+        Returns:
+            (Tuple[int, int]): the estimated operations of the forward
+                pass and of the weight update.
+        """
+        num_weights = math.prod(self.dense_weights_shape)
+        num_neurons = self.num_macs * self.dense_weights_shape[-1]
+
+        return (
+            2 * batch_size * num_weights + 8 * batch_size * num_neurons,
+            2 * batch_size * num_weights + 12 * num_weights
+        )
+
+
+    def pack_bits(self, bits: torch.Tensor) -> torch.Tensor:
+        """
+        Packs boolean planes along their last dimension into 64-bit
+        words, zero-padded to num_input_words words.
+
+        Args:
+            bits (torch.Tensor): boolean tensor of size
+                (..., num_bits), with num_bits <= 64 * num_input_words.
+
+        Returns:
+            (torch.Tensor): int64 tensor of size (..., num_input_words).
+        """
+        bytes_per_plane = self.num_input_words * 8
+
+        bits = torch.nn.functional.pad(
+            bits.to(torch.uint8),
+            (0, bytes_per_plane * 8 - bits.shape[-1])
+        ).reshape(*bits.shape[:-1], bytes_per_plane, 8)
+
+        bit_values = torch.tensor(
+            [1, 2, 4, 8, 16, 32, 64, 128],
+            dtype=torch.uint8, device=bits.device
+        )
+
+        return torch.sum(
+            torch.mul(bits, bit_values), dim=-1, dtype=torch.uint8
+        ).view(torch.int64)
+
+
+    def get_weights_state(self) -> Tuple[int, int, Tuple[int, ...]]:
+        """
+        Returns a key that changes whenever the weights are replaced
+        or modified in place, for the caches derived from them.
+
+        Returns:
+            (Tuple[int, int, Tuple[int, ...]]): the address, version
+                counter and shape of the weights.
+        """
+        return (
+            self.weights.data_ptr(), self.weights._version,
+            tuple(self.weights.shape)
+        )
+
+
+    def get_compute_weights(self) -> Optional[torch.Tensor]:
+        """
+        Returns the weights of the layer in its compute dtype. Weights
+        stored in another dtype are converted whenever they have
+        changed since they were last converted.
+
+        Returns:
+            (Optional[torch.Tensor]): the weights, with the same layout
+                as the layer weights, or None when computing in float32,
+                where the weights are converted chunk by chunk.
+        """
+        compute_dtype = get_compute_dtype(self.compute_dtype)
+
+        if compute_dtype == torch.float32:
+            return None
+
+        if self.weights.dtype == compute_dtype:
+            return self.weights.detach()
+
+        weights_state = self.get_weights_state()
+
+        if (
+            self.compute_weights is None or
+            self.compute_weights[0] != weights_state
+        ):
+            self.compute_weights = (
+                weights_state,
+                dequantize_weights(self.weights.detach()).to(compute_dtype)
+            )
+
+        return self.compute_weights[1]
+
+
+    def get_chunk_weights(
+        self, chunk: ReceptiveFieldBucket,
+        compute_weights: Optional[torch.Tensor]) -> torch.Tensor:
+        """
+        Returns the weights of a chunk of MACs in the compute dtype of
+        the layer.
+
+        Args:
+            chunk (ReceptiveFieldBucket): the chunk of MACs.
+            compute_weights (Optional[torch.Tensor]): the weights in the
+                compute dtype, as returned by get_compute_weights.
+
+        Returns:
+            (torch.Tensor): the weights of the chunk.
+        """
+        if self.weight_window is not None:
+            return dequantize_weights(
+                self.get_window_weights(chunk, self.weight_window)
+            )
+
+        if compute_weights is None:
+            return dequantize_weights(self.get_bucket_weights(chunk))
+
+        return self.get_bucket_weights(chunk, compute_weights)
+
+
+    def get_window_weights(self, chunk: ReceptiveFieldBucket,
+                           window: WeightWindow,
+                           dirty: bool = False) -> torch.Tensor:
+        """
+        Returns the weights of a chunk of MACs from a window over the
+        memory-mapped weights of the layer, or over a tensor with the
+        same layout, loading them into the window if needed.
+
+        Args:
+            chunk (ReceptiveFieldBucket): the chunk of MACs.
+            window (WeightWindow): the window to read the weights from.
+            dirty (bool): whether the weights are modified, and have
+                to be written back to the file.
+
+        Returns:
+            (torch.Tensor): the resident weights of the chunk, with the
+                layout of get_bucket_weights.
+        """
+        return window.get(
+            chunk.weights_start, chunk.weights_end, dirty
+        ).view(chunk.mac_indices.shape[0], -1, window.weights.shape[-1])
+
+
+    def get_packed_weights(self) -> torch.Tensor:
+        """
+        Returns the bit-packed binary weights of every MAC, with one
+        plane per output neuron. The planes are rebuilt whenever the
+        weights have changed since they were last packed.
+
+        Returns:
+            (torch.Tensor): int64 tensor of size (
+                num_macs,
+                num_cms_per_mac * num_neurons_per_cm,
+                num_input_words
+            ).
+        """
+        weights_state = self.get_weights_state()
+
+        if (
+            self.packed_weights is not None and
+            self.packed_weights[0] == weights_state
+        ):
+            return self.packed_weights[1]
+
+        num_outputs = self.weights.shape[-1]
+
+        if self.weight_storage == 'sparse':
+            weight_bits = torch.zeros(
+                (math.prod(self.dense_weights_shape[:-1]), num_outputs),
+                dtype=torch.bool, device=self.device
+            )
+
+            weight_bits[self.weight_rows] = torch.ne(self.weights, 0)
+        else:
+            weight_bits = torch.ne(self.weights, 0).view(-1, num_outputs)
+
+        if self.receptive_field_layout == 'csr':
+            padded_weight_bits = torch.zeros(
+                (
+                    self.num_macs,
+                    self.receptive_field_num_macs *
+                    self.prev_layer_num_cms_per_mac *
+                    self.prev_layer_num_neurons_per_cm,
+                    num_outputs
+                ), dtype=torch.bool, device=self.device
+            )
+
+            for bucket in self.rf_buckets:
+                bucket_weight_bits = self.get_bucket_weights(
+                    bucket, weight_bits
+                )
+
+                padded_weight_bits[
+                    bucket.mac_indices, :bucket_weight_bits.shape[1]
+                ] = bucket_weight_bits
+
+            weight_bits = padded_weight_bits
+
+        packed_weights = self.pack_bits(
+            weight_bits.view(self.num_macs, -1, num_outputs).transpose(1, 2)
+        )
+
+        self.packed_weights = (weights_state, packed_weights)
+
+        return packed_weights
+
+
+    def compute_popcount_raw_activations(
+        self, x: torch.Tensor,
+        workspace_budget: Optional[int]) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Computes the raw activations and the number of active inputs
+        of every MAC in the layer with binary weights. The activation
+        of a neuron is the number of active inputs whose weight is set,
+        computed as the popcount of the AND of the bit-packed input
+        and weight planes.
+
+        Args:
+            x (torch.Tensor): the layer input.
+            workspace_budget (Optional[int]): the workspace budget in
+                bytes, or None for no limit.
+
+        Returns:
+            (Tuple[torch.Tensor, torch.Tensor]): the raw activations and
+                the number of active inputs, as returned by
+                compute_raw_activations.
+        """
+        batch_size = x.shape[0]
+        packed_weights = self.get_packed_weights()
+        num_outputs = packed_weights.shape[1]
+
+        x = self.pad_input(x)
+
+        num_active_inputs = torch.sum(
+            torch.sum(x, dim=2)[:, self.input_connections],
+            dim=2, keepdim=True
+        )
+
+        packed_inputs = self.pack_bits(
+            torch.ne(x, 0)[:, self.input_connections].view(
+                batch_size, self.num_macs, -1
+            )
+        )
+
+        raw_activations = torch.empty(
+            (batch_size, self.num_macs, num_outputs),
+            dtype=torch.float32, device=self.device
+        )
+
+        bytes_per_mac = batch_size * num_outputs * self.num_input_words * 16
+        chunk_size = max(1, POPCOUNT_CHUNK_BYTES // bytes_per_mac)
+
+        if workspace_budget is not None:
+            chunk_size = min(
+                chunk_size,
+                max(
+                    1,
+                    (workspace_budget - get_num_bytes(packed_inputs)) //
+                    bytes_per_mac
+                )
+            )
+
+        for chunk_start in range(0, self.num_macs, chunk_size):
+            chunk_end = min(chunk_start + chunk_size, self.num_macs)
+
+            words = torch.bitwise_and(
+                packed_inputs[:, chunk_start:chunk_end].unsqueeze(2),
+                packed_weights[chunk_start:chunk_end].unsqueeze(0)
+            ).view(torch.uint8)
+
+            # popcount of every byte, with unsigned byte arithmetic.
+            words.sub_(torch.bitwise_right_shift(words, 1).bitwise_and_(0x55))
+            word_pairs = torch.bitwise_right_shift(words, 2).bitwise_and_(0x33)
+            words.bitwise_and_(0x33).add_(word_pairs)
+            words.add_(torch.bitwise_right_shift(words, 4)).bitwise_and_(0x0f)
+
+            raw_activations[:, chunk_start:chunk_end] = torch.sum(
+                words, dim=-1
+            )
+
+        self.peak_workspace_bytes = (
+            get_num_bytes(x) + get_num_bytes(packed_inputs) +
+            min(chunk_size, self.num_macs) * bytes_per_mac
+        )
+
+        return raw_activations, num_active_inputs
+
+
+    def compute_sparse_raw_activations(
+        self, x: torch.Tensor,
+        workspace_budget: Optional[int]) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Computes the raw activations and the number of active inputs
+        of every MAC in the layer when using sparse weight storage, by
+        summing the stored weight rows selected by the nonzero inputs.
+
+        Args:
+            x (torch.Tensor): the layer input.
+            workspace_budget (Optional[int]): the workspace budget in
+                bytes, or None for no limit.
+
+        Returns:
+            (Tuple[torch.Tensor, torch.Tensor]): the raw activations and
+                the number of active inputs, as returned by
+                compute_raw_activations.
+        """
+        batch_size = x.shape[0]
+
+        x = self.pad_input(x)
+
+        raw_activations = torch.empty(
+            (batch_size, self.num_macs, self.weights.shape[-1]),
+            dtype=torch.float32, device=self.device
+        )
+
+        num_active_inputs = torch.empty(
+            (batch_size, self.num_macs, 1),
+            dtype=torch.float32, device=self.device
+        )
+
+        if workspace_budget is not None:
+            workspace_budget = max(0, workspace_budget - get_num_bytes(x))
+
+        peak_workspace_bytes = 0
+
+        for chunk in self.get_mac_chunks(
+            workspace_budget, batch_size * x.element_size(),
+            batch_size * raw_activations.shape[-1] *
+            raw_activations.element_size()
+        ):
+            num_chunk_macs = chunk.mac_indices.shape[0]
+
+            mac_inputs = x[:, chunk.input_connections].view(
+                batch_size, num_chunk_macs, -1
+            )
+
+            num_active_inputs[:, chunk.mac_indices] = torch.sum(
+                mac_inputs, dim=2, keepdim=True
+            )
+
+            chunk_activations = self.sum_pair_weight_rows(
+                mac_inputs.view(batch_size * num_chunk_macs, -1),
+                chunk.mac_indices.repeat(batch_size)
+            )
+
+            raw_activations[:, chunk.mac_indices] = chunk_activations.view(
+                batch_size, num_chunk_macs, -1
+            )
+
+            peak_workspace_bytes = max(
+                peak_workspace_bytes,
+                get_num_bytes(mac_inputs) + get_num_bytes(chunk_activations)
+            )
+
+        self.peak_workspace_bytes = get_num_bytes(x) + peak_workspace_bytes
+
+        return raw_activations, num_active_inputs
+
+
+    def get_integer_weights(self) -> List[torch.ScriptObject]:
+        """
+        Returns the weights of every MAC packed for the quantized
+        linear kernels. The weights are packed again whenever they
+        have changed since they were last packed.
+
+        Returns:
+            (List[torch.ScriptObject]): the packed weights of each MAC,
+                in row-major MAC order.
+        """
+        weights_state = self.get_weights_state()
+
+        if (
+            self.integer_weights is not None and
+            self.integer_weights[0] == weights_state
+        ):
+            return self.integer_weights[1]
+
+        weights = self.weights.detach()
+        integer_weights = [None] * self.num_macs
+
+        for bucket in self.get_mac_chunks(None, 0):
+            bucket_weights = self.get_bucket_weights(bucket, weights)
+
+            for position, mac_index in enumerate(
+                bucket.mac_indices.tolist()
+            ):
+                integer_weights[mac_index] = prepack_integer_weights(
+                    bucket_weights[position]
+                )
+
+        self.integer_weights = (weights_state, integer_weights)
+
+        return integer_weights
+
+
+    def compute_integer_activations(self, mac_inputs: torch.Tensor,
+                                    mac_indices: torch.Tensor) -> torch.Tensor:
+        """
+        Computes the raw activations of a set of MACs with the
+        quantized linear kernels, which quantize the inputs to 8 bits,
+        accumulate their products with the weights in int32 and scale
+        the sums back to float32.
+
+        Args:
+            mac_inputs (torch.Tensor): the inputs in the receptive
+                field of each MAC, of size
+                (batch_size, num_subset_macs, num_input_rows).
+            mac_indices (torch.Tensor): the indices of the MACs.
+
+        Returns:
+            (torch.Tensor): the raw activations of size (
+                batch_size, num_subset_macs,
+                num_cms_per_mac * num_neurons_per_cm
+            ).
+        """
+        integer_weights = self.get_integer_weights()
+
+        raw_activations = torch.empty(
+            (*mac_inputs.shape[:2], self.weights.shape[-1]),
+            dtype=torch.float32, device=self.device
+        )
+
+        for position, mac_index in enumerate(mac_indices.tolist()):
+            # binary inputs are exact in 7 bits, which keeps the 16-bit
+            # intermediate sums of the x86 kernels from saturating.
+            raw_activations[:, position] = torch.ops.quantized.linear_dynamic(
+                mac_inputs[:, position], integer_weights[mac_index], True
+            )
+
+        return raw_activations
+
+
+    def compute_integer_raw_activations(
+        self, x: torch.Tensor,
+        workspace_budget: Optional[int]) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Computes the raw activations and the number of active inputs
+        of every MAC in the layer with integer accumulation.
+
+        Args:
+            x (torch.Tensor): the layer input.
+            workspace_budget (Optional[int]): the workspace budget in
+                bytes, or None for no limit.
+
+        Returns:
+            (Tuple[torch.Tensor, torch.Tensor]): the raw activations and
+                the number of active inputs, as returned by
+                compute_raw_activations.
+        """
+        batch_size = x.shape[0]
+
+        x = self.pad_input(x)
+
+        raw_activations = torch.empty(
+            (batch_size, self.num_macs, self.weights.shape[-1]),
+            dtype=torch.float32, device=self.device
+        )
+
+        num_active_inputs = torch.empty(
+            (batch_size, self.num_macs, 1),
+            dtype=torch.float32, device=self.device
+        )
+
+        if workspace_budget is not None:
+            workspace_budget = max(0, workspace_budget - get_num_bytes(x))
+
+        peak_workspace_bytes = 0
+
+        for chunk in self.get_mac_chunks(
+            workspace_budget, batch_size * x.element_size(),
+            batch_size * raw_activations.shape[-1] *
+            raw_activations.element_size()
+        ):
+            mac_inputs = x[:, chunk.input_connections].view(
+                batch_size, chunk.mac_indices.shape[0], -1
+            )
+
+            num_active_inputs[:, chunk.mac_indices] = torch.sum(
+                mac_inputs, dim=2, keepdim=True
+            )
+
+            chunk_activations = self.compute_integer_activations(
+                mac_inputs, chunk.mac_indices
+            )
+
+            raw_activations[:, chunk.mac_indices] = chunk_activations
 
-            raw_activations = raw_activations.view(
-                batch_size, self.num_macs,
-                self.num_cms_per_mac,
-                self.num_neurons_per_cm
+            peak_workspace_bytes = max(
+                peak_workspace_bytes,
+                get_num_bytes(mac_inputs) + get_num_bytes(chunk_activations)
             )
 
-            if self.training:
-                familiarities = torch.max(
-                    raw_activations, dim=3, keepdim=True
-                )[0]
+        self.peak_workspace_bytes = get_num_bytes(x) + peak_workspace_bytes
 
-                etas = torch.mean(familiarities, dim=2, keepdim=True)
-                torch.sub(etas, self.min_familiarity, out=etas)
-                torch.div(etas, 1.0 - self.min_familiarity, out=etas)
-                torch.mul(etas, self.sigmoid_chi, out=etas)
-                torch.maximum(
-                    etas, torch.zeros(
-                        (), dtype=torch.float32
-                    ), out=etas
+        return raw_activations, num_active_inputs
+
+
+    def score_neurons(self, raw_activations: torch.Tensor,
+        num_active_inputs: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Determines which MACs are active and normalizes the raw
+        activations of their neurons. In training mode the normalized
+        activations are then turned into the CSA distribution over
+        the neurons in each CM, unless the CSA fast path is on, in
+        which case they are only transformed for the MACs that need
+        sampling when the winners are selected.
+
+        The raw activations are overwritten.
+
+        Args:
+            raw_activations (torch.Tensor): the raw activations of size
+                (batch_size, num_macs, num_cms_per_mac * num_neurons_per_cm).
+            num_active_inputs (torch.Tensor): the number of active
+                inputs to each MAC, of size (batch_size, num_macs, 1).
+
+        Returns:
+            (Tuple[torch.Tensor, torch.Tensor]): the neuron scores of
+                size (
+                    batch_size, num_macs,
+                    num_cms_per_mac, num_neurons_per_cm
+                ), and the boolean mask of active MACs of size
+                (batch_size, num_macs, 1).
+        """
+        macs_are_active = self.threshold_macs(num_active_inputs)
+
+        torch.div(raw_activations, num_active_inputs, out=raw_activations)
+        torch.nan_to_num(raw_activations, nan=0.0, out=raw_activations)
+
+        raw_activations = raw_activations.view(
+            raw_activations.shape[0], self.num_macs,
+            self.num_cms_per_mac,
+            self.num_neurons_per_cm
+        )
+
+        if self.training and self.csa_fast_path_tolerance is None:
+            self.compute_csa_probabilities(raw_activations, self.workspace)
+
+        return raw_activations, macs_are_active
+
+
+    def threshold_macs(self, num_active_inputs: torch.Tensor) -> torch.Tensor:
+        """
+        Determines which MACs are active from the number of
+        active inputs in their receptive fields.
+
+        Args:
+            num_active_inputs (torch.Tensor): the number of active
+                inputs to each MAC, of size (batch_size, num_macs, 1).
+
+        Returns:
+            (torch.Tensor): the boolean mask of active MACs, of size
+                (batch_size, num_macs, 1).
+        """
+        macs_are_active = self.get_buffer(
+            'macs_are_active', num_active_inputs.shape, torch.bool
+        )
+
+        macs_are_below_max = self.get_buffer(
+            'macs_are_below_max', num_active_inputs.shape, torch.bool
+        )
+
+        torch.ge(
+            num_active_inputs, self.activation_threshold_min,
+            out=macs_are_active
+        )
+
+        torch.le(
+            num_active_inputs, self.activation_threshold_max,
+            out=macs_are_below_max
+        )
+
+        return macs_are_active.logical_and_(macs_are_below_max)
+
+
+    def compute_csa_probabilities(
+        self, activations: torch.Tensor,
+        workspace: Optional[WorkspaceArena] = None) -> None:
+        """
+        Turns normalized activations into the (unnormalized) CSA
+        distribution over the neurons in each CM, in place.
+
+        Args:
+            activations (torch.Tensor): the normalized activations,
+                of size (..., num_cms_per_mac, num_neurons_per_cm).
+            workspace (Optional[WorkspaceArena]): the arena to take
+                the temporary buffers from, if any.
+        """
+        familiarities = get_workspace_buffer(
+            workspace, 'familiarities', (*activations.shape[:-1], 1),
+            torch.float32, self.device
+        )
+
+        etas = get_workspace_buffer(
+            workspace, 'etas', (*activations.shape[:-2], 1, 1),
+            torch.float32, self.device
+        )
+
+        torch.amax(activations, dim=-1, keepdim=True, out=familiarities)
+        torch.mean(familiarities, dim=-2, keepdim=True, out=etas)
+        torch.sub(etas, self.min_familiarity, out=etas)
+        torch.div(etas, 1.0 - self.min_familiarity, out=etas)
+        torch.mul(etas, self.sigmoid_chi, out=etas)
+        torch.clamp(etas, min=0.0, out=etas)
+
+        probs = activations
+        torch.mul(-self.sigmoid_lambda, probs, out=probs)
+        torch.add(probs, self.sigmoid_phi, out=probs)
+        torch.exp(probs, out=probs)
+        torch.add(probs, 1.0, out=probs)
+        torch.div(etas, probs, out=probs)
+        torch.add(probs, 1e-6, out=probs)
+
+
+    def select_active_neurons(
+        self, scores: torch.Tensor,
+        sample_indices: Optional[torch.Tensor] = None,
+        mac_indices: Optional[torch.Tensor] = None) -> torch.Tensor:
+        """
+        Selects the active neuron in each CM of each MAC, either by
+        sampling from the CSA distribution (training) or by taking
+        the neuron with the highest activation (evaluation).
+
+        Args:
+            scores (torch.Tensor): the neuron scores returned by
+                score_neurons, of size
+                (..., num_cms_per_mac, num_neurons_per_cm).
+            sample_indices (Optional[torch.Tensor]): the sample of each
+                row of scores, if scores does not hold every sample and
+                MAC of the batch in order.
+            mac_indices (Optional[torch.Tensor]): the MAC of each row
+                of scores, given along with sample_indices.
+
+        Returns:
+            (torch.Tensor): the indices of the active neurons, of size
+                (..., num_cms_per_mac, 1) and dtype torch.long.
+        """
+        if self.training:
+            # pairs of active MACs vary in number from batch to batch,
+            # so only full batches take their buffers from the workspace.
+            workspace = None
+
+            if self.sampling_sample_indices is not None:
+                if sample_indices is None:
+                    workspace = self.workspace
+                    sample_indices = self.sampling_sample_indices.unsqueeze(1)
+                    mac_indices = self.mac_indices.unsqueeze(0)
+                else:
+                    sample_indices = self.sampling_sample_indices[
+                        sample_indices
+                    ]
+
+                sample_indices = torch.add(
+                    sample_indices, self.sampling_sample_offset
                 )
+            elif sample_indices is None:
+                workspace = self.workspace
+
+                sample_indices = torch.arange(
+                    self.sampling_sample_offset,
+                    self.sampling_sample_offset + scores.shape[0],
+                    out=self.get_buffer(
+                        'sample_indices', (scores.shape[0],), torch.long
+                    )
+                ).unsqueeze(1)
 
-                probs = raw_activations
-                torch.mul(-self.sigmoid_lambda, probs, out=probs)
-                torch.add(probs, self.sigmoid_phi, out=probs)
-                torch.exp(probs, out=probs)
-                torch.add(probs, 1.0, out=probs)
-                torch.div(etas, probs, out=probs)
-                torch.add(probs, 1e-6, out=probs)
+                mac_indices = self.mac_indices.unsqueeze(0)
+            else:
+                sample_indices = torch.add(
+                    sample_indices, self.sampling_sample_offset
+                )
 
-                prob_dist = Categorical(probs=raw_activations)
-                active_neurons = prob_dist.sample().unsqueeze(-1)
+            if self.sampling_mac_offset:
+                mac_indices = torch.add(mac_indices, self.sampling_mac_offset)
+
+            seed = self.draw_sampling_seed()
+
+            if self.csa_fast_path_tolerance is None:
+                active_neurons = sample_winners(
+                    scores, seed, self.sampling_step, self.layer_index,
+                    sample_indices, mac_indices, workspace
+                )
+
+                self.csa_path_counts = (
+                    0, 0, math.prod(scores.shape[:-2])
+                )
             else:
-                active_neurons = torch.argmax(
-                    raw_activations, dim=3, keepdim=True
+                active_neurons = self.select_winners_by_csa_path(
+                    scores, seed, sample_indices, mac_indices
+                )
+        elif sample_indices is None:
+            active_neurons = torch.argmax(
+                scores, dim=-1, keepdim=True,
+                out=self.get_buffer(
+                    'active_neurons', (*scores.shape[:-1], 1), torch.long
                 )
+            )
+        else:
+            active_neurons = torch.argmax(scores, dim=-1, keepdim=True)
 
-            output = raw_activations
-            torch.zeros(
-                output.shape, out=output,
-                dtype=torch.float32, device=self.device
+        return active_neurons
+
+
+    def draw_sampling_seed(self) -> int:
+        """
+        Returns the seed of the active neuron sampler for a training
+        pass: the fixed sampling_seed, or a new seed drawn from torch's
+        random number generator if it is None.
+
+        Returns:
+            (int): the seed.
+        """
+        if self.sampling_seed is None:
+            return int(torch.randint(2 ** 32, ()).item())
+
+        return self.sampling_seed
+
+
+    def select_winners_by_csa_path(
+        self, activations: torch.Tensor, seed: int,
+        sample_indices: torch.Tensor,
+        mac_indices: torch.Tensor) -> torch.Tensor:
+        """
+        Selects the active neurons of a training pass from the
+        normalized activations, taking closed-form winners for the
+        (sample, MAC) pairs whose CSA distribution is effectively
+        one-hot or uniform, and sampling the others from their full
+        CSA distribution. The winners of every pair only depend on its
+        sampling counters, as with sample_winners.
+
+        The probabilities of the most active, second most active and
+        least active neurons of each CM bound its distribution: it is
+        effectively one-hot if the other neurons together hold at most
+        the tolerance relative to the most active one, and effectively
+        uniform if the most active neuron is at most the tolerance
+        more likely than the least active one.
+
+        The activations are overwritten.
+
+        Args:
+            activations (torch.Tensor): the normalized activations, of
+                size (..., num_cms_per_mac, num_neurons_per_cm).
+            seed (int): the sampling seed.
+            sample_indices (torch.Tensor): the sampling sample index of
+                each pair, broadcastable to activations.shape[:-2].
+            mac_indices (torch.Tensor): the MAC index of each pair,
+                broadcastable to activations.shape[:-2].
+
+        Returns:
+            (torch.Tensor): the indices of the active neurons, of size
+                (..., num_cms_per_mac, 1) and dtype torch.long.
+        """
+        group_shape = tuple(activations.shape[:-2])
+        num_cms, num_neurons = activations.shape[-2:]
+        tolerance = self.csa_fast_path_tolerance
+
+        activations = activations.reshape(-1, num_cms, num_neurons)
+        num_pairs = activations.shape[0]
+        sample_indices = torch.broadcast_to(
+            sample_indices, group_shape
+        ).reshape(-1)
+        mac_indices = torch.broadcast_to(mac_indices, group_shape).reshape(-1)
+
+        # the etas of the bounding neurons are those of the full
+        # distributions, since they only depend on the most active.
+        if self.can_csa_saturate():
+            top_activations, top_neurons = torch.topk(
+                activations, min(2, num_neurons), dim=-1
+            )
+            bounds = torch.cat(
+                [
+                    top_activations[..., :1],
+                    torch.amin(activations, dim=-1, keepdim=True),
+                    top_activations[..., -1:]
+                ], dim=-1
+            )
+        else:
+            top_neurons = None
+            bounds = torch.cat(
+                [
+                    torch.amax(activations, dim=-1, keepdim=True),
+                    torch.amin(activations, dim=-1, keepdim=True)
+                ], dim=-1
             )
 
-            output.scatter_(
-                3, active_neurons,
-                torch.ones(
-                    output.shape,
-                    dtype=torch.float32,
-                    device=self.device
+        self.compute_csa_probabilities(bounds)
+
+        pairs_are_uniform = torch.all(
+            torch.le(
+                bounds[..., 0], torch.mul(bounds[..., 1], 1.0 + tolerance)
+            ), dim=-1
+        )
+
+        if top_neurons is None:
+            pairs_are_one_hot = torch.zeros_like(pairs_are_uniform)
+        else:
+            pairs_are_one_hot = torch.all(
+                torch.le(
+                    torch.mul(bounds[..., 2], num_neurons - 1),
+                    torch.mul(bounds[..., 0], tolerance)
+                ), dim=-1
+            )
+            pairs_are_uniform.logical_and_(
+                torch.logical_not(pairs_are_one_hot)
+            )
+
+        one_hot_pairs = torch.nonzero(pairs_are_one_hot).squeeze(1)
+        uniform_pairs = torch.nonzero(pairs_are_uniform).squeeze(1)
+        num_sampled_pairs = (
+            num_pairs - one_hot_pairs.shape[0] - uniform_pairs.shape[0]
+        )
+
+        if num_sampled_pairs * 2 > num_pairs:
+            # most pairs are sampled, so every pair is sampled and the
+            # winners of the others replaced, rather than gathered.
+            self.compute_csa_probabilities(activations)
+
+            winners = sample_winners(
+                activations, seed, self.sampling_step, self.layer_index,
+                sample_indices, mac_indices
+            )
+        else:
+            winners = torch.empty(
+                (num_pairs, num_cms, 1), dtype=torch.long,
+                device=self.device
+            )
+
+            if num_sampled_pairs:
+                sampled_pairs = torch.nonzero(
+                    torch.logical_not(
+                        torch.logical_or(pairs_are_one_hot, pairs_are_uniform)
+                    )
+                ).squeeze(1)
+
+                scores = activations[sampled_pairs]
+                self.compute_csa_probabilities(scores)
+
+                winners[sampled_pairs] = sample_winners(
+                    scores, seed, self.sampling_step, self.layer_index,
+                    sample_indices[sampled_pairs], mac_indices[sampled_pairs]
                 )
+
+        if one_hot_pairs.shape[0]:
+            winners[one_hot_pairs] = top_neurons[one_hot_pairs, :, :1]
+
+        if uniform_pairs.shape[0]:
+            winners[uniform_pairs] = sample_uniform_winners(
+                seed, self.sampling_step, self.layer_index,
+                sample_indices[uniform_pairs], mac_indices[uniform_pairs],
+                num_cms, num_neurons
             )
 
-            output = output.view((batch_size, self.num_macs, -1))
-            torch.mul(output, macs_are_active, out=output)
+        self.csa_path_counts = (
+            one_hot_pairs.shape[0], uniform_pairs.shape[0], num_sampled_pairs
+        )
+
+        return winners.view(*group_shape, num_cms, 1)
+
+
+    def can_csa_saturate(self) -> bool:
+        """
+        Checks whether the CSA distribution of a CM can be effectively
+        one-hot within the fast path tolerance: even at the highest
+        familiarity, the least active neurons keep a share of the
+        distribution set by the sigmoid parameters.
+
+        Returns:
+            (bool): whether any CM can take the one-hot path.
+        """
+        def get_probability(activation: float) -> float:
+            exponent = self.sigmoid_phi - self.sigmoid_lambda * activation
+
+            return self.sigmoid_chi / (
+                1.0 + math.exp(min(exponent, 700.0))
+            ) + 1e-6
+
+        return (
+            (self.num_neurons_per_cm - 1) * get_probability(0.0) <=
+            self.csa_fast_path_tolerance * get_probability(1.0)
+        )
+
+
+    def get_csa_path_fractions(self) -> Tuple[float, float, float]:
+        """
+        Returns the fractions of the (sample, MAC) pairs of the last
+        training pass whose winners were the most active neurons,
+        drawn uniformly, and sampled from the full CSA distribution.
+
+        Returns:
+            (Tuple[float, float, float]): the fractions, or zeros
+                before the first training pass.
+        """
+        num_pairs = sum(self.csa_path_counts)
+
+        if not num_pairs:
+            return (0.0, 0.0, 0.0)
+
+        return tuple(count / num_pairs for count in self.csa_path_counts)
+
+
+    def build_output(self, active_neurons: torch.Tensor,
+                     macs_are_active: torch.Tensor) -> torch.Tensor:
+        """
+        Builds the dense layer output from the active neurons.
+
+        Args:
+            active_neurons (torch.Tensor): the indices of the active
+                neurons, as returned by select_active_neurons.
+            macs_are_active (torch.Tensor): the boolean mask of active
+                MACs, of size (batch_size, num_macs, 1).
+
+        Returns:
+            (torch.Tensor): the layer output of size (
+                batch_size,
+                num_macs,
+                num_cms_per_mac * num_neurons_per_cm
+            ).
+        """
+        output = self.get_buffer(
+            'output', (*active_neurons.shape[:3], self.num_neurons_per_cm)
+        )
+
+        output.zero_().scatter_(3, active_neurons, 1.0)
+
+        output = output.view(output.shape[0], self.num_macs, -1)
+        torch.mul(output, macs_are_active, out=output)
 
         return output
 
 
+    def encode_index_code(
+        self, x: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Converts a dense input code for this layer into the index
+        code format used by forward_indices().
+
+        Args:
+            x (torch.Tensor): dense input of size (
+                batch_size,
+                prev_layer_num_macs,
+                prev_layer_num_cms_per_mac *
+                prev_layer_num_neurons_per_cm
+            ).
+
+        Returns:
+            (Tuple[torch.Tensor, torch.Tensor]): the index of the
+                active neuron in each CM of each previous layer MAC,
+                of size (
+                    batch_size, prev_layer_num_macs,
+                    prev_layer_num_cms_per_mac
+                ), and the boolean mask of active previous layer
+                MACs, of size (batch_size, prev_layer_num_macs).
+        """
+        x = x.view(
+            x.shape[0], self.prev_layer_output_shape[0],
+            self.prev_layer_num_cms_per_mac,
+            self.prev_layer_num_neurons_per_cm
+        )
+
+        winners = torch.argmax(x, dim=3).to(self.input_winner_dtype)
+        macs_are_active = torch.gt(torch.amax(x, dim=(2, 3)), 0.0)
+
+        return winners, macs_are_active
+
+
+    def decode_index_code(self, winners: torch.Tensor,
+        macs_are_active: torch.Tensor) -> torch.Tensor:
+        """
+        Converts an index code produced by forward_indices() into
+        the dense output format produced by forward().
+
+        Args:
+            winners (torch.Tensor): the index of the active neuron
+                in each CM of each MAC, of size
+                (batch_size, num_macs, num_cms_per_mac).
+            macs_are_active (torch.Tensor): boolean mask of active
+                MACs of size (batch_size, num_macs).
+
+        Returns:
+            (torch.Tensor): dense code of size (
+                batch_size, num_macs,
+                num_cms_per_mac * num_neurons_per_cm
+            ) of dtype torch.float32.
+        """
+        output = torch.zeros(
+            (*winners.shape, self.num_neurons_per_cm),
+            dtype=torch.float32, device=winners.device
+        )
+
+        output.scatter_(3, winners.long().unsqueeze(-1), 1.0)
+        torch.mul(
+            output, macs_are_active.unsqueeze(-1).unsqueeze(-1),
+            out=output
+        )
+
+        return output.view(*winners.shape[:2], -1)
+
+
+    def forward_indices(self, winners: torch.Tensor,
+        macs_are_active: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Passes an index code through a Sparsey layer.
+
+        Since every CM in an active MAC has exactly one active neuron,
+        the raw activations are computed by summing the weight rows
+        selected by the active input neurons instead of multiplying
+        the (mostly zero) dense input with the full weight matrix.
+
+        Args:
+            winners (torch.Tensor): the index of the active neuron in
+                each CM of each previous layer MAC, of size (
+                    batch_size, prev_layer_num_macs,
+                    prev_layer_num_cms_per_mac
+                ) and any integer dtype.
+            macs_are_active (torch.Tensor): boolean mask of active
+                previous layer MACs of size
+                (batch_size, prev_layer_num_macs).
+
+        Returns:
+            (Tuple[torch.Tensor, torch.Tensor]): the index of the
+                active neuron in each CM of each MAC in this layer,
+                of size (batch_size, num_macs, num_cms_per_mac), and
+                the boolean mask of active MACs in this layer, of size
+                (batch_size, num_macs).
+        """
+        expected_shape = (
+            self.prev_layer_output_shape[0],
+            self.prev_layer_num_cms_per_mac
+        )
+
+        if tuple(winners.shape[1:]) != expected_shape:
+            raise ValueError(
+                'Input shape is incorrect! '
+                f'Expected shape {expected_shape} but received '
+                f'{tuple(winners.shape[1:])} instead.'
+            )
+
+        batch_size = winners.shape[0]
+
+        with torch.no_grad():
+            scores, macs_are_active = self.score_neurons(
+                *self.compute_raw_activations_from_indices(
+                    winners, macs_are_active
+                )
+            )
+
+            macs_are_active = macs_are_active.view(batch_size, self.num_macs)
+            self.is_active = macs_are_active
+
+            active_neurons = self.select_active_neurons(scores)
+
+            output_winners = active_neurons.squeeze(-1).to(
+                self.output_winner_dtype
+            )
+
+            torch.mul(
+                output_winners, macs_are_active.unsqueeze(-1),
+                out=output_winners
+            )
+
+        if self.training:
+            self.sampling_step += 1
+
+        return output_winners, macs_are_active
+
+
+    def compute_raw_activations_from_indices(
+        self, winners: torch.Tensor,
+        macs_are_active: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Computes the unnormalized activations of every neuron in the
+        layer from an index code by summing the weight rows of the
+        active input neurons.
+
+        Args:
+            winners (torch.Tensor): the index of the active neuron in
+                each CM of each previous layer MAC.
+            macs_are_active (torch.Tensor): boolean mask of active
+                previous layer MACs.
+
+        Returns:
+            (Tuple[torch.Tensor, torch.Tensor]): the raw activations of
+                size (
+                    batch_size, num_macs,
+                    num_cms_per_mac * num_neurons_per_cm
+                ), and the number of active inputs of size
+                (batch_size, num_macs, 1).
+        """
+        batch_size = winners.shape[0]
+
+        if self.receptive_field_layout == 'csr':
+            raw_activations = torch.empty(
+                (batch_size, self.num_macs, self.weights.shape[-1]),
+                dtype=torch.float32, device=self.device
+            )
+
+            num_active_inputs = torch.empty(
+                (batch_size, self.num_macs, 1),
+                dtype=torch.float32, device=self.device
+            )
+
+            for bucket in self.rf_buckets:
+                (
+                    raw_activations[:, bucket.mac_indices],
+                    num_active_inputs[:, bucket.mac_indices]
+                ) = self._sum_weight_rows(
+                    winners, macs_are_active,
+                    bucket.input_connections, None,
+                    bucket.index_row_offsets, self.weights
+                )
+
+            return raw_activations, num_active_inputs
+
+        return self._sum_weight_rows(
+            winners, macs_are_active,
+            self.index_input_connections, self.input_connection_mask,
+            self.index_row_offsets,
+            self.weights.view(-1, self.weights.shape[-1])
+        )
+
+
+    def _sum_weight_rows(self, winners: torch.Tensor,
+        macs_are_active: torch.Tensor, input_connections: torch.Tensor,
+        input_connection_mask: torch.Tensor,
+        index_row_offsets: torch.Tensor,
+        flat_weights: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Sums the weight rows selected by the active input neurons
+        of a group of MACs with equally sized receptive fields.
+
+        Args:
+            winners (torch.Tensor): the index of the active neuron in
+                each CM of each previous layer MAC.
+            macs_are_active (torch.Tensor): boolean mask of active
+                previous layer MACs.
+            input_connections (torch.Tensor): the previous layer MACs
+                connected to each MAC in the group.
+            input_connection_mask (torch.Tensor): mask of valid
+                input connections, or None if all are valid.
+            index_row_offsets (torch.Tensor): offset of the first
+                weight row of every (MAC, receptive field position, CM).
+            flat_weights (torch.Tensor): the weights, flattened to
+                size (num_weight_rows, num_cms_per_mac * num_neurons_per_cm).
+
+        Returns:
+            (Tuple[torch.Tensor, torch.Tensor]): the raw activations and
+                the number of active inputs of the MACs in the group.
+        """
+        batch_size = winners.shape[0]
+        num_group_macs = input_connections.shape[0]
+
+        input_is_active = macs_are_active[:, input_connections]
+
+        if input_connection_mask is not None:
+            torch.logical_and(
+                input_is_active, input_connection_mask,
+                out=input_is_active
+            )
+
+        num_active_inputs = torch.mul(
+            torch.sum(input_is_active, dim=2, keepdim=True),
+            self.prev_layer_num_cms_per_mac
+        ).float()
+
+        weight_rows = torch.add(
+            winners[:, input_connections].long(),
+            index_row_offsets
+        ).view(batch_size * num_group_macs, -1)
+
+        per_row_weights = input_is_active.unsqueeze(-1).expand(
+            -1, -1, -1, self.prev_layer_num_cms_per_mac
+        ).reshape(weight_rows.shape).float()
+
+        if self.weight_storage == 'sparse':
+            if not self.weight_rows.shape[0]:
+                return torch.zeros(
+                    (batch_size, num_group_macs, flat_weights.shape[-1]),
+                    dtype=torch.float32, device=self.device
+                ), num_active_inputs
+
+            # rows that are not stored are all zero, so they are
+            # redirected to any stored row with a weight of zero.
+            weight_rows, row_is_stored = self.find_weight_rows(weight_rows)
+            torch.mul(per_row_weights, row_is_stored, out=per_row_weights)
+
+        if flat_weights.dtype != torch.float32 or self.binary_weights:
+            flat_weights, weight_rows = self.gather_weight_rows(weight_rows)
+
+        raw_activations = torch.nn.functional.embedding_bag(
+            weight_rows, flat_weights,
+            mode='sum', per_sample_weights=per_row_weights
+        ).view(batch_size, num_group_macs, -1)
+
+        return raw_activations, num_active_inputs
+
+
 class SparseyLayerV2(torch.nn.Module):
     """
     SparseyLayer: class representing layers in the Sparsey model.
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+
+"""
+Weight Precision: helpers for storing layer weights, which always
+    lie in [0, 1], in lower precision formats.
+"""
+
+
+import torch
+
+
+WEIGHT_DTYPES = {
+    'float32': torch.float32,
+    'float16': torch.float16,
+    'bfloat16': torch.bfloat16,
+    'uint8': torch.uint8
+}
+
+# uint8 weights are fixed-point values in steps of 1 / UINT8_WEIGHT_SCALE.
+UINT8_WEIGHT_SCALE = 255.0
+
+# uint8 weights are shifted by this zero point into the signed 8-bit
+# range of the quantized linear kernels.
+INTEGER_WEIGHT_ZERO_POINT = -128
+
+# the dtypes the activation matmuls of a layer can run in; the
+# products are always accumulated in float32.
+COMPUTE_DTYPES = {
+    'float32': torch.float32,
+    'bfloat16': torch.bfloat16
+}
+
+
+def get_weight_dtype(weight_dtype: str) -> torch.dtype:
+    """
+    Returns the torch dtype used to store weights.
+
+    Args:
+        weight_dtype (str): the name of the weight dtype, one of
+            'float32', 'float16', 'bfloat16' or 'uint8'.
+
+    Returns:
+        (torch.dtype): the dtype.
+
+    Raises:
+        ValueError: if the weight dtype is not supported.
+    """
+    if weight_dtype not in WEIGHT_DTYPES:
+        raise ValueError(
+            'Invalid weight dtype! Expected one of '
+            f'{list(WEIGHT_DTYPES.keys())} but received {weight_dtype}.'
+        )
+
+    return WEIGHT_DTYPES[weight_dtype]
+
+
+def get_compute_dtype(compute_dtype: str) -> torch.dtype:
+    """
+    Returns the torch dtype the activation matmuls of a layer run in.
+
+    Args:
+        compute_dtype (str): the name of the compute dtype, one of
+            'float32' or 'bfloat16'.
+
+    Returns:
+        (torch.dtype): the dtype.
+
+    Raises:
+        ValueError: if the compute dtype is not supported.
+    """
+    if compute_dtype not in COMPUTE_DTYPES:
+        raise ValueError(
+            'Invalid compute dtype! Expected one of '
+            f'{list(COMPUTE_DTYPES.keys())} but received {compute_dtype}.'
+        )
+
+    return COMPUTE_DTYPES[compute_dtype]
+
+
+def dequantize_weights(weights: torch.Tensor) -> torch.Tensor:
+    """
+    Converts stored weights to float32.
+
+    Args:
+        weights (torch.Tensor): the stored weights.
+
+    Returns:
+        (torch.Tensor): the weights as float32; float32 weights are
+            returned as is, without a copy.
+    """
+    if weights.dtype == torch.float32:
+        return weights
+
+    if weights.dtype == torch.uint8:
+        return weights.float().div_(UINT8_WEIGHT_SCALE)
+
+    return weights.float()
+
+
+def quantize_weights(weights: torch.Tensor,
+                     dtype: torch.dtype) -> torch.Tensor:
+    """
+    Converts float weights in [0, 1] to a storage dtype, rounding
+    to the nearest representable value.
+
+    Args:
+        weights (torch.Tensor): the weights.
+        dtype (torch.dtype): the storage dtype.
+
+    Returns:
+        (torch.Tensor): the weights stored as dtype.
+    """
+    if dtype == torch.uint8:
+        return torch.round(
+            torch.mul(torch.clamp(weights, 0.0, 1.0), UINT8_WEIGHT_SCALE)
+        ).to(torch.uint8)
+
+    return weights.to(dtype)
+
+
+def convert_weights(weights: torch.Tensor,
+                    dtype: torch.dtype) -> torch.Tensor:
+    """
+    Converts stored weights from one storage dtype to another.
+
+    Args:
+        weights (torch.Tensor): the stored weights.
+        dtype (torch.dtype): the storage dtype to convert to.
+
+    Returns:
+        (torch.Tensor): the weights stored as dtype.
+    """
+    if weights.dtype == dtype:
+        return weights
+
+    return quantize_weights(dequantize_weights(weights), dtype)
+
+
+def check_integer_kernels() -> None:
+    """
+    Checks that torch provides quantized linear kernels, which integer
+    activations are computed with.
+
+    Raises:
+        ValueError: if no quantized engine is available.
+    """
+    if torch.backends.quantized.engine == 'none':
+        raise ValueError(
+            'Invalid integer activations! No quantized engine is '
+            'available in this build of torch.'
+        )
+
+
+def prepack_integer_weights(weights: torch.Tensor) -> torch.ScriptObject:
+    """
+    Packs the uint8 weights of a MAC for the quantized linear kernels,
+    as 8-bit integers whose products with the inputs are accumulated
+    in int32.
+
+    Args:
+        weights (torch.Tensor): the uint8 weights of the MAC, of size
+            (num_input_rows, num_outputs).
+
+    Returns:
+        (torch.ScriptObject): the packed weights, to pass to
+            torch.ops.quantized.linear_dynamic.
+    """
+    integer_weights = torch.sub(
+        weights.t().to(torch.int16), -INTEGER_WEIGHT_ZERO_POINT
+    ).to(torch.int8)
+
+    # the weights are stored exactly, so only the raw integer values
+    # are reinterpreted with the scale and zero point of uint8 weights.
+    return torch.ops.quantized.linear_prepack(
+        torch._make_per_tensor_quantized_tensor(
+            integer_weights.contiguous(), 1.0 / UINT8_WEIGHT_SCALE,
+            INTEGER_WEIGHT_ZERO_POINT
+        ), None
+    )
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+
+"""
+Weight Streaming: weights backed by a memory-mapped file, streamed
+    through a bounded window of resident chunks.
+"""
+
+
+from collections import OrderedDict
+import math
+import os
+from typing import BinaryIO, Optional, Tuple, Union
+
+import numpy as np
+import torch
+
+
+def check_resident_budget(max_resident_bytes: Optional[int]) -> None:
+    """
+    Checks that the budget of a weight window is valid.
+
+    Args:
+        max_resident_bytes (Optional[int]): the maximum number of
+            bytes of weights kept in memory, or None for no limit.
+
+    Raises:
+        ValueError: if the budget is not None or a positive int.
+    """
+    if max_resident_bytes is None:
+        return
+
+    if (
+        isinstance(max_resident_bytes, bool) or
+        not isinstance(max_resident_bytes, int) or
+        max_resident_bytes <= 0
+    ):
+        raise ValueError(
+            'Invalid resident weight size! Expected a positive number of '
+            f'bytes or None but received {max_resident_bytes}.'
+        )
+
+
+class WeightWindow:
+    """
+    WeightWindow: tensor rows stored in a memory-mapped file, read and
+        written through a window of chunks of rows copied into memory.
+        Chunks are evicted in least recently used order to keep the
+        window within its budget, and evicted chunks that were written
+        to are copied back to the file. Chunks are not tracked once
+        evicted, so a chunk must be done with before the next one is
+        requested.
+
+    Attributes:
+        mapping (np.memmap): the bytes of the file.
+        weights (torch.Tensor): the tensor stored in the file, sharing
+            its memory with the mapping.
+        max_resident_bytes (Optional[int]): the maximum number of bytes
+            of chunks kept in memory, or None for no limit. A chunk
+            larger than the budget is still loaded, on its own.
+        chunks (OrderedDict): the resident chunks, keyed by their
+            [start, end) range of rows, least recently used first.
+        dirty_chunks (set): the ranges of the resident chunks that
+            were written to.
+        resident_bytes (int): the bytes of the resident chunks.
+        peak_resident_bytes (int): the most bytes resident at once.
+        num_loads (int): the number of chunks read from the file.
+        num_write_backs (int): the number of chunks written back.
+    """
+    def __init__(self, file: Union[str, BinaryIO], shape: Tuple[int, ...],
+                 dtype: torch.dtype,
+                 max_resident_bytes: Optional[int] = None) -> None:
+        """
+        Maps a tensor to a file. A file that does not exist, or is
+        empty, is created filled with zeros.
+
+        Args:
+            file (Union[str, BinaryIO]): the path of the file, or an
+                open file object.
+            shape (Tuple[int, ...]): the shape of the tensor; chunks
+                are ranges along its first dimension.
+            dtype (torch.dtype): the dtype of the tensor.
+            max_resident_bytes (Optional[int]): the maximum number of
+                bytes of chunks kept in memory, or None for no limit.
+
+        Raises:
+            ValueError: if the budget is invalid, or the file already
+                holds a different number of bytes.
+        """
+        check_resident_budget(max_resident_bytes)
+
+        num_bytes = math.prod(shape) * torch.empty(
+            0, dtype=dtype
+        ).element_size()
+
+        if isinstance(file, str):
+            file_bytes = os.path.getsize(file) if os.path.exists(file) else 0
+        else:
+            file_bytes = os.fstat(file.fileno()).st_size
+
+        if file_bytes not in (0, num_bytes):
+            raise ValueError(
+                f'Invalid weight file! Expected {num_bytes} bytes of '
+                f'weights of shape {tuple(shape)} but the file holds '
+                f'{file_bytes} bytes.'
+            )
+
+        # mmap cannot map empty files, so empty tensors are kept in
+        # memory.
+        if num_bytes == 0:
+            self.mapping = np.zeros(0, dtype=np.uint8)
+        else:
+            self.mapping = np.memmap(
+                file, dtype=np.uint8, mode='r+' if file_bytes else 'w+',
+                shape=(num_bytes,)
+            )
+
+        self.weights = torch.from_numpy(self.mapping).view(dtype).view(shape)
+        self.max_resident_bytes = max_resident_bytes
+        self.chunks = OrderedDict()
+        self.dirty_chunks = set()
+        self.resident_bytes = 0
+        self.peak_resident_bytes = 0
+        self.num_loads = 0
+        self.num_write_backs = 0
+
+
+    def get_row_bytes(self) -> int:
+        """
+        Returns the number of bytes of each row of the tensor.
+
+        Returns:
+            (int): the size of a row in bytes.
+        """
+        return math.prod(self.weights.shape[1:]) * self.weights.element_size()
+
+
+    def get(self, start: int, end: int, dirty: bool = False) -> torch.Tensor:
+        """
+        Returns a chunk of rows, loading it from the file if it is not
+        resident, after evicting the least recently used chunks it
+        does not fit beside.
+
+        Args:
+            start (int): the first row of the chunk.
+            end (int): the row after the last row of the chunk.
+            dirty (bool): whether the caller writes to the chunk, so
+                that it is written back when evicted.
+
+        Returns:
+            (torch.Tensor): the resident copy of the rows.
+        """
+        key = (start, end)
+
+        if key in self.chunks:
+            self.chunks.move_to_end(key)
+        else:
+            chunk_bytes = (end - start) * self.get_row_bytes()
+
+            while self.chunks and (
+                self.max_resident_bytes is not None and
+                self.resident_bytes + chunk_bytes > self.max_resident_bytes
+            ):
+                self.evict(next(iter(self.chunks)))
+
+            self.chunks[key] = self.weights[start:end].clone()
+            self.resident_bytes += chunk_bytes
+            self.peak_resident_bytes = max(
+                self.peak_resident_bytes, self.resident_bytes
+            )
+            self.num_loads += 1
+
+        if dirty:
+            self.dirty_chunks.add(key)
+
+        return self.chunks[key]
+
+
+    def evict(self, key: Tuple[int, int]) -> None:
+        """
+        Removes a chunk from the window, writing it back to the file
+        if it was written to.
+
+        Args:
+            key (Tuple[int, int]): the range of rows of the chunk.
+        """
+        chunk = self.chunks.pop(key)
+        self.resident_bytes -= chunk.shape[0] * self.get_row_bytes()
+
+        if key in self.dirty_chunks:
+            self.dirty_chunks.remove(key)
+            self.weights[key[0]:key[1]].copy_(chunk)
+            self.num_write_backs += 1
+
+
+    def release(self) -> None:
+        """
+        Evicts every chunk, and flushes the file to disk if any chunk
+        was written back, so that the file, and the tensor mapped to
+        it, hold the current rows.
+        """
+        num_write_backs = self.num_write_backs
+
+        while self.chunks:
+            self.evict(next(iter(self.chunks)))
+
+        if self.num_write_backs != num_write_backs and isinstance(
+            self.mapping, np.memmap
+        ):
+            self.mapping.flush()
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+
+"""
+Winner Sampling: a counter-based sampler for the active neuron of
+    each CM, used in place of torch.distributions.Categorical.
+"""
+
+
+from typing import Optional, Tuple, Union
+
+import torch
+
+from sparseypy.core.model_layers.workspace import (
+    WorkspaceArena, get_workspace_buffer
+)
+
+
+HASH_MASK = 0xFFFFFFFF
+# multiplier of the 32-bit integer hash; it has 27 bits, so products
+# with 32-bit values fit in an int64 without overflowing.
+HASH_MULTIPLIER = 0x45D9F3B
+
+
+def hash_counter(hashes: int, counter: int) -> int:
+    """
+    Mixes a counter into a 32-bit hash. For a fixed hash, distinct
+    32-bit counters always give distinct results.
+
+    Args:
+        hashes (int): the hash to mix the counter into, in [0, 2 ** 32).
+        counter (int): the counter.
+
+    Returns:
+        (int): the new hash, in [0, 2 ** 32).
+    """
+    hashes = (counter ^ hashes) & HASH_MASK
+
+    for _ in range(2):
+        hashes = ((hashes >> 16) ^ hashes) * HASH_MULTIPLIER & HASH_MASK
+
+    return (hashes >> 16) ^ hashes
+
+
+def hash_counter_(hashes: torch.Tensor, counter: Union[int, torch.Tensor],
+                  scratch: torch.Tensor) -> torch.Tensor:
+    """
+    Mixes a counter into a tensor of 32-bit hashes in place, with
+    the same result as hash_counter.
+
+    Args:
+        hashes (torch.Tensor): the int64 hashes, in [0, 2 ** 32).
+        counter (Union[int, torch.Tensor]): the counter, broadcastable
+            to the hashes.
+        scratch (torch.Tensor): an int64 buffer the size of hashes.
+
+    Returns:
+        (torch.Tensor): the hashes.
+    """
+    torch.bitwise_xor(hashes, counter, out=hashes)
+    torch.bitwise_and(hashes, HASH_MASK, out=hashes)
+
+    for _ in range(2):
+        torch.bitwise_right_shift(hashes, 16, out=scratch)
+        torch.bitwise_xor(hashes, scratch, out=hashes)
+        torch.mul(hashes, HASH_MULTIPLIER, out=hashes)
+        torch.bitwise_and(hashes, HASH_MASK, out=hashes)
+
+    torch.bitwise_right_shift(hashes, 16, out=scratch)
+
+    return torch.bitwise_xor(hashes, scratch, out=hashes)
+
+
+def compute_variates(seed: int, step: int, layer_index: int,
+                     sample_indices: torch.Tensor, mac_indices: torch.Tensor,
+                     group_shape: Tuple[int, ...], num_cms: int,
+                     workspace: Optional[WorkspaceArena] = None) -> torch.Tensor:
+    """
+    Computes the uniform variate of every CM of a group of (sample,
+    MAC) pairs, as a hash of (seed, step, layer, sample, MAC, CM).
+
+    Args:
+        seed (int): the sampling seed.
+        step (int): the sampling step.
+        layer_index (int): the index of the layer.
+        sample_indices (torch.Tensor): the sample index of each pair,
+            broadcastable to group_shape.
+        mac_indices (torch.Tensor): the MAC index of each pair,
+            broadcastable to group_shape.
+        group_shape (Tuple[int, ...]): the shape of the pairs.
+        num_cms (int): the number of CMs of each MAC.
+        workspace (Optional[WorkspaceArena]): the arena to take the
+            temporary buffers and the result from, if any.
+
+    Returns:
+        (torch.Tensor): the variates in (0, 1), of size
+            (*group_shape, num_cms, 1) and dtype torch.float32.
+    """
+    cm_shape = (*group_shape, num_cms)
+
+    def get_buffer(name, shape, dtype):
+        return get_workspace_buffer(
+            workspace, name, shape, dtype, sample_indices.device
+        )
+
+    prefix = hash_counter(
+        hash_counter(hash_counter(0, seed & HASH_MASK), step & HASH_MASK),
+        layer_index
+    )
+
+    group_hashes = get_buffer('sampling_group_hashes', group_shape, torch.long)
+    group_scratch = get_buffer('sampling_group_scratch', group_shape, torch.long)
+
+    group_hashes.copy_(sample_indices)
+    torch.bitwise_and(group_hashes, HASH_MASK, out=group_hashes)
+    hash_counter_(group_hashes, prefix, group_scratch)
+    hash_counter_(group_hashes, mac_indices, group_scratch)
+
+    cm_indices = get_buffer('sampling_cm_indices', (num_cms,), torch.long)
+    torch.arange(num_cms, out=cm_indices)
+
+    hashes = get_buffer('sampling_hashes', cm_shape, torch.long)
+    scratch = get_buffer('sampling_scratch', cm_shape, torch.long)
+
+    hashes.copy_(group_hashes.unsqueeze(-1))
+    hash_counter_(hashes, cm_indices, scratch)
+
+    # the top 24 bits give uniform variates in (0, 1) that are
+    # exact in float32.
+    torch.bitwise_right_shift(hashes, 8, out=scratch)
+
+    variates = get_buffer('sampling_variates', (*cm_shape, 1), torch.float32)
+    variates.copy_(scratch.unsqueeze(-1))
+
+    return variates.add_(0.5).mul_(2.0 ** -24)
+
+
+def sample_winners(scores: torch.Tensor, seed: int, step: int,
+                   layer_index: int, sample_indices: torch.Tensor,
+                   mac_indices: torch.Tensor,
+                   workspace: Optional[WorkspaceArena] = None) -> torch.Tensor:
+    """
+    Samples the active neuron of every CM from the unnormalized
+    CSA distribution by inverse transform sampling: the winner is
+    the first neuron whose cumulative score exceeds a uniform
+    fraction of the total score of the CM.
+
+    The uniform variate of every CM is a hash of (seed, step, layer,
+    sample, MAC, CM), so each draw only depends on these counters
+    and not on how the batch or the MACs are split into chunks or
+    across workers.
+
+    Args:
+        scores (torch.Tensor): the positive neuron scores, of size
+            (..., num_cms_per_mac, num_neurons_per_cm).
+        seed (int): the sampling seed.
+        step (int): the sampling step.
+        layer_index (int): the index of the layer.
+        sample_indices (torch.Tensor): the sample index of the scores,
+            broadcastable to scores.shape[:-2].
+        mac_indices (torch.Tensor): the MAC index of the scores,
+            broadcastable to scores.shape[:-2].
+        workspace (Optional[WorkspaceArena]): the arena to take the
+            temporary buffers and the result from, if any.
+
+    Returns:
+        (torch.Tensor): the indices of the active neurons, of size
+            (..., num_cms_per_mac, 1) and dtype torch.long.
+    """
+    num_cms, num_neurons = scores.shape[-2:]
+
+    def get_buffer(name, shape, dtype):
+        return get_workspace_buffer(
+            workspace, name, shape, dtype, scores.device
+        )
+
+    variates = compute_variates(
+        seed, step, layer_index, sample_indices, mac_indices,
+        tuple(scores.shape[:-2]), num_cms, workspace
+    )
+
+    cumulative_scores = get_buffer(
+        'sampling_cumulative_scores', scores.shape, torch.float32
+    )
+
+    torch.cumsum(scores, dim=-1, out=cumulative_scores)
+    torch.mul(variates, cumulative_scores[..., -1:], out=variates)
+
+    below_variates = get_buffer(
+        'sampling_below_variates', scores.shape, torch.bool
+    )
+
+    torch.lt(cumulative_scores, variates, out=below_variates)
+
+    winners = get_buffer(
+        'sampling_winners', (*scores.shape[:-1], 1), torch.long
+    )
+    torch.sum(below_variates, dim=-1, keepdim=True, out=winners)
+
+    return torch.clamp(winners, max=num_neurons - 1, out=winners)
+
+
+def sample_uniform_winners(seed: int, step: int, layer_index: int,
+                           sample_indices: torch.Tensor,
+                           mac_indices: torch.Tensor, num_cms: int,
+                           num_neurons: int) -> torch.Tensor:
+    """
+    Draws the active neuron of every CM of a set of (sample, MAC)
+    pairs uniformly, from the same variates as sample_winners.
+
+    Args:
+        seed (int): the sampling seed.
+        step (int): the sampling step.
+        layer_index (int): the index of the layer.
+        sample_indices (torch.Tensor): the sample index of each pair.
+        mac_indices (torch.Tensor): the MAC index of each pair.
+        num_cms (int): the number of CMs of each MAC.
+        num_neurons (int): the number of neurons of each CM.
+
+    Returns:
+        (torch.Tensor): the indices of the active neurons, of size
+            (num_pairs, num_cms, 1) and dtype torch.long.
+    """
+    variates = compute_variates(
+        seed, step, layer_index, sample_indices, mac_indices,
+        tuple(sample_indices.shape), num_cms
+    )
+
+    winners = torch.mul(variates, num_neurons).long()
+
+    return torch.clamp(winners, max=num_neurons - 1, out=winners)
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+
+"""
+Workspace: helpers for keeping the temporary memory used by
+    layers and optimizers within a budget.
+"""
+
+
+import os
+from typing import Optional, Tuple, Union
+
+import torch
+
+
+# fraction of the currently available memory used as the
+# budget when the workspace size is set to 'auto'.
+AUTO_WORKSPACE_FRACTION = 0.25
+
+
+def check_workspace_budget(max_workspace_bytes: Union[int, str, None]) -> None:
+    """
+    Checks that a workspace budget is valid.
+
+    Args:
+        max_workspace_bytes (Union[int, str, None]): the maximum
+            number of bytes of temporary memory to use; None for no
+            limit, or 'auto' to size the budget to the available memory.
+
+    Raises:
+        ValueError: if the budget is not None, 'auto' or a positive int.
+    """
+    if max_workspace_bytes is None or max_workspace_bytes == 'auto':
+        return
+
+    if (
+        isinstance(max_workspace_bytes, bool) or
+        not isinstance(max_workspace_bytes, int) or
+        max_workspace_bytes <= 0
+    ):
+        raise ValueError(
+            'Invalid workspace size! Expected a positive number of bytes, '
+            f"'auto' or None but received {max_workspace_bytes}."
+        )
+
+
+def get_num_bytes(tensor: torch.Tensor) -> int:
+    """
+    Returns the number of bytes taken up by the elements of a tensor.
+
+    Args:
+        tensor (torch.Tensor): the tensor.
+
+    Returns:
+        (int): the size of the tensor in bytes.
+    """
+    return tensor.numel() * tensor.element_size()
+
+
+def get_available_memory(device: torch.device) -> Optional[int]:
+    """
+    Returns the number of bytes of memory currently available
+    on a device.
+
+    Args:
+        device (torch.device): the device to check.
+
+    Returns:
+        (Optional[int]): the available memory in bytes, or None if it
+            cannot be determined on this platform.
+    """
+    device = torch.device(device)
+
+    if device.type == 'cuda':
+        return torch.cuda.mem_get_info(device)[0]
+
+    try:
+        with open('/proc/meminfo', 'r', encoding='utf-8') as meminfo:
+            for line in meminfo:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def resolve_workspace_budget(max_workspace_bytes: Union[int, str, None],
+                             device: torch.device) -> Optional[int]:
+    """
+    Converts a workspace budget setting into a number of bytes.
+
+    Args:
+        max_workspace_bytes (Union[int, str, None]): the budget setting.
+        device (torch.device): the device the workspace is allocated on.
+
+    Returns:
+        (Optional[int]): the budget in bytes, or None for no limit.
+    """
+    if max_workspace_bytes != 'auto':
+        return max_workspace_bytes
+
+    available_memory = get_available_memory(device)
+
+    if available_memory is None:
+        return None
+
+    return max(1, int(available_memory * AUTO_WORKSPACE_FRACTION))
+
+
+class WorkspaceArena:
+    """
+    WorkspaceArena: a set of named buffers kept between calls, so that
+        steps with the same batch size reuse the same memory instead
+        of allocating new tensors.
+
+    Attributes:
+        device (torch.device): the device the buffers are allocated on.
+        buffers (dict): the buffers, keyed by name, shape and dtype; the
+            shape includes the batch size, so every batch size seen
+            keeps its own buffers.
+        num_allocations (int): the number of buffers allocated so far.
+    """
+    def __init__(self, device: torch.device) -> None:
+        """
+        Initializes the WorkspaceArena.
+
+        Args:
+            device (torch.device): the device to allocate buffers on.
+        """
+        self.device = device
+        self.buffers = dict()
+        self.num_allocations = 0
+
+
+    def get(self, name: str, shape: Tuple[int, ...],
+            dtype: torch.dtype = torch.float32) -> torch.Tensor:
+        """
+        Returns the buffer with a name, shape and dtype, allocating
+        it the first time it is requested. The contents of the buffer
+        are left over from its previous use.
+
+        Args:
+            name (str): the name of the buffer.
+            shape (Tuple[int, ...]): the shape of the buffer.
+            dtype (torch.dtype): the dtype of the buffer.
+
+        Returns:
+            (torch.Tensor): the buffer.
+        """
+        key = (name, tuple(shape), dtype)
+        buffer = self.buffers.get(key)
+
+        if buffer is None:
+            buffer = torch.empty(shape, dtype=dtype, device=self.device)
+            self.buffers[key] = buffer
+            self.num_allocations += 1
+
+        return buffer
+
+
+    def get_num_bytes(self) -> int:
+        """
+        Returns the memory held by the buffers.
+
+        Returns:
+            (int): the size of all the buffers in bytes.
+        """
+        return sum(get_num_bytes(buffer) for buffer in self.buffers.values())
+
+
+    def clear(self) -> None:
+        """
+        Releases all the buffers.
+        """
+        self.buffers = dict()
+
+
+def get_workspace_buffer(workspace: Optional[WorkspaceArena], name: str,
+                         shape: Tuple[int, ...], dtype: torch.dtype,
+                         device: torch.device) -> torch.Tensor:
+    """
+    Returns a buffer from a workspace arena, or a newly allocated
+    tensor if there is no arena.
+
+    Args:
+        workspace (Optional[WorkspaceArena]): the arena, or None.
+        name (str): the name of the buffer.
+        shape (Tuple[int, ...]): the shape of the buffer.
+        dtype (torch.dtype): the dtype of the buffer.
+        device (torch.device): the device to allocate on without an arena.
+
+    Returns:
+        (torch.Tensor): the buffer, with undefined contents.
+    """
+    if workspace is None:
+        return torch.empty(shape, dtype=dtype, device=device)
+
+    return workspace.get(name, shape, dtype)
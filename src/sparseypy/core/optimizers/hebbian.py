@@ -5,11 +5,28 @@ Hebbian: file holding the Hebbian optimizer class.
 """
 
 
+import os
 import sys
+import tempfile
+from typing import List, Optional, Union
+
 import torch
 
-from sparseypy.core.hooks import LayerIOHook
-from sparseypy.core.model_layers.sparsey_layer import MAC
+from sparseypy.core.hooks import create_layer_io
+from sparseypy.core.model_layers.sparsey_layer import (
+    MAC, ReceptiveFieldBucket
+)
+from sparseypy.core.model_layers.mac_groups import (
+    check_num_threads, run_mac_groups
+)
+from sparseypy.core.model_layers.weight_precision import (
+    dequantize_weights, quantize_weights
+)
+from sparseypy.core.model_layers.weight_streaming import WeightWindow
+from sparseypy.core.model_layers.workspace import (
+    WorkspaceArena, check_workspace_budget, get_num_bytes,
+    get_workspace_buffer, resolve_workspace_budget
+)
 
 
 class HebbianOptimizer(torch.optim.Optimizer):
@@ -25,12 +42,30 @@ class HebbianOptimizer(torch.optim.Optimizer):
                 thresholds for each layer.
             timesteps (dict): the number of timesteps that each
                 weight has not been updated for.
+            timestep_windows (dict): the windows the timesteps of
+                layers with memory-mapped weights are streamed
+                through, keyed by layer index.
             verbosity (int): the verbosity level.
-            hook (LayerIOHook): the hook to use for
-                retrieving layer inputs and outputs.
+            hook (Union[LayerIOHook, ForwardResultIO]): the source of the
+                layer inputs and outputs.
+            max_workspace_bytes (Union[int, str, None]): the
+                workspace budget used when updating a layer.
+            peak_workspace_bytes (int): the peak workspace used
+                by the last step.
+            num_steps (int): the number of steps taken so far.
+            workspace (Optional[WorkspaceArena]): the buffers reused
+                by every step, or None to allocate new tensors.
+            num_threads (int): the number of threads the updates of
+                a layer are split across, by groups of MACs.
+            group_workspaces (Optional[List[WorkspaceArena]]): the
+                workspace of each thread, the first being workspace,
+                or None to allocate new tensors.
     """
     def __init__(self, model: torch.nn.Module, device: torch.device, 
-                 epsilon: float = 1e-7):
+                 epsilon: float = 1e-7,
+                 max_workspace_bytes: Union[int, str, None] = None,
+                 reuse_workspace: bool = False,
+                 num_threads: int = 1):
         """
         Initialize the HebbianOptimizer.
         Args:
@@ -38,16 +73,41 @@ class HebbianOptimizer(torch.optim.Optimizer):
             device (torch.device): the device to run the model on.
             epsilon (float): the epsilon value to use for
                 numerical stability.
+            max_workspace_bytes (Union[int, str, None]): the maximum
+                number of bytes of temporary memory to use when
+                updating a layer; None for no limit, or 'auto' to size
+                the budget to the available memory.
+            reuse_workspace (bool): whether to keep the temporary
+                buffers used to update layers with dense weight storage
+                between steps, instead of allocating new tensors.
+            num_threads (int): the number of threads to split the
+                updates of layers with dense weight storage across,
+                each updating a group of MACs with its own workspace.
         """
         super().__init__(model.parameters(), dict())
 
+        check_workspace_budget(max_workspace_bytes)
+        check_num_threads(num_threads)
+
         self.model = model
         self.saturation_thresholds = []
         self.timesteps = dict()
+        self.timestep_windows = dict()
         self.epsilon = epsilon
         self.device = device
         self.verbosity = 0
-        self.hook = LayerIOHook(self.model)
+        self.hook = create_layer_io(self.model)
+        self.max_workspace_bytes = max_workspace_bytes
+        self.peak_workspace_bytes = 0
+        self.num_steps = 0
+        self.workspace = WorkspaceArena(device) if reuse_workspace else None
+        self.num_threads = num_threads
+        self.group_workspaces = None
+
+        if reuse_workspace:
+            self.group_workspaces = [self.workspace] + [
+                WorkspaceArena(device) for _ in range(num_threads - 1)
+            ]
 
         for layer in model.children():
             if hasattr(layer, 'saturation_threshold'):
@@ -56,22 +116,186 @@ class HebbianOptimizer(torch.optim.Optimizer):
                 self.saturation_thresholds.append(1.0)
 
 
-    def calculate_freezing_mask(self, weights, layer_index):
+    def calculate_freezing_mask(self, weights, layer_index, num_rows=None,
+                                workspace=None):
         """
         Calculates the freezing mask for the weights of a SparseyLayer.
+
+        The weights are summed in double precision, which is exact for
+        the weight values a layer holds in practice, so the fraction
+        does not depend on the reduction order or on how many rows of
+        zeros are stored alongside the weights.
+
+        Args:
+            weights (torch.Tensor): the weights, of size
+                (num_macs, num_weight_rows, num_output_neurons).
+            layer_index (int): the index of the layer in the model.
+            num_rows (int): the number of rows to average over;
+                defaults to the number of rows in weights.
+            workspace (Optional[WorkspaceArena]): the arena to take
+                the temporary buffers from, if any.
         """
-        active_weights_frac = torch.mean(weights, dim=1, keepdim=True)
+        if num_rows is None:
+            num_rows = weights.shape[1]
+
+        mask_shape = (weights.shape[0], 1, weights.shape[2])
+
+        active_weights_frac = torch.sum(
+            weights, dim=1, keepdim=True, dtype=torch.float64,
+            out=get_workspace_buffer(
+                workspace, 'active_weights_frac', mask_shape,
+                torch.float64, self.device
+            )
+        )
+
+        torch.div(active_weights_frac, num_rows, out=active_weights_frac)
+
         weight_update_mask = torch.gt(
-            active_weights_frac, self.saturation_thresholds[layer_index]
+            active_weights_frac, self.saturation_thresholds[layer_index],
+            out=get_workspace_buffer(
+                workspace, 'weight_update_mask', mask_shape,
+                torch.bool, self.device
+            )
         ).expand_as(weights)
 
         return weight_update_mask
 
 
-    def apply_permanence_update(self, permanence_steps: int,
-                                permanence_convexity: float,
-                                params: torch.Tensor,
-                                timestep_values: torch.Tensor) -> None:
+    def calculate_layer_freezing_mask(
+        self, layer: torch.nn.Module, weights: torch.Tensor,
+        layer_index: int,
+        workspace: Optional[WorkspaceArena] = None) -> torch.Tensor:
+        """
+        Calculates the freezing mask for the weights of a chunk of
+        MACs in a SparseyLayer, taking the receptive field layout of
+        the layer into account.
+
+        Args:
+            layer (torch.nn.Module): the layer the weights belong to.
+            weights (torch.Tensor): the weights of the chunk, of size
+                (num_chunk_macs, num_weight_rows, num_output_neurons).
+            layer_index (int): the index of the layer in the model.
+            workspace (Optional[WorkspaceArena]): the arena to take
+                the temporary buffers from, if any.
+
+        Returns:
+            (torch.Tensor): boolean mask of the frozen weights.
+        """
+        num_padded_rows = (
+            layer.receptive_field_num_macs *
+            layer.prev_layer_num_cms_per_mac *
+            layer.prev_layer_num_neurons_per_cm
+        )
+
+        return self.calculate_freezing_mask(
+            weights, layer_index, num_padded_rows, workspace
+        )
+
+
+    def calculate_sparse_freezing_mask(self, layer: torch.nn.Module,
+                                       weights: torch.Tensor,
+                                       layer_index: int) -> torch.Tensor:
+        """
+        Calculates which output neurons of each MAC in a layer using
+        sparse weight storage have their weights frozen.
+
+        Args:
+            layer (torch.nn.Module): the layer the weights belong to.
+            weights (torch.Tensor): the stored weight rows of the layer.
+            layer_index (int): the index of the layer in the model.
+
+        Returns:
+            (torch.Tensor): boolean mask of size
+                (num_macs, num_output_neurons).
+        """
+        mac_weight_sums = torch.zeros(
+            (layer.num_macs, weights.shape[-1]),
+            dtype=torch.float64, device=self.device
+        )
+
+        mac_weight_sums.index_add_(
+            0, layer.get_weight_row_macs(), weights.double()
+        )
+
+        return torch.gt(
+            torch.div(
+                mac_weight_sums,
+                layer.receptive_field_num_macs *
+                layer.prev_layer_num_cms_per_mac *
+                layer.prev_layer_num_neurons_per_cm
+            ), self.saturation_thresholds[layer_index]
+        )
+
+
+    def compute_weight_updates(
+        self, layer: torch.nn.Module, chunk: ReceptiveFieldBucket,
+        layer_input: torch.Tensor, layer_output: torch.Tensor,
+        workspace: Optional[WorkspaceArena] = None,
+        set_inputs: Optional[torch.Tensor] = None) -> torch.Tensor:
+        """
+        Computes the (unnormalized) Hebbian weight updates for a chunk
+        of MACs in a layer as the sum over the batch of the outer
+        products between the inputs and outputs of each MAC.
+
+        Args:
+            layer (torch.nn.Module): the layer to compute updates for.
+            chunk (ReceptiveFieldBucket): the chunk of MACs to compute
+                updates for.
+            layer_input (torch.Tensor): the input to the layer, padded
+                with an empty MAC for the padded receptive field layout.
+            layer_output (torch.Tensor): the output of the layer.
+            workspace (Optional[WorkspaceArena]): the arena to take
+                the temporary buffers and the result from, if any.
+            set_inputs (Optional[torch.Tensor]): the inputs of every
+                shared receptive field of the layer, read by the MACs
+                of chunks with shared receptive fields instead of
+                gathering their own.
+
+        Returns:
+            (torch.Tensor): the weight updates, with the same layout
+                as the weights of the chunk.
+        """
+        batch_size = layer_input.shape[0]
+        num_chunk_macs = chunk.mac_indices.shape[0]
+
+        if chunk.input_sets_start is not None:
+            mac_inputs = layer.get_chunk_set_inputs(chunk, set_inputs)
+        else:
+            mac_inputs = torch.index_select(
+                layer_input, 1, chunk.input_connections.reshape(-1),
+                out=get_workspace_buffer(
+                    workspace, 'mac_inputs',
+                    (
+                        batch_size, chunk.input_connections.numel(),
+                        layer_input.shape[2]
+                    ), torch.float32, self.device
+                )
+            ).view(batch_size, num_chunk_macs, -1)
+
+        mac_outputs = torch.index_select(
+            layer_output, 1, chunk.mac_indices,
+            out=get_workspace_buffer(
+                workspace, 'mac_outputs',
+                (batch_size, num_chunk_macs, layer_output.shape[2]),
+                torch.float32, self.device
+            )
+        )
+
+        return torch.matmul(
+            torch.permute(mac_inputs, (1, 2, 0)),
+            torch.permute(mac_outputs, (1, 0, 2)),
+            out=get_workspace_buffer(
+                workspace, 'weight_updates',
+                (num_chunk_macs, mac_inputs.shape[2], mac_outputs.shape[2]),
+                torch.float32, self.device
+            )
+        )
+
+
+    def apply_permanence_update(
+        self, permanence_steps: int, permanence_convexity: float,
+        params: torch.Tensor, timestep_values: torch.Tensor,
+        workspace: Optional[WorkspaceArena] = None) -> None:
         """
         Applies the permanence weight updates.
 
@@ -84,27 +308,379 @@ class HebbianOptimizer(torch.optim.Optimizer):
             params (torch.Tensor): the weight tensor to update.
             timestep_values (torch.Tensor): the timesteps that
                 each weight in params has not been updated for.
+            workspace (Optional[WorkspaceArena]): the arena to take
+                the temporary buffers from, if any.
         """
+        torch.sub(permanence_steps, timestep_values, out=params)
+        torch.div(permanence_convexity, params, out=params)
+        torch.add(params, 1.0, out=params)
         torch.div(
-            1.0 + (permanence_convexity / permanence_steps),
-            torch.add(
-                torch.div(
-                    permanence_convexity,
-                    torch.sub(
-                        permanence_steps,
-                        timestep_values
-                    )
-                ), 1.0
-            ),
+            1.0 + (permanence_convexity / permanence_steps), params,
             out=params
         )
 
-        torch.where(
+        params.masked_fill_(
             torch.ge(
-                timestep_values,
-                permanence_steps
-            ), torch.zeros(1, device=self.device),
-            params, out=params
+                timestep_values, permanence_steps,
+                out=get_workspace_buffer(
+                    workspace, 'weights_are_expired', params.shape,
+                    torch.bool, self.device
+                )
+            ), 0.0
+        )
+
+
+    def create_timestep_window(self, layer: torch.nn.Module,
+                               params: torch.Tensor) -> WeightWindow:
+        """
+        Creates the timesteps of a layer whose weights are streamed
+        from a file, in an unnamed file next to the weight file. The
+        window holds as many weights as the window of the layer.
+
+        Args:
+            layer (torch.nn.Module): the layer.
+            params (torch.Tensor): the weights of the layer.
+
+        Returns:
+            (WeightWindow): the window over the timesteps, filled
+                with zeros.
+        """
+        max_resident_bytes = layer.weight_window.max_resident_bytes
+
+        if max_resident_bytes is not None:
+            max_resident_bytes = max(
+                1, max_resident_bytes * 4 // params.element_size()
+            )
+
+        # the file is removed once closed, and the mapping keeps its
+        # contents alive.
+        with tempfile.TemporaryFile(
+            dir=os.path.dirname(os.path.abspath(layer.weight_file))
+        ) as timestep_file:
+            return WeightWindow(
+                timestep_file, params.shape, torch.float32,
+                max_resident_bytes
+            )
+
+
+    def update_layer_weights(self, layer: torch.nn.Module,
+                             layer_index: int, params: torch.Tensor,
+                             layer_input: torch.Tensor,
+                             layer_output: torch.Tensor) -> int:
+        """
+        Applies the weight updates to a layer, one chunk of MACs
+        at a time so that the workspace fits in the budget. The chunks
+        are split into groups updated by different threads when the
+        optimizer runs on more than one thread. The weights and
+        timesteps of layers with a weight file are streamed through
+        their windows on a single thread, and the modified chunks are
+        written back to the files at the end of the update.
+
+        Args:
+            layer (torch.nn.Module): the layer to update.
+            layer_index (int): the index of the layer in the model.
+            params (torch.Tensor): the weights of the layer.
+            layer_input (torch.Tensor): the input to the layer.
+            layer_output (torch.Tensor): the output of the layer.
+
+        Returns:
+            (int): the peak workspace used, in bytes.
+        """
+        workspace_budget = resolve_workspace_budget(
+            self.max_workspace_bytes, self.device
+        )
+
+        weight_window = getattr(layer, 'weight_window', None)
+        num_threads = self.num_threads if weight_window is None else 1
+        input_workspace_bytes = 0
+
+        if layer.receptive_field_layout == 'padded':
+            padded_input = get_workspace_buffer(
+                self.workspace, 'padded_input',
+                (
+                    layer_input.shape[0], layer_input.shape[1] + 1,
+                    *layer_input.shape[2:]
+                ), torch.float32, self.device
+            )
+
+            padded_input[:, :-1].copy_(layer_input)
+            padded_input[:, -1].zero_()
+            layer_input = padded_input
+
+            input_workspace_bytes = get_num_bytes(layer_input)
+
+            if workspace_budget is not None:
+                workspace_budget = max(
+                    0, workspace_budget - input_workspace_bytes
+                )
+
+        set_inputs = None
+
+        if layer.input_set_indices is not None:
+            # every shared receptive field is gathered once, and read
+            # by all the MACs connected to it.
+            set_inputs = layer.gather_input_sets(layer_input, self.workspace)
+            input_workspace_bytes = get_num_bytes(set_inputs)
+
+            if workspace_budget is not None:
+                workspace_budget = max(
+                    0, workspace_budget - input_workspace_bytes
+                )
+
+        if workspace_budget is not None:
+            # every thread updates a chunk at the same time.
+            workspace_budget //= num_threads
+
+        # the weight updates and the temporaries of the permanence
+        # update take up to this many bytes per weight.
+        bytes_per_weight = 16
+
+        if params.dtype != torch.float32:
+            # plus the float32 copy of the weights and its conversion
+            # back to the storage dtype.
+            bytes_per_weight += 4 + params.element_size()
+
+        def update_group_weights(
+            group_index: int, group: List[ReceptiveFieldBucket]) -> int:
+            workspace = None
+
+            if self.group_workspaces is not None:
+                workspace = self.group_workspaces[group_index]
+
+            peak_workspace_bytes = 0
+
+            for chunk in group:
+                if weight_window is None:
+                    chunk_params = layer.get_bucket_weights(chunk, params)
+                    chunk_timesteps = layer.get_bucket_weights(
+                        chunk, self.timesteps[layer_index]
+                    )
+                else:
+                    chunk_params = layer.get_window_weights(
+                        chunk, weight_window, True
+                    )
+                    chunk_timesteps = layer.get_window_weights(
+                        chunk, self.timestep_windows[layer_index], True
+                    )
+
+                chunk_weights = dequantize_weights(chunk_params)
+
+                weight_updates = self.compute_weight_updates(
+                    layer, chunk, layer_input, layer_output, workspace,
+                    set_inputs
+                )
+
+                weight_freeze_mask = self.calculate_layer_freezing_mask(
+                    layer, chunk_weights, layer_index, workspace
+                )
+
+                torch.div(
+                    weight_updates,
+                    layer_input.shape[0],
+                    out=weight_updates
+                )
+
+                weight_updates.masked_fill_(weight_freeze_mask, 0.0)
+
+                torch.add(chunk_timesteps, 1, out=chunk_timesteps)
+
+                self.apply_permanence_update(
+                    layer.permanence_steps,
+                    layer.permanence_convexity,
+                    chunk_weights, chunk_timesteps, workspace
+                )
+
+                torch.add(chunk_weights, weight_updates, out=chunk_weights)
+                torch.clamp(chunk_weights, 0.0, 1.0, out=chunk_weights)
+                chunk_timesteps.masked_fill_(
+                    torch.gt(
+                        weight_updates, 0,
+                        out=get_workspace_buffer(
+                            workspace, 'weights_were_updated',
+                            weight_updates.shape, torch.bool, self.device
+                        )
+                    ), 0
+                )
+
+                if chunk_weights is not chunk_params:
+                    chunk_params.copy_(
+                        quantize_weights(chunk_weights, chunk_params.dtype)
+                    )
+
+                mac_inputs_bytes = 0
+
+                if chunk.input_sets_start is None:
+                    mac_inputs_bytes = (
+                        chunk.input_connections.numel() *
+                        layer_input.shape[0] * layer_input.shape[2] *
+                        layer_input.element_size()
+                    )
+
+                peak_workspace_bytes = max(
+                    peak_workspace_bytes,
+                    mac_inputs_bytes + chunk_params.numel() * bytes_per_weight
+                )
+
+            return peak_workspace_bytes
+
+        peak_workspace_bytes = sum(
+            run_mac_groups(
+                update_group_weights,
+                layer.get_mac_groups(
+                    layer.get_mac_chunks(
+                        workspace_budget,
+                        layer_input.shape[0] * layer_input.element_size() +
+                        params.shape[-1] * bytes_per_weight
+                    ), num_threads
+                ), num_threads
+            )
+        )
+
+        if weight_window is not None:
+            weight_window.release()
+            self.timestep_windows[layer_index].release()
+
+        return input_workspace_bytes + peak_workspace_bytes
+
+
+    def update_sparse_layer_weights(self, layer: torch.nn.Module,
+                                    layer_index: int, params: torch.Tensor,
+                                    layer_input: torch.Tensor,
+                                    layer_output: torch.Tensor) -> int:
+        """
+        Applies the weight updates to a layer using sparse weight
+        storage. Only the stored weight rows are decayed; rows that
+        receive an update for the first time are inserted, and rows
+        that decayed to zero are removed every
+        layer.weight_compaction_interval steps.
+
+        Args:
+            layer (torch.nn.Module): the layer to update.
+            layer_index (int): the index of the layer in the model.
+            params (torch.Tensor): the stored weights of the layer.
+            layer_input (torch.Tensor): the input to the layer.
+            layer_output (torch.Tensor): the output of the layer.
+
+        Returns:
+            (int): the peak workspace used, in bytes.
+        """
+        workspace_budget = resolve_workspace_budget(
+            self.max_workspace_bytes, self.device
+        )
+
+        batch_size = layer_input.shape[0]
+
+        weight_freeze_mask = self.calculate_sparse_freezing_mask(
+            layer, dequantize_weights(params), layer_index
+        )
+
+        layer_input = torch.cat(
+            (
+                layer_input,
+                torch.zeros(
+                    (batch_size, 1, *layer_input.shape[2:]),
+                    dtype=torch.float32, device=self.device
+                )
+            ), dim=1
+        )
+
+        # only the (sample, MAC) pairs with an active output and
+        # their nonzero inputs contribute to the updates.
+        sample_indices, mac_indices = torch.nonzero(
+            torch.any(torch.ne(layer_output, 0.0), dim=2), as_tuple=True
+        )
+
+        mac_inputs = layer_input[
+            sample_indices.unsqueeze(1),
+            layer.input_connections[mac_indices]
+        ].view(sample_indices.shape[0], -1)
+
+        pair_indices, input_rows = torch.nonzero(mac_inputs, as_tuple=True)
+
+        update_rows, update_row_indices = torch.unique(
+            torch.add(
+                layer.mac_weight_offsets[mac_indices[pair_indices]],
+                input_rows
+            ), return_inverse=True
+        )
+
+        weight_updates = torch.zeros(
+            (update_rows.shape[0], params.shape[-1]),
+            dtype=torch.float32, device=self.device
+        )
+
+        update_row_macs = torch.empty_like(update_rows)
+        update_row_macs[update_row_indices] = mac_indices[pair_indices]
+
+        bytes_per_entry = params.shape[-1] * params.element_size()
+        num_entries = pair_indices.shape[0]
+        chunk_size = num_entries
+
+        if workspace_budget is not None:
+            chunk_size = max(1, workspace_budget // bytes_per_entry)
+
+        for chunk_start in range(0, num_entries, chunk_size):
+            chunk_pairs = pair_indices[chunk_start:chunk_start + chunk_size]
+
+            weight_updates.index_add_(
+                0, update_row_indices[chunk_start:chunk_start + chunk_size],
+                torch.mul(
+                    mac_inputs[
+                        chunk_pairs,
+                        input_rows[chunk_start:chunk_start + chunk_size]
+                    ].unsqueeze(1),
+                    layer_output[
+                        sample_indices[chunk_pairs], mac_indices[chunk_pairs]
+                    ]
+                )
+            )
+
+        torch.div(weight_updates, batch_size, out=weight_updates)
+        weight_updates[weight_freeze_mask[update_row_macs]] = 0.0
+
+        timesteps = self.timesteps[layer_index]
+        num_stored_rows = params.shape[0]
+        stored_row_positions = layer.insert_weight_rows(update_rows)
+
+        if params.shape[0] != num_stored_rows:
+            # new rows have not been updated for at least
+            # permanence_steps steps, just like all-zero dense weights.
+            timesteps = torch.full(
+                params.shape, layer.permanence_steps,
+                dtype=torch.float32, device=self.device
+            ).index_copy_(0, stored_row_positions, timesteps)
+
+        update_positions = layer.find_weight_rows(update_rows)[0]
+        weights = dequantize_weights(params)
+
+        torch.add(timesteps, 1, out=timesteps)
+
+        self.apply_permanence_update(
+            layer.permanence_steps,
+            layer.permanence_convexity,
+            weights, timesteps
+        )
+
+        weights.index_add_(0, update_positions, weight_updates)
+        torch.clamp(weights, 0.0, 1.0, out=weights)
+
+        if weights is not params:
+            params.copy_(quantize_weights(weights, params.dtype))
+
+        timesteps[update_positions] = torch.where(
+            torch.gt(weight_updates, 0), 0.0, timesteps[update_positions]
+        )
+
+        if not self.num_steps % layer.weight_compaction_interval:
+            timesteps = timesteps[layer.compact_weights()]
+
+        self.timesteps[layer_index] = timesteps
+
+        return (
+            get_num_bytes(layer_input) + get_num_bytes(mac_inputs) +
+            get_num_bytes(weight_updates) +
+            min(chunk_size, num_entries) * bytes_per_entry +
+            (0 if weights is params else get_num_bytes(weights))
         )
 
 
@@ -122,19 +698,45 @@ class HebbianOptimizer(torch.optim.Optimizer):
         layers, inputs, outputs = self.hook.get_layer_io()
 
         with torch.no_grad():
+            self.peak_workspace_bytes = 0
+            self.num_steps += 1
+
             # Iterate over each layer
             for layer_index, (layer, layer_input, layer_output) in enumerate(
                 zip(layers, inputs, outputs)
             ):
+                # layers split between processes only update the
+                # weights of the MACs of this process.
+                if hasattr(layer, 'select_shard_output'):
+                    layer_output = layer.select_shard_output(layer_output)
+                    layer = layer.shard
+
                 if layer_index not in self.timesteps:
                     self.timesteps[layer_index] = []
 
+                is_sparse = getattr(layer, 'weight_storage', None) == 'sparse'
+                is_streamed = getattr(layer, 'weight_window', None) is not None
+
                 for param_index, params in enumerate(layer.parameters()):
-                    if len(self.timesteps[layer_index]) == param_index:
-                        self.timesteps[layer_index] = torch.ones(
-                            params.shape, dtype=torch.float32,
-                            device=self.device
-                        )
+                    # sparse weights can be replaced from outside the
+                    # optimizer, e.g. by loading a state dict.
+                    if len(self.timesteps[layer_index]) == param_index or (
+                        is_sparse and
+                        self.timesteps[layer_index].shape != params.shape
+                    ):
+                        if is_streamed:
+                            self.timestep_windows[layer_index] = (
+                                self.create_timestep_window(layer, params)
+                            )
+                            self.timesteps[layer_index] = (
+                                self.timestep_windows[layer_index].weights
+                            )
+                            self.timesteps[layer_index].fill_(1.0)
+                        else:
+                            self.timesteps[layer_index] = torch.ones(
+                                params.shape, dtype=torch.float32,
+                                device=self.device
+                            )
 
                         torch.mul(
                             self.timesteps[layer_index],
@@ -142,56 +744,17 @@ class HebbianOptimizer(torch.optim.Optimizer):
                             out=self.timesteps[layer_index]
                         )
 
-                    layer_input = torch.cat(
-                        (
-                            layer_input,
-                            torch.zeros(
-                                (
-                                    layer_input.shape[0],
-                                    1, *layer_input.shape[2:]
-                                ),
-                                dtype=torch.float32, device=self.device
-                            )
-                        ), dim=1
-                    )
-
-                    mac_inputs = layer_input[:, layer.input_connections]
-
-                    weight_updates = torch.matmul(
-                        torch.permute(
-                            mac_inputs.view(*mac_inputs.shape[:2], -1),
-                            (1, 2, 0)
-                        ),
-                        torch.permute(layer_output, (1, 0, 2))
-                    )
-
-                    weight_freeze_mask = self.calculate_freezing_mask(
-                        params, layer_index
-                    )
-
-                    torch.div(
-                        weight_updates,
-                        layer_input.shape[0],
-                        out=weight_updates
-                    )
+                    if is_sparse:
+                        update_weights = self.update_sparse_layer_weights
+                    else:
+                        update_weights = self.update_layer_weights
 
-                    weight_updates[weight_freeze_mask] = 0.0
-
-                    torch.add(
-                        self.timesteps[layer_index], 1,
-                        out=self.timesteps[layer_index]
-                    )
-
-                    self.apply_permanence_update(
-                        layer.permanence_steps,
-                        layer.permanence_convexity,
-                        params, self.timesteps[layer_index]
+                    self.peak_workspace_bytes = max(
+                        self.peak_workspace_bytes,
+                        update_weights(
+                            layer, layer_index, params,
+                            layer_input, layer_output
+                        )
                     )
 
-                    torch.add(params, weight_updates, out=params)
-                    torch.clamp(params, 0.0, 1.0, out=params)
-                    self.timesteps[layer_index][
-                        torch.gt(weight_updates, 0)
-                    ] = 0
-
         return
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+"""
+Estimate model: script to estimate the resources needed to train
+    a model before building it.
+"""
+
+import argparse
+from argparse import RawDescriptionHelpFormatter
+import sys
+
+from sparseypy.access_objects.models.model_estimator import ModelEstimator
+from sparseypy.cli.config_validation.validate_config import (
+    validate_config, get_config_info
+)
+
+DESCRIPTION = '''
+=====================================
+sparseypy: The Sparsey Testing System
+=====================================
+\n
+estimate_model: estimate the memory and compute needed to train a model
+\n
+--------------------------------------------------------------------------------
+\n
+Builds the model described by a network configuration file without
+allocating its weights, and reports for every layer the memory taken by its
+weights and by the optimizer timesteps, the memory used by a forward pass for
+the given batch size, and the floating point operations of a training step.
+\n
+With --max_bytes, exits with an error if the estimated memory of a training
+step exceeds the budget, so that oversized configurations can be rejected
+before anything is allocated.
+\n
+--------------------------------------------------------------------------------
+'''
+
+EPILOG = '''
+--------------------------------------------------------------------------------
+Sparsey (c) Dr. Rod Rinkus and Neurithmic Systems. All rights reserved.
+--------------------------------------------------------------------------------
+'''
+
+def parse_args() -> argparse.Namespace:
+    """
+    Parses the command line arguments passed in during execution.
+
+    Returns:
+        Namespace containing the parsed arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description=DESCRIPTION,
+        epilog=EPILOG,
+        formatter_class=RawDescriptionHelpFormatter
+    )
+
+    parser.add_argument(
+        '--model_config', type=str, required=True,
+        help='The location of the model config file.'
+    )
+
+    parser.add_argument(
+        '--batch_size', type=int, default=1,
+        help='The number of samples in each training batch.'
+    )
+
+    parser.add_argument(
+        '--max_bytes', type=int, required=False,
+        help='The memory budget of a training step, in bytes.'
+    )
+
+    args = parser.parse_args()
+
+    return args
+
+
+def format_bytes(num_bytes: int) -> str:
+    """
+    Formats a number of bytes with a binary unit.
+
+    Args:
+        num_bytes (int): the number of bytes.
+
+    Returns:
+        (str): the formatted size.
+    """
+    size = float(num_bytes)
+
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if size < 1024:
+            return f'{size:.1f} {unit}'
+
+        size /= 1024
+
+    return f'{size:.1f} TiB'
+
+
+def main():
+    """
+    Main function for the estimate_model script. Accepts and parses the command line
+    arguments, validates the model config file and prints the estimate of every layer.
+    """
+    args = parse_args()
+
+    model_config = validate_config(
+        get_config_info(args.model_config), 'model', 'sparsey'
+    )
+
+    estimates = ModelEstimator.estimate_model(model_config, args.batch_size)
+
+    print(
+        f"{'layer':>5} {'weights':>12} {'timesteps':>12} {'forward':>12} "
+        f"{'forward FLOPs':>14} {'update FLOPs':>14}"
+    )
+
+    for estimate in estimates:
+        print(
+            f'{estimate.layer_index:>5} '
+            f'{format_bytes(estimate.weight_bytes):>12} '
+            f'{format_bytes(estimate.timestep_bytes):>12} '
+            f'{format_bytes(estimate.forward_workspace_bytes):>12} '
+            f'{estimate.forward_flops:>14.3e} {estimate.update_flops:>14.3e}'
+        )
+
+    total_bytes = ModelEstimator.get_total_bytes(estimates)
+
+    print(
+        f'total: {format_bytes(total_bytes)} per training step with a '
+        f'batch size of {args.batch_size}'
+    )
+
+    if args.max_bytes is not None and total_bytes > args.max_bytes:
+        print(
+            f'The model does not fit in the budget of '
+            f'{format_bytes(args.max_bytes)}.'
+        )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+import pytest
+import torch
+
+from sparseypy.access_objects.models.layer_autotuner import (
+    LAYER_BACKENDS, LayerAutotuner
+)
+from sparseypy.access_objects.models.model_builder import ModelBuilder
+
+
+def create_model_config(cache_path: str) -> dict:
+    """
+    Returns the config of a one-layer model with an automatically
+    chosen backend.
+    """
+    return {
+        'layers': [{
+            'name': 'sparsey',
+            'params': {
+                'autosize_grid': False, 'grid_layout': 'rect',
+                'num_macs': 16, 'num_cms_per_mac': 3,
+                'num_neurons_per_cm': 4,
+                'mac_grid_num_rows': 4, 'mac_grid_num_cols': 4,
+                'mac_receptive_field_size': 0.5,
+                'prev_layer_num_cms_per_mac': 1,
+                'prev_layer_num_neurons_per_cm': 1,
+                'prev_layer_mac_grid_num_rows': 5,
+                'prev_layer_mac_grid_num_cols': 5,
+                'prev_layer_num_macs': 25,
+                'prev_layer_grid_layout': 'rect',
+                'sigmoid_phi': 5.0, 'sigmoid_lambda': 28.0,
+                'saturation_threshold': 0.5, 'permanence_steps': 10,
+                'permanence_convexity': 0.3, 'activation_threshold_min': 0.2,
+                'activation_threshold_max': 1.0, 'min_familiarity': 0.2,
+                'sigmoid_chi': 2.5, 'receptive_field_layout': 'auto'
+            }
+        }],
+        'autotune_cache': cache_path,
+        'autotune_batch_size': 4
+    }
+
+
+class TestLayerAutotuner:
+    """
+    Class to test the backend choices of the LayerAutotuner class.
+    """
+    def test_auto_backend_is_timed_and_cached(self, tmp_path):
+        """
+        Tests that layers with the 'auto' layout are built with the
+        fastest timed backend, that the decision is written to the
+        cache, and that the model config keeps 'auto'.
+        """
+        cache_path = str(tmp_path / 'backends.json')
+        model_config = create_model_config(cache_path)
+
+        model = ModelBuilder.build_model(model_config, torch.device('cpu'))
+        layer = model.layers[0]
+
+        with open(cache_path, 'r', encoding='utf-8') as cache:
+            decisions = json.load(cache)
+
+        assert len(decisions) == 1
+
+        decision = next(iter(decisions.values()))
+
+        assert set(decision['times']) == set(LAYER_BACKENDS)
+        assert decision['backend'] == min(
+            decision['times'], key=decision['times'].get
+        )
+        assert LAYER_BACKENDS[decision['backend']] == {
+            'receptive_field_layout': layer.receptive_field_layout,
+            'mac_ordering': layer.mac_ordering
+        }
+        assert (
+            model_config['layers'][0]['params']['receptive_field_layout'] ==
+            'auto'
+        )
+
+
+    @pytest.mark.parametrize('backend', ['padded', 'csr_hilbert'])
+    def test_cached_decision_is_reused(self, tmp_path, monkeypatch,
+                                       backend: str):
+        """
+        Tests that a cached decision is used without timing the
+        backends again, and that models with either backend load each
+        other's state dicts.
+        """
+        cache_path = str(tmp_path / 'backends.json')
+        model = ModelBuilder.build_model(
+            create_model_config(cache_path), torch.device('cpu')
+        )
+
+        with open(cache_path, 'r', encoding='utf-8') as cache:
+            decisions = json.load(cache)
+
+        for decision in decisions.values():
+            decision['backend'] = backend
+
+        with open(cache_path, 'w', encoding='utf-8') as cache:
+            json.dump(decisions, cache)
+
+        def fail(*args, **kwargs):
+            raise AssertionError('A cached backend was timed again.')
+
+        monkeypatch.setattr(LayerAutotuner, 'time_backend', fail)
+
+        cached_model = ModelBuilder.build_model(
+            create_model_config(cache_path), torch.device('cpu')
+        )
+        layer = cached_model.layers[0]
+
+        assert LAYER_BACKENDS[backend] == {
+            'receptive_field_layout': layer.receptive_field_layout,
+            'mac_ordering': layer.mac_ordering
+        }
+
+        cached_model.load_state_dict(model.state_dict())
+
+        data = torch.lt(torch.rand((6, 25, 1)), 0.5).float()
+        model.eval()
+        cached_model.eval()
+
+        assert torch.equal(model(data), cached_model(data))
+
+
+    def test_timing_keeps_random_state(self, tmp_path):
+        """
+        Tests that building a model leaves torch's random number
+        generator in the same state whether its backend was timed or
+        read from the cache.
+        """
+        cache_path = str(tmp_path / 'backends.json')
+        rng_states = []
+
+        for _ in range(2):
+            torch.manual_seed(0)
+            ModelBuilder.build_model(
+                create_model_config(cache_path), torch.device('cpu')
+            )
+            rng_states.append(torch.get_rng_state())
+
+        assert torch.equal(rng_states[0], rng_states[1])
+
+
+    def test_meta_device_is_not_timed(self, tmp_path, monkeypatch):
+        """
+        Tests that models built on the meta device fall back to the
+        padded backend without timing anything.
+        """
+        def fail(*args, **kwargs):
+            raise AssertionError('A backend was timed on the meta device.')
+
+        monkeypatch.setattr(LayerAutotuner, 'time_backend', fail)
+
+        model = ModelBuilder.build_model(
+            create_model_config(str(tmp_path / 'backends.json')),
+            torch.device('meta')
+        )
+
+        assert model.layers[0].receptive_field_layout == 'padded'
+        assert not (tmp_path / 'backends.json').exists()
+
+
+    def test_weight_file_requires_explicit_layout(self, tmp_path):
+        """
+        Tests that layers with memory-mapped weights, whose file size
+        depends on the layout, cannot choose their layout by timing.
+        """
+        model_config = create_model_config(str(tmp_path / 'backends.json'))
+        model_config['layers'][0]['params']['weight_file'] = str(
+            tmp_path / 'weights.bin'
+        )
+
+        with pytest.raises(ValueError):
+            ModelBuilder.build_model(model_config, torch.device('cpu'))
+
+        assert not (tmp_path / 'weights.bin').exists()
+
+
+    def test_invalid_params_fail_every_backend(self, tmp_path):
+        """
+        Tests that layers whose parameters no backend supports raise
+        the error of the backends instead of choosing a backend.
+        """
+        model_config = create_model_config(str(tmp_path / 'backends.json'))
+        model_config['layers'][0]['params']['weight_dtype'] = 'float8'
+
+        with pytest.raises(ValueError, match='Invalid weight dtype'):
+            ModelBuilder.build_model(model_config, torch.device('cpu'))
+
+        assert not (tmp_path / 'backends.json').exists()
@@ -0,0 +1,377 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+import torch
+
+from sparseypy.access_objects.models.model_builder import ModelBuilder
+from sparseypy.core.hooks import ForwardResultIO, LayerIOHook
+from sparseypy.core.metrics.num_activations import NumActivationsMetric
+from sparseypy.core.optimizers.hebbian import HebbianOptimizer
+
+
+def create_model_config(fused_forward: bool, **layer_params) -> dict:
+    """
+    Returns the config of a three-layer model with a fixed sampling
+    seed, with any given layer parameters overriding the defaults.
+    """
+    layers = []
+
+    for num_macs, prev_layer_num_macs, prev_layer_num_cms in (
+        (16, 25, 1), (9, 16, 3), (4, 9, 3)
+    ):
+        layers.append({
+            'name': 'sparsey',
+            'params': {
+                'autosize_grid': False, 'grid_layout': 'rect',
+                'num_macs': num_macs, 'num_cms_per_mac': 3,
+                'num_neurons_per_cm': 4,
+                'mac_grid_num_rows': int(num_macs ** 0.5),
+                'mac_grid_num_cols': int(num_macs ** 0.5),
+                'mac_receptive_field_size': 0.5,
+                'prev_layer_num_cms_per_mac': prev_layer_num_cms,
+                'prev_layer_num_neurons_per_cm': (
+                    1 if prev_layer_num_cms == 1 else 4
+                ),
+                'prev_layer_mac_grid_num_rows': int(prev_layer_num_macs ** 0.5),
+                'prev_layer_mac_grid_num_cols': int(prev_layer_num_macs ** 0.5),
+                'prev_layer_num_macs': prev_layer_num_macs,
+                'prev_layer_grid_layout': 'rect',
+                'sigmoid_phi': 5.0, 'sigmoid_lambda': 28.0,
+                'saturation_threshold': 0.5, 'permanence_steps': 10,
+                'permanence_convexity': 0.3, 'activation_threshold_min': 0.2,
+                'activation_threshold_max': 1.0, 'min_familiarity': 0.2,
+                'sigmoid_chi': 2.5, **layer_params
+            }
+        })
+
+    return {
+        'layers': layers, 'sampling_seed': 5, 'fused_forward': fused_forward
+    }
+
+
+class TestFusedForward:
+    """
+    Class to test the fused forward pass of the Model class.
+    """
+    def test_fused_result_matches_hooks(self):
+        """
+        Tests that the result of a fused forward pass holds the same
+        layers, inputs, outputs and active MACs as a layer IO hook
+        records during a regular forward pass.
+        """
+        model = ModelBuilder.build_model(
+            create_model_config(False), torch.device('cpu')
+        )
+        hook = LayerIOHook(model)
+
+        data = torch.lt(torch.rand((6, 25, 1)), 0.5).float()
+
+        model.eval()
+        output = model(data)
+        layers, inputs, outputs = hook.get_layer_io()
+
+        result = model.forward_fused(data)
+
+        assert torch.equal(result.outputs[-1], output)
+        assert result.layers == layers
+
+        for index, layer in enumerate(layers):
+            assert torch.equal(result.inputs[index], inputs[index])
+            assert torch.equal(result.outputs[index], outputs[index])
+            assert torch.equal(result.is_active[index], layer.is_active)
+
+
+    def test_fused_training_matches_hooks(self):
+        """
+        Tests that the optimizer and metrics of a fused model read the
+        layer inputs and outputs without registering hooks, and train
+        the model exactly as with hooks.
+        """
+        device = torch.device('cpu')
+        models, optimizers, metrics = [], [], []
+
+        for fused_forward in (False, True):
+            model = ModelBuilder.build_model(
+                create_model_config(fused_forward), device
+            )
+
+            if models:
+                model.load_state_dict(models[0].state_dict())
+
+            models.append(model)
+            optimizers.append(HebbianOptimizer(model, device))
+            metrics.append(NumActivationsMetric(model, device))
+
+        assert isinstance(optimizers[1].hook, ForwardResultIO)
+        assert isinstance(metrics[1].hook, ForwardResultIO)
+        assert not any(layer._forward_hooks for layer in models[1].children())
+
+        for _ in range(3):
+            data = torch.lt(torch.rand((6, 25, 1)), 0.5).float()
+            values = []
+
+            for model, optimizer, metric in zip(models, optimizers, metrics):
+                model.train()
+                model(data)
+                optimizer.step()
+                values.append(metric.compute(model, data, None, True))
+
+            for value, fused_value in zip(
+                torch.unbind(values[0]), torch.unbind(values[1])
+            ):
+                assert torch.equal(value, fused_value)
+
+        for key, value in models[0].state_dict().items():
+            assert torch.equal(value, models[1].state_dict()[key])
+
+
+    def test_fused_forward_rejects_hooks(self):
+        """
+        Tests that hooks cannot be configured on a fused model, since
+        they would never be called.
+        """
+        model_config = create_model_config(True)
+        model_config['hooks'] = [{'name': 'layer_io'}]
+
+        with pytest.raises(ValueError):
+            ModelBuilder.build_model(model_config, torch.device('cpu'))
+
+
+class TestSampleInference:
+    """
+    Class to test the single-sample inference path of the Model class.
+    """
+    @pytest.mark.parametrize('layer_params', [
+        {},
+        {'receptive_field_layout': 'csr'},
+        {'receptive_field_layout': 'csr', 'mac_ordering': 'hilbert'},
+        {
+            'receptive_field_layout': 'csr', 'mac_receptive_field_size': 1.5,
+            'shared_receptive_fields': True
+        },
+        {'receptive_field_layout': 'csr', 'weight_storage': 'sparse'},
+        {'compute_dtype': 'bfloat16'}
+    ])
+    def test_sample_inference_matches_eval(self, layer_params: dict):
+        """
+        Tests that the single-sample inference path returns the same
+        outputs as an evaluation forward pass of a batch of one, also
+        after the weights are updated, and leaves the layers untouched.
+        """
+        device = torch.device('cpu')
+        model = ModelBuilder.build_model(
+            create_model_config(False, **layer_params), device
+        )
+        optimizer = HebbianOptimizer(model, device)
+
+        for _ in range(3):
+            model.train()
+            model(torch.lt(torch.rand((4, 25, 1)), 0.5).float())
+            optimizer.step()
+
+            sampling_steps = [layer.sampling_step for layer in model.layers]
+
+            for sample in torch.lt(torch.rand((4, 25, 1)), 0.5).float():
+                output = model.infer_sample(sample).clone()
+
+                assert [
+                    layer.sampling_step for layer in model.layers
+                ] == sampling_steps
+                assert model.layers[0].training
+
+                model.eval()
+                assert torch.equal(output, model(sample.unsqueeze(0))[0])
+                model.train()
+
+
+    def test_sample_inference_rejects_batches(self):
+        """
+        Tests that samples of the wrong shape, such as batches, are
+        rejected.
+        """
+        model = ModelBuilder.build_model(
+            create_model_config(False), torch.device('cpu')
+        )
+
+        with pytest.raises(ValueError):
+            model.infer_sample(torch.zeros((1, 25, 1)))
+
+
+class TestDeadSampleSkipping:
+    """
+    Class to test the skipping of samples with no active MAC by the
+    layers above them.
+    """
+    @pytest.mark.parametrize('fused_forward', [False, True])
+    @pytest.mark.parametrize('layer_params', [
+        {},
+        {'receptive_field_layout': 'csr'},
+        {'active_mac_compaction': True},
+        {'receptive_field_layout': 'csr', 'weight_storage': 'sparse'},
+        {'csa_fast_path_tolerance': 1e-3},
+        {'reuse_workspace': True}
+    ])
+    def test_skipping_matches_full_forward(self, fused_forward: bool,
+                                           layer_params: dict):
+        """
+        Tests that skipping dead samples gives the optimizer and
+        metrics the same layer inputs, outputs and active MACs as a
+        forward pass over every sample, and trains the model the same.
+        """
+        device = torch.device('cpu')
+        models, optimizers, metrics, hooks = [], [], [], []
+
+        for skip_dead_samples in (False, True):
+            model = ModelBuilder.build_model(
+                create_model_config(fused_forward, **layer_params), device
+            )
+
+            if models:
+                model.load_state_dict(models[0].state_dict())
+
+            if not skip_dead_samples:
+                for layer in model.layers:
+                    layer.can_skip_dead_samples = lambda: False
+
+            models.append(model)
+            optimizers.append(HebbianOptimizer(model, device))
+            metrics.append(NumActivationsMetric(model, device))
+            hooks.append(optimizers[-1].hook)
+
+        for _ in range(3):
+            data = torch.lt(torch.rand((8, 25, 1)), 0.5).float()
+            data[::2] = 0.0
+            values, layer_io = [], []
+
+            for model, optimizer, metric, hook in zip(
+                models, optimizers, metrics, hooks
+            ):
+                model.train()
+                model(data)
+                layer_io.append(hook.get_layer_io())
+                values.append(metric.compute(model, data, None, True))
+                optimizer.step()
+
+            for index, layer in enumerate(models[0].layers):
+                assert torch.equal(layer_io[0][1][index], layer_io[1][1][index])
+                assert torch.equal(layer_io[0][2][index], layer_io[1][2][index])
+                assert torch.equal(
+                    layer.is_active, models[1].layers[index].is_active
+                )
+
+            for value, skipped_value in zip(
+                torch.unbind(values[0]), torch.unbind(values[1])
+            ):
+                assert torch.equal(value, skipped_value)
+
+        # the upper layers only ran the live samples.
+        assert models[1].layers[1].num_recomputed_macs < 8 * 9
+
+        for key, value in models[0].state_dict().items():
+            assert torch.equal(value, models[1].state_dict()[key])
+
+
+    def test_skipping_reuses_workspace(self):
+        """
+        Tests that skipping dead samples with a reused workspace stops
+        allocating buffers once every live batch size has been seen.
+        """
+        model = ModelBuilder.build_model(
+            create_model_config(False, reuse_workspace=True),
+            torch.device('cpu')
+        )
+        model.train()
+
+        generator = torch.Generator().manual_seed(0)
+        data = torch.lt(torch.rand((8, 25, 1), generator=generator), 0.5)
+        data = data.float()
+        data[::2] = 0.0
+
+        for step in range(3):
+            model(data)
+
+            if step == 0:
+                num_allocations = [
+                    layer.workspace.num_allocations for layer in model.layers
+                ]
+
+        assert [
+            layer.workspace.num_allocations for layer in model.layers
+        ] == num_allocations
+
+
+    def test_all_dead_batches(self):
+        """
+        Tests that batches with no live sample give all-zero outputs
+        and still advance the sampler counters of every layer.
+        """
+        model = ModelBuilder.build_model(
+            create_model_config(False), torch.device('cpu')
+        )
+        model.train()
+
+        output = model(torch.zeros((4, 25, 1)))
+
+        assert not torch.any(output)
+        assert [layer.sampling_step for layer in model.layers] == [1, 1, 1]
+        assert [
+            tuple(layer.is_active.shape) for layer in model.layers
+        ] == [(4, 16), (4, 9), (4, 4)]
+
+
+    @pytest.mark.parametrize('layer_params', [
+        {}, {'active_mac_compaction': True}
+    ])
+    def test_skipping_keeps_random_state(self, layer_params: dict):
+        """
+        Tests that layers without a fixed sampling seed draw as many
+        seeds when skipping dead samples as when running every sample,
+        so that later steps sample the same active neurons.
+        """
+        outputs, rng_states = [], []
+
+        for skip_dead_samples in (False, True):
+            model_config = create_model_config(False, **layer_params)
+            model_config['sampling_seed'] = None
+
+            model = ModelBuilder.build_model(
+                model_config, torch.device('cpu')
+            )
+            model.train()
+
+            if not skip_dead_samples:
+                for layer in model.layers:
+                    layer.can_skip_dead_samples = lambda: False
+
+            generator = torch.Generator().manual_seed(0)
+            data = torch.lt(
+                torch.rand((4, 25, 1), generator=generator), 0.5
+            ).float()
+            data[1:] = 0.0
+
+            torch.manual_seed(0)
+            model(torch.zeros((4, 25, 1)))
+            outputs.append(model(data).clone())
+            rng_states.append(torch.get_rng_state())
+
+        assert torch.equal(outputs[0], outputs[1])
+        assert torch.equal(rng_states[0], rng_states[1])
+
+
+    def test_zero_threshold_layers_run_every_sample(self):
+        """
+        Tests that layers whose MACs can be active without active
+        inputs do not skip dead samples.
+        """
+        model = ModelBuilder.build_model(
+            create_model_config(False, activation_threshold_min=0.0),
+            torch.device('cpu')
+        )
+
+        assert not any(
+            layer.can_skip_dead_samples() for layer in model.layers
+        )
+
+        output = model(torch.zeros((4, 25, 1)))
+
+        assert torch.all(torch.sum(output, dim=-1) == 3)
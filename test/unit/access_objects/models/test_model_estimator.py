@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+import torch
+
+from sparseypy.access_objects.models.model_builder import ModelBuilder
+from sparseypy.access_objects.models.model_estimator import ModelEstimator
+from sparseypy.core.optimizers.hebbian import HebbianOptimizer
+
+
+def create_model_config(**layer_params) -> dict:
+    """
+    Returns the config of a two-layer model whose layers use the
+    given extra parameters.
+    """
+    layers = []
+
+    for num_macs, prev_layer_num_macs, prev_layer_num_neurons in (
+        (16, 25, 1), (9, 16, 4)
+    ):
+        params = {
+            'autosize_grid': False, 'grid_layout': 'rect',
+            'num_macs': num_macs, 'num_cms_per_mac': 3,
+            'num_neurons_per_cm': 4,
+            'mac_grid_num_rows': int(num_macs ** 0.5),
+            'mac_grid_num_cols': int(num_macs ** 0.5),
+            'mac_receptive_field_size': 0.5,
+            'prev_layer_num_cms_per_mac': 3 if num_macs == 9 else 1,
+            'prev_layer_num_neurons_per_cm': prev_layer_num_neurons,
+            'prev_layer_mac_grid_num_rows': int(prev_layer_num_macs ** 0.5),
+            'prev_layer_mac_grid_num_cols': int(prev_layer_num_macs ** 0.5),
+            'prev_layer_num_macs': prev_layer_num_macs,
+            'prev_layer_grid_layout': 'rect',
+            'sigmoid_phi': 5.0, 'sigmoid_lambda': 28.0,
+            'saturation_threshold': 0.5, 'permanence_steps': 10,
+            'permanence_convexity': 0.3, 'activation_threshold_min': 0.2,
+            'activation_threshold_max': 1.0, 'min_familiarity': 0.2,
+            'sigmoid_chi': 2.5
+        }
+
+        params.update(layer_params)
+        layers.append({'name': 'sparsey', 'params': params})
+
+    return {'layers': layers}
+
+
+class TestModelEstimator:
+    """
+    Class to test the estimates of the ModelEstimator class.
+    """
+    @pytest.mark.parametrize('receptive_field_layout', ['padded', 'csr'])
+    def test_meta_build_allocates_no_weights(
+        self, receptive_field_layout: str):
+        """
+        Tests that models can be built on the meta device, with the
+        same weight shapes as on the CPU.
+        """
+        model_config = create_model_config(
+            receptive_field_layout=receptive_field_layout
+        )
+
+        meta_model = ModelBuilder.build_model(
+            model_config, torch.device('meta')
+        )
+        model = ModelBuilder.build_model(model_config, torch.device('cpu'))
+
+        for meta_layer, layer in zip(meta_model.children(), model.children()):
+            assert meta_layer.weights.is_meta
+            assert meta_layer.weights.shape == layer.weights.shape
+            assert meta_layer.device == torch.device('meta')
+
+
+    @pytest.mark.parametrize('layer_params', [
+        {'receptive_field_layout': 'padded'},
+        {'receptive_field_layout': 'csr'},
+        {'receptive_field_layout': 'padded', 'max_workspace_bytes': 2048},
+        {'receptive_field_layout': 'csr', 'max_workspace_bytes': 2048},
+        {'receptive_field_layout': 'csr', 'weight_dtype': 'uint8'},
+        {'receptive_field_layout': 'padded', 'compute_dtype': 'bfloat16'},
+        {'receptive_field_layout': 'csr', 'compute_dtype': 'bfloat16',
+         'weight_dtype': 'bfloat16'},
+        {'receptive_field_layout': 'csr', 'shared_receptive_fields': True},
+        {'receptive_field_layout': 'csr', 'shared_receptive_fields': True,
+         'max_workspace_bytes': 2048}
+    ])
+    def test_estimates_match_built_model(self, layer_params: dict):
+        """
+        Tests that the estimated weight, timestep and workspace sizes
+        match those of the model built on the CPU and trained for a
+        step.
+        """
+        batch_size = 6
+        estimates = ModelEstimator.estimate_model(
+            create_model_config(**layer_params), batch_size
+        )
+
+        model = ModelBuilder.build_model(
+            create_model_config(**layer_params), torch.device('cpu')
+        )
+        optimizer = HebbianOptimizer(model, torch.device('cpu'))
+
+        model.train()
+        model(torch.lt(torch.rand((batch_size, 25, 1)), 0.5).float())
+        optimizer.step()
+
+        for layer_index, (estimate, layer) in enumerate(
+            zip(estimates, model.children())
+        ):
+            assert estimate.layer_index == layer_index
+            assert estimate.weight_bytes == (
+                layer.weights.numel() * layer.weights.element_size()
+            )
+            assert estimate.timestep_bytes == (
+                optimizer.timesteps[layer_index].numel() * 4
+            )
+            # weights converted to another compute dtype are cached.
+            compute_weights_bytes = 0
+
+            if layer.compute_weights is not None:
+                compute_weights_bytes = (
+                    layer.compute_weights[1].numel() *
+                    layer.compute_weights[1].element_size()
+                )
+
+            assert estimate.forward_workspace_bytes == (
+                layer.peak_workspace_bytes + compute_weights_bytes +
+                batch_size * layer.num_macs * layer.weights.shape[-1] * 13
+            )
+            assert 0 < estimate.forward_flops < estimate.update_flops
+
+
+    def test_streamed_layers_count_their_window(self, tmp_path):
+        """
+        Tests that layers with a weight file are estimated at the size
+        of their window, and that estimating them creates no file.
+        """
+        model_config = create_model_config(
+            receptive_field_layout='padded',
+            weight_file=str(tmp_path / 'weights.bin'),
+            max_resident_weight_bytes=1024
+        )
+        dense_estimates = ModelEstimator.estimate_model(
+            create_model_config(receptive_field_layout='padded'), 4
+        )
+
+        for estimate, dense_estimate in zip(
+            ModelEstimator.estimate_model(model_config, 4), dense_estimates
+        ):
+            assert dense_estimate.weight_bytes > 1024
+            assert estimate.weight_bytes == 1024
+            assert estimate.timestep_bytes == 1024
+            assert estimate.forward_flops == dense_estimate.forward_flops
+
+        assert not (tmp_path / 'weights.bin').exists()
+
+
+    def test_check_model_fits(self):
+        """
+        Tests that models whose estimate exceeds the budget are
+        rejected, and that others are accepted.
+        """
+        model_config = create_model_config()
+        total_bytes = ModelEstimator.get_total_bytes(
+            ModelEstimator.estimate_model(model_config, 4)
+        )
+
+        ModelEstimator.check_model_fits(model_config, 4, total_bytes)
+
+        with pytest.raises(ValueError):
+            ModelEstimator.check_model_fits(model_config, 4, total_bytes - 1)
+
+        with pytest.raises(ValueError):
+            ModelEstimator.estimate_model(model_config, 0)
@@ -201,3 +201,149 @@ class TestSparseyModelConfigs:
                 sparsey_model_schema, 'model', 'sparsey',
                 survive_with_exception=True
             )
+
+
+    def test_invalid_forward_mode(
+            self, sparsey_model_schema: dict) -> None:
+        """
+        Test whether the config validation throws an error
+        or not when the forward mode is not one of the
+        supported modes.
+
+        Args:
+            sparsey_model_schema: a dict containing the valid
+            sparsey model schema to be used for testing, passed in 
+            via pytest's fixture functionality.
+        """
+        sparsey_model_schema['forward_mode'] = 'jit'
+
+        with pytest.raises(SchemaError):
+            validate_config(
+                sparsey_model_schema, 'model', 'sparsey',
+                survive_with_exception=True
+            )
+
+
+    def test_invalid_weight_storage(
+            self, sparsey_model_schema: dict) -> None:
+        """
+        Test whether the config validation throws an error
+        or not when the weight storage of a layer is not one
+        of the supported storage types.
+
+        Args:
+            sparsey_model_schema: a dict containing the valid
+            sparsey model schema to be used for testing, passed in 
+            via pytest's fixture functionality.
+        """
+        sparsey_model_schema['layers'][0]['params']['weight_storage'] = 'coo'
+
+        with pytest.raises(SchemaError):
+            validate_config(
+                sparsey_model_schema, 'model', 'sparsey',
+                survive_with_exception=True
+            )
+
+
+    def test_invalid_weight_dtype(
+            self, sparsey_model_schema: dict) -> None:
+        """
+        Test whether the config validation throws an error
+        or not when the weight dtype of a layer is not one
+        of the supported dtypes.
+
+        Args:
+            sparsey_model_schema: a dict containing the valid
+            sparsey model schema to be used for testing, passed in 
+            via pytest's fixture functionality.
+        """
+        sparsey_model_schema['layers'][0]['params']['weight_dtype'] = 'int4'
+
+        with pytest.raises(SchemaError):
+            validate_config(
+                sparsey_model_schema, 'model', 'sparsey',
+                survive_with_exception=True
+            )
+
+
+    def test_invalid_binary_weights(
+            self, sparsey_model_schema: dict) -> None:
+        """
+        Test whether the config validation throws an error
+        or not when the binary weights setting of a layer is
+        not a boolean.
+
+        Args:
+            sparsey_model_schema: a dict containing the valid
+            sparsey model schema to be used for testing, passed in 
+            via pytest's fixture functionality.
+        """
+        sparsey_model_schema['layers'][0]['params']['binary_weights'] = 'yes'
+
+        with pytest.raises(SchemaError):
+            validate_config(
+                sparsey_model_schema, 'model', 'sparsey',
+                survive_with_exception=True
+            )
+
+
+    def test_invalid_sampling_seed(
+            self, sparsey_model_schema: dict) -> None:
+        """
+        Test whether the config validation throws an error
+        or not when the sampling seed is negative.
+
+        Args:
+            sparsey_model_schema: a dict containing the valid
+            sparsey model schema to be used for testing, passed in 
+            via pytest's fixture functionality.
+        """
+        sparsey_model_schema['sampling_seed'] = -1
+
+        with pytest.raises(SchemaError):
+            validate_config(
+                sparsey_model_schema, 'model', 'sparsey',
+                survive_with_exception=True
+            )
+
+
+    def test_invalid_reuse_workspace(
+            self, sparsey_model_schema: dict) -> None:
+        """
+        Test whether the config validation throws an error
+        or not when the reuse workspace setting of a layer is
+        not a boolean.
+
+        Args:
+            sparsey_model_schema: a dict containing the valid
+            sparsey model schema to be used for testing, passed in 
+            via pytest's fixture functionality.
+        """
+        sparsey_model_schema['layers'][0]['params']['reuse_workspace'] = 1
+
+        with pytest.raises(SchemaError):
+            validate_config(
+                sparsey_model_schema, 'model', 'sparsey',
+                survive_with_exception=True
+            )
+
+
+    def test_invalid_num_threads(
+            self, sparsey_model_schema: dict) -> None:
+        """
+        Test whether the config validation throws an error
+        or not when the number of threads of a layer is not
+        a positive integer.
+
+        Args:
+            sparsey_model_schema: a dict containing the valid
+            sparsey model schema to be used for testing, passed in 
+            via pytest's fixture functionality.
+        """
+        sparsey_model_schema['layers'][0]['params']['num_threads'] = 0
+
+        with pytest.raises(SchemaError):
+            validate_config(
+                sparsey_model_schema, 'model', 'sparsey',
+                survive_with_exception=True
+            )
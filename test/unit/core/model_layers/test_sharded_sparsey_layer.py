@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+
+"""
+Test Sharded Sparsey Layer: tests covering Sparsey layers whose MACs
+    are split between processes.
+"""
+
+
+import os
+from datetime import timedelta
+
+import pytest
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+
+from sparseypy.access_objects.models.model_builder import ModelBuilder
+from sparseypy.core.hooks import LayerIOHook
+from sparseypy.core.model_layers.sharded_sparsey_layer import (
+    ShardedSparseyLayer, get_mac_shards
+)
+from sparseypy.core.optimizers.hebbian import HebbianOptimizer
+
+
+def create_model_config(model_parallel: bool, sampling_seed: int = 5,
+                        **layer_params) -> dict:
+    """
+    Returns the config of a three-layer model, whose layers are split
+    between processes if model_parallel is set.
+    """
+    layers = []
+
+    for num_macs, prev_layer_num_macs, prev_layer_num_cms in (
+        (16, 25, 1), (9, 16, 3), (4, 9, 3)
+    ):
+        layers.append({
+            'name': 'sparsey',
+            'params': {
+                'autosize_grid': False, 'grid_layout': 'rect',
+                'num_macs': num_macs, 'num_cms_per_mac': 3,
+                'num_neurons_per_cm': 4,
+                'mac_grid_num_rows': int(num_macs ** 0.5),
+                'mac_grid_num_cols': int(num_macs ** 0.5),
+                'mac_receptive_field_size': 0.5,
+                'prev_layer_num_cms_per_mac': prev_layer_num_cms,
+                'prev_layer_num_neurons_per_cm': (
+                    1 if prev_layer_num_cms == 1 else 4
+                ),
+                'prev_layer_mac_grid_num_rows': int(prev_layer_num_macs ** 0.5),
+                'prev_layer_mac_grid_num_cols': int(prev_layer_num_macs ** 0.5),
+                'prev_layer_num_macs': prev_layer_num_macs,
+                'prev_layer_grid_layout': 'rect',
+                'sigmoid_phi': 5.0, 'sigmoid_lambda': 28.0,
+                'saturation_threshold': 0.5, 'permanence_steps': 10,
+                'permanence_convexity': 0.3, 'activation_threshold_min': 0.2,
+                'activation_threshold_max': 1.0, 'min_familiarity': 0.2,
+                'sigmoid_chi': 2.5,
+                'model_parallel': model_parallel,
+                **layer_params
+            }
+        })
+
+    return {'layers': layers, 'sampling_seed': sampling_seed}
+
+
+def run_sharded_training(rank: int, world_size: int, init_file: str,
+                         layer_params: dict) -> None:
+    """
+    Trains a model whose layers are split between the processes
+    alongside an unsharded copy in every process, checking that the
+    sharded layers give the optimizer the same inputs and outputs, and
+    keep the same weights for their MACs. Only the first process is
+    given the data, and the random number generator of each process
+    is seeded differently for the sharded model. The process group is torn down when the process
+    exits, since destroying gloo groups explicitly can hang.
+    """
+    dist.init_process_group(
+        'gloo', init_method=f'file://{init_file}', rank=rank,
+        world_size=world_size, timeout=timedelta(seconds=60)
+    )
+
+    device = torch.device('cpu')
+    models, optimizers, hooks = [], [], []
+
+    for model_parallel in (False, True):
+        model = ModelBuilder.build_model(
+            create_model_config(model_parallel, **layer_params), device
+        )
+
+        models.append(model)
+        optimizers.append(HebbianOptimizer(model, device))
+        hooks.append(LayerIOHook(model))
+
+    assert isinstance(models[1].layers[1], ShardedSparseyLayer)
+    assert models[1].layers[1].shard.num_macs == 3
+
+    generator = torch.Generator().manual_seed(0)
+
+    for step in range(3):
+        data = torch.lt(
+            torch.rand((6, 25, 1), generator=generator), 0.5
+        ).float()
+        outputs = []
+
+        for model, optimizer, model_input, seed in zip(
+            models, optimizers,
+            (data, data.clone() if rank == 0 else torch.zeros_like(data)),
+            (step, step + 100 * rank)
+        ):
+            torch.manual_seed(seed)
+            model.train()
+            outputs.append(model(model_input))
+            optimizer.step()
+
+        assert torch.equal(outputs[0], outputs[1])
+
+        for index, layer in enumerate(models[0].layers):
+            assert torch.equal(
+                hooks[0].input_list[index], hooks[1].input_list[index]
+            )
+            assert torch.equal(
+                hooks[0].output_list[index], hooks[1].output_list[index]
+            )
+            assert torch.equal(
+                layer.is_active, models[1].layers[index].is_active
+            )
+
+    for model in models:
+        model.eval()
+
+    sharded_data = data.clone() if rank == 0 else torch.zeros_like(data)
+
+    assert torch.equal(models[0](data), models[1](sharded_data.clone()))
+
+    for index_code, sharded_index_code in zip(
+        models[0].forward_indices(data),
+        models[1].forward_indices(sharded_data.clone())
+    ):
+        assert torch.equal(index_code, sharded_index_code)
+
+    assert torch.equal(
+        models[0].infer_sample(data[0]).clone(),
+        models[1].infer_sample(sharded_data[0].clone())
+    )
+
+    if layer_params.get('receptive_field_layout', 'padded') == 'padded':
+        for layer, sharded_layer in zip(models[0].layers, models[1].layers):
+            start, end = sharded_layer.mac_shards[rank]
+
+            assert torch.equal(
+                layer.weights[start:end], sharded_layer.shard.weights
+            )
+
+
+def run_sharded_weight_files(rank: int, world_size: int, init_file: str,
+                             weight_file: str) -> None:
+    """
+    Builds a model whose layers are split between the processes with
+    memory-mapped weights, checking that every process maps the
+    weights of its own MACs to its own file.
+    """
+    dist.init_process_group(
+        'gloo', init_method=f'file://{init_file}', rank=rank,
+        world_size=world_size, timeout=timedelta(seconds=60)
+    )
+
+    model_config = create_model_config(True)
+    model_config['layers'] = model_config['layers'][1:2]
+    model_config['layers'][0]['params']['weight_file'] = weight_file
+
+    shard = ModelBuilder.build_model(
+        model_config, torch.device('cpu')
+    ).layers[0].shard
+
+    assert shard.weight_file == f'{weight_file}.{rank}'
+    assert os.path.getsize(shard.weight_file) == (
+        shard.weights.numel() * shard.weights.element_size()
+    )
+
+
+class TestShardedSparseyLayer:
+    """
+    TestShardedSparseyLayer: tests covering the splitting of the MACs
+        of a layer between processes.
+    """
+    @pytest.mark.parametrize('num_macs, num_shards, mac_shards', [
+        (9, 3, [(0, 3), (3, 6), (6, 9)]),
+        (4, 3, [(0, 2), (2, 3), (3, 4)]),
+        (5, 1, [(0, 5)])
+    ])
+    def test_get_mac_shards(self, num_macs: int, num_shards: int,
+                            mac_shards: list):
+        """
+        Test that the MACs are split into contiguous, nearly equal
+        ranges.
+        """
+        assert get_mac_shards(num_macs, num_shards) == mac_shards
+
+
+    def test_more_shards_than_macs(self):
+        """
+        Test that a layer cannot be split between more processes than
+        it has MACs.
+        """
+        with pytest.raises(ValueError):
+            get_mac_shards(4, 5)
+
+
+    def test_requires_distributed(self):
+        """
+        Test that model parallel layers require torch.distributed to
+        be initialized.
+        """
+        with pytest.raises(ValueError):
+            ModelBuilder.build_model(
+                create_model_config(True), torch.device('cpu')
+            )
+
+
+    def test_rejects_auto_layout(self):
+        """
+        Test that model parallel layers cannot time their backends,
+        which would build the full layer in every process.
+        """
+        with pytest.raises(ValueError, match='receptive field layout'):
+            ModelBuilder.build_model(
+                create_model_config(True, receptive_field_layout='auto'),
+                torch.device('cpu')
+            )
+
+
+    @pytest.mark.parametrize('layer_params', [
+        {}, {'receptive_field_layout': 'csr', 'mac_ordering': 'hilbert'},
+        {'sampling_seed': None}
+    ])
+    def test_sharded_training_matches_single_process(self, tmp_path,
+                                                     layer_params: dict):
+        """
+        Test that training a model split between three local processes
+        over gloo gives the same codes and weights as training it in a
+        single process, with or without a fixed sampling seed, and
+        that its evaluation, index code and single-sample passes give
+        the same codes.
+        """
+        mp.spawn(
+            run_sharded_training,
+            args=(3, os.path.join(tmp_path, 'init'), layer_params),
+            nprocs=3, join=True
+        )
+
+
+    def test_shards_map_their_own_weight_files(self, tmp_path):
+        """
+        Test that the processes of a model parallel layer with a weight
+        file each map the weights of their MACs to a file of their own.
+        """
+        mp.spawn(
+            run_sharded_weight_files,
+            args=(
+                2, os.path.join(tmp_path, 'init'),
+                os.path.join(tmp_path, 'weights.bin')
+            ),
+            nprocs=2, join=True
+        )
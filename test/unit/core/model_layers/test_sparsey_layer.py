@@ -9,9 +9,76 @@ Test Sparsey Layer: tests covering the functionality of a single
 from typing import Tuple
 
 import torch
+import torch._dynamo
 import pytest
 
 from sparseypy.core.model_layers.sparsey_layer import MAC, SparseyLayer
+from sparseypy.core.model_layers.weight_precision import dequantize_weights
+from sparseypy.core.model_layers.winner_sampling import sample_winners
+
+
+# the geometry of layers with large CMs over a small previous layer.
+WIDE_CM_LAYER_PARAMS = {
+    'num_cms_per_mac': 8, 'num_neurons_per_cm': 16, 'prev_layer_num_macs': 9,
+    'mac_receptive_field_size': 0.5, 'prev_layer_num_cms_per_mac': 12,
+    'prev_layer_num_neurons_per_cm': 10, 'prev_layer_mac_grid_num_rows': 3,
+    'prev_layer_mac_grid_num_cols': 3, 'layer_index': 2
+}
+
+
+def create_sparsey_layer(**layer_params) -> SparseyLayer:
+    """
+    Returns a SparseyLayer with a 4x4 grid of MACs over a 5x5 grid of
+    previous layer MACs, whose edge MACs have smaller receptive fields
+    than its interior MACs, with any given parameters overriding the
+    defaults.
+    """
+    return SparseyLayer(**{
+        'autosize_grid': False, 'grid_layout': 'rect', 'num_macs': 16,
+        'num_cms_per_mac': 4, 'num_neurons_per_cm': 6,
+        'mac_grid_num_rows': 4, 'mac_grid_num_cols': 4,
+        'prev_layer_num_macs': 25, 'mac_receptive_field_size': 0.4,
+        'prev_layer_num_cms_per_mac': 3, 'prev_layer_num_neurons_per_cm': 5,
+        'prev_layer_mac_grid_num_rows': 5, 'prev_layer_mac_grid_num_cols': 5,
+        'prev_layer_grid_layout': 'rect', 'layer_index': 1,
+        'sigmoid_phi': 5.0, 'sigmoid_lambda': 28.0,
+        'saturation_threshold': 0.5, 'permanence_steps': 25,
+        'permanence_convexity': 1.0, 'activation_threshold_max': 1.0,
+        'activation_threshold_min': 0.2, 'min_familiarity': 0.2,
+        'sigmoid_chi': 2.5, 'device': torch.device('cpu'),
+        **layer_params
+    })
+
+
+def create_layer_input(batch_size: int, active_mac_rate: float = 0.6,
+                       prev_layer_num_macs: int = 25,
+                       prev_layer_num_cms_per_mac: int = 3,
+                       prev_layer_num_neurons_per_cm: int = 5) -> torch.Tensor:
+    """
+    Returns a random layer input with one active neuron in every CM of
+    the active previous layer MACs, each of which is active with
+    probability active_mac_rate. The default geometry is the previous
+    layer of create_sparsey_layer.
+    """
+    layer_input = torch.zeros(
+        (
+            batch_size, prev_layer_num_macs, prev_layer_num_cms_per_mac,
+            prev_layer_num_neurons_per_cm
+        ), dtype=torch.float32
+    )
+    layer_input.scatter_(
+        3,
+        torch.randint(
+            0, prev_layer_num_neurons_per_cm,
+            (batch_size, prev_layer_num_macs, prev_layer_num_cms_per_mac, 1)
+        ),
+        1.0
+    )
+    layer_input *= torch.rand((batch_size, prev_layer_num_macs, 1, 1)) < (
+        active_mac_rate
+    )
+
+    return layer_input.view(batch_size, prev_layer_num_macs, -1)
 
 
 class TestMAC:
@@ -102,3 +169,1775 @@ class TestMAC:
             torch.sum(equal_elements_zero).item() == 15 * 32 * 8 * 16
         )
             
+
+
+class TestIndexCodes:
+    """
+    TestIndexCodes: tests covering the index code format
+        used by SparseyLayer.forward_indices().
+    """
+    @pytest.fixture
+    def sample_sparsey_layer(self):
+        """
+        Returns a sample SparseyLayer object with random weights
+        to perform tests with.
+        """
+        sparsey_layer = create_sparsey_layer(**WIDE_CM_LAYER_PARAMS)
+
+        torch.manual_seed(0)
+        sparsey_layer.weights.data.uniform_()
+
+        return sparsey_layer
+
+
+    @pytest.fixture
+    def coded_input(self):
+        """
+        Returns a dense input with one active neuron per CM
+        in every active MAC.
+        """
+        torch.manual_seed(1)
+        winners = torch.randint(0, 10, (32, 9, 12))
+        macs_are_active = torch.rand((32, 9)) < 0.6
+
+        dense_input = torch.zeros((32, 9, 12, 10), dtype=torch.float32)
+        dense_input.scatter_(3, winners.unsqueeze(-1), 1.0)
+        dense_input *= macs_are_active.unsqueeze(-1).unsqueeze(-1)
+
+        return dense_input.view(32, 9, 120)
+
+
+    def test_index_code_round_trip(self, sample_sparsey_layer, coded_input):
+        """
+        Test that decoding the output of forward_indices() gives
+        back the dense code produced by forward().
+        """
+        sample_sparsey_layer.train()
+        output = sample_sparsey_layer(coded_input)
+
+        winners = torch.argmax(
+            output.view(32, 16, 8, 16), dim=3
+        ).to(sample_sparsey_layer.output_winner_dtype)
+
+        decoded_output = sample_sparsey_layer.decode_index_code(
+            winners, sample_sparsey_layer.is_active
+        )
+
+        assert torch.equal(decoded_output, output)
+
+
+    def test_forward_indices_matches_forward(
+        self, sample_sparsey_layer, coded_input):
+        """
+        Test that the index code forward pass computes the same
+        codes and MAC activity as the dense forward pass.
+        """
+        sample_sparsey_layer.eval()
+
+        dense_output = sample_sparsey_layer(coded_input)
+        dense_is_active = sample_sparsey_layer.is_active.clone()
+
+        winners, macs_are_active = sample_sparsey_layer.forward_indices(
+            *sample_sparsey_layer.encode_index_code(coded_input)
+        )
+
+        assert winners.shape == (32, 16, 8)
+        assert winners.dtype == torch.int16
+        assert torch.equal(macs_are_active, dense_is_active)
+        assert torch.equal(
+            sample_sparsey_layer.decode_index_code(winners, macs_are_active),
+            dense_output
+        )
+
+
+class TestReceptiveFieldLayouts:
+    """
+    TestReceptiveFieldLayouts: tests covering the padding-free
+        CSR receptive field layout of SparseyLayer.
+    """
+    def create_layer(self, receptive_field_layout: str,
+                     mac_ordering: str = 'row_major') -> SparseyLayer:
+        """
+        Returns a SparseyLayer whose edge MACs have smaller
+        receptive fields than its interior MACs.
+        """
+        return create_sparsey_layer(
+            **WIDE_CM_LAYER_PARAMS,
+            receptive_field_layout=receptive_field_layout,
+            mac_ordering=mac_ordering
+        )
+
+
+    @torch.no_grad()
+    def copy_padded_weights(self, padded_layer: SparseyLayer,
+                            csr_layer: SparseyLayer) -> None:
+        """
+        Copies the weights of a padded layer into a CSR layer.
+        """
+        for bucket in csr_layer.rf_buckets:
+            num_rows = csr_layer.get_bucket_weights(bucket).shape[1]
+
+            csr_layer.get_bucket_weights(bucket).copy_(
+                padded_layer.weights[bucket.mac_indices, :num_rows]
+            )
+
+
+    def test_csr_weights_sized_to_receptive_fields(self):
+        """
+        Test that the CSR layout stores exactly one weight row per
+        input neuron in each MAC's true receptive field.
+        """
+        padded_layer = self.create_layer('padded')
+        csr_layer = self.create_layer('csr')
+
+        rf_sizes = torch.sum(padded_layer.input_connection_mask, dim=1)
+
+        assert torch.equal(
+            csr_layer.input_offsets[1:] - csr_layer.input_offsets[:-1],
+            rf_sizes
+        )
+        assert csr_layer.weights.shape == (
+            torch.sum(rf_sizes).item() * 120, 128
+        )
+        assert csr_layer.weights.numel() < padded_layer.weights.numel()
+
+
+    def test_csr_forward_matches_padded(self):
+        """
+        Test that the CSR layout produces the same outputs as the
+        padded layout for the same weights.
+        """
+        padded_layer = self.create_layer('padded')
+        csr_layer = self.create_layer('csr')
+
+        torch.manual_seed(0)
+        torch.nn.init.uniform_(padded_layer.weights.data)
+        self.copy_padded_weights(padded_layer, csr_layer)
+
+        padded_layer.eval()
+        csr_layer.eval()
+
+        layer_input = create_layer_input(
+            32, prev_layer_num_macs=9, prev_layer_num_cms_per_mac=12,
+            prev_layer_num_neurons_per_cm=10
+        )
+
+        assert torch.equal(padded_layer(layer_input), csr_layer(layer_input))
+        assert torch.equal(padded_layer.is_active, csr_layer.is_active)
+
+        for padded_output, csr_output in zip(
+            padded_layer.forward_indices(
+                *padded_layer.encode_index_code(layer_input)
+            ),
+            csr_layer.forward_indices(
+                *csr_layer.encode_index_code(layer_input)
+            )
+        ):
+            assert torch.equal(padded_output, csr_output)
+
+
+    @pytest.mark.parametrize('mac_ordering', ['row_major', 'hilbert'])
+    def test_state_dicts_load_across_layouts(self, mac_ordering: str):
+        """
+        Test that a CSR layer loads the state dict of a padded layer
+        and the reverse, giving the same weights and outputs.
+        """
+        padded_layer = self.create_layer('padded')
+        csr_layer = self.create_layer('csr', mac_ordering)
+        reference_layer = self.create_layer('csr')
+
+        torch.manual_seed(0)
+        torch.nn.init.uniform_(padded_layer.weights.data)
+
+        # the rows of padded connections are not saved by CSR layers.
+        padded_layer.weights.data *= torch.repeat_interleave(
+            padded_layer.input_connection_mask, 120, dim=1
+        ).unsqueeze(-1)
+        self.copy_padded_weights(padded_layer, reference_layer)
+
+        csr_layer.load_state_dict(padded_layer.state_dict())
+
+        assert torch.equal(
+            csr_layer.state_dict()['weights'],
+            reference_layer.state_dict()['weights']
+        )
+
+        loaded_padded_layer = self.create_layer('padded')
+        loaded_padded_layer.load_state_dict(csr_layer.state_dict())
+
+        assert torch.equal(loaded_padded_layer.weights, padded_layer.weights)
+
+        layer_input = create_layer_input(
+            8, 1.0, prev_layer_num_macs=9, prev_layer_num_cms_per_mac=12,
+            prev_layer_num_neurons_per_cm=10
+        )
+
+        padded_layer.eval()
+        csr_layer.eval()
+
+        assert torch.equal(padded_layer(layer_input), csr_layer(layer_input))
+
+
+class TestMACGeometry:
+    """
+    TestMACGeometry: tests covering the construction of MAC
+        positions and receptive fields in SparseyLayer.
+    """
+    @pytest.mark.parametrize('grid_layout', ['rect', 'hex'])
+    @pytest.mark.parametrize('receptive_field_size', [0.1, 0.35, 1.5])
+    def test_connections_match_pairwise_search(
+        self, grid_layout: str, receptive_field_size: float
+    ):
+        """
+        Test that the receptive fields found by the layer match a
+        brute-force pairwise search over the previous layer's MACs.
+        """
+        layer = create_sparsey_layer(
+            grid_layout=grid_layout, num_macs=35, num_cms_per_mac=2,
+            num_neurons_per_cm=2, mac_grid_num_rows=5, mac_grid_num_cols=7,
+            prev_layer_num_macs=48,
+            mac_receptive_field_size=receptive_field_size,
+            prev_layer_num_cms_per_mac=2, prev_layer_num_neurons_per_cm=2,
+            prev_layer_mac_grid_num_rows=8, prev_layer_mac_grid_num_cols=6,
+            prev_layer_grid_layout=grid_layout
+        )
+
+        mac_positions = layer.compute_mac_positions(
+            35, 5, 7, grid_layout
+        ).tolist()
+        prev_layer_mac_positions = layer.compute_mac_positions(
+            48, 8, 6, grid_layout
+        ).tolist()
+
+        _, mac_rf_sizes = layer.find_connected_macs_in_prev_layer(
+            layer.compute_mac_positions(35, 5, 7, grid_layout),
+            layer.compute_mac_positions(48, 8, 6, grid_layout), 48
+        )
+
+        expected_connections = [
+            [
+                index for index, prev_position in enumerate(
+                    prev_layer_mac_positions
+                )
+                if layer._compute_distance(
+                    position, prev_position
+                ) <= receptive_field_size
+            ] for position in mac_positions
+        ]
+
+        for mac_index, expected in enumerate(expected_connections):
+            connections = layer.input_connections[mac_index]
+
+            assert connections[:len(expected)].tolist() == expected
+            assert torch.all(connections[len(expected):] == 48)
+            assert mac_rf_sizes[mac_index] == len(expected)
+
+
+class TestCompiledForward:
+    """
+    TestCompiledForward: tests covering the compiled execution
+        mode of SparseyLayer.
+    """
+    def create_layer(self, **layer_params) -> SparseyLayer:
+        """
+        Returns a small SparseyLayer with random weights.
+        """
+        layer = create_sparsey_layer(**{
+            'num_macs': 4, 'num_cms_per_mac': 3, 'num_neurons_per_cm': 4,
+            'mac_grid_num_rows': 2, 'mac_grid_num_cols': 2,
+            'prev_layer_num_macs': 9, 'mac_receptive_field_size': 0.75,
+            'prev_layer_num_cms_per_mac': 2,
+            'prev_layer_num_neurons_per_cm': 3,
+            'prev_layer_mac_grid_num_rows': 3,
+            'prev_layer_mac_grid_num_cols': 3, 'layer_index': 0,
+            **layer_params
+        })
+
+        torch.nn.init.uniform_(layer.weights.data)
+
+        return layer
+
+
+    @pytest.fixture
+    def layer_input(self) -> torch.Tensor:
+        """
+        Returns a random input with one active neuron per CM.
+        """
+        return create_layer_input(
+            8, 0.7, prev_layer_num_macs=9, prev_layer_num_cms_per_mac=2,
+            prev_layer_num_neurons_per_cm=3
+        )
+
+
+    @pytest.mark.parametrize('receptive_field_layout', ['padded', 'csr'])
+    @pytest.mark.parametrize('training', [False, True])
+    def test_compiled_forward_matches_eager(self, layer_input: torch.Tensor,
+                                            receptive_field_layout: str,
+                                            training: bool):
+        """
+        Test that the compiled forward pass produces the same
+        outputs as the eager forward pass.
+        """
+        torch.manual_seed(0)
+        eager_layer = self.create_layer(
+            receptive_field_layout=receptive_field_layout
+        )
+        torch.manual_seed(0)
+        compiled_layer = self.create_layer(
+            receptive_field_layout=receptive_field_layout
+        )
+
+        if not compiled_layer.compile_forward():
+            pytest.skip('torch.compile is not supported here.')
+
+        eager_layer.train(training)
+        compiled_layer.train(training)
+
+        torch.manual_seed(1)
+        eager_output = eager_layer(layer_input)
+        torch.manual_seed(1)
+        compiled_output = compiled_layer(layer_input)
+
+        assert compiled_layer.compiled_kernels is not None
+        assert torch.equal(eager_output, compiled_output)
+        assert torch.equal(eager_layer.is_active, compiled_layer.is_active)
+
+
+    def test_compiled_training_scores_match_eager(
+        self, layer_input: torch.Tensor):
+        """
+        Test that the compiled kernels compute the same CSA
+        distribution as the eager forward pass in training mode.
+        """
+        layer = self.create_layer()
+
+        if not layer.compile_forward():
+            pytest.skip('torch.compile is not supported here.')
+
+        layer.train()
+
+        with torch.no_grad():
+            eager_scores, _ = layer.compute_neuron_scores(layer_input)
+            compiled_scores, _ = layer.compiled_kernels[0](layer, layer_input)
+
+        assert torch.allclose(eager_scores, compiled_scores, atol=1e-5)
+
+
+    def test_compiled_layers_keep_cache_limit(
+        self, layer_input: torch.Tensor):
+        """
+        Test that compiling and running layers leaves the global
+        dynamo cache limit unchanged.
+        """
+        cache_size_limit = torch._dynamo.config.cache_size_limit
+        layers = [self.create_layer() for _ in range(2)]
+
+        if not all(layer.compile_forward() for layer in layers):
+            pytest.skip('torch.compile is not supported here.')
+
+        for training in (True, False):
+            for layer in layers:
+                layer.train(training)
+                layer(layer_input)
+
+        assert all(layer.compiled_kernels is not None for layer in layers)
+        assert torch._dynamo.config.cache_size_limit == cache_size_limit
+
+
+    def test_compiled_forward_falls_back_to_eager(
+        self, layer_input: torch.Tensor):
+        """
+        Test that a layer whose compiled kernels fail falls
+        back to the eager forward pass.
+        """
+        def failing_kernel(*args):
+            raise RuntimeError('unsupported')
+
+        layer = self.create_layer()
+        layer.eval()
+        expected_output = layer(layer_input)
+
+        layer.compiled_kernels = (failing_kernel, failing_kernel)
+
+        with pytest.warns(UserWarning):
+            output = layer(layer_input)
+
+        assert layer.compiled_kernels is None
+        assert torch.equal(output, expected_output)
+
+
+class TestActiveMACCompaction:
+    """
+    TestActiveMACCompaction: tests covering the forward pass of
+        SparseyLayer that only computes the outputs of active MACs.
+    """
+    @pytest.fixture
+    def layer_input(self) -> torch.Tensor:
+        """
+        Returns a random input in which roughly half of
+        the MACs are active.
+        """
+        return create_layer_input(16, 0.4)
+
+
+    @pytest.mark.parametrize('receptive_field_layout', ['padded', 'csr'])
+    def test_compaction_matches_dense_forward(
+        self, layer_input: torch.Tensor, receptive_field_layout: str):
+        """
+        Test that the compacted forward pass produces the same
+        outputs as the dense forward pass in evaluation mode, and
+        valid codes for exactly the same MACs in training mode.
+        """
+        dense_layer = create_sparsey_layer(
+            activation_threshold_min=0.4,
+            receptive_field_layout=receptive_field_layout,
+            active_mac_compaction=False
+        )
+        compact_layer = create_sparsey_layer(
+            activation_threshold_min=0.4,
+            receptive_field_layout=receptive_field_layout,
+            active_mac_compaction=True
+        )
+
+        torch.nn.init.uniform_(dense_layer.weights.data)
+        compact_layer.load_state_dict(dense_layer.state_dict())
+
+        dense_layer.eval()
+        compact_layer.eval()
+
+        assert torch.equal(dense_layer(layer_input), compact_layer(layer_input))
+        assert torch.equal(dense_layer.is_active, compact_layer.is_active)
+        assert 0 < torch.sum(compact_layer.is_active) < 16 * 16
+
+        dense_layer.train()
+        compact_layer.train()
+
+        dense_layer(layer_input)
+        output = compact_layer(layer_input).view(16, 16, 4, 6)
+
+        assert torch.equal(dense_layer.is_active, compact_layer.is_active)
+        assert torch.equal(
+            torch.sum(output, dim=3),
+            compact_layer.is_active.float().unsqueeze(-1).expand(-1, -1, 4)
+        )
+
+
+    def test_compaction_without_active_macs(self):
+        """
+        Test that the compacted forward pass returns an empty
+        code when no MAC is active.
+        """
+        layer = create_sparsey_layer(
+            activation_threshold_min=0.4, receptive_field_layout='padded',
+            active_mac_compaction=True
+        )
+
+        output = layer(torch.zeros((4, 25, 15), dtype=torch.float32))
+
+        assert not torch.any(output)
+        assert not torch.any(layer.is_active)
+
+
+class TestWorkspaceBudget:
+    """
+    TestWorkspaceBudget: tests covering the memory-budgeted,
+        chunked computation of activations in SparseyLayer.
+    """
+    @pytest.mark.parametrize('receptive_field_layout', ['padded', 'csr'])
+    @pytest.mark.parametrize('max_workspace_bytes', [1, 40000, 'auto'])
+    def test_chunked_forward_matches_unchunked(
+        self, receptive_field_layout: str, max_workspace_bytes):
+        """
+        Test that processing the MACs in chunks produces the same
+        outputs as processing all of them at once, within the budget
+        whenever a chunk of a single MAC fits in it.
+        """
+        layer = create_sparsey_layer(
+            receptive_field_layout=receptive_field_layout,
+            max_workspace_bytes=None
+        )
+        chunked_layer = create_sparsey_layer(
+            receptive_field_layout=receptive_field_layout,
+            max_workspace_bytes=max_workspace_bytes
+        )
+
+        torch.nn.init.uniform_(layer.weights.data)
+        chunked_layer.load_state_dict(layer.state_dict())
+
+        layer_input = create_layer_input(16)
+
+        layer.eval()
+        chunked_layer.eval()
+
+        assert torch.equal(layer(layer_input), chunked_layer(layer_input))
+        assert torch.equal(layer.is_active, chunked_layer.is_active)
+        assert 0 < chunked_layer.peak_workspace_bytes
+
+        if max_workspace_bytes == 40000:
+            assert chunked_layer.peak_workspace_bytes <= max_workspace_bytes
+            assert chunked_layer.peak_workspace_bytes < (
+                layer.peak_workspace_bytes
+            )
+
+
+    @pytest.mark.parametrize('layer_params', [
+        {'receptive_field_layout': 'padded'},
+        {'receptive_field_layout': 'csr'},
+        {'receptive_field_layout': 'csr', 'shared_receptive_fields': True},
+        {'active_mac_compaction': True}
+    ])
+    @pytest.mark.parametrize('max_workspace_bytes', [None, 40000])
+    def test_reused_workspace(self, layer_params: dict, max_workspace_bytes):
+        """
+        Test that reusing the workspace buffers across forward passes
+        gives the same outputs and draws as allocating them, and that
+        no buffer is allocated after the first pass.
+        """
+        layer = create_sparsey_layer(
+            max_workspace_bytes=max_workspace_bytes, **layer_params
+        )
+        reusing_layer = create_sparsey_layer(
+            max_workspace_bytes=max_workspace_bytes, reuse_workspace=True,
+            **layer_params
+        )
+
+        torch.nn.init.uniform_(layer.weights.data)
+        reusing_layer.load_state_dict(layer.state_dict())
+
+        for layer_ in (layer, reusing_layer):
+            layer_.sampling_seed = 3
+
+        torch.manual_seed(0)
+
+        for step in range(3):
+            layer_input = create_layer_input(16)
+
+            assert torch.equal(layer(layer_input), reusing_layer(layer_input))
+
+            if not step:
+                num_allocations = reusing_layer.workspace.num_allocations
+
+        assert 0 < num_allocations
+        assert reusing_layer.workspace.num_allocations == num_allocations
+
+
+    @pytest.mark.parametrize('max_workspace_bytes', [0, -5, 'half', True])
+    def test_invalid_workspace_budget(self, max_workspace_bytes):
+        """
+        Test that invalid workspace budgets are rejected.
+        """
+        with pytest.raises(ValueError):
+            create_sparsey_layer(
+                receptive_field_layout='padded',
+                max_workspace_bytes=max_workspace_bytes
+            )
+
+
+class TestSparseWeightStorage:
+    """
+    TestSparseWeightStorage: tests covering SparseyLayer with
+        sparse weight storage.
+    """
+    @pytest.mark.parametrize('receptive_field_layout', ['padded', 'csr'])
+    def test_sparse_forward_matches_dense(self, receptive_field_layout: str):
+        """
+        Test that a layer with sparse weight storage loads the
+        weights of a dense layer, produces the same outputs, and
+        saves the weights back in the dense format.
+        """
+        layer = create_sparsey_layer(
+            receptive_field_layout=receptive_field_layout,
+            weight_storage='dense'
+        )
+        sparse_layer = create_sparsey_layer(
+            receptive_field_layout=receptive_field_layout,
+            weight_storage='sparse'
+        )
+
+        flat_weights = layer.weights.data.view(-1, layer.weights.shape[-1])
+        torch.nn.init.uniform_(flat_weights)
+        flat_weights *= torch.rand((flat_weights.shape[0], 1)) < 0.3
+
+        sparse_layer.load_state_dict(layer.state_dict())
+
+        assert sparse_layer.weights.shape[0] == torch.count_nonzero(
+            torch.any(flat_weights, dim=1)
+        )
+
+        assert torch.equal(
+            sparse_layer.state_dict()['weights'], layer.weights
+        )
+
+        layer_input = create_layer_input(16)
+
+        layer.eval()
+        sparse_layer.eval()
+
+        assert torch.equal(layer(layer_input), sparse_layer(layer_input))
+        assert torch.equal(layer.is_active, sparse_layer.is_active)
+
+        winners, macs_are_active = layer.encode_index_code(layer_input)
+
+        assert torch.equal(
+            layer.forward_indices(winners, macs_are_active)[0],
+            sparse_layer.forward_indices(winners, macs_are_active)[0]
+        )
+
+
+    def test_insert_and_compact_weight_rows(self):
+        """
+        Test that inserting and compacting weight rows keeps the
+        stored rows sorted and reports where the old rows went.
+        """
+        layer = create_sparsey_layer(
+            receptive_field_layout='padded', weight_storage='sparse'
+        )
+
+        assert layer.weights.shape[0] == 0
+        assert layer.insert_weight_rows(
+            torch.tensor([40, 3, 17])
+        ).shape[0] == 0
+
+        layer.weights.data[:] = torch.tensor([[1.0], [0.0], [2.0]])
+
+        new_positions = layer.insert_weight_rows(torch.tensor([17, 5]))
+
+        assert torch.equal(layer.weight_rows, torch.tensor([3, 5, 17, 40]))
+        assert torch.equal(new_positions, torch.tensor([0, 2, 3]))
+        assert torch.equal(
+            layer.weights[:, 0], torch.tensor([1.0, 0.0, 0.0, 2.0])
+        )
+
+        assert torch.equal(layer.compact_weights(), torch.tensor([0, 3]))
+        assert torch.equal(layer.weight_rows, torch.tensor([3, 40]))
+        assert torch.equal(
+            layer.get_weight_row_macs(),
+            torch.div(layer.weight_rows, layer.dense_weights_shape[1],
+                      rounding_mode='floor')
+        )
+
+
+    @pytest.mark.parametrize(
+        'weight_storage, weight_compaction_interval',
+        [('compressed', 100), ('sparse', 0), ('sparse', 2.5)]
+    )
+    def test_invalid_weight_storage(self, weight_storage: str,
+                                    weight_compaction_interval):
+        """
+        Test that invalid weight storage settings are rejected.
+        """
+        with pytest.raises(ValueError):
+            create_sparsey_layer(
+                num_macs=4, num_cms_per_mac=2, num_neurons_per_cm=2,
+                mac_grid_num_rows=2, mac_grid_num_cols=2,
+                prev_layer_num_macs=4, mac_receptive_field_size=0.5,
+                prev_layer_num_cms_per_mac=2, prev_layer_num_neurons_per_cm=2,
+                prev_layer_mac_grid_num_rows=2, prev_layer_mac_grid_num_cols=2,
+                layer_index=0, weight_storage=weight_storage,
+                weight_compaction_interval=weight_compaction_interval
+            )
+
+
+class TestWeightDtype:
+    """
+    TestWeightDtype: tests covering SparseyLayer with weights
+        stored in lower precision dtypes.
+    """
+    @pytest.mark.parametrize('receptive_field_layout', ['padded', 'csr'])
+    @pytest.mark.parametrize(
+        'weight_dtype, max_error',
+        [('float16', 2 ** -11), ('bfloat16', 2 ** -8), ('uint8', 0.5 / 255 + 1e-6)]
+    )
+    def test_low_precision_forward(self, receptive_field_layout: str,
+                                   weight_dtype: str, max_error: float):
+        """
+        Test that float32 weights are rounded to the nearest stored
+        value on load, saved in the storage dtype, and that the
+        forward pass matches a float32 layer holding the same values.
+        """
+        layer = create_sparsey_layer(
+            receptive_field_layout=receptive_field_layout,
+            weight_dtype='float32'
+        )
+        low_precision_layer = create_sparsey_layer(
+            receptive_field_layout=receptive_field_layout,
+            weight_dtype=weight_dtype
+        )
+
+        torch.nn.init.uniform_(layer.weights.data)
+        low_precision_layer.load_state_dict(layer.state_dict())
+
+        state_dict = low_precision_layer.state_dict()
+
+        assert state_dict['weights'].dtype == getattr(torch, weight_dtype)
+        assert torch.max(
+            torch.abs(
+                torch.sub(dequantize_weights(state_dict['weights']),
+                          layer.weights)
+            )
+        ) <= max_error
+
+        layer.load_state_dict(state_dict)
+
+        assert torch.equal(
+            layer.weights, dequantize_weights(state_dict['weights'])
+        )
+
+        layer_input = create_layer_input(16)
+
+        layer.eval()
+        low_precision_layer.eval()
+
+        assert torch.equal(
+            layer(layer_input), low_precision_layer(layer_input)
+        )
+
+        winners, macs_are_active = layer.encode_index_code(layer_input)
+
+        assert torch.equal(
+            layer.forward_indices(winners, macs_are_active)[0],
+            low_precision_layer.forward_indices(winners, macs_are_active)[0]
+        )
+
+
+    def test_invalid_weight_dtype(self):
+        """
+        Test that unsupported weight dtypes are rejected.
+        """
+        with pytest.raises(ValueError):
+            create_sparsey_layer(
+                receptive_field_layout='padded', weight_dtype='int4'
+            )
+
+
+class TestBinaryWeights:
+    """
+    TestBinaryWeights: tests covering SparseyLayer computing its
+        activations with bit-packed binary weights.
+    """
+    @pytest.fixture
+    def layer_input(self) -> torch.Tensor:
+        """
+        Returns a batch of inputs with one active neuron per CM in
+        roughly 60% of the previous layer's MACs.
+        """
+        return create_layer_input(16)
+
+
+    @pytest.mark.parametrize('receptive_field_layout', ['padded', 'csr'])
+    @pytest.mark.parametrize('weight_storage', ['dense', 'sparse'])
+    def test_binary_forward_matches_float(self, receptive_field_layout: str,
+                                          weight_storage: str,
+                                          layer_input: torch.Tensor):
+        """
+        Test that the popcount forward pass matches the float forward
+        pass of a layer holding the same binary weights.
+        """
+        layer = create_sparsey_layer(
+            receptive_field_layout=receptive_field_layout,
+            weight_storage='dense', binary_weights=False
+        )
+        binary_layer = create_sparsey_layer(
+            receptive_field_layout=receptive_field_layout,
+            weight_storage=weight_storage, binary_weights=True
+        )
+
+        layer.weights.data.copy_(
+            torch.lt(torch.rand(layer.weights.shape), 0.3).float()
+        )
+        binary_layer.load_state_dict(layer.state_dict())
+
+        layer.eval()
+        binary_layer.eval()
+
+        assert torch.equal(layer(layer_input), binary_layer(layer_input))
+
+        winners, macs_are_active = layer.encode_index_code(layer_input)
+
+        assert torch.equal(
+            layer.forward_indices(winners, macs_are_active)[0],
+            binary_layer.forward_indices(winners, macs_are_active)[0]
+        )
+
+
+    def test_packed_weights_follow_weight_changes(
+            self, layer_input: torch.Tensor):
+        """
+        Test that the packed weights are rebuilt after the weights
+        are changed in place.
+        """
+        layer = create_sparsey_layer(
+            receptive_field_layout='padded', weight_storage='dense',
+            binary_weights=False
+        )
+        binary_layer = create_sparsey_layer(
+            receptive_field_layout='padded', weight_storage='dense',
+            binary_weights=True
+        )
+
+        layer.eval()
+        binary_layer.eval()
+
+        binary_layer(layer_input)
+
+        with torch.no_grad():
+            layer.weights.fill_(1.0)
+            binary_layer.weights.fill_(1.0)
+
+        assert torch.equal(layer(layer_input), binary_layer(layer_input))
+
+
+class TestWinnerSampling:
+    """
+    TestWinnerSampling: tests covering the counter-based sampler
+        choosing the active neurons during training.
+    """
+    def create_layer(self, active_mac_compaction: bool) -> SparseyLayer:
+        """
+        Returns a seeded SparseyLayer with random weights.
+        """
+        layer = create_sparsey_layer(
+            activation_threshold_min=0.4,
+            active_mac_compaction=active_mac_compaction, sampling_seed=7
+        )
+
+        layer.weights.data.copy_(
+            torch.rand(
+                layer.weights.shape,
+                generator=torch.Generator().manual_seed(0)
+            )
+        )
+
+        return layer
+
+
+    @pytest.fixture
+    def layer_input(self) -> torch.Tensor:
+        """
+        Returns a random input in which roughly half of
+        the MACs are active.
+        """
+        return create_layer_input(16, 0.4)
+
+
+    def test_draws_do_not_depend_on_chunking(self, layer_input: torch.Tensor):
+        """
+        Test that seeded training forward passes draw the same active
+        neurons for the whole batch, for the batch split in two, and
+        for the active MACs only, and that the draws change with the
+        sampling step.
+        """
+        layer = self.create_layer(False)
+        compacted_layer = self.create_layer(True)
+
+        output = layer(layer_input)
+
+        assert layer.sampling_step == 1
+        assert torch.equal(output, compacted_layer(layer_input))
+
+        layer.sampling_step = 0
+        first_output = layer(layer_input[:8])
+
+        layer.sampling_step = 0
+        layer.sampling_sample_offset = 8
+        second_output = layer(layer_input[8:])
+
+        assert torch.equal(output, torch.cat((first_output, second_output)))
+        assert not torch.equal(output, layer(layer_input))
+
+
+    def test_sample_winners_distribution(self):
+        """
+        Test that the neurons are drawn with probabilities
+        proportional to their scores.
+        """
+        scores = torch.tensor([1.0, 2.0, 3.0, 4.0]).expand(100000, 1, 4)
+
+        winners = sample_winners(
+            scores, 3, 0, 0,
+            torch.arange(100000), torch.zeros((), dtype=torch.long)
+        )
+
+        frequencies = torch.bincount(winners.flatten(), minlength=4) / 100000
+
+        assert torch.allclose(
+            frequencies, torch.tensor([0.1, 0.2, 0.3, 0.4]), atol=0.01
+        )
+
+
+class TestIncrementalForward:
+    """
+    TestIncrementalForward: tests covering the evaluation forward
+        pass of SparseyLayer that only recomputes the MACs whose
+        receptive fields changed.
+    """
+    def create_layer(self, receptive_field_layout: str,
+                     active_mac_compaction: bool) -> SparseyLayer:
+        """
+        Returns a SparseyLayer in evaluation mode with random weights.
+        """
+        layer = create_sparsey_layer(
+            activation_threshold_min=0.4,
+            receptive_field_layout=receptive_field_layout,
+            active_mac_compaction=active_mac_compaction
+        )
+
+        layer.weights.data.copy_(
+            torch.rand(
+                layer.weights.shape,
+                generator=torch.Generator().manual_seed(0)
+            )
+        )
+
+        layer.eval()
+
+        return layer
+
+
+    @pytest.mark.parametrize('receptive_field_layout', ['padded', 'csr'])
+    @pytest.mark.parametrize('active_mac_compaction', [False, True])
+    def test_incremental_matches_full(
+        self, receptive_field_layout: str, active_mac_compaction: bool):
+        """
+        Test that incremental forward passes over a stream of slowly
+        changing inputs give the same outputs as full forward passes,
+        and only recompute MACs next to the changes.
+        """
+        layer = self.create_layer(receptive_field_layout, active_mac_compaction)
+        incremental_layer = self.create_layer(
+            receptive_field_layout, active_mac_compaction
+        )
+
+        incremental_layer.set_incremental(True)
+
+        torch.manual_seed(0)
+
+        layer_input = create_layer_input(4).view(4, 25, 3, 5)
+
+        for step in range(4):
+            if step:
+                # move one CM of one previous-layer MAC per sample.
+                changed_macs = torch.randint(0, 25, (4,))
+                layer_input[torch.arange(4), changed_macs, 0] = torch.roll(
+                    layer_input[torch.arange(4), changed_macs, 0], 1, 1
+                )
+
+            output = incremental_layer(layer_input.view(4, 25, 15))
+
+            assert torch.equal(output, layer(layer_input.view(4, 25, 15)))
+            assert torch.equal(incremental_layer.is_active, layer.is_active)
+
+            if step:
+                assert incremental_layer.num_recomputed_macs < 4 * 16
+
+
+    def test_weight_changes_reset_incremental_state(self):
+        """
+        Test that changing the weights forces a full forward pass.
+        """
+        layer = self.create_layer('padded', False)
+        layer.set_incremental(True)
+
+        layer_input = torch.zeros((2, 25, 15), dtype=torch.float32)
+        layer_input[:, :, ::5] = 1.0
+
+        layer(layer_input)
+        layer(layer_input)
+
+        assert layer.num_recomputed_macs == 0
+
+        with torch.no_grad():
+            layer.weights.mul_(0.5)
+
+        layer(layer_input)
+
+        assert layer.num_recomputed_macs == 2 * 16
+
+
+class TestMACGroups:
+    """
+    TestMACGroups: tests covering SparseyLayer running the forward
+        pass on a thread pool, by groups of MACs.
+    """
+    def create_layer(self, receptive_field_layout: str, num_threads: int,
+                     reuse_workspace: bool = False) -> SparseyLayer:
+        """
+        Returns a SparseyLayer with random weights running on the
+        given number of threads.
+        """
+        layer = create_sparsey_layer(
+            receptive_field_layout=receptive_field_layout, sampling_seed=5,
+            reuse_workspace=reuse_workspace, num_threads=num_threads
+        )
+
+        layer.weights.data.copy_(
+            torch.rand(
+                layer.weights.shape,
+                generator=torch.Generator().manual_seed(0)
+            )
+        )
+
+        return layer
+
+
+    @pytest.mark.parametrize('receptive_field_layout', ['padded', 'csr'])
+    @pytest.mark.parametrize('num_groups', [1, 3, 16, 40])
+    def test_groups_cover_every_mac_once(
+        self, receptive_field_layout: str, num_groups: int):
+        """
+        Test that the groups of MACs hold every MAC and weight row of
+        the layer exactly once, in at most the requested number of
+        groups.
+        """
+        layer = self.create_layer(receptive_field_layout, 1)
+        groups = layer.get_mac_groups(layer.get_mac_chunks(None, 0), num_groups)
+
+        assert len(groups) <= num_groups
+
+        if receptive_field_layout == 'padded':
+            assert len(groups) == min(num_groups, 16)
+
+        chunks = [chunk for group in groups for chunk in group]
+
+        assert torch.equal(
+            torch.sort(
+                torch.cat([chunk.mac_indices for chunk in chunks])
+            ).values,
+            torch.arange(16)
+        )
+
+        assert sum(
+            chunk.weights_end - chunk.weights_start for chunk in chunks
+        ) == (16 if receptive_field_layout == 'padded' else layer.weights.shape[0])
+
+
+    @pytest.mark.parametrize('receptive_field_layout', ['padded', 'csr'])
+    @pytest.mark.parametrize('reuse_workspace', [False, True])
+    def test_threaded_forward_matches_serial(
+        self, receptive_field_layout: str, reuse_workspace: bool):
+        """
+        Test that running the forward pass on several threads gives
+        the same outputs as running it on one, in training and
+        evaluation mode.
+        """
+        layer = self.create_layer(receptive_field_layout, 1)
+        threaded_layer = self.create_layer(
+            receptive_field_layout, 3, reuse_workspace
+        )
+
+        layer_input = create_layer_input(8)
+
+        for training in (True, False):
+            layer.train(training)
+            threaded_layer.train(training)
+
+            assert torch.equal(
+                layer(layer_input), threaded_layer(layer_input)
+            )
+
+
+    @pytest.mark.parametrize('num_threads', [0, -1, 2.0, True])
+    def test_invalid_num_threads(self, num_threads):
+        """
+        Test that invalid numbers of threads are rejected.
+        """
+        with pytest.raises(ValueError):
+            self.create_layer('padded', num_threads)
+
+
+class TestMACOrdering:
+    """
+    TestMACOrdering: tests covering SparseyLayer storing the MACs
+        of its receptive field buckets along space-filling curves.
+    """
+    def create_layer(self, mac_ordering: str,
+                     receptive_field_layout: str = 'csr',
+                     weight_storage: str = 'dense') -> SparseyLayer:
+        """
+        Returns a SparseyLayer on a non-square grid storing its MACs
+        in the given order.
+        """
+        return create_sparsey_layer(
+            num_macs=30, mac_grid_num_rows=5, mac_grid_num_cols=6,
+            prev_layer_num_macs=36, mac_receptive_field_size=0.3,
+            prev_layer_mac_grid_num_rows=6, prev_layer_mac_grid_num_cols=6,
+            receptive_field_layout=receptive_field_layout,
+            weight_storage=weight_storage, sampling_seed=3,
+            mac_ordering=mac_ordering
+        )
+
+
+    @pytest.mark.parametrize('mac_ordering', ['z_order', 'hilbert'])
+    def test_buckets_follow_the_ordering(self, mac_ordering: str):
+        """
+        Test that reordering keeps every MAC in its receptive field
+        bucket and changes the order they are stored in.
+        """
+        layer = self.create_layer('row_major')
+        reordered_layer = self.create_layer(mac_ordering)
+
+        assert reordered_layer.canonical_weight_rows is not None
+        assert not torch.equal(
+            torch.cat([bucket.mac_indices for bucket in layer.rf_buckets]),
+            torch.cat(
+                [bucket.mac_indices for bucket in reordered_layer.rf_buckets]
+            )
+        )
+
+        for bucket, reordered_bucket in zip(
+            layer.rf_buckets, reordered_layer.rf_buckets
+        ):
+            assert torch.equal(
+                torch.sort(reordered_bucket.mac_indices).values,
+                bucket.mac_indices
+            )
+            assert torch.equal(
+                reordered_bucket.input_connections,
+                reordered_layer.input_connections[
+                    reordered_bucket.mac_indices,
+                    :reordered_bucket.input_connections.shape[1]
+                ]
+            )
+
+
+    @pytest.mark.parametrize('mac_ordering', ['z_order', 'hilbert'])
+    @pytest.mark.parametrize('weight_storage', ['dense', 'sparse'])
+    def test_reordered_forward_matches_row_major(
+        self, mac_ordering: str, weight_storage: str):
+        """
+        Test that a layer loading the state dict of a row-major layer
+        gives the same outputs and saves the same state dict.
+        """
+        layer = self.create_layer('row_major')
+        reordered_layer = self.create_layer(
+            mac_ordering, weight_storage=weight_storage
+        )
+
+        layer.weights.data.copy_(
+            torch.rand(
+                layer.weights.shape,
+                generator=torch.Generator().manual_seed(0)
+            ) * (torch.rand(layer.weights.shape[0], 1) < 0.5)
+        )
+
+        reordered_layer.load_state_dict(layer.state_dict())
+
+        for key, value in layer.state_dict().items():
+            assert torch.equal(value, reordered_layer.state_dict()[key])
+
+        layer_input = create_layer_input(8, prev_layer_num_macs=36)
+
+        for training in (True, False):
+            layer.train(training)
+            reordered_layer.train(training)
+
+            assert torch.equal(layer(layer_input), reordered_layer(layer_input))
+
+        for output, reordered_output in zip(
+            layer.forward_indices(*layer.encode_index_code(layer_input)),
+            reordered_layer.forward_indices(
+                *reordered_layer.encode_index_code(layer_input)
+            )
+        ):
+            assert torch.equal(output, reordered_output)
+
+
+    @pytest.mark.parametrize('mac_ordering,receptive_field_layout', [
+        ('snake', 'csr'), ('z_order', 'padded'), ('hilbert', 'padded')
+    ])
+    def test_invalid_mac_ordering(self, mac_ordering: str,
+                                  receptive_field_layout: str):
+        """
+        Test that unknown MAC orderings, and reordering MACs with
+        the padded layout, are rejected.
+        """
+        with pytest.raises(ValueError):
+            self.create_layer(mac_ordering, receptive_field_layout)
+
+
+class TestComputeDtype:
+    """
+    TestComputeDtype: tests covering SparseyLayer running the matmuls
+        of its forward pass in bfloat16 with float32 accumulation.
+    """
+    @pytest.mark.parametrize('receptive_field_layout', ['padded', 'csr'])
+    @pytest.mark.parametrize('weight_dtype', ['float32', 'bfloat16', 'uint8'])
+    @pytest.mark.parametrize('reuse_workspace', [False, True])
+    def test_bfloat16_matches_float32(self, receptive_field_layout: str,
+                                      weight_dtype: str,
+                                      reuse_workspace: bool):
+        """
+        Test that the raw activations computed in bfloat16 are within
+        bfloat16 rounding of those computed in float32, that the
+        active MACs are identical, that the evaluation winners of
+        nearly all CMs agree, and that single samples and training
+        passes run, with or without a reused workspace.
+        """
+        torch.manual_seed(0)
+
+        layer = create_sparsey_layer(
+            receptive_field_layout=receptive_field_layout,
+            weight_dtype=weight_dtype, sampling_seed=1
+        )
+        bfloat16_layer = create_sparsey_layer(
+            receptive_field_layout=receptive_field_layout,
+            weight_dtype=weight_dtype, compute_dtype='bfloat16',
+            sampling_seed=1, reuse_workspace=reuse_workspace
+        )
+
+        weights = torch.rand(layer.weights.shape)
+        layer.load_state_dict({'weights': weights})
+        bfloat16_layer.load_state_dict({'weights': weights})
+
+        layer_input = create_layer_input(64)
+
+        with torch.no_grad():
+            raw_activations, num_active_inputs = (
+                layer.compute_raw_activations(layer_input)
+            )
+            bfloat16_activations, bfloat16_active_inputs = (
+                bfloat16_layer.compute_raw_activations(layer_input)
+            )
+
+        assert bfloat16_activations.dtype == torch.float32
+        assert torch.equal(num_active_inputs, bfloat16_active_inputs)
+        assert torch.allclose(
+            bfloat16_activations, raw_activations, rtol=2 ** -7, atol=1e-6
+        )
+
+        layer.eval()
+        bfloat16_layer.eval()
+
+        output = layer(layer_input)
+        bfloat16_output = bfloat16_layer(layer_input).clone()
+
+        assert torch.equal(
+            torch.any(output > 0, dim=-1),
+            torch.any(bfloat16_output > 0, dim=-1)
+        )
+        assert torch.mean(
+            torch.eq(
+                output.view(64, 16, 4, 6), bfloat16_output.view(64, 16, 4, 6)
+            ).all(dim=-1).float()
+        ) >= 0.95
+
+        assert torch.equal(
+            bfloat16_layer.infer_sample(layer_input[0]),
+            bfloat16_output[0]
+        )
+
+        bfloat16_layer.train()
+
+        assert bfloat16_layer(layer_input).shape == bfloat16_output.shape
+
+
+    def test_converted_weights_follow_updates(self):
+        """
+        Test that float32 weights are converted once, and converted
+        again after they are updated.
+        """
+        layer = create_sparsey_layer(
+            receptive_field_layout='padded', compute_dtype='bfloat16',
+            sampling_seed=1
+        )
+        layer.eval()
+
+        layer_input = create_layer_input(8)
+        layer(layer_input)
+
+        compute_weights = layer.get_compute_weights()
+
+        assert compute_weights.dtype == torch.bfloat16
+        assert layer.get_compute_weights() is compute_weights
+
+        with torch.no_grad():
+            layer.weights.add_(0.5)
+
+        assert torch.equal(
+            layer.get_compute_weights(),
+            layer.weights.detach().to(torch.bfloat16)
+        )
+
+
+    @pytest.mark.parametrize('compute_dtype, layer_params', [
+        ('float16', {}),
+        ('bfloat16', {'weight_storage': 'sparse'}),
+        ('bfloat16', {'binary_weights': True}),
+        ('bfloat16', {'active_mac_compaction': True})
+    ])
+    def test_invalid_compute_dtype(self, compute_dtype: str,
+                                   layer_params: dict):
+        """
+        Test that unsupported compute dtypes, and bfloat16 compute
+        with sparse storage, binary weights or active MAC compaction,
+        are rejected.
+        """
+        with pytest.raises(ValueError):
+            create_sparsey_layer(
+                receptive_field_layout='csr', compute_dtype=compute_dtype,
+                sampling_seed=1, **layer_params
+            )
+
+
+class TestSharedReceptiveFields:
+    """
+    TestSharedReceptiveFields: tests covering SparseyLayer gathering
+        the inputs of MACs with identical receptive fields once.
+    """
+    def create_layer(self, shared_receptive_fields: bool,
+                     receptive_field_layout: str = 'csr',
+                     **layer_params) -> SparseyLayer:
+        """
+        Returns a SparseyLayer with more MACs than the previous layer,
+        so that many of them have the same receptive field.
+        """
+        return create_sparsey_layer(
+            num_macs=48, mac_grid_num_rows=6, mac_grid_num_cols=8,
+            prev_layer_num_macs=16, prev_layer_mac_grid_num_rows=4,
+            prev_layer_mac_grid_num_cols=4,
+            receptive_field_layout=receptive_field_layout, sampling_seed=3,
+            shared_receptive_fields=shared_receptive_fields, **layer_params
+        )
+
+
+    def test_buckets_read_their_receptive_fields(self):
+        """
+        Test that every MAC is stored once, that the shared inputs each
+        MAC reads are those of its own receptive field, and that the
+        layer gathers fewer receptive fields than it has MACs.
+        """
+        layer = self.create_layer(True)
+
+        assert layer.input_set_offsets.shape[0] - 1 < layer.num_macs
+        assert torch.equal(
+            torch.sort(
+                torch.cat([bucket.mac_indices for bucket in layer.rf_buckets])
+            ).values,
+            torch.arange(layer.num_macs)
+        )
+
+        for bucket in layer.rf_buckets:
+            if bucket.input_sets_start is None:
+                assert torch.all(layer.mac_input_sets[bucket.mac_indices] < 0)
+                continue
+
+            num_bucket_macs = bucket.mac_indices.shape[0]
+            set_indices = (
+                bucket.input_sets_start +
+                torch.arange(num_bucket_macs) * bucket.input_sets_step
+            )
+
+            assert torch.equal(
+                layer.mac_input_sets[bucket.mac_indices], set_indices
+            )
+            for set_index, connections in zip(
+                set_indices.tolist(), bucket.input_connections
+            ):
+                assert torch.equal(
+                    layer.input_set_indices[
+                        layer.input_set_offsets[set_index]:
+                        layer.input_set_offsets[set_index + 1]
+                    ], connections
+                )
+
+
+    @pytest.mark.parametrize('layer_params', [
+        {}, {'max_workspace_bytes': 4096}, {'mac_ordering': 'hilbert'},
+        {'compute_dtype': 'bfloat16'}
+    ])
+    def test_shared_forward_matches_unshared(self, layer_params: dict):
+        """
+        Test that a layer sharing its gathers loads the state dict of a
+        layer that does not, and gives the same outputs.
+        """
+        layer = self.create_layer(False, **layer_params)
+        shared_layer = self.create_layer(True, **layer_params)
+
+        layer.weights.data.copy_(
+            torch.rand(
+                layer.weights.shape,
+                generator=torch.Generator().manual_seed(0)
+            )
+        )
+
+        shared_layer.load_state_dict(layer.state_dict())
+
+        for key, value in layer.state_dict().items():
+            assert torch.equal(value, shared_layer.state_dict()[key])
+
+        layer_input = create_layer_input(8, prev_layer_num_macs=16)
+
+        for training in (True, False):
+            layer.train(training)
+            shared_layer.train(training)
+
+            assert torch.equal(layer(layer_input), shared_layer(layer_input))
+
+
+    def test_invalid_shared_receptive_fields(self):
+        """
+        Test that receptive fields cannot be shared with the padded
+        layout.
+        """
+        with pytest.raises(ValueError):
+            self.create_layer(True, 'padded')
+
+
+class TestIntegerActivations:
+    """
+    TestIntegerActivations: tests covering SparseyLayer computing its
+        raw activations from uint8 weights with int32 accumulation.
+    """
+    @pytest.mark.parametrize('receptive_field_layout', ['padded', 'csr'])
+    @pytest.mark.parametrize('layer_params', [
+        {}, {'max_workspace_bytes': 4096}
+    ])
+    def test_integer_matches_float32(self, receptive_field_layout: str,
+                                     layer_params: dict):
+        """
+        Test that the integer raw activations are within float32
+        rounding of the float32 ones, that the active MACs are
+        identical, and that the evaluation winners of nearly all CMs
+        agree.
+        """
+        torch.manual_seed(0)
+
+        layer = create_sparsey_layer(
+            weight_dtype='uint8',
+            receptive_field_layout=receptive_field_layout,
+            integer_activations=False, sampling_seed=1, **layer_params
+        )
+        integer_layer = create_sparsey_layer(
+            weight_dtype='uint8',
+            receptive_field_layout=receptive_field_layout,
+            integer_activations=True, sampling_seed=1, **layer_params
+        )
+
+        integer_layer.load_state_dict(
+            {'weights': torch.rand(layer.weights.shape)}
+        )
+        layer.load_state_dict(integer_layer.state_dict())
+
+        layer_input = create_layer_input(64)
+
+        with torch.no_grad():
+            raw_activations, num_active_inputs = (
+                layer.compute_raw_activations(layer_input)
+            )
+            integer_activations, integer_active_inputs = (
+                integer_layer.compute_raw_activations(layer_input)
+            )
+
+        assert integer_activations.dtype == torch.float32
+        assert torch.equal(num_active_inputs, integer_active_inputs)
+        assert torch.allclose(
+            integer_activations, raw_activations, rtol=1e-6, atol=1e-6
+        )
+
+        layer.eval()
+        integer_layer.eval()
+
+        output = layer(layer_input)
+        integer_output = integer_layer(layer_input)
+
+        assert torch.equal(
+            torch.any(output > 0, dim=-1),
+            torch.any(integer_output > 0, dim=-1)
+        )
+        assert torch.mean(
+            torch.eq(
+                output.view(64, 16, 4, 6), integer_output.view(64, 16, 4, 6)
+            ).all(dim=-1).float()
+        ) >= 0.99
+
+
+    def test_packed_weights_follow_updates(self):
+        """
+        Test that the weights are packed once, and packed again after
+        they are updated.
+        """
+        layer = create_sparsey_layer(
+            weight_dtype='uint8', receptive_field_layout='csr',
+            integer_activations=True, sampling_seed=1
+        )
+        layer.eval()
+        layer(create_layer_input(8))
+
+        integer_weights = layer.get_integer_weights()
+
+        assert layer.get_integer_weights() is integer_weights
+
+        with torch.no_grad():
+            layer.weights.add_(1)
+
+        assert layer.get_integer_weights() is not integer_weights
+
+
+    @pytest.mark.parametrize('layer_params', [
+        {'weight_dtype': 'float32'}, {'weight_storage': 'sparse'},
+        {'binary_weights': True}, {'active_mac_compaction': True},
+        {'compute_dtype': 'bfloat16'}
+    ])
+    def test_invalid_integer_activations(self, layer_params: dict):
+        """
+        Test that integer activations require dense uint8 weights
+        multiplied by the batched matmul path.
+        """
+        with pytest.raises(ValueError):
+            create_sparsey_layer(**{
+                'weight_dtype': 'uint8', 'receptive_field_layout': 'csr',
+                'integer_activations': True, **layer_params
+            })
+
+
+class TestCsaFastPath:
+    """
+    TestCsaFastPath: tests covering SparseyLayer taking closed-form
+        winners for the (sample, MAC) pairs whose CSA distribution is
+        effectively one-hot or uniform.
+    """
+    def test_no_tolerance_samples_every_pair(self):
+        """
+        Test that layers without a tolerance sample every pair.
+        """
+        layer = create_sparsey_layer(
+            receptive_field_layout='padded', csa_fast_path_tolerance=None,
+            sampling_seed=1
+        )
+        layer.train()
+
+        assert layer.get_csa_path_fractions() == (0.0, 0.0, 0.0)
+
+        layer(create_layer_input(8))
+
+        assert layer.csa_path_counts == (0, 0, 8 * 16)
+        assert layer.get_csa_path_fractions() == (0.0, 0.0, 1.0)
+
+
+    @pytest.mark.parametrize('receptive_field_layout', ['padded', 'csr'])
+    @pytest.mark.parametrize('csa_fast_path_tolerance', [0.0, 1e-3])
+    @pytest.mark.parametrize('layer_params', [
+        {}, {'active_mac_compaction': True}
+    ])
+    def test_fast_path_matches_sampling(self, receptive_field_layout: str,
+                                        csa_fast_path_tolerance: float,
+                                        layer_params: dict):
+        """
+        Test that the fast path selects the same codes as sampling
+        every pair from its full CSA distribution.
+        """
+        torch.manual_seed(0)
+
+        layer = create_sparsey_layer(
+            receptive_field_layout=receptive_field_layout,
+            csa_fast_path_tolerance=None, sampling_seed=1, **layer_params
+        )
+        fast_layer = create_sparsey_layer(
+            receptive_field_layout=receptive_field_layout,
+            csa_fast_path_tolerance=csa_fast_path_tolerance, sampling_seed=1,
+            **layer_params
+        )
+
+        layer.load_state_dict({'weights': torch.rand(layer.weights.shape)})
+        fast_layer.load_state_dict(layer.state_dict())
+
+        layer.train()
+        fast_layer.train()
+
+        layer_input = create_layer_input(32)
+
+        output = layer(layer_input)
+
+        assert torch.equal(output, fast_layer(layer_input))
+
+        # compacted layers only select winners for the active MACs.
+        num_pairs = 32 * 16
+
+        if layer_params:
+            num_pairs = torch.sum(
+                torch.any(output.view(32, 16, -1) > 0, dim=-1)
+            ).item()
+
+        assert sum(fast_layer.csa_path_counts) == num_pairs
+        assert sum(fast_layer.get_csa_path_fractions()) == pytest.approx(1.0)
+
+
+    def test_unfamiliar_macs_take_the_uniform_path(self):
+        """
+        Test that MACs whose CSA distributions are flat draw uniform
+        winners that use every neuron.
+        """
+        layer = create_sparsey_layer(
+            receptive_field_layout='csr', csa_fast_path_tolerance=0.001,
+            sampling_seed=1
+        )
+        layer.load_state_dict(
+            {'weights': torch.zeros(layer.weights.shape)}
+        )
+        layer.train()
+
+        layer_input = create_layer_input(64)
+        scores = torch.zeros((64, 16, 4, 6))
+
+        winners = layer.select_active_neurons(scores)
+
+        assert layer.get_csa_path_fractions() == (0.0, 1.0, 0.0)
+        assert torch.equal(
+            torch.unique(winners), torch.arange(6, dtype=torch.long)
+        )
+
+        layer(layer_input)
+
+        assert layer.get_csa_path_fractions() == (0.0, 1.0, 0.0)
+
+
+    @pytest.mark.parametrize('receptive_field_layout', ['padded', 'csr'])
+    def test_saturated_macs_take_the_one_hot_path(
+        self, receptive_field_layout: str):
+        """
+        Test that MACs whose CSA distributions put nearly all of their
+        probability on the most active neuron of every CM select it,
+        when the sigmoid parameters allow saturation.
+        """
+        layer = create_sparsey_layer(
+            receptive_field_layout=receptive_field_layout,
+            csa_fast_path_tolerance=0.001, sigmoid_phi=12.0, sampling_seed=1
+        )
+        weights = torch.zeros(layer.weights.shape)
+        weights[..., ::6] = 1.0
+        layer.load_state_dict({'weights': weights})
+        layer.train()
+
+        assert layer.can_csa_saturate()
+
+        layer_input = create_layer_input(32)
+        output = layer(layer_input).view(32, 16, 4, 6)
+        macs_are_active = torch.any(output.view(32, 16, -1) > 0, dim=-1)
+        num_one_hot, _, num_sampled = layer.csa_path_counts
+
+        assert num_one_hot == torch.sum(macs_are_active).item()
+        assert num_sampled == 0
+        assert torch.all(output[macs_are_active][..., 0] == 1.0)
+
+
+    def test_default_sigmoid_cannot_saturate(self):
+        """
+        Test that the default sigmoid parameters leave enough of the
+        distribution on the least active neurons that no CM is one-hot.
+        """
+        assert not create_sparsey_layer(
+            receptive_field_layout='csr', csa_fast_path_tolerance=0.001,
+            sampling_seed=1
+        ).can_csa_saturate()
+
+
+    @pytest.mark.parametrize('csa_fast_path_tolerance', [
+        -0.1, 1.0, True, 'small'
+    ])
+    def test_invalid_csa_fast_path_tolerance(self, csa_fast_path_tolerance):
+        """
+        Test that the tolerance must be a number in [0, 1).
+        """
+        with pytest.raises(ValueError):
+            create_sparsey_layer(
+                receptive_field_layout='csr',
+                csa_fast_path_tolerance=csa_fast_path_tolerance,
+                sampling_seed=1
+            )
+
+
+class TestWeightStreaming:
+    """
+    TestWeightStreaming: tests covering SparseyLayer with weights
+        memory-mapped to a file and streamed through a bounded window.
+    """
+    @pytest.mark.parametrize('receptive_field_layout', ['padded', 'csr'])
+    @pytest.mark.parametrize('max_resident_weight_bytes', [None, 12000])
+    def test_streamed_forward_matches_resident(
+        self, receptive_field_layout: str,
+        max_resident_weight_bytes, tmp_path):
+        """
+        Test that a layer streaming its weights from a file gives the
+        outputs of a layer keeping them in memory, holds no more than
+        its budget of weights at once, and keeps no chunk resident
+        between passes.
+        """
+        layer = create_sparsey_layer(
+            receptive_field_layout=receptive_field_layout
+        )
+        streamed_layer = create_sparsey_layer(
+            receptive_field_layout=receptive_field_layout,
+            weight_file=str(tmp_path / 'weights.bin'),
+            max_resident_weight_bytes=max_resident_weight_bytes
+        )
+
+        torch.nn.init.uniform_(layer.weights.data)
+        streamed_layer.load_state_dict(layer.state_dict())
+
+        layer_input = create_layer_input(8)
+
+        layer.eval()
+        streamed_layer.eval()
+
+        assert torch.equal(layer(layer_input), streamed_layer(layer_input))
+
+        window = streamed_layer.weight_window
+
+        assert not window.chunks
+
+        if max_resident_weight_bytes is None:
+            assert window.num_loads == (
+                1 if receptive_field_layout == 'padded'
+                else len(streamed_layer.rf_buckets)
+            )
+        else:
+            assert window.num_loads > len(layer.get_mac_chunks(None, 0))
+            assert window.peak_resident_bytes <= max_resident_weight_bytes
+
+
+    def test_weight_file_is_reused(self, tmp_path):
+        """
+        Test that the weights written to a file are the initial weights
+        of a layer mapping the same file, and that files of another
+        size are rejected.
+        """
+        weight_file = str(tmp_path / 'weights.bin')
+
+        layer = create_sparsey_layer(weight_file=weight_file)
+
+        with torch.no_grad():
+            layer.weights.fill_(0.5)
+
+        layer.weight_window.mapping.flush()
+
+        assert torch.all(
+            create_sparsey_layer(weight_file=weight_file).weights == 0.5
+        )
+
+        with pytest.raises(ValueError):
+            create_sparsey_layer(weight_file=weight_file, num_cms_per_mac=2)
+
+
+    @pytest.mark.parametrize('layer_params', [
+        {'weight_storage': 'sparse'}, {'binary_weights': True},
+        {'active_mac_compaction': True}, {'compute_dtype': 'bfloat16'},
+        {'num_threads': 2}, {'max_resident_weight_bytes': 0}
+    ])
+    def test_invalid_weight_file(self, layer_params: dict, tmp_path):
+        """
+        Test that memory-mapped weights require dense float32 weights
+        multiplied by the batched matmul path on one thread, and a
+        positive resident budget.
+        """
+        with pytest.raises(ValueError):
+            create_sparsey_layer(
+                weight_file=str(tmp_path / 'weights.bin'), **layer_params
+            )
+
+
+    def test_resident_budget_requires_weight_file(self):
+        """
+        Test that a resident budget is rejected without a weight file.
+        """
+        with pytest.raises(ValueError):
+            create_sparsey_layer(max_resident_weight_bytes=4096)
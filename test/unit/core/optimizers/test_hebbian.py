@@ -2,12 +2,114 @@
 Test Hebbian Optimizer: test cases for the Hebbian optimizer functionality in the Sparsey model system.
 """
 
+from typing import List, Optional, Tuple
+
 import pytest
 import torch
 from sparseypy.core.optimizers.hebbian import HebbianOptimizer
 from sparseypy.access_objects.models.model import Model
 from sparseypy.core.model_layers.sparsey_layer import SparseyLayer
 from sparseypy.core.hooks import LayerIOHook
+from sparseypy.core.model_layers.weight_precision import quantize_weights
+
+
+def create_sparsey_layer(**layer_params) -> SparseyLayer:
+    """
+    Returns a SparseyLayer with a 4x4 grid of MACs over a 3x3 grid of
+    previous layer MACs, with any given parameters overriding the
+    defaults.
+    """
+    return SparseyLayer(**{
+        'autosize_grid': False, 'grid_layout': 'rect', 'num_macs': 16,
+        'num_cms_per_mac': 4, 'num_neurons_per_cm': 4,
+        'mac_grid_num_rows': 4, 'mac_grid_num_cols': 4,
+        'prev_layer_num_macs': 9, 'mac_receptive_field_size': 0.5,
+        'prev_layer_num_cms_per_mac': 3, 'prev_layer_num_neurons_per_cm': 3,
+        'prev_layer_mac_grid_num_rows': 3, 'prev_layer_mac_grid_num_cols': 3,
+        'prev_layer_grid_layout': 'rect', 'layer_index': 0,
+        'sigmoid_phi': 5.0, 'sigmoid_lambda': 28.0,
+        'saturation_threshold': 0.3, 'permanence_steps': 5,
+        'permanence_convexity': 1.0, 'activation_threshold_max': 1.0,
+        'activation_threshold_min': 0.2, 'min_familiarity': 0.2,
+        'sigmoid_chi': 2.5, 'device': torch.device('cpu'),
+        **layer_params
+    })
+
+
+def create_layer_input(active_mac_rate: float = 0.7) -> torch.Tensor:
+    """
+    Returns a batch of 8 random inputs to the layers of
+    create_sparsey_layer, with one active neuron in every CM of the
+    active previous layer MACs, each of which is active with
+    probability active_mac_rate.
+    """
+    input_tensor = torch.zeros((8, 9, 3, 3), dtype=torch.float32)
+    input_tensor.scatter_(3, torch.randint(0, 3, (8, 9, 3, 1)), 1.0)
+    input_tensor *= torch.rand((8, 9, 1, 1)) < active_mac_rate
+
+    return input_tensor.view(8, 9, 9)
+
+
+def train_side_by_side(
+    layer_params_a: dict, layer_params_b: dict,
+    optimizer_params_a: Optional[dict] = None,
+    optimizer_params_b: Optional[dict] = None,
+    inputs: Optional[List[torch.Tensor]] = None
+) -> List[Tuple[Model, HebbianOptimizer]]:
+    """
+    Trains two one-layer models built by create_sparsey_layer on the
+    same inputs, drawing the same random numbers in both, and checks
+    that they give the same outputs at every step.
+
+    Args:
+        layer_params_a (dict): the layer parameters of the first model.
+        layer_params_b (dict): the layer parameters of the second model.
+        optimizer_params_a (Optional[dict]): the optimizer parameters
+            of the first model.
+        optimizer_params_b (Optional[dict]): the optimizer parameters
+            of the second model.
+        inputs (Optional[List[torch.Tensor]]): the input of each step,
+            or None for 10 steps of create_layer_input.
+
+    Returns:
+        (List[Tuple[Model, HebbianOptimizer]]): the trained models and
+            their optimizers.
+    """
+    models = []
+
+    for layer_params, optimizer_params in (
+        (layer_params_a, optimizer_params_a),
+        (layer_params_b, optimizer_params_b)
+    ):
+        model = Model(device='cpu')
+        model.add_layer(create_sparsey_layer(**layer_params))
+
+        models.append(
+            (
+                model,
+                HebbianOptimizer(
+                    model, torch.device('cpu'), **(optimizer_params or {})
+                )
+            )
+        )
+
+    torch.manual_seed(0)
+
+    if inputs is None:
+        inputs = [create_layer_input() for _ in range(10)]
+
+    for step, input_tensor in enumerate(inputs):
+        outputs = []
+
+        for model, optimizer in models:
+            torch.manual_seed(step)
+            outputs.append(model(input_tensor).clone())
+            optimizer.step()
+
+        assert torch.equal(outputs[0], outputs[1])
+
+    return models
+
 
 class TestHebbianOptimizer:
     """
@@ -221,3 +323,278 @@ class TestHebbianOptimizer:
 
             output = simple_model(input_tensor)
             optimizer.step()
+
+
+    def test_csr_layout_weight_updates(self) -> None:
+        """
+        Tests that the Hebbian optimizer applies the same weight
+        updates to layers using the CSR receptive field layout as it
+        does to layers using the padded layout.
+        """
+        models = train_side_by_side(
+            {'receptive_field_layout': 'padded'},
+            {'receptive_field_layout': 'csr'}
+        )
+
+        padded_layer = models[0][0].get_submodule('Layer_0')
+        csr_layer = models[1][0].get_submodule('Layer_0')
+
+        for bucket in csr_layer.rf_buckets:
+            bucket_weights = csr_layer.get_bucket_weights(bucket)
+
+            assert torch.equal(
+                bucket_weights,
+                padded_layer.weights[
+                    bucket.mac_indices, :bucket_weights.shape[1]
+                ]
+            )
+
+
+    @pytest.mark.parametrize('max_workspace_bytes', [None, 4096])
+    def test_shared_receptive_field_updates(
+        self, max_workspace_bytes) -> None:
+        """
+        Tests that the Hebbian optimizer gives layers that share the
+        gathers of identical receptive fields the same weights as
+        layers that do not.
+        """
+        layer_params = {
+            'num_macs': 36, 'mac_grid_num_rows': 6, 'mac_grid_num_cols': 6,
+            'receptive_field_layout': 'csr',
+            'max_workspace_bytes': max_workspace_bytes
+        }
+        optimizer_params = {'max_workspace_bytes': max_workspace_bytes}
+
+        models = train_side_by_side(
+            {**layer_params, 'shared_receptive_fields': False},
+            {**layer_params, 'shared_receptive_fields': True},
+            optimizer_params, optimizer_params
+        )
+
+        shared_layer = models[1][0].get_submodule('Layer_0')
+
+        assert shared_layer.input_set_offsets.shape[0] - 1 < 36
+
+        for key, value in models[0][0].state_dict().items():
+            assert torch.equal(value, models[1][0].state_dict()[key])
+
+
+    @pytest.mark.parametrize('receptive_field_layout', ['padded', 'csr'])
+    def test_chunked_weight_updates(self, receptive_field_layout: str) -> None:
+        """
+        Tests that updating the weights in chunks of MACs to fit a
+        workspace budget gives the same weights as updating all MACs
+        at once, and that the peak workspace is reported.
+        """
+        models = train_side_by_side(
+            {'receptive_field_layout': receptive_field_layout},
+            {
+                'receptive_field_layout': receptive_field_layout,
+                'max_workspace_bytes': 4096
+            },
+            optimizer_params_b={'max_workspace_bytes': 4096}
+        )
+
+        assert torch.equal(
+            models[0][0].get_submodule('Layer_0').weights,
+            models[1][0].get_submodule('Layer_0').weights
+        )
+
+        assert 0 < models[1][1].peak_workspace_bytes
+        assert models[1][1].peak_workspace_bytes < (
+            models[0][1].peak_workspace_bytes
+        )
+
+
+    @pytest.mark.parametrize('receptive_field_layout', ['padded', 'csr'])
+    def test_sparse_weight_updates(self, receptive_field_layout: str) -> None:
+        """
+        Tests that the Hebbian optimizer gives layers using sparse
+        weight storage the same weights as layers using dense
+        storage, and that compaction drops rows that decayed to zero.
+        """
+        layer_params = {
+            'permanence_steps': 3,
+            'receptive_field_layout': receptive_field_layout,
+            'weight_compaction_interval': 4
+        }
+
+        torch.manual_seed(0)
+        inputs = [create_layer_input() for _ in range(12)]
+
+        # later steps only activate the first input MACs, so
+        # the weights of the other inputs decay to zero.
+        for input_tensor in inputs[4:]:
+            input_tensor[:, 3:] = 0.0
+
+        models = train_side_by_side(
+            {**layer_params, 'weight_storage': 'dense'},
+            {**layer_params, 'weight_storage': 'sparse'},
+            inputs=inputs
+        )
+
+        dense_layer = models[0][0].get_submodule('Layer_0')
+        sparse_layer = models[1][0].get_submodule('Layer_0')
+
+        assert torch.equal(dense_layer.weights, sparse_layer.get_dense_weights())
+        # the last step compacted the weights, so exactly the
+        # nonzero rows of the dense weights are stored.
+        assert torch.equal(
+            sparse_layer.weight_rows,
+            torch.nonzero(
+                torch.any(
+                    dense_layer.weights.view(
+                        -1, dense_layer.weights.shape[-1]
+                    ), dim=1
+                )
+            ).view(-1)
+        )
+
+
+    @pytest.mark.parametrize('weight_storage', ['dense', 'sparse'])
+    @pytest.mark.parametrize('weight_dtype', ['float16', 'bfloat16', 'uint8'])
+    def test_low_precision_weight_updates(self, weight_storage: str,
+                                          weight_dtype: str) -> None:
+        """
+        Tests that the Hebbian optimizer computes the updates of
+        weights stored in a lower precision in float32, and stores the
+        result rounded to the nearest representable value.
+        """
+        torch.manual_seed(0)
+
+        models = train_side_by_side(
+            {'weight_storage': weight_storage, 'weight_dtype': 'float32'},
+            {'weight_storage': weight_storage, 'weight_dtype': weight_dtype},
+            inputs=[create_layer_input(1.0)]
+        )
+
+        layer = models[1][0].get_submodule('Layer_0')
+
+        assert layer.weights.dtype == getattr(torch, weight_dtype)
+        assert torch.equal(
+            layer.get_dense_weights(),
+            quantize_weights(
+                models[0][0].get_submodule('Layer_0').get_dense_weights(),
+                layer.weights.dtype
+            )
+        )
+
+
+    @pytest.mark.parametrize('receptive_field_layout', ['padded', 'csr'])
+    def test_reused_workspace_updates(
+        self, receptive_field_layout: str) -> None:
+        """
+        Tests that reusing the workspace buffers of the layer and the
+        optimizer across steps gives the same weights as allocating
+        them at every step, without allocating after the first step.
+        """
+        layer_params = {
+            'receptive_field_layout': receptive_field_layout,
+            'max_workspace_bytes': 4096, 'sampling_seed': 0
+        }
+
+        models = train_side_by_side(
+            layer_params, {**layer_params, 'reuse_workspace': True},
+            {'max_workspace_bytes': 4096},
+            {'max_workspace_bytes': 4096, 'reuse_workspace': True}
+        )
+
+        assert torch.equal(
+            models[0][0].get_submodule('Layer_0').weights,
+            models[1][0].get_submodule('Layer_0').weights
+        )
+
+        model, optimizer = models[1]
+        num_allocations = optimizer.workspace.num_allocations
+
+        model(create_layer_input())
+        optimizer.step()
+
+        assert 0 < num_allocations
+        assert optimizer.workspace.num_allocations == num_allocations
+
+
+    @pytest.mark.parametrize('receptive_field_layout', ['padded', 'csr'])
+    def test_threaded_weight_updates(self, receptive_field_layout: str) -> None:
+        """
+        Tests that splitting the forward pass and the weight updates
+        across threads by groups of MACs gives the same weights as
+        running them on a single thread.
+        """
+        layer_params = {
+            'receptive_field_layout': receptive_field_layout,
+            'sampling_seed': 0
+        }
+
+        models = train_side_by_side(
+            layer_params, {**layer_params, 'num_threads': 3},
+            optimizer_params_b={'num_threads': 3}
+        )
+
+        assert torch.equal(
+            models[0][0].get_submodule('Layer_0').weights,
+            models[1][0].get_submodule('Layer_0').weights
+        )
+
+
+    @pytest.mark.parametrize('mac_ordering', ['z_order', 'hilbert'])
+    def test_reordered_mac_weight_updates(self, mac_ordering: str) -> None:
+        """
+        Tests that layers storing their MACs along a space-filling
+        curve learn the same weights, as seen through their state
+        dicts, as layers storing them in row-major order.
+        """
+        layer_params = {'receptive_field_layout': 'csr', 'sampling_seed': 0}
+
+        models = train_side_by_side(
+            {**layer_params, 'mac_ordering': 'row_major'},
+            {**layer_params, 'mac_ordering': mac_ordering}
+        )
+
+        assert torch.equal(
+            models[0][0].state_dict()['Layer_0.weights'],
+            models[1][0].state_dict()['Layer_0.weights']
+        )
+        assert not torch.equal(
+            models[0][0].get_submodule('Layer_0').weights,
+            models[1][0].get_submodule('Layer_0').weights
+        )
+
+
+    @pytest.mark.parametrize('receptive_field_layout', ['padded', 'csr'])
+    def test_streamed_weight_updates(self, receptive_field_layout: str,
+                                     tmp_path) -> None:
+        """
+        Tests that layers streaming their weights from a file through
+        a bounded window learn the same weights as layers keeping them
+        in memory, within the window budget, and that the weights
+        written back to the file are picked up by a new layer.
+        """
+        weight_file = str(tmp_path / 'weights.bin')
+        layer_params = {
+            'receptive_field_layout': receptive_field_layout,
+            'sampling_seed': 0
+        }
+
+        models = train_side_by_side(
+            layer_params,
+            {
+                **layer_params, 'weight_file': weight_file,
+                'max_resident_weight_bytes': 4096
+            }
+        )
+
+        weights = models[0][0].get_submodule('Layer_0').weights
+        streamed_layer = models[1][0].get_submodule('Layer_0')
+
+        assert torch.equal(weights, streamed_layer.weights)
+        assert 0 < streamed_layer.weight_window.peak_resident_bytes <= 4096
+        assert streamed_layer.weight_window.num_write_backs > 0
+        assert not streamed_layer.weight_window.chunks
+        assert torch.equal(
+            weights,
+            create_sparsey_layer(
+                receptive_field_layout=receptive_field_layout,
+                weight_file=weight_file
+            ).weights
+        )